@@ -0,0 +1,303 @@
+"""
+保存済みHTMLスナップショットの一括スキャン
+ディレクトリ・tarアーカイブ・WARCファイルのページを並列に抽出し、結果をNDJSONで出力する
+（キーワードや抽出ルールの調整時に、過去のスナップショットをまとめて再生する用途）
+
+使い方:
+    python batch_scan.py snapshots/ -o results.ndjson
+    python batch_scan.py snapshots.tar.gz --workers 8 --no-items
+    python batch_scan.py crawl.warc.gz -o - | jq .item_count
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 対象とするHTMLファイルの拡張子
+HTML_EXTENSIONS = ('.html', '.htm', '.html.gz', '.htm.gz')
+
+# スナップショット: (名前, URL, HTMLのバイト列)
+Snapshot = Tuple[str, str, bytes]
+
+
+def _is_html_name(name: str) -> bool:
+    return name.lower().endswith(HTML_EXTENSIONS)
+
+
+def _maybe_gunzip(name: str, data: bytes) -> bytes:
+    return gzip.decompress(data) if name.lower().endswith('.gz') else data
+
+
+def iter_directory(path: str) -> Iterator[Snapshot]:
+    """ディレクトリ以下のHTMLファイルを名前順に読み込む"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if not _is_html_name(filename):
+                continue
+            file_path = os.path.join(root, filename)
+            with open(file_path, 'rb') as f:
+                yield os.path.relpath(file_path, path), '', _maybe_gunzip(filename, f.read())
+
+
+def iter_tar(path: str) -> Iterator[Snapshot]:
+    """tarアーカイブ（.tar / .tar.gz / .tgz など）内のHTMLファイルを格納順に読み込む"""
+    with tarfile.open(path, 'r:*') as archive:
+        for member in archive:
+            if not member.isfile() or not _is_html_name(member.name):
+                continue
+            f = archive.extractfile(member)
+            if f is not None:
+                yield member.name, '', _maybe_gunzip(member.name, f.read())
+
+
+def _read_warc_headers(stream) -> Optional[Dict[str, str]]:
+    # レコード間の空行を読み飛ばし、バージョン行とヘッダーを読む
+    line = stream.readline()
+    while line in (b'\r\n', b'\n'):
+        line = stream.readline()
+    if not line:
+        return None
+    if not line.startswith(b'WARC/'):
+        raise ValueError(f"WARCレコードの形式が不正です: {line[:40]!r}")
+
+    headers = {}
+    for line in iter(stream.readline, b''):
+        line = line.rstrip(b'\r\n')
+        if not line:
+            break
+        key, _, value = line.decode('utf-8', 'replace').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return headers
+
+
+def _split_http_response(block: bytes) -> Tuple[int, bytes]:
+    head, separator, body = block.partition(b'\r\n\r\n')
+    if not separator:
+        head, separator, body = block.partition(b'\n\n')
+    status_line = head.split(b'\n', 1)[0].split()
+    status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 0
+    return status, body
+
+
+def iter_warc(path: str) -> Iterator[Snapshot]:
+    """
+    WARCファイル（.warc / .warc.gz）のresponseレコードのうち、HTMLのものを読み込む
+
+    HTTPレスポンスのContent-Encoding（gzip等）には対応していないため、
+    圧縮されたレスポンスボディはスキップされる。
+    """
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    with opener(path, 'rb') as stream:
+        index = 0
+        while True:
+            headers = _read_warc_headers(stream)
+            if headers is None:
+                break
+            block = stream.read(int(headers.get('content-length', '0')))
+            index += 1
+
+            if headers.get('warc-type') != 'response':
+                continue
+            if not headers.get('content-type', '').startswith('application/http'):
+                continue
+
+            status, body = _split_http_response(block)
+            if status != 200 or b'<' not in body[:1024]:
+                continue
+
+            url = headers.get('warc-target-uri', '')
+            date = headers.get('warc-date', '')
+            yield f"{os.path.basename(path)}#{index}@{date}", url, body
+
+
+def iter_snapshots(path: str) -> Iterator[Snapshot]:
+    """
+    入力の種類（ディレクトリ・tar・WARC・単一のHTML）を判別してスナップショットを読み込む
+
+    Args:
+        path: 入力のパス
+
+    Returns:
+        (名前, URL, HTMLのバイト列) のイテレータ
+    """
+    lower = path.lower()
+    if os.path.isdir(path):
+        return iter_directory(path)
+    if lower.endswith(('.warc', '.warc.gz')):
+        return iter_warc(path)
+    if tarfile.is_tarfile(path):
+        return iter_tar(path)
+    if _is_html_name(path):
+        with open(path, 'rb') as f:
+            return iter([(os.path.basename(path), '', _maybe_gunzip(path, f.read()))])
+    raise ValueError(f"対応していない入力です: {path}")
+
+
+# --- ワーカープロセス ---
+
+_worker_scraper = None
+_worker_default_url = ''
+_worker_include_items = True
+
+
+def _init_worker(target_url: str, keywords: List[str], match_mode: str, include_items: bool,
+                 parser_backend: str):
+    global _worker_scraper, _worker_default_url, _worker_include_items
+    from scraper import Switch2Scraper
+
+    # ファイルごとの検出ログは出さない
+    logging.getLogger('scraper').setLevel(logging.WARNING)
+    logging.getLogger('normalizer').setLevel(logging.WARNING)
+
+    _worker_scraper = Switch2Scraper(target_url, keywords, match_mode, parser_backend=parser_backend)
+    _worker_default_url = target_url
+    _worker_include_items = include_items
+
+
+def scan_snapshot(snapshot: Snapshot) -> Dict:
+    """
+    1件のスナップショットからアイテムを抽出（ワーカープロセスで実行）
+
+    Args:
+        snapshot: (名前, URL, HTMLのバイト列)
+
+    Returns:
+        NDJSONの1行分の辞書
+    """
+    from items import serialize_items
+
+    name, url, html = snapshot
+    scraper = _worker_scraper
+    # 相対リンクはスナップショットのURL（WARCの場合）を基準に解決
+    scraper.target_url = url or _worker_default_url
+
+    started = time.perf_counter()
+    try:
+        items = scraper.extract_relevant_content(html)
+        result = {
+            'file': name,
+            'url': scraper.target_url,
+            'success': True,
+            'item_count': len(items),
+            'hash': scraper.compute_items_hash(items),
+        }
+        if _worker_include_items:
+            result['items'] = serialize_items(items)
+    except Exception as e:
+        result = {'file': name, 'url': scraper.target_url, 'success': False, 'error': str(e)}
+
+    result['bytes'] = len(html)
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def batch_scan(snapshots: Iterator[Snapshot], target_url: str, keywords: List[str],
+               match_mode: str = 'any', workers: Optional[int] = None,
+               include_items: bool = True, max_pending: Optional[int] = None,
+               parser_backend: str = 'bs4') -> Iterator[Dict]:
+    """
+    スナップショットを並列にスキャンし、入力順に結果を返す
+
+    読み込み済みで未処理のスナップショットは max_pending 件までに抑えるため、
+    大きなアーカイブでもメモリ使用量は一定。
+
+    Args:
+        snapshots: スナップショットのイテレータ
+        target_url: 相対リンクの解決に使う既定のURL
+        keywords: 検出対象のキーワードリスト
+        match_mode: 'any' or 'all'
+        workers: ワーカープロセス数（省略時はCPU数）
+        include_items: 結果にアイテムを含めるか
+        max_pending: 同時に処理中にするスナップショットの最大数（省略時はワーカー数の4倍）
+        parser_backend: 解析バックエンド（'bs4' または 'lxml'）
+
+    Returns:
+        結果の辞書のイテレータ
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(target_url, keywords, match_mode, include_items, parser_backend)
+    ) as executor:
+        pending = deque()
+        for snapshot in snapshots:
+            pending.append(executor.submit(scan_snapshot, snapshot))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def main():
+    """コマンドラインのエントリーポイント"""
+    import config
+
+    parser = argparse.ArgumentParser(description='保存済みHTMLスナップショットを一括スキャンしてNDJSONで出力')
+    parser.add_argument('inputs', nargs='+', help='ディレクトリ・tarアーカイブ・WARCファイル・HTMLファイル')
+    parser.add_argument('-o', '--output', default='-', help="出力先のNDJSONファイル（'-'で標準出力）")
+    parser.add_argument('-w', '--workers', type=int, default=None, help='ワーカープロセス数（既定: CPU数）')
+    parser.add_argument('--url', default=config.TARGET_URL, help='相対リンクの解決に使うURL')
+    parser.add_argument('--match-mode', default=config.KEYWORD_MATCH_MODE, choices=['any', 'all'])
+    parser.add_argument('--parser', default=config.PARSER_BACKEND, choices=['bs4', 'lxml'],
+                        help='解析バックエンド')
+    parser.add_argument('--no-items', action='store_true', help='結果にアイテムを含めない（件数とハッシュのみ）')
+    args = parser.parse_args()
+
+    def all_snapshots():
+        for path in args.inputs:
+            yield from iter_snapshots(path)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    timings = []
+    failures = 0
+    total_items = 0
+    started = time.perf_counter()
+
+    try:
+        for result in batch_scan(all_snapshots(), args.url, config.WATCH_KEYWORDS, args.match_mode,
+                                 workers=args.workers, include_items=not args.no_items,
+                                 parser_backend=args.parser):
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            timings.append(result['elapsed_ms'])
+            total_items += result.get('item_count', 0)
+            if not result['success']:
+                failures += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"{len(timings)}件をスキャンしました（失敗: {failures}件, アイテム: {total_items}件, {elapsed:.2f}秒）"
+    )
+    if timings:
+        logger.info(
+            f"ファイルごとの処理時間: 平均 {sum(timings) / len(timings):.1f}ms, "
+            f"p50 {_percentile(timings, 0.5):.1f}ms, p95 {_percentile(timings, 0.95):.1f}ms, "
+            f"最大 {max(timings):.1f}ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
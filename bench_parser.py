@@ -0,0 +1,107 @@
+"""
+解析バックエンドのベンチマーク
+同じHTMLをbs4（参照実装）とlxmlバックエンドで抽出し、抽出結果が一致するかと処理時間を比較する
+
+使い方:
+    python bench_parser.py snapshots/ --repeat 5
+    python bench_parser.py page.html crawl.warc.gz
+    python bench_parser.py            # 監視対象のページを1回取得して比較
+"""
+import argparse
+import time
+from typing import Dict, List
+import logging
+
+from batch_scan import iter_snapshots
+from items import serialize_items
+from parser_backends import PARSER_BACKENDS, PARSER_BS4
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def comparable_items(items) -> List[Dict]:
+    """比較用のアイテム（チャンクハッシュはバックエンドごとに異なるため除く）"""
+    return [
+        {key: value for key, value in item.items() if key != 'chunk'}
+        for item in serialize_items(items)
+    ]
+
+
+def bench_page(scrapers: Dict, html: str, repeat: int) -> Dict:
+    """
+    1ページをすべてのバックエンドで抽出
+
+    Args:
+        scrapers: バックエンド名とSwitch2Scraperの辞書
+        html: HTML文字列
+        repeat: 計測の繰り返し回数
+
+    Returns:
+        {'items': バックエンドごとのアイテム, 'ms': バックエンドごとの平均処理時間}
+    """
+    result = {'items': {}, 'ms': {}}
+    for name, scraper in scrapers.items():
+        result['items'][name] = comparable_items(scraper.extract_relevant_content(html))
+        started = time.perf_counter()
+        for _ in range(repeat):
+            scraper.extract_relevant_content(html)
+        result['ms'][name] = (time.perf_counter() - started) / repeat * 1000
+    return result
+
+
+def main():
+    """コマンドラインのエントリーポイント"""
+    import config
+    from scraper import Switch2Scraper
+
+    parser = argparse.ArgumentParser(description='解析バックエンドの抽出結果と処理時間を比較')
+    parser.add_argument('inputs', nargs='*', help='ディレクトリ・tarアーカイブ・WARCファイル・HTMLファイル')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='ページごとの計測回数')
+    parser.add_argument('--url', default=config.TARGET_URL, help='相対リンクの解決に使うURL')
+    args = parser.parse_args()
+
+    # ページごとの検出ログは出さない
+    logging.getLogger('scraper').setLevel(logging.WARNING)
+
+    # 解析の速度を比較するため、キーワードの事前チェックは使わない
+    scrapers = {
+        name: Switch2Scraper(args.url, config.WATCH_KEYWORDS, config.KEYWORD_MATCH_MODE,
+                             parser_backend=name, keyword_prefilter=False)
+        for name in PARSER_BACKENDS
+    }
+
+    if args.inputs:
+        pages = [
+            (name, html.decode('utf-8', 'replace'))
+            for path in args.inputs
+            for name, _, html in iter_snapshots(path)
+        ]
+    else:
+        html = scrapers[PARSER_BS4].fetch_page()
+        pages = [(args.url, html)] if html else []
+
+    if not pages:
+        logger.error("比較するページがありません")
+        return
+
+    totals = {name: 0.0 for name in scrapers}
+    mismatches = 0
+    for name, html in pages:
+        result = bench_page(scrapers, html, args.repeat)
+        reference = result['items'][PARSER_BS4]
+        for backend, items in result['items'].items():
+            if items != reference:
+                mismatches += 1
+                logger.warning(f"{name}: {backend}の抽出結果がbs4と異なります（{len(items)}件 / {len(reference)}件）")
+        for backend, ms in result['ms'].items():
+            totals[backend] += ms
+
+    print(f"ページ数: {len(pages)}, 抽出結果の不一致: {mismatches}件")
+    for backend, total in totals.items():
+        speedup = totals[PARSER_BS4] / total if total else 0.0
+        print(f"  {backend:<5} 合計 {total:8.1f}ms  平均 {total / len(pages):7.2f}ms/ページ  (bs4比 {speedup:.2f}倍)")
+
+
+if __name__ == '__main__':
+    main()
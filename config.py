@@ -2,6 +2,7 @@
 設定ファイル
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 環境変数を読み込み
@@ -11,12 +12,73 @@ load_dotenv()
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN', '')
 LINE_USER_ID = os.getenv('LINE_USER_ID', '')  # 個人宛て通知の場合
 LINE_GROUP_ID = os.getenv('LINE_GROUP_ID', '')  # グループ宛て通知の場合
+# 検出通知の形式（'text': テキスト、'flex': Flex Message）
+NOTIFICATION_FORMAT = os.getenv('NOTIFICATION_FORMAT', 'text')
+LINE_TIMEOUT = float(os.getenv('LINE_TIMEOUT', '10'))  # 送信のタイムアウト（秒）
+
+# その他の通知チャネル（設定したチャネルすべてに並列で送信）
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # 汎用Webhook（JSONをPOST）
+SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL', '')  # Slack Incoming Webhook
+DISCORD_WEBHOOK_URL = os.getenv('DISCORD_WEBHOOK_URL', '')  # Discord Webhook
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', '10'))  # Webhookのタイムアウト（秒）
+
+# メール通知（SMTP）
+SMTP_HOST = os.getenv('SMTP_HOST', '')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USER = os.getenv('SMTP_USER', '')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'True').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '15'))  # タイムアウト（秒）
+EMAIL_FROM = os.getenv('EMAIL_FROM', '')
+EMAIL_TO = [address.strip() for address in os.getenv('EMAIL_TO', '').split(',') if address.strip()]
+
+# 各チャネルのタイムアウトに加えて待つ時間（秒）
+NOTIFY_GRACE_SECONDS = float(os.getenv('NOTIFY_GRACE_SECONDS', '2'))
+
+# 優先度別の通知
+# スコアが PRIORITY_THRESHOLD 以上のアイテムは状態の保存を待たずに短い速報で即時通知し、
+# それ以外は DIGEST_INTERVAL_MINUTES 分ごとのダイジェストでまとめて通知（0の場合は毎回）
+PRIORITY_ALERTS = os.getenv('PRIORITY_ALERTS', 'True').lower() == 'true'
+PRIORITY_THRESHOLD = float(os.getenv('PRIORITY_THRESHOLD', '6'))
+
+# アイテムのタイプごとの重み
+PRIORITY_TYPE_WEIGHTS = {
+    'heading': 3,
+    'banner': 3,
+    'link': 1,
+    'paragraph': 0,
+}
+
+# タイトル・本文に含まれるキーワードごとの重み
+PRIORITY_KEYWORD_WEIGHTS = {
+    '招待販売': 4,
+    '抽選': 3,
+    '申込期限': 3,
+    '受付中': 3,
+    '受付開始': 3,
+    '当選': 2,
+    '予約': 2,
+    '在庫': 1,
+}
+
+# URLの正規表現ごとの重み
+PRIORITY_URL_PATTERNS = [
+    (r'/lottery', 3),
+    (r'/invitation', 3),
+]
+
+DIGEST_INTERVAL_MINUTES = float(os.getenv('DIGEST_INTERVAL_MINUTES', '0'))
+DIGEST_MAX_ITEMS = int(os.getenv('DIGEST_MAX_ITEMS', '100'))  # 保留する最大件数
+DIGEST_FILE = os.getenv('DIGEST_FILE', 'switch2_digest.json')  # ローカルの保存先
+GCS_DIGEST_FILE = os.getenv('GCS_DIGEST_FILE', 'switch2_digest.json')  # GCS上の保存先
 
 # 監視対象URL
 TARGET_URL = os.getenv(
     'TARGET_URL',
     'https://store-jp.nintendo.com/'
 )
+# 一緒に監視するURL（カンマ区切り、アイテムは TARGET_URL のものとまとめて通知）
+EXTRA_TARGET_URLS = [url.strip() for url in os.getenv('EXTRA_TARGET_URLS', '').split(',') if url.strip()]
 
 # 監視キーワード（これらのキーワードを含むコンテンツを検出）
 WATCH_KEYWORDS = [
@@ -32,11 +94,111 @@ WATCH_KEYWORDS = [
     '申し込み',
 ]
 
+# 正規化設定（ハッシュ・差分判定の前に揮発的な内容を取り除く）
+# テキストから削除する正規表現（秒まで含む更新日時、カウントダウン表示など）
+NORMALIZE_SCRUB_PATTERNS = [
+    r'\d{4}[/-]\d{1,2}[/-]\d{1,2}[ T]\d{1,2}:\d{2}:\d{2}',
+    r'(?:残り|あと)\s*\d+\s*(?:日|時間|分|秒)(?:\s*\d+\s*(?:時間|分|秒))*',
+]
+# URLから削除するクエリパラメータ（ワイルドカード可、'*'ですべて削除）
+# 既定では計測用のパラメータだけを削除する。'v'・'t'・'_'などのキャッシュ回避用と思われる名前は
+# 商品や記事の識別に使われることもあるため、NORMALIZE_EXTRA_QUERY_PARAMS（カンマ区切り）で明示的に追加する
+# （例: _,t,ts,v,ver,cb,cache,timestamp）
+NORMALIZE_STRIP_QUERY_PARAMS = ['utm_*', 'gclid', 'fbclid', '_ga'] + [
+    param.strip() for param in os.getenv('NORMALIZE_EXTRA_QUERY_PARAMS', '').split(',') if param.strip()
+]
+# 抽出前に取り除く揮発的な要素（おすすめ枠・カルーセルなど）のCSSセレクタ
+NORMALIZE_VOLATILE_SELECTORS = [
+    '[class*="recommend"]',
+    '[class*="ranking"]',
+    '[class*="countdown"]',
+]
+NORMALIZE_UNICODE = os.getenv('NORMALIZE_UNICODE', 'True').lower() == 'true'  # NFKC正規化
+
 # 検出条件（'any': いずれか、'all': すべて）
 KEYWORD_MATCH_MODE = os.getenv('KEYWORD_MATCH_MODE', 'any')
 
 # スクレイピング設定
-REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', '30'))  # タイムアウト（秒）
+# 前回から変化したチャンク（セクション）だけを再抽出するか
+INCREMENTAL_EXTRACTION = os.getenv('INCREMENTAL_EXTRACTION', 'True').lower() == 'true'
+# 見出しのコンテキスト抽出の上限（含める兄弟要素数・たどる兄弟要素数・文字数）
+CONTEXT_MAX_SIBLINGS = int(os.getenv('CONTEXT_MAX_SIBLINGS', '2'))
+CONTEXT_MAX_NODES = int(os.getenv('CONTEXT_MAX_NODES', '10'))
+CONTEXT_MAX_CHARS = int(os.getenv('CONTEXT_MAX_CHARS', '500'))
+# 監視対象ごとの上書き（'URLの前方一致=含める兄弟要素数,たどる兄弟要素数,文字数' を ';' で区切る、空の値は上の設定）
+# 例: https://store-jp.nintendo.com/news/=3,20,1000
+CONTEXT_LIMITS = os.getenv('CONTEXT_LIMITS', '')
+# 解析バックエンド（'lxml': lxmlを直接使う高速版、'bs4': BeautifulSoupの参照実装）
+# 抽出結果は同じ（python bench_parser.py で比較できる）。lxmlで揮発的な要素を除くにはcssselectが必要
+PARSER_BACKEND = os.getenv('PARSER_BACKEND', 'lxml')
+# キーワードを一切含まないページはHTMLを解析せずに0件とする（取得した本文を直接照合）
+KEYWORD_PREFILTER = os.getenv('KEYWORD_PREFILTER', 'True').lower() == 'true'
+# 取得したページのスナップショット保存（検出の原因調査・再スキャン・差分確認用）
+# 同じ内容のページは1回だけ圧縮して保存する（zstandardがなければzlib）
+SNAPSHOT_STORE = os.getenv('SNAPSHOT_STORE', 'False').lower() == 'true'
+# 保存先ディレクトリ（Cloud Functions / Cloud Runではデプロイしたディレクトリが読み取り専用のため、一時ディレクトリを既定にする。
+# 一時ディレクトリはインスタンスごと・メモリ上のため、残しておく場合はVMやローカルで永続ディスクのパスを指定する）
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'snapshots'))
+SNAPSHOT_MAX_MB = float(os.getenv('SNAPSHOT_MAX_MB', '256'))  # 合計サイズの上限
+SNAPSHOT_MAX_AGE_DAYS = float(os.getenv('SNAPSHOT_MAX_AGE_DAYS', '14'))  # 保持日数
+SNAPSHOT_PACK_MB = float(os.getenv('SNAPSHOT_PACK_MB', '32'))  # パックファイル1つあたりのサイズ
+REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', '30'))  # 読み込みのタイムアウト（秒）
+FETCH_CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', '5'))  # 接続のタイムアウト（秒）
+# HTTP/2で取得（同じホストへのリクエストを1本の接続に多重化。httpx[http2]がない場合・非対応のホストはHTTP/1.1）
+FETCH_HTTP2 = os.getenv('FETCH_HTTP2', 'True').lower() == 'true'
+FETCH_MAX_CONNECTIONS = int(os.getenv('FETCH_MAX_CONNECTIONS', '8'))  # 同時に取得するリクエスト数の上限
+# ページ取得のリトライ（ジッター付き指数バックオフ、実行の期限内に収まる場合だけリトライする）
+FETCH_MAX_ATTEMPTS = int(os.getenv('FETCH_MAX_ATTEMPTS', '3'))  # 最大試行回数
+FETCH_BACKOFF_BASE = float(os.getenv('FETCH_BACKOFF_BASE', '0.5'))  # 1回目のリトライまでの待ち時間の上限（秒）
+FETCH_BACKOFF_MAX = float(os.getenv('FETCH_BACKOFF_MAX', '8'))  # 待ち時間の上限（秒）
+
+# ヘッジリクエスト（1回目の応答が最近の応答時間のパーセンタイルを過ぎても返らない場合に2回目を送る）
+FETCH_HEDGING = os.getenv('FETCH_HEDGING', 'False').lower() == 'true'
+FETCH_HEDGE_PERCENTILE = float(os.getenv('FETCH_HEDGE_PERCENTILE', '95'))  # 2回目を送るまでの待ち時間
+FETCH_HEDGE_MIN_SAMPLES = int(os.getenv('FETCH_HEDGE_MIN_SAMPLES', '10'))  # ヘッジを始めるまでの記録数
+FETCH_HEDGE_MAX_RATIO = float(os.getenv('FETCH_HEDGE_MAX_RATIO', '0.1'))  # 追加のリクエスト数の上限（割合）
+
+# ホストごとのアクセス間隔の制御（403・429・503を受けたら間隔を倍々に広げ、成功するたびに少しずつ戻す）
+# ホストの状態は状態と同じ種類のバックエンドに保存し（HOST_HEALTH_PERSIST）、制限中は期限内に待ちきれなければ取得を見送る
+HOST_POLITENESS = os.getenv('HOST_POLITENESS', 'True').lower() == 'true'
+HOST_MIN_INTERVAL = float(os.getenv('HOST_MIN_INTERVAL', '1'))  # 同じホストへのリクエストの最小間隔（秒）
+HOST_MAX_INTERVAL = float(os.getenv('HOST_MAX_INTERVAL', '600'))  # 間隔の上限（秒）
+HOST_BACKOFF_FACTOR = float(os.getenv('HOST_BACKOFF_FACTOR', '2'))  # 制限を受けたときに間隔に掛ける倍率
+HOST_RECOVERY_STEP = float(os.getenv('HOST_RECOVERY_STEP', '10'))  # 成功するたびに間隔から引く秒数
+HOST_HEALTH_FILE = os.getenv('HOST_HEALTH_FILE', 'switch2_host_health.json')  # ローカルの保存先
+GCS_HOST_HEALTH_FILE = os.getenv('GCS_HOST_HEALTH_FILE', 'switch2_host_health.json')  # GCS上の保存先
+
+# 探索クロール（監視ページのキーワードに一致するリンクをたどり、キーワードを含む新しいページを監視対象に追加）
+# たどったURL・持ち越したURL・追加した監視対象は状態と同じ種類のバックエンドに保存し、毎回は差分だけを取得する
+DISCOVERY_CRAWL = os.getenv('DISCOVERY_CRAWL', 'False').lower() == 'true'
+DISCOVERY_MAX_DEPTH = int(os.getenv('DISCOVERY_MAX_DEPTH', '2'))  # 監視ページから何階層までたどるか
+DISCOVERY_MAX_PAGES = int(os.getenv('DISCOVERY_MAX_PAGES', '10'))  # 1回の実行で取得するページ数の上限
+DISCOVERY_CONCURRENCY = int(os.getenv('DISCOVERY_CONCURRENCY', '4'))  # 同時に取得するページ数の上限
+DISCOVERY_MAX_TARGETS = int(os.getenv('DISCOVERY_MAX_TARGETS', '10'))  # 追加する監視対象の上限
+DISCOVERY_MAX_ATTEMPTS = int(os.getenv('DISCOVERY_MAX_ATTEMPTS', '3'))  # 取得に失敗したページを取得し直す回数の上限
+DISCOVERY_SITEMAP_URL = os.getenv('DISCOVERY_SITEMAP_URL', '')  # sitemap.xml のURL（空の場合は読み込まない）
+DISCOVERY_SITEMAP_INTERVAL_MINUTES = float(os.getenv('DISCOVERY_SITEMAP_INTERVAL_MINUTES', '60'))  # 読み込み直す間隔（分）
+DISCOVERY_FILE = os.getenv('DISCOVERY_FILE', 'switch2_discovery.json')  # ローカルの保存先
+GCS_DISCOVERY_FILE = os.getenv('GCS_DISCOVERY_FILE', 'switch2_discovery.json')  # GCS上の保存先
+
+# シャードに分けた分散実行（''で無効、'coordinator'、'worker'）
+# コーディネーターは監視対象のURLを SHARD_COUNT 個のシャードに分けて作業メッセージを送り、報告を待ってまとめて通知する
+# ワーカーはシャードのURLをスキャンしてシャードの状態に保存し、結果を報告する
+SHARD_MODE = os.getenv('SHARD_MODE', '')
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '4'))
+SHARD_QUEUE = os.getenv('SHARD_QUEUE', 'local')  # 'local'（同じプロセス内）、'file'、'pubsub'
+SHARD_QUEUE_DIR = os.getenv('SHARD_QUEUE_DIR', 'switch2_queue')  # fileのキューのディレクトリ
+PUBSUB_PROJECT_ID = os.getenv('PUBSUB_PROJECT_ID', '')  # pubsubのキューのプロジェクトID
+SHARD_WORK_TOPIC = os.getenv('SHARD_WORK_TOPIC', 'switch2-shard-work')  # 作業メッセージのトピック
+SHARD_RESULT_TOPIC = os.getenv('SHARD_RESULT_TOPIC', 'switch2-shard-results')  # 報告のトピック
+SHARD_WAIT_SECONDS = float(os.getenv('SHARD_WAIT_SECONDS', '30'))  # コーディネーターが報告を待つ秒数の上限
+SHARD_STATE_FILE = os.getenv('SHARD_STATE_FILE', 'switch2_shard_{shard}.json')  # ローカルの保存先
+GCS_SHARD_STATE_FILE = os.getenv('GCS_SHARD_STATE_FILE', 'switch2_shard_{shard}.json')  # GCS上の保存先
+
+# 1回の実行の期限（秒、0以下で無効）。Cloud Functionsのタイムアウト（--timeout 60s）より短くする
+# 最後の DEADLINE_RESERVE_SECONDS 秒は状態の保存と通知のために残し、取得・解析はその手前で打ち切る
+RUN_DEADLINE_SECONDS = float(os.getenv('RUN_DEADLINE_SECONDS', '55'))
+DEADLINE_RESERVE_SECONDS = float(os.getenv('DEADLINE_RESERVE_SECONDS', '10'))
 USER_AGENT = os.getenv(
     'USER_AGENT',
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
@@ -50,6 +212,65 @@ GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', '')
 GCS_STATE_FILE = os.getenv('GCS_STATE_FILE', 'switch2_lottery_state.json')
 USE_CLOUD_STORAGE = os.getenv('USE_CLOUD_STORAGE', 'False').lower() == 'true'
 
+# 状態バックエンド（'auto': USE_CLOUD_STORAGEに応じてgcs/json、'json'、'gcs'、'sqlite'）
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'auto')
+STATE_DB_FILE = os.getenv('STATE_DB_FILE', 'switch2_state.db')  # SQLiteバックエンドのデータベースファイル
+
+# 状態をGCSに保存するか（状態とは別に保存するストアの既定値に使用）
+_STATE_ON_GCS = STATE_BACKEND == 'gcs' or (
+    STATE_BACKEND in ('auto', '') and USE_CLOUD_STORAGE and bool(GCS_BUCKET_NAME)
+)
+# 状態とは別に保存するストアを保存先に書くか（GCSでは実行ごとに読み書きが1往復ずつ増えるため、
+# 既定では保存せず同じインスタンスの実行間でメモリ上に保持するだけにする）
+_SIDE_STORE_PERSIST_DEFAULT = 'False' if _STATE_ON_GCS else 'True'
+
+# アイテム履歴・変更ログ（消えて再出現したアイテムを新規として再通知しない）
+TRACK_HISTORY = os.getenv('TRACK_HISTORY', 'True').lower() == 'true'
+HISTORY_MAX_EVENTS = int(os.getenv('HISTORY_MAX_EVENTS', '1000'))  # 変更ログの最大件数
+HISTORY_MAX_AGE_DAYS = int(os.getenv('HISTORY_MAX_AGE_DAYS', '30'))  # 変更ログ・履歴の保持日数
+
+# 通知の重複防止（状態のリセット後や再出現時に、TTL内は同じアイテムを再通知しない）
+NOTIFY_DEDUP = os.getenv('NOTIFY_DEDUP', 'True').lower() == 'true'
+NOTIFY_DEDUP_TTL_HOURS = float(os.getenv('NOTIFY_DEDUP_TTL_HOURS', '24'))  # 通知済みとして扱う時間
+NOTIFY_DEDUP_MAX_ENTRIES = int(os.getenv('NOTIFY_DEDUP_MAX_ENTRIES', '5000'))  # 送信先ごとの最大件数
+NOTIFY_DEDUP_FILE = os.getenv('NOTIFY_DEDUP_FILE', 'switch2_notified.json')  # ローカルの保存先
+GCS_NOTIFY_DEDUP_FILE = os.getenv('GCS_NOTIFY_DEDUP_FILE', 'switch2_notified.json')  # GCS上の保存先
+# ホストの状態（HOST_POLITENESS）を保存先に書くか（状態がGCSの場合は既定でFalse、メモリ上のみ）
+HOST_HEALTH_PERSIST = os.getenv('HOST_HEALTH_PERSIST', _SIDE_STORE_PERSIST_DEFAULT).lower() == 'true'
+# 通知済みキャッシュを保存先に書くか（状態がGCSの場合は既定でFalse、メモリ上のみ）
+NOTIFY_DEDUP_PERSIST = os.getenv('NOTIFY_DEDUP_PERSIST', _SIDE_STORE_PERSIST_DEFAULT).lower() == 'true'
+
+# 購読者ごとのキーワード（LINEのユーザーID・グループIDごとにキーワード・マッチモード・対象のURLを登録）
+# ページの抽出は全購読者と WATCH_KEYWORDS の和集合で1回だけ行い、新しいアイテムを購読者ごとに振り分けてLINEで通知する
+SUBSCRIPTIONS = os.getenv('SUBSCRIPTIONS', 'False').lower() == 'true'
+SUBSCRIPTIONS_FILE = os.getenv('SUBSCRIPTIONS_FILE', 'switch2_subscriptions.json')  # ローカルの保存先
+GCS_SUBSCRIPTIONS_FILE = os.getenv('GCS_SUBSCRIPTIONS_FILE', 'switch2_subscriptions.json')  # GCS上の保存先
+
+# 状態のwrite-behind設定（デーモン・ウォームインスタンス向け）
+# 有効時は状態をメモリに保持し、バックエンドへの書き込みをまとめて非同期に行う
+STATE_WRITE_BEHIND = os.getenv('STATE_WRITE_BEHIND', 'False').lower() == 'true'
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', '5'))  # フラッシュ間隔（秒）
+# 先行書き込みログ（空の場合は STATE_FILE + .wal）
+# WALは常にローカルディスクに書き込む。クラッシュ後に復元できるのは同じディスクで再起動した場合（ローカル・VM・デーモン）だけで、
+# Cloud Functions / Cloud Runではインスタンスとともに消えるため、フラッシュ前の状態は失われる
+STATE_WAL_FILE = os.getenv('STATE_WAL_FILE', '')
+
+# デーモンモードのポーリング間隔（秒）
+POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', '60'))
+
+# 1つのインスタンスで複数のリクエストを同時に処理する場合の設定（Cloud Runの --concurrency 2以上、python main.py --serve）
+# SINGLE_FLIGHT有効時は同じ監視対象への同時のスキャンを1回にまとめ、実行中のスキャンの結果を後から来たリクエストにも返す
+SINGLE_FLIGHT = os.getenv('SINGLE_FLIGHT', 'True').lower() == 'true'
+SERVE_PORT = int(os.getenv('PORT', '8080'))  # --serve で待ち受けるポート（Cloud Runと同じくPORT）
+
+# 販売の時間帯（カンマ区切りの「開始時刻[/継続時間（分）]」、例: 2025-11-18T11:00+09:00/60）
+# デーモンは開始の WARMUP_LEAD_SECONDS 秒前に名前解決・接続・状態の読み込みなどを済ませ、開始時刻ちょうどに監視する
+# Cloud Functionsでは開始の少し前に ?warmup=true で呼び出す
+SALE_WINDOWS = os.getenv('SALE_WINDOWS', '')
+SALE_WINDOW_DURATION_MINUTES = float(os.getenv('SALE_WINDOW_DURATION_MINUTES', '60'))  # 継続時間の既定値（分）
+WARMUP_LEAD_SECONDS = float(os.getenv('WARMUP_LEAD_SECONDS', '45'))  # 開始の何秒前に事前準備を行うか
+DNS_CACHE_TTL = float(os.getenv('DNS_CACHE_TTL', '300'))  # 事前準備で有効にする名前解決のキャッシュ（秒、0で無効）
+
 # ログレベル
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
@@ -61,11 +282,18 @@ def validate_config():
     """設定のバリデーション"""
     errors = []
 
-    if not LINE_CHANNEL_ACCESS_TOKEN:
-        errors.append("LINE_CHANNEL_ACCESS_TOKENが設定されていません")
+    other_channels = WEBHOOK_URL or SLACK_WEBHOOK_URL or DISCORD_WEBHOOK_URL or (SMTP_HOST and EMAIL_TO)
 
-    if not LINE_USER_ID and not LINE_GROUP_ID:
-        errors.append("LINE_USER_IDまたはLINE_GROUP_IDのいずれかを設定してください")
+    # LINE以外のチャネルが設定されている場合、LINEは任意
+    if LINE_CHANNEL_ACCESS_TOKEN or not other_channels:
+        if not LINE_CHANNEL_ACCESS_TOKEN:
+            errors.append("LINE_CHANNEL_ACCESS_TOKENが設定されていません")
+
+        if not LINE_USER_ID and not LINE_GROUP_ID:
+            errors.append("LINE_USER_IDまたはLINE_GROUP_IDのいずれかを設定してください")
+
+    if SMTP_HOST and EMAIL_TO and not EMAIL_FROM:
+        errors.append("メール通知にはEMAIL_FROMを設定してください")
 
     if not TARGET_URL:
         errors.append("TARGET_URLが設定されていません")
@@ -76,6 +304,57 @@ def validate_config():
     if KEYWORD_MATCH_MODE not in ['any', 'all']:
         errors.append("KEYWORD_MATCH_MODEは'any'または'all'を指定してください")
 
+    if NOTIFICATION_FORMAT not in ['text', 'flex']:
+        errors.append("NOTIFICATION_FORMATは'text'または'flex'を指定してください")
+
+    if PARSER_BACKEND not in ['bs4', 'lxml']:
+        errors.append("PARSER_BACKENDは'bs4'または'lxml'を指定してください")
+
+    if FETCH_MAX_ATTEMPTS < 1:
+        errors.append("FETCH_MAX_ATTEMPTSは1以上を指定してください")
+
+    if not 0 < FETCH_HEDGE_PERCENTILE <= 100:
+        errors.append("FETCH_HEDGE_PERCENTILEは0より大きく100以下を指定してください")
+
+    if HOST_BACKOFF_FACTOR < 1:
+        errors.append("HOST_BACKOFF_FACTORは1以上を指定してください")
+
+    if SHARD_MODE not in ['', 'coordinator', 'worker']:
+        errors.append("SHARD_MODEは''、'coordinator'、'worker'のいずれかを指定してください")
+
+    if SHARD_MODE and SHARD_QUEUE not in ['local', 'file', 'pubsub']:
+        errors.append("SHARD_QUEUEは'local'、'file'、'pubsub'のいずれかを指定してください")
+
+    if SHARD_MODE and SHARD_QUEUE == 'pubsub' and not PUBSUB_PROJECT_ID:
+        errors.append("SHARD_QUEUE=pubsubにはPUBSUB_PROJECT_IDを設定してください")
+
+    if SHARD_COUNT < 1:
+        errors.append("SHARD_COUNTは1以上を指定してください")
+
+    if SUBSCRIPTIONS and not LINE_CHANNEL_ACCESS_TOKEN:
+        errors.append("購読者への通知（SUBSCRIPTIONS）にはLINE_CHANNEL_ACCESS_TOKENを設定してください")
+
+    if DISCOVERY_CRAWL and (DISCOVERY_MAX_DEPTH < 1 or DISCOVERY_CONCURRENCY < 1):
+        errors.append("DISCOVERY_MAX_DEPTH・DISCOVERY_CONCURRENCYは1以上を指定してください")
+
+    try:
+        from warmup import parse_sale_windows
+        parse_sale_windows(SALE_WINDOWS)
+    except ValueError as e:
+        errors.append(str(e))
+
+    try:
+        from scraper import parse_context_limits
+        parse_context_limits(CONTEXT_LIMITS)
+    except ValueError as e:
+        errors.append(str(e))
+
+    if RUN_DEADLINE_SECONDS > 0 and DEADLINE_RESERVE_SECONDS >= RUN_DEADLINE_SECONDS:
+        errors.append("DEADLINE_RESERVE_SECONDSはRUN_DEADLINE_SECONDSより短くしてください")
+
+    if STATE_BACKEND not in ['auto', 'json', 'gcs', 'sqlite']:
+        errors.append("STATE_BACKENDは'auto'、'json'、'gcs'、'sqlite'のいずれかを指定してください")
+
     if errors:
         error_message = "\n".join(f"- {error}" for error in errors)
         raise ValueError(f"設定エラー:\n{error_message}")
@@ -89,8 +368,12 @@ if __name__ == '__main__':
     print(f"LINE_GROUP_ID: {'設定済み' if LINE_GROUP_ID else '未設定'}")
     print(f"監視キーワード数: {len(WATCH_KEYWORDS)}")
     print(f"キーワードマッチモード: {KEYWORD_MATCH_MODE}")
+    print(f"PARSER_BACKEND: {PARSER_BACKEND}")
     print(f"REQUEST_TIMEOUT: {REQUEST_TIMEOUT}秒")
+    print(f"RUN_DEADLINE_SECONDS: {RUN_DEADLINE_SECONDS}秒（保存・通知用に{DEADLINE_RESERVE_SECONDS}秒）")
     print(f"STATE_FILE: {STATE_FILE}")
+    print(f"STATE_BACKEND: {STATE_BACKEND}")
+    print(f"STATE_WRITE_BEHIND: {STATE_WRITE_BEHIND}")
     print(f"DEBUG_MODE: {DEBUG_MODE}")
 
     try:
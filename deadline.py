@@ -0,0 +1,157 @@
+"""
+実行の期限とリトライ方針
+1回の実行に期限を設け、取得・解析・状態保存・通知が期限内に終わるようにする
+
+期限の最後の reserve_seconds 秒は状態の保存と通知（エラー通知を含む）のために残し、
+ページの取得・解析はその手前で打ち切る。
+"""
+import math
+import random
+import time
+from typing import Callable, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """取得・解析に使える時間を使い切った場合の例外"""
+
+
+class Deadline:
+    """実行全体の期限（単調増加する時計で管理）"""
+
+    def __init__(self, seconds: Optional[float] = None, reserve_seconds: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            seconds: 期限までの秒数（Noneの場合は期限なし）
+            reserve_seconds: 状態の保存・通知のために残しておく秒数
+            clock: 時計（テスト用）
+        """
+        self.clock = clock
+        self.started = clock()
+        self.expires_at = math.inf if seconds is None else self.started + seconds
+        self.reserve_seconds = reserve_seconds
+
+    @classmethod
+    def from_config(cls) -> 'Deadline':
+        """設定ファイルの RUN_DEADLINE_SECONDS / DEADLINE_RESERVE_SECONDS から作成"""
+        import config
+        seconds = config.RUN_DEADLINE_SECONDS if config.RUN_DEADLINE_SECONDS > 0 else None
+        return cls(seconds, reserve_seconds=config.DEADLINE_RESERVE_SECONDS)
+
+    def elapsed(self) -> float:
+        """開始からの経過秒数"""
+        return self.clock() - self.started
+
+    def remaining(self) -> float:
+        """期限までの残り秒数（期限なしの場合はinf）"""
+        return max(0.0, self.expires_at - self.clock())
+
+    def work_remaining(self) -> float:
+        """取得・解析に使える残り秒数（保存・通知の分を除く）"""
+        return max(0.0, self.remaining() - self.reserve_seconds)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def work_expired(self) -> bool:
+        return self.work_remaining() <= 0
+
+    def cap(self, seconds: float, reserve: bool = True) -> float:
+        """
+        タイムアウトなどの秒数を残り時間で切り詰める
+
+        Args:
+            seconds: 本来の秒数
+            reserve: 保存・通知の分を除いた残り時間で切り詰めるか
+
+        Returns:
+            切り詰めた秒数
+        """
+        return min(seconds, self.work_remaining() if reserve else self.remaining())
+
+    def check(self, stage: str):
+        """
+        取得・解析に使える時間が残っているか確認
+
+        Args:
+            stage: 処理の名前（ログ・例外のメッセージ用）
+
+        Raises:
+            DeadlineExceeded: 残り時間がない場合
+        """
+        if self.work_expired():
+            raise DeadlineExceeded(f"{stage}の時点で実行の期限に達しました（経過 {self.elapsed():.1f}秒）")
+
+
+class RetryPolicy:
+    """ジッター付き指数バックオフのリトライ方針"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 min_attempt_seconds: float = 1.0):
+        """
+        Args:
+            max_attempts: 最大試行回数
+            base_delay: 1回目のリトライまでの待ち時間の上限（秒、以降2倍ずつ）
+            max_delay: 待ち時間の上限（秒）
+            min_attempt_seconds: 試行を始めるのに必要な最小の残り時間（秒）
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_seconds = min_attempt_seconds
+
+    def backoff(self, attempt: int) -> float:
+        """
+        attempt回目（0始まり）の失敗後の待ち時間（full jitter: 0〜上限の一様乱数）
+
+        Args:
+            attempt: 失敗した試行の番号
+
+        Returns:
+            待ち時間（秒）
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def wait_before_retry(self, attempt: int, deadline: Deadline) -> bool:
+        """
+        次の試行まで待つ（待った後に試行する時間が残らない場合は待たない）
+
+        Args:
+            attempt: 失敗した試行の番号（0始まり）
+            deadline: 実行の期限
+
+        Returns:
+            次の試行を行う場合True
+        """
+        if attempt + 1 >= self.max_attempts:
+            return False
+
+        delay = self.backoff(attempt)
+        if deadline.work_remaining() - delay < self.min_attempt_seconds:
+            logger.warning("実行の期限が近いため、リトライを中止します")
+            return False
+
+        if delay > 0:
+            logger.info(f"{delay:.2f}秒後にリトライします")
+            time.sleep(delay)
+        return True
+
+
+def main():
+    """テスト用のメイン関数"""
+    policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=8.0)
+    for attempt in range(5):
+        upper = min(policy.max_delay, policy.base_delay * 2 ** attempt)
+        print(f"試行{attempt + 1}の失敗後: 0〜{upper:.1f}秒（例: {policy.backoff(attempt):.2f}秒）")
+
+    deadline = Deadline(60, reserve_seconds=10)
+    print(f"\n残り: {deadline.remaining():.1f}秒, 取得・解析に使える時間: {deadline.work_remaining():.1f}秒")
+    print(f"読み込みタイムアウト30秒 → {deadline.cap(30):.1f}秒")
+
+
+if __name__ == '__main__':
+    main()
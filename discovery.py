@@ -0,0 +1,525 @@
+"""
+キーワードに一致するリンクをたどる探索クロール
+監視ページから抽出したリンク（キーワードに一致するもの）を設定した深さまでたどり、キーワードを含む
+新しいページ（別の抽選・招待販売の告知ページなど）を見つけたら監視対象に追加する
+
+実行のたびにサイト全体をたどると重いため、探索は差分で行う:
+    - 一度たどったURLは、正規化したURLの64ビットのフィンガープリントを並べた小さな索引で覚えておき、
+      再び取得しない（1URLあたり16バイト）
+    - sitemap.xml は lastmod が前回より新しいページだけを取得し直す
+      （初めて読み込んだときは lastmod を記録するだけで、ページは取得しない）
+    - 1回の実行で取得するページ数に上限を設け、残りは次回の実行に持ち越す
+"""
+import base64
+import gzip
+import io
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+import logging
+
+from deadline import Deadline
+from fingerprint import fingerprint
+from http_client import FetchError, HttpClient
+from normalizer import get_default_normalizer
+from scraper import Switch2Scraper, fetch_pages
+from state_backends import StateBackend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 取得してもHTMLではないためたどらない拡張子
+SKIP_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.pdf', '.zip', '.mp4', '.css', '.js')
+
+# sitemap.xml の展開後の上限（仕様上の上限は50MB）
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+
+
+def canonical_url(url: str) -> str:
+    """
+    既読の判定に使う正規化したURL（キャッシュ回避用のパラメータ・フラグメントを除き、ホスト名を小文字に）
+
+    Args:
+        url: 対象のURL
+
+    Returns:
+        正規化後のURL
+    """
+    parts = urlsplit(get_default_normalizer().normalize_url(url.strip()))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+
+class SeenUrlIndex:
+    """
+    たどったURLの索引
+
+    正規化したURLのフィンガープリントを昇順に並べた配列と、同じ順序の lastmod の配列で保持し、
+    二分探索で引く。追加分は辞書に溜めておき、保存時にまとめて並べ直す。
+    """
+
+    def __init__(self):
+        self._keys = array('Q')
+        self._lastmods = array('q')
+        self._pending: Dict[int, int] = {}
+
+    @staticmethod
+    def key_of(url: str) -> int:
+        return fingerprint(canonical_url(url))
+
+    def _position(self, key: int) -> int:
+        index = bisect_left(self._keys, key)
+        return index if index < len(self._keys) and self._keys[index] == key else -1
+
+    def __contains__(self, url: str) -> bool:
+        key = self.key_of(url)
+        return key in self._pending or self._position(key) >= 0
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._pending)
+
+    def get_lastmod(self, url: str) -> Optional[int]:
+        """
+        記録済みの lastmod
+
+        Returns:
+            UNIX時間（lastmodがない場合は0、未登録の場合はNone）
+        """
+        key = self.key_of(url)
+        if key in self._pending:
+            return self._pending[key]
+        index = self._position(key)
+        return self._lastmods[index] if index >= 0 else None
+
+    def add(self, url: str, lastmod: int = 0) -> bool:
+        """
+        URLを登録（登録済みの場合は lastmod を更新）
+
+        Args:
+            url: 対象のURL
+            lastmod: 最終更新時刻（UNIX時間、不明な場合は0）
+
+        Returns:
+            新しく登録した場合True
+        """
+        key = self.key_of(url)
+        index = self._position(key)
+        if index >= 0:
+            self._lastmods[index] = lastmod
+            return False
+        is_new = key not in self._pending
+        self._pending[key] = lastmod
+        return is_new
+
+    def _merge(self):
+        if not self._pending:
+            return
+        merged = dict(zip(self._keys, self._lastmods))
+        merged.update(self._pending)
+        keys = sorted(merged)
+        self._keys = array('Q', keys)
+        self._lastmods = array('q', (merged[key] for key in keys))
+        self._pending = {}
+
+    def to_state(self) -> Dict[str, str]:
+        """保存用の辞書（リトルエンディアンのバイト列をBase64で）"""
+        self._merge()
+        keys, lastmods = array('Q', self._keys), array('q', self._lastmods)
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            lastmods.byteswap()
+        return {
+            'keys': base64.b64encode(keys.tobytes()).decode('ascii'),
+            'lastmods': base64.b64encode(lastmods.tobytes()).decode('ascii')
+        }
+
+    @classmethod
+    def from_state(cls, data: Optional[Dict]) -> 'SeenUrlIndex':
+        index = cls()
+        if not data:
+            return index
+        index._keys.frombytes(base64.b64decode(data.get('keys', '')))
+        index._lastmods.frombytes(base64.b64decode(data.get('lastmods', '')))
+        if sys.byteorder == 'big':
+            index._keys.byteswap()
+            index._lastmods.byteswap()
+        if len(index._keys) != len(index._lastmods):
+            logger.warning("探索済みURLの索引が壊れているため作り直します")
+            return cls()
+        return index
+
+
+def _parse_lastmod(value: Optional[str]) -> int:
+    if not value:
+        return 0
+    try:
+        when = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return 0
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return int(when.timestamp())
+
+
+def parse_sitemap(body: bytes) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+    """
+    sitemap.xml（gzip圧縮も可）を解析
+
+    Args:
+        body: sitemap.xml の本文
+
+    Returns:
+        (ページのリスト, 子サイトマップのリスト)（それぞれ (URL, lastmodのUNIX時間) のリスト）
+
+    Raises:
+        ValueError: XMLとして解析できない場合
+    """
+    if body[:2] == b'\x1f\x8b':
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as stream:
+            body = stream.read(MAX_SITEMAP_BYTES + 1)
+    if len(body) > MAX_SITEMAP_BYTES:
+        raise ValueError('sitemap.xml が大きすぎます')
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError as e:
+        raise ValueError(f"sitemap.xml を解析できません: {e}")
+
+    pages, sitemaps = [], []
+    for entry in root:
+        tag = entry.tag.rsplit('}', 1)[-1]
+        if tag not in ('url', 'sitemap'):
+            continue
+        loc = lastmod = None
+        for child in entry:
+            name = child.tag.rsplit('}', 1)[-1]
+            if name == 'loc':
+                loc = (child.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = child.text
+        if loc:
+            (pages if tag == 'url' else sitemaps).append((loc, _parse_lastmod(lastmod)))
+    return pages, sitemaps
+
+
+class DiscoveryCrawler:
+    """監視ページからリンクをたどって新しいページを見つけ、監視対象に追加するクラス"""
+
+    def __init__(self, backend: Optional[StateBackend], scraper_factory: Callable[[str], Switch2Scraper],
+                 http_client: HttpClient, allowed_hosts: Iterable[str], max_depth: int = 2,
+                 max_pages: int = 20, concurrency: int = 4, max_targets: int = 20, root_urls: Iterable[str] = (),
+                 sitemap_url: str = '', sitemap_interval_seconds: float = 3600.0, max_sitemaps: int = 10,
+                 max_attempts: int = 3, timeout: Tuple[float, float] = (5.0, 30.0),
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            backend: 探索の状態（既読URLの索引・持ち越したURL・追加した監視対象）の保存先
+                    （Noneの場合はメモリ上のみ）
+            scraper_factory: URLからそのページ用のスクレイパーを作成する関数
+            http_client: sitemap.xml の取得に使うHTTPクライアント
+            allowed_hosts: たどるホスト名（これ以外のホストへのリンクはたどらない）
+            max_depth: 監視ページから何階層までたどるか
+            max_pages: 1回の実行で取得するページ数の上限（残りは次回に持ち越す）
+            concurrency: 同時に取得するページ数の上限
+            max_targets: 追加する監視対象の上限
+            root_urls: 監視中のページのURL（監視対象には追加しない）
+            sitemap_url: sitemap.xml のURL（空の場合は読み込まない）
+            sitemap_interval_seconds: sitemap.xml を読み込み直す間隔（秒）
+            max_sitemaps: 1回の実行で読み込む子サイトマップの上限
+            max_attempts: 取得に失敗したページを取得し直す回数の上限（失敗したページは次回の実行で取得し直す）
+            timeout: (接続のタイムアウト, 読み込みのタイムアウト)（秒）
+            clock: 時計（UNIX時間、テスト用）
+        """
+        self.backend = backend
+        self.scraper_factory = scraper_factory
+        self.http_client = http_client
+        self.allowed_hosts = {host.lower() for host in allowed_hosts}
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = max(1, concurrency)
+        self.max_targets = max_targets
+        self.root_urls = list(root_urls)
+        self.sitemap_url = sitemap_url
+        self.sitemap_interval_seconds = sitemap_interval_seconds
+        self.max_sitemaps = max_sitemaps
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self.clock = clock
+
+        self._index = SeenUrlIndex()
+        self._frontier: Deque[Tuple[str, int]] = deque()
+        self._queued = set()
+        self._failures: Dict[str, int] = {}  # 取得に失敗したURLと失敗した回数
+        self._targets: Dict[str, Dict] = {}
+        self._sitemap = {'fetched_at': 0.0, 'ready': False}
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.backend is not None:
+            data = self.backend.load() or {}
+            self._index = SeenUrlIndex.from_state(data.get('index'))
+            self._frontier = deque((url, depth) for url, depth in data.get('frontier', []))
+            self._queued = {url for url, _ in self._frontier}
+            self._failures = dict(data.get('failures', {}))
+            self._targets = {target['url']: dict(target) for target in data.get('targets', [])}
+            self._sitemap.update(data.get('sitemap', {}))
+        # 監視中のページはリンクを見つけてもたどらない
+        for url in self.root_urls:
+            if self._index.get_lastmod(url) is None:
+                self._index.add(url)
+
+    def targets(self) -> List[str]:
+        """追加した監視対象のURL（見つけた順）"""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._targets)
+
+    def should_follow(self, url: str) -> bool:
+        """たどる対象のURLか（同じホストのHTMLページだけをたどる）"""
+        parts = urlsplit(url)
+        return (parts.scheme in ('http', 'https')
+                and parts.netloc.lower() in self.allowed_hosts
+                and not parts.path.lower().endswith(SKIP_EXTENSIONS))
+
+    def _enqueue(self, url: str, depth: int, lastmod: int = 0, recrawl: bool = False) -> bool:
+        # 既読のURLは、sitemap.xml で更新されたもの（recrawl）以外は取得しない
+        if url in self._queued or not self.should_follow(url):
+            return False
+        if not recrawl and self._index.get_lastmod(url) is not None:
+            return False
+        self._index.add(url, lastmod)
+        self._frontier.append((url, depth))
+        self._queued.add(url)
+        self._dirty = True
+        return True
+
+    def _fetch_sitemap(self, url: str, deadline: Optional[Deadline]) -> Optional[Tuple[list, list]]:
+        try:
+            response = self.http_client.get(url, self.timeout, deadline)
+            return parse_sitemap(response.body)
+        except (FetchError, ValueError) as e:
+            logger.warning(f"sitemap.xml の読み込みに失敗: {url}（{e}）")
+            return None
+
+    def _ingest_sitemap(self, deadline: Optional[Deadline]) -> int:
+        # lastmodが前回より新しいページを取得対象に加える（初回は記録のみ）
+        now = self.clock()
+        if not self.sitemap_url or now - self._sitemap['fetched_at'] < self.sitemap_interval_seconds:
+            return 0
+
+        ready = self._sitemap['ready']
+        queued = 0
+        sitemaps = deque([(self.sitemap_url, 0)])
+        fetched_sitemaps = 0
+        complete = True
+        while sitemaps:
+            url, lastmod = sitemaps.popleft()
+            if fetched_sitemaps >= self.max_sitemaps or (deadline is not None and deadline.work_expired()):
+                complete = False
+                break
+            parsed = self._fetch_sitemap(url, deadline)
+            fetched_sitemaps += 1
+            if parsed is None:
+                complete = False
+                continue
+            self._index.add(url, lastmod)
+            pages, children = parsed
+            for child_url, child_lastmod in children:
+                previous = self._index.get_lastmod(child_url)
+                if previous is None or child_lastmod > previous or not child_lastmod:
+                    sitemaps.append((child_url, child_lastmod))
+            for page_url, page_lastmod in pages:
+                if not self.should_follow(page_url):
+                    continue
+                previous = self._index.get_lastmod(page_url)
+                if not ready:
+                    self._index.add(page_url, page_lastmod)
+                elif previous is None:
+                    queued += self._enqueue(page_url, 1, page_lastmod)
+                elif page_lastmod > previous:
+                    queued += self._enqueue(page_url, 1, page_lastmod, recrawl=True)
+
+        self._sitemap['fetched_at'] = now
+        if complete and not ready:
+            self._sitemap['ready'] = True
+            logger.info(f"sitemap.xml の lastmod を記録しました（{len(self._index)}件）")
+        self._dirty = True
+        return queued
+
+    def _visit_many(self, urls: List[str], deadline: Optional[Deadline]) -> List[Tuple[Optional[List], bool]]:
+        # ページをまとめて取得してキーワードに一致するアイテムを抽出（失敗時はNone、制限中かどうか）
+        scrapers = [self.scraper_factory(url) for url in urls]
+        results = []
+        for url, scraper, fetched in zip(urls, scrapers, fetch_pages(scrapers, deadline, max_retries=1)):
+            if not fetched.html:
+                logger.warning(f"探索先の取得に失敗: {url}（{fetched.error}）")
+                results.append((None, fetched.throttled))
+            else:
+                results.append((scraper.extract_relevant_content(fetched.html), False))
+        return results
+
+    def _promote(self, url: str, depth: int, items: List):
+        if url in self._targets or url in self.root_urls or len(self._targets) >= self.max_targets:
+            return False
+        self._targets[url] = {
+            'url': url,
+            'depth': depth,
+            'title': items[0].get('title', ''),
+            'discovered_at': datetime.now(timezone.utc).isoformat()
+        }
+        logger.info(f"監視対象に追加: {url}（{items[0].get('title', '')}）")
+        return True
+
+    def crawl(self, seed_urls: Iterable[str], deadline: Optional[Deadline] = None) -> Dict:
+        """
+        探索を1回分進める
+
+        Args:
+            seed_urls: 監視ページで見つかったリンクのURL（深さ1として扱う）
+            deadline: 実行の期限（取得できる時間が残っていなければ持ち越す）
+
+        Returns:
+            結果の辞書（fetched, queued, promoted, pending, retrying, seen）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            queued = sum(self._enqueue(url, 1) for url in seed_urls)
+            queued += self._ingest_sitemap(deadline)
+
+            fetched = 0
+            promoted: List[str] = []
+            retries: List[Tuple[str, int]] = []
+            throttled = False
+            while self._frontier and fetched < self.max_pages and not throttled:
+                if deadline is not None and deadline.work_remaining() < sum(self.timeout):
+                    logger.info("探索の時間が残っていないため、残りを次回に持ち越します")
+                    break
+                batch = [self._frontier.popleft()
+                         for _ in range(min(self.concurrency, self.max_pages - fetched, len(self._frontier)))]
+                results = self._visit_many([url for url, _ in batch], deadline)
+                self._dirty = True
+
+                for (url, depth), (items, was_throttled) in zip(batch, results):
+                    if was_throttled:
+                        # 制限中のホストは次回の実行で取得し直す
+                        self._frontier.appendleft((url, depth))
+                        throttled = True
+                        continue
+                    fetched += 1
+                    if items is None:
+                        # 既読の索引には登録済みのため、取得し直さないと二度とたどれなくなる
+                        if self._retry_later(url):
+                            retries.append((url, depth))
+                        continue
+                    self._queued.discard(url)
+                    self._failures.pop(url, None)
+                    if not items:
+                        continue
+                    if self._promote(url, depth, items):
+                        promoted.append(url)
+                    if depth < self.max_depth:
+                        for item in items:
+                            link = item.get('url', '')
+                            if link and link != url:
+                                queued += self._enqueue(link, depth + 1)
+
+            # 失敗したページは同じ実行では取得し直さず、次回の実行に持ち越す
+            self._frontier.extend(retries)
+
+            return {
+                'fetched': fetched,
+                'queued': queued,
+                'promoted': promoted,
+                'pending': len(self._frontier),
+                'retrying': len(retries),
+                'seen': len(self._index),
+                'targets': len(self._targets)
+            }
+
+    def _retry_later(self, url: str) -> bool:
+        # 失敗した回数を数え、上限に達していなければTrue（達した場合は諦めて既読のままにする）
+        attempts = self._failures.get(url, 0) + 1
+        if attempts < self.max_attempts:
+            self._failures[url] = attempts
+            return True
+        self._failures.pop(url, None)
+        self._queued.discard(url)
+        logger.warning(f"探索先の取得に{attempts}回失敗したため、たどるのをやめます: {url}")
+        return False
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                'seen': len(self._index),
+                'pending': len(self._frontier),
+                'targets': len(self._targets),
+                'sitemap_ready': self._sitemap['ready']
+            }
+
+    def save(self) -> bool:
+        """
+        変更があればバックエンドに保存
+
+        Returns:
+            保存成功時（変更がない場合も）True
+        """
+        with self._lock:
+            if self.backend is None or not self._dirty:
+                return True
+            data = {
+                'index': self._index.to_state(),
+                'frontier': [[url, depth] for url, depth in self._frontier],
+                'failures': dict(self._failures),
+                'targets': list(self._targets.values()),
+                'sitemap': dict(self._sitemap)
+            }
+            if self.backend.save(data):
+                self._dirty = False
+                return True
+            return False
+
+
+def main():
+    """テスト用のメイン関数（監視ページからリンクをたどり、見つかったページを表示）"""
+    import config
+
+    def scraper_factory(url: str) -> Switch2Scraper:
+        return Switch2Scraper(url, config.WATCH_KEYWORDS, config.KEYWORD_MATCH_MODE, incremental=False)
+
+    crawler = DiscoveryCrawler(
+        None, scraper_factory, scraper_factory(config.TARGET_URL).http_client,
+        allowed_hosts=[urlsplit(config.TARGET_URL).netloc], max_depth=2, max_pages=10,
+        sitemap_url=config.DISCOVERY_SITEMAP_URL
+    )
+    seed = scraper_factory(config.TARGET_URL)
+    fetched = seed.fetch()
+    if not fetched.html:
+        print(f"監視ページの取得に失敗: {fetched.error}")
+        return
+    links = [item.get('url', '') for item in seed.extract_relevant_content(fetched.html)]
+    started = time.perf_counter()
+    result = crawler.crawl([link for link in links if link != config.TARGET_URL])
+    print(f"探索: {result}（{time.perf_counter() - started:.2f}秒）")
+    for url in crawler.targets():
+        print(f"  {url}")
+
+    index = SeenUrlIndex()
+    for i in range(10000):
+        index.add(f"https://store-jp.nintendo.com/item/{i}?utm_source=x")
+    state = index.to_state()
+    print(f"索引: {len(index)}件 → {len(state['keys']) + len(state['lastmods'])}文字")
+
+
+if __name__ == '__main__':
+    main()
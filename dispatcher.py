@@ -0,0 +1,276 @@
+"""
+通知の並列配信
+設定されたすべての通知チャネルに同時に送信し、遅いチャネルが他のチャネルの通知を遅らせないようにする
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+import logging
+
+from deadline import Deadline
+from notifier import BaseNotifier
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """複数の通知チャネルへ並列に送信するクラス"""
+
+    def __init__(self, channels: List[BaseNotifier], grace_seconds: float = 2.0):
+        """
+        Args:
+            channels: 通知チャネルのリスト
+            grace_seconds: 各チャネルのタイムアウトに加える待ち時間（秒）
+        """
+        if not channels:
+            raise ValueError("通知チャネルが設定されていません")
+
+        names = [channel.name for channel in channels]
+        if len(set(names)) != len(names):
+            raise ValueError(f"通知チャネル名が重複しています: {names}")
+
+        self.channels = list(channels)
+        self.grace_seconds = grace_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def channel_names(self) -> List[str]:
+        return [channel.name for channel in self.channels]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # 実行のたびにスレッドを作らないよう、プールは初回に作成して使い回す
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=len(self.channels),
+                        thread_name_prefix='notify'
+                    )
+        return self._executor
+
+    @staticmethod
+    def _call(channel: BaseNotifier, method: str, args: tuple, kwargs: dict) -> bool:
+        try:
+            return bool(getattr(channel, method)(*args, **kwargs))
+        except Exception as e:
+            logger.exception(f"通知チャネル {channel.name} でエラー: {e}")
+            return False
+
+    def dispatch(self, method: str, *args, deadline: Optional[Deadline] = None, **kwargs) -> Dict[str, bool]:
+        """
+        すべてのチャネルで同じメソッドを並列に実行
+
+        各チャネルの結果は、そのチャネルのタイムアウト（+ grace_seconds）まで待つ。
+        実行の期限が指定された場合は、期限を過ぎて待つことはない。
+        時間内に終わらなかったチャネルは失敗として扱い、他のチャネルの結果は待たずに返す。
+
+        Args:
+            method: チャネルのメソッド名（例: 'send_lottery_notification_v2'）
+            *args, **kwargs: メソッドの引数
+            deadline: 実行の期限（省略時はチャネルのタイムアウトのみ）
+
+        Returns:
+            チャネル名と成否の辞書
+        """
+        return self._dispatch_to(self.channels, method, args, kwargs, deadline)
+
+    def _dispatch_to(self, channels: List[BaseNotifier], method: str, args: tuple, kwargs: dict,
+                     deadline: Optional[Deadline], calls: int = 1) -> Dict[str, bool]:
+        # calls: 1回の呼び出しでチャネルが順に送信する回数（待つ時間をその分延ばす）
+        executor = self._get_executor()
+        started = time.monotonic()
+        run_limit = started + deadline.remaining() if deadline is not None else None
+        futures = [
+            (channel, executor.submit(self._call, channel, method, args, kwargs))
+            for channel in channels
+        ]
+
+        results = {}
+        for channel, future in futures:
+            wait_until = started + channel.timeout * calls + self.grace_seconds
+            if run_limit is not None:
+                wait_until = min(wait_until, run_limit)
+            try:
+                results[channel.name] = future.result(timeout=max(0.0, wait_until - time.monotonic()))
+            except TimeoutError:
+                logger.warning(f"通知チャネル {channel.name} がタイムアウトしました（{channel.timeout}秒）")
+                results[channel.name] = False
+
+        elapsed = time.monotonic() - started
+        succeeded = sum(results.values())
+        logger.info(f"{len(results)}チャネルに配信しました（成功: {succeeded}件, {elapsed:.2f}秒）")
+        return results
+
+    def send_lottery_notification_v2(self, items: List[Dict],
+                                     deadline: Optional[Deadline] = None) -> Dict[str, bool]:
+        """検出通知をすべてのチャネルに送信"""
+        if not items:
+            logger.info("通知するアイテムがありません")
+            return {}
+        return self.dispatch('send_lottery_notification_v2', items, deadline=deadline)
+
+    def send_urgent_notification(self, items: List[Dict],
+                                 deadline: Optional[Deadline] = None) -> Dict[str, bool]:
+        """優先度の高いアイテムの速報をすべてのチャネルに送信"""
+        if not items:
+            return {}
+        return self.dispatch('send_urgent_notification', items, deadline=deadline)
+
+    def send_subscriber_notifications(self, batches: List[Tuple[List[Dict], List[str]]],
+                                      deadline: Optional[Deadline] = None) -> Dict[str, bool]:
+        """
+        購読者ごとの検出通知を、送信先を指定できるチャネル（LINE）に送信
+
+        Args:
+            batches: (アイテムのリスト, 送信先のリスト) のリスト
+            deadline: 実行の期限
+
+        Returns:
+            チャネル名と成否の辞書（送信先を指定できるチャネルがない場合は空）
+        """
+        channels = [channel for channel in self.channels if channel.supports_recipients]
+        if not batches:
+            return {}
+        if not channels:
+            logger.warning("送信先を指定できる通知チャネル（LINE）がないため、購読者に通知できません")
+            return {}
+        calls = max(sum(channel.request_count(recipients) for _, recipients in batches) for channel in channels)
+        return self._dispatch_to(channels, 'send_lottery_batches', (batches,), {'deadline': deadline},
+                                 deadline, calls=calls)
+
+    def send_error_notification(self, error_message: str,
+                                deadline: Optional[Deadline] = None) -> Dict[str, bool]:
+        """エラー通知をすべてのチャネルに送信"""
+        return self.dispatch('send_error_notification', error_message, deadline=deadline)
+
+    def send_test_notification(self) -> Dict[str, bool]:
+        """テスト通知をすべてのチャネルに送信"""
+        return self.dispatch('send_test_notification')
+
+    def send_status_notification(self, status: str, details: str = "") -> Dict[str, bool]:
+        """ステータス通知をすべてのチャネルに送信"""
+        return self.dispatch('send_status_notification', status, details)
+
+    def warm_up(self) -> Dict[str, bool]:
+        """すべてのチャネルの送信先への接続を並列に確立（通知は送信しない）"""
+        return self.dispatch('warm_up')
+
+    def close(self):
+        """スレッドプールを終了（実行中の送信は待たない）"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def create_channels(cfg, dedup_cache=None) -> List[BaseNotifier]:
+    """
+    設定から通知チャネルを作成（設定されているチャネルのみ）
+
+    Args:
+        cfg: 設定モジュール（config）
+        dedup_cache: 通知済みアイテムのキャッシュ
+
+    Returns:
+        通知チャネルのリスト
+    """
+    from notification_channels import ChatWebhookNotifier, EmailNotifier, WebhookNotifier
+    from notifier import LineNotifier
+
+    channels: List[BaseNotifier] = []
+
+    if cfg.LINE_CHANNEL_ACCESS_TOKEN and (cfg.LINE_USER_ID or cfg.LINE_GROUP_ID):
+        channels.append(LineNotifier(
+            cfg.LINE_CHANNEL_ACCESS_TOKEN,
+            cfg.LINE_USER_ID,
+            cfg.LINE_GROUP_ID,
+            message_format=cfg.NOTIFICATION_FORMAT,
+            dedup_cache=dedup_cache,
+            timeout=cfg.LINE_TIMEOUT
+        ))
+
+    if cfg.WEBHOOK_URL:
+        channels.append(WebhookNotifier(
+            cfg.WEBHOOK_URL,
+            dedup_cache=dedup_cache,
+            timeout=cfg.WEBHOOK_TIMEOUT
+        ))
+
+    if cfg.SLACK_WEBHOOK_URL:
+        channels.append(ChatWebhookNotifier(
+            cfg.SLACK_WEBHOOK_URL,
+            style='slack',
+            dedup_cache=dedup_cache,
+            timeout=cfg.WEBHOOK_TIMEOUT
+        ))
+
+    if cfg.DISCORD_WEBHOOK_URL:
+        channels.append(ChatWebhookNotifier(
+            cfg.DISCORD_WEBHOOK_URL,
+            style='discord',
+            dedup_cache=dedup_cache,
+            timeout=cfg.WEBHOOK_TIMEOUT
+        ))
+
+    if cfg.SMTP_HOST and cfg.EMAIL_TO:
+        channels.append(EmailNotifier(
+            cfg.SMTP_HOST,
+            cfg.SMTP_PORT,
+            cfg.EMAIL_FROM,
+            cfg.EMAIL_TO,
+            username=cfg.SMTP_USER,
+            password=cfg.SMTP_PASSWORD,
+            use_tls=cfg.SMTP_USE_TLS,
+            dedup_cache=dedup_cache,
+            timeout=cfg.SMTP_TIMEOUT
+        ))
+
+    return channels
+
+
+def main():
+    """テスト用のメイン関数（ローカルのスタブサーバーで遅いチャネルを再現）"""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from notification_channels import ChatWebhookNotifier, WebhookNotifier
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path == '/slow':
+                time.sleep(3)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    dispatcher = NotificationDispatcher([
+        WebhookNotifier(f"{base_url}/fast", timeout=5),
+        ChatWebhookNotifier(f"{base_url}/slow", style='slack', timeout=1),
+        ChatWebhookNotifier(f"{base_url}/discord", style='discord', timeout=5),
+    ], grace_seconds=0.5)
+
+    items = [{
+        'type': 'banner',
+        'title': 'Switch2 抽選販売 受付中',
+        'content': 'Switch2 抽選販売 受付中 | 詳細はこちら',
+        'url': 'https://store-jp.nintendo.com/lottery/switch2'
+    }]
+    started = time.monotonic()
+    results = dispatcher.send_lottery_notification_v2(items)
+    print(f"結果: {json.dumps(results)}（{time.monotonic() - started:.2f}秒）")
+
+    dispatcher.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+高速な64ビットのフィンガープリント
+抽出時の重複判定・アイテムID・状態の差分判定で共通に使う（暗号学的な強度は不要）
+"""
+import hashlib
+from typing import Union
+
+# xxhash対応（オプショナル、未インストール時はblake2bの8バイトダイジェスト）
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+# 使用中のアルゴリズム名（保存済みのIDと算出方式が一致するかの判定に使う）
+ALGORITHM = 'xxh3_64' if XXHASH_AVAILABLE else 'blake2b_64'
+
+# 複数の値を連結するときの区切り文字
+SEPARATOR = '\x1f'
+
+
+if XXHASH_AVAILABLE:
+    def fingerprint_bytes(data: bytes) -> int:
+        """
+        バイト列の64ビットフィンガープリントを計算
+
+        Args:
+            data: 対象のバイト列
+
+        Returns:
+            0以上2**64未満の整数
+        """
+        return xxhash.xxh3_64_intdigest(data)
+else:
+    def fingerprint_bytes(data: bytes) -> int:
+        """
+        バイト列の64ビットフィンガープリントを計算
+
+        Args:
+            data: 対象のバイト列
+
+        Returns:
+            0以上2**64未満の整数
+        """
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def fingerprint(text: Union[str, bytes]) -> int:
+    """
+    文字列の64ビットフィンガープリントを計算（エンコードは1回だけ）
+
+    Args:
+        text: 対象の文字列またはバイト列
+
+    Returns:
+        0以上2**64未満の整数
+    """
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return fingerprint_bytes(text)
+
+
+def fingerprint_parts(*parts: str) -> int:
+    """
+    複数の文字列を区切り文字で連結したフィンガープリントを計算
+
+    Args:
+        *parts: 対象の文字列
+
+    Returns:
+        0以上2**64未満の整数
+    """
+    return fingerprint(SEPARATOR.join(parts))
+
+
+def to_hex(value: int) -> str:
+    """
+    フィンガープリントを保存用の16桁の16進文字列に変換
+
+    Args:
+        value: フィンガープリント
+
+    Returns:
+        16桁の16進文字列
+    """
+    return f"{value:016x}"
+
+
+def main():
+    """テスト用のメイン関数"""
+    import timeit
+
+    text = '「Nintendo Switch 2（多言語対応）」招待販売について | 申込期限: 11月18日（火）午前11:00'
+    print(f"アルゴリズム: {ALGORITHM}")
+    print(f"フィンガープリント: {fingerprint(text)} ({to_hex(fingerprint(text))})")
+
+    count = 100000
+    md5_time = timeit.timeit(lambda: hashlib.md5(text.encode()).hexdigest(), number=count)
+    fp_time = timeit.timeit(lambda: fingerprint(text), number=count)
+    print(f"\n{count}回の計算時間: md5(hex)={md5_time:.3f}秒, fingerprint={fp_time:.3f}秒")
+
+
+if __name__ == '__main__':
+    main()
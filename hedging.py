@@ -0,0 +1,321 @@
+"""
+ヘッジリクエスト
+1回目のリクエストがホストごとの最近の応答時間のパーセンタイルを過ぎても返らない場合に
+2回目のリクエストを送り、先に返った方を使う（遅い応答の裾で通知が遅れるのを防ぐ）
+
+負けた方のリクエストは中止の目印を立て、本文の受信中であればその場で打ち切る。
+追加のリクエストは通常のリクエスト数の max_ratio 倍までに抑える（トークンバケット）。
+ホストごとのアクセス間隔を制御している場合、追加のリクエストもその間隔の予約を取れたときだけ送る。
+
+使い方（応答時間の一部を遅くしたローカルのスタブサーバーで効果を測る）:
+    python hedging.py --requests 200 --slow-rate 0.1 --slow-ms 500
+"""
+import argparse
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, TypeVar
+import logging
+
+from deadline import Deadline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class HedgeCancelled(Exception):
+    """先に別のリクエストが返ったため中止した場合の例外"""
+
+
+class LatencyTracker:
+    """ホストごとの最近の応答時間を保持するクラス"""
+
+    def __init__(self, window: int = 100):
+        """
+        Args:
+            window: ホストごとに保持する応答時間の件数
+        """
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, host: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(host)
+            if samples is None:
+                samples = self._samples[host] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, host: str) -> int:
+        with self._lock:
+            return len(self._samples.get(host, ()))
+
+    def percentile(self, host: str, percent: float) -> Optional[float]:
+        """
+        応答時間のパーセンタイル（最近傍順位法）
+
+        Args:
+            host: ホスト名
+            percent: パーセンタイル（0〜100）
+
+        Returns:
+            秒数（記録がない場合はNone）
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(host, ()))
+        if not samples:
+            return None
+        rank = max(1, -(-len(samples) * percent // 100))
+        return samples[int(min(rank, len(samples))) - 1]
+
+
+class HedgedFetcher:
+    """ヘッジリクエストを送るクラス"""
+
+    def __init__(self, tracker: Optional[LatencyTracker] = None, percentile: float = 95.0,
+                 min_samples: int = 10, max_ratio: float = 0.1, burst: float = 2.0,
+                 min_delay: float = 0.05, max_delay: float = 10.0):
+        """
+        Args:
+            tracker: 応答時間の記録（省略時は新しく作成）
+            percentile: 2回目のリクエストを送るまでの待ち時間に使うパーセンタイル
+            min_samples: ヘッジを始めるのに必要な応答時間の記録数
+            max_ratio: 通常のリクエスト数に対する追加のリクエスト数の上限
+            burst: 続けて送れる追加のリクエスト数
+            min_delay: 待ち時間の下限（秒）
+            max_delay: 待ち時間の上限（秒）
+        """
+        self.tracker = tracker or LatencyTracker()
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.admit_denied = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+            return self._executor
+
+    def hedge_delay(self, host: str) -> Optional[float]:
+        """
+        2回目のリクエストを送るまでの待ち時間
+
+        Args:
+            host: ホスト名
+
+        Returns:
+            秒数（記録が足りない場合はNone）
+        """
+        if self.tracker.count(host) < self.min_samples:
+            return None
+        delay = self.tracker.percentile(host, self.percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _take_token(self, admit: Optional[Callable[[], bool]] = None) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                self.budget_denied += 1
+                return False
+        # 上限内の場合だけ予約を取る（予約を取った後で上限に達した場合、予約は使わずに間隔として残る）
+        if admit is not None and not admit():
+            with self._lock:
+                self.admit_denied += 1
+            return False
+        with self._lock:
+            if self._tokens < 1.0:
+                self.budget_denied += 1
+                return False
+            self._tokens -= 1.0
+            self.hedged += 1
+            return True
+
+    def fetch(self, host: str, send: Callable[[threading.Event], T],
+              deadline: Optional[Deadline] = None,
+              admit: Optional[Callable[[], bool]] = None) -> T:
+        """
+        リクエストを送り、必要に応じてヘッジする
+
+        Args:
+            host: ホスト名（応答時間の記録単位）
+            send: リクエストを送る関数（中止の目印を受け取り、立っていればHedgeCancelledを送出する）
+            deadline: 実行の期限（待ち時間を残り時間で切り詰める）
+            admit: 追加のリクエストを送る直前に呼ぶ関数（Falseを返した場合は送らない。
+                   PolitenessScheduler.try_acquireでホストのアクセス間隔を予約する場合に使用）
+
+        Returns:
+            先に成功したリクエストの結果
+        """
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.max_ratio)
+
+        delay = self.hedge_delay(host)
+        if delay is None:
+            # 記録が足りない間はヘッジせずにそのまま送る
+            started = time.monotonic()
+            result = send(threading.Event())
+            self.tracker.record(host, time.monotonic() - started)
+            return result
+
+        if deadline is not None:
+            delay = deadline.cap(delay)
+
+        executor = self._get_executor()
+        attempts: Dict[Future, tuple] = {}
+
+        def submit(label: str):
+            cancelled = threading.Event()
+            attempts[executor.submit(send, cancelled)] = (label, cancelled, time.monotonic())
+
+        submit('primary')
+        done, pending = wait(list(attempts), timeout=delay)
+        if not done and self._take_token(admit):
+            logger.info(f"{host}: {delay * 1000:.0f}ms以内に応答がないため、2回目のリクエストを送ります")
+            submit('hedge')
+            pending = set(attempts)
+
+        error: Optional[BaseException] = None
+        while True:
+            if not done:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                label, _, started = attempts[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+
+                now = time.monotonic()
+                self.tracker.record(host, now - started)
+                for other in pending:
+                    # 負けた方は中止し、その時点までの時間を（実際の応答時間の下限として）記録
+                    _, other_cancelled, other_started = attempts[other]
+                    other_cancelled.set()
+                    self.tracker.record(host, now - other_started)
+                if label == 'hedge':
+                    with self._lock:
+                        self.hedge_wins += 1
+                return result
+
+            if not pending:
+                raise error
+            done = set()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        リクエスト数とヘッジの回数
+
+        Returns:
+            {'requests': リクエスト数, 'hedged': 追加のリクエスト数,
+             'hedge_wins': 追加のリクエストが先に返った回数, 'budget_denied': 上限で送らなかった回数,
+             'admit_denied': アクセス間隔の予約が取れず送らなかった回数}
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'budget_denied': self.budget_denied,
+                'admit_denied': self.admit_denied
+            }
+
+    def close(self):
+        """スレッドプールを終了（中止したリクエストの終了は待たない）"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def _summarize(latencies: List[float]) -> str:
+    ordered = sorted(latencies)
+
+    def at(percent: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] * 1000
+
+    return f"p50 {at(50):7.1f}ms  p95 {at(95):7.1f}ms  p99 {at(99):7.1f}ms  最大 {ordered[-1] * 1000:7.1f}ms"
+
+
+def main():
+    """ローカルのスタブサーバーでヘッジの効果を測る"""
+    import random
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import requests
+
+    parser = argparse.ArgumentParser(description='応答時間の一部を遅くしたスタブサーバーでヘッジの効果を測る')
+    parser.add_argument('--requests', type=int, default=200, help='リクエスト数')
+    parser.add_argument('--fast-ms', type=float, default=20, help='通常の応答時間（ミリ秒）')
+    parser.add_argument('--slow-ms', type=float, default=500, help='遅い応答の応答時間（ミリ秒）')
+    parser.add_argument('--slow-rate', type=float, default=0.1, help='遅い応答の割合')
+    parser.add_argument('--percentile', type=float, default=90, help='ヘッジまでの待ち時間のパーセンタイル')
+    parser.add_argument('--max-ratio', type=float, default=0.2, help='追加のリクエスト数の上限（割合）')
+    args = parser.parse_args()
+
+    logging.getLogger(__name__).setLevel(logging.WARNING)
+    served = {'count': 0}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            served['count'] += 1
+            slow = random.random() < args.slow_rate
+            time.sleep((args.slow_ms if slow else args.fast_ms) / 1000)
+            body = b'<html><body><h2>Switch2</h2></body></html>'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    host = f"127.0.0.1:{server.server_port}"
+
+    def send(cancelled: threading.Event) -> bytes:
+        with requests.get(url, timeout=5, stream=True) as response:
+            if cancelled.is_set():
+                raise HedgeCancelled()
+            return response.content
+
+    try:
+        for mode in ('ヘッジなし', 'ヘッジあり'):
+            fetcher = HedgedFetcher(percentile=args.percentile, max_ratio=args.max_ratio)
+            served['count'] = 0
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                if mode == 'ヘッジなし':
+                    send(threading.Event())
+                else:
+                    fetcher.fetch(host, send)
+                latencies.append(time.perf_counter() - started)
+            stats = fetcher.get_stats()
+            extra = served['count'] / args.requests - 1
+            print(f"{mode}: {_summarize(latencies)}  追加の負荷 {extra:+.1%}"
+                  + (f"（ヘッジ {stats['hedged']}回, 先着 {stats['hedge_wins']}回）" if mode == 'ヘッジあり' else ''))
+            fetcher.close()
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+アイテムの検出履歴と変更ログ
+アイテムごとの初回/最終検出日時と、追加・削除・変更イベントを保持する
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+import logging
+
+from items import ITEM_ID_VERSION, assign_item_ids, item_digest_of
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EVENT_ADDED = 'added'
+EVENT_REMOVED = 'removed'
+EVENT_MODIFIED = 'modified'
+
+
+def to_aware_datetime(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """
+    日時をタイムゾーン付きのdatetimeに変換（比較用）
+
+    タイムゾーンのない日時（これまで保存してきた形式）はローカル時刻として扱う。
+
+    Args:
+        value: datetimeまたはISO 8601形式の文字列
+
+    Returns:
+        タイムゾーン付きのdatetime（空・解析できない場合はNone）
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            logger.warning(f"日時を解析できません: {value}")
+            return None
+    return value if value.tzinfo is not None else value.astimezone()
+
+
+class ItemHistory:
+    """アイテムの検出履歴と追記型の変更ログを管理するクラス"""
+
+    def __init__(self, entries: Optional[Dict[str, Dict]] = None,
+                 changes: Optional[List[Dict]] = None,
+                 max_events: int = 1000, max_age_days: int = 30):
+        """
+        Args:
+            entries: アイテムIDごとの履歴（title, type, url, digest, first_seen, last_seen, present）
+            changes: 変更イベントのリスト（古い順）
+            max_events: 変更ログの最大保持件数
+            max_age_days: 変更ログ・消えたアイテムの履歴の最大保持日数
+        """
+        self.entries = entries if entries is not None else {}
+        self.changes = changes if changes is not None else []
+        self.max_events = max_events
+        self.max_age_days = max_age_days
+
+    @classmethod
+    def from_state(cls, state: Optional[Dict], max_events: int = 1000,
+                   max_age_days: int = 30) -> 'ItemHistory':
+        """
+        状態辞書から履歴を復元
+
+        履歴を持たない旧形式の状態や、アイテムIDの算出方式が変わった状態の場合は、
+        保存済みのアイテムを既知として登録し直す（変更ログは引き継ぐ）。
+
+        Args:
+            state: 状態辞書（Noneの場合は空の履歴）
+            max_events: 変更ログの最大保持件数
+            max_age_days: 最大保持日数
+
+        Returns:
+            ItemHistoryインスタンス
+        """
+        if state is None:
+            return cls(max_events=max_events, max_age_days=max_age_days)
+
+        if 'history' in state and state.get('history_version') == ITEM_ID_VERSION:
+            return cls(
+                entries=dict(state.get('history') or {}),
+                changes=list(state.get('changes') or []),
+                max_events=max_events,
+                max_age_days=max_age_days
+            )
+
+        history = cls(
+            changes=list(state.get('changes') or []),
+            max_events=max_events,
+            max_age_days=max_age_days
+        )
+        seen_at = state.get('last_updated') or datetime.now().isoformat()
+        items = state.get('items', [])
+        for item_id, item in zip(assign_item_ids(items), items):
+            history.entries[item_id] = history._make_entry(item, seen_at, seen_at)
+        logger.info(f"旧形式の状態から履歴を作成しました（{len(history.entries)}件）")
+        return history
+
+    def to_state(self, state: Dict) -> Dict:
+        """
+        履歴を状態辞書に書き込み
+
+        Args:
+            state: 書き込み先の状態辞書
+
+        Returns:
+            書き込み後の状態辞書
+        """
+        state['history'] = self.entries
+        state['history_version'] = ITEM_ID_VERSION
+        state['changes'] = self.changes
+        return state
+
+    @staticmethod
+    def _make_entry(item: Dict, first_seen: str, last_seen: str) -> Dict:
+        return {
+            'type': item.get('type'),
+            'title': item.get('title', ''),
+            'url': item.get('url', ''),
+            'digest': item_digest_of(item),
+            'first_seen': first_seen,
+            'last_seen': last_seen,
+            'present': True
+        }
+
+    def _append_change(self, event: str, item_id: str, entry: Dict, timestamp: str, **extra):
+        change = {
+            'timestamp': timestamp,
+            'event': event,
+            'item_id': item_id,
+            'type': entry.get('type'),
+            'title': entry.get('title', ''),
+            'url': entry.get('url', '')
+        }
+        change.update(extra)
+        self.changes.append(change)
+
+    def record(self, current_items: List[Dict], now: Optional[datetime] = None,
+               snapshot: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """
+        今回のアイテムを履歴に反映し、変更イベントを記録
+
+        一度消えて再び現れたアイテムは、保持期間内であれば新規ではなく再出現として扱う。
+
+        Args:
+            current_items: 今回検出したアイテムのリスト
+            now: 記録日時（省略時は現在時刻）
+            snapshot: 今回のページのスナップショットのダイジェスト（変更イベントに記録）
+
+        Returns:
+            イベント種別ごとのアイテムのリスト:
+            {
+                'added': List[Dict],       # 初めて検出したアイテム
+                'reappeared': List[Dict],  # 消えていたが再び現れたアイテム
+                'modified': List[Dict],    # 内容が変わったアイテム
+                'removed': List[Dict]      # 消えたアイテム（履歴エントリ）
+            }
+        """
+        timestamp = (now or datetime.now()).isoformat()
+        result = {'added': [], 'reappeared': [], 'modified': [], 'removed': []}
+        extra = {'snapshot': snapshot} if snapshot else {}
+
+        current_ids = set()
+        for item_id, item in zip(assign_item_ids(current_items), current_items):
+            current_ids.add(item_id)
+            entry = self.entries.get(item_id)
+
+            if entry is None:
+                entry = self._make_entry(item, timestamp, timestamp)
+                self.entries[item_id] = entry
+                self._append_change(EVENT_ADDED, item_id, entry, timestamp, **extra)
+                result['added'].append(item)
+                continue
+
+            digest = item_digest_of(item)
+            reappeared = not entry.get('present', True)
+            modified = entry.get('digest') != digest
+
+            entry['present'] = True
+            entry['last_seen'] = timestamp
+            entry['digest'] = digest
+
+            if modified:
+                self._append_change(EVENT_MODIFIED, item_id, entry, timestamp, **extra)
+                result['modified'].append(item)
+            elif reappeared:
+                self._append_change(EVENT_ADDED, item_id, entry, timestamp, reappeared=True, **extra)
+                result['reappeared'].append(item)
+
+        for item_id, entry in self.entries.items():
+            if entry.get('present', True) and item_id not in current_ids:
+                entry['present'] = False
+                self._append_change(EVENT_REMOVED, item_id, entry, timestamp, **extra)
+                result['removed'].append(entry)
+
+        self.compact()
+        return result
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """
+        保持期間・保持件数を超えた変更ログと、消えてから保持期間を過ぎた履歴を削除
+
+        Args:
+            now: 基準日時（省略時は現在時刻）
+
+        Returns:
+            削除した変更イベントと履歴エントリの合計数
+        """
+        cutoff = to_aware_datetime((now or datetime.now()) - timedelta(days=self.max_age_days))
+
+        def expired_at(timestamp: Optional[str]) -> bool:
+            # 解析できない日時は削除しない
+            seen_at = to_aware_datetime(timestamp)
+            return seen_at is not None and seen_at < cutoff
+
+        before = len(self.changes)
+        self.changes = [change for change in self.changes if not expired_at(change.get('timestamp'))]
+        if len(self.changes) > self.max_events:
+            self.changes = self.changes[-self.max_events:]
+        removed_changes = before - len(self.changes)
+
+        expired = [
+            item_id for item_id, entry in self.entries.items()
+            if not entry.get('present', True) and expired_at(entry.get('last_seen'))
+        ]
+        for item_id in expired:
+            del self.entries[item_id]
+
+        if removed_changes or expired:
+            logger.debug(f"履歴を整理しました（変更ログ: {removed_changes}件, 履歴: {len(expired)}件）")
+
+        return removed_changes + len(expired)
+
+    def get_changes_since(self, since: Union[str, datetime],
+                          events: Optional[List[str]] = None) -> List[Dict]:
+        """
+        指定日時以降の変更イベントを取得
+
+        日時は文字列ではなくタイムゾーン付きのdatetimeとして比較する
+        （タイムゾーンのない日時はローカル時刻として扱う）。
+
+        Args:
+            since: 基準日時（datetimeまたはISO 8601形式の文字列）
+            events: 取得するイベント種別（省略時はすべて）
+
+        Returns:
+            変更イベントのリスト（古い順）
+
+        Raises:
+            ValueError: 基準日時を解析できない場合
+        """
+        since_at = to_aware_datetime(since)
+        if since_at is None:
+            raise ValueError(f"基準日時を解析できません: {since}")
+
+        changes = []
+        for change in self.changes:
+            if events is not None and change.get('event') not in events:
+                continue
+            changed_at = to_aware_datetime(change.get('timestamp'))
+            if changed_at is not None and changed_at >= since_at:
+                changes.append(change)
+        return changes
+
+
+def main():
+    """テスト用のメイン関数"""
+    history = ItemHistory()
+
+    banner = {'type': 'banner', 'title': 'Switch2 抽選販売 受付中', 'content': '受付中', 'url': 'https://example.com/1'}
+    heading = {'type': 'heading', 'title': '招待販売について', 'content': '申込期限: 11月18日', 'url': 'https://example.com/2'}
+
+    print("=== 1回目（2件） ===")
+    result = history.record([banner, heading])
+    print({key: len(value) for key, value in result.items()})
+
+    print("\n=== 2回目（バナーが消え、見出しの内容が変更） ===")
+    result = history.record([dict(heading, content='申込期限: 11月25日')])
+    print({key: len(value) for key, value in result.items()})
+
+    print("\n=== 3回目（バナーが再出現） ===")
+    result = history.record([banner, dict(heading, content='申込期限: 11月25日')])
+    print({key: len(value) for key, value in result.items()})
+
+    print("\n変更ログ:")
+    for change in history.get_changes_since('2000-01-01'):
+        print(f"  {change['timestamp']} {change['event']:<8} {change['title']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+ページ取得のHTTPクライアント
+httpx（h2）が使える場合はHTTP/2で同じホストへのリクエストを1本の接続に多重化し、
+使えない場合・サーバーがHTTP/2に対応していない場合はHTTP/1.1で取得する
+
+圧縮（gzip / deflate / br）はクライアントが対応する形式を送ってサーバーと合意し、
+本文は分割して受信しながら展開する（受信中も実行の期限・ヘッジの中止を確認する）。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import Deadline
+from hedging import HedgeCancelled
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  httpxのHTTP/2対応に必要
+    HTTP2_AVAILABLE = HTTPX_AVAILABLE
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# httpxはリクエストごとにINFOログを出すため、取得のログはこのモジュール側で出す
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+CHUNK_SIZE = 65536
+
+
+def origin_of(url: str) -> str:
+    """URLのスキーム・ホスト部分（事前接続の接続先）"""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}/"
+
+
+class FetchError(Exception):
+    """ページ取得のエラー"""
+
+
+class FetchTimeout(FetchError):
+    """接続・読み込みのタイムアウト"""
+
+
+class FetchConnectionError(FetchError):
+    """接続のエラー"""
+
+
+class FetchHTTPError(FetchError):
+    """4xx・5xxの応答"""
+
+    def __init__(self, url: str, status: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"{status} エラー: {url}")
+        self.url = url
+        self.status = status
+        self.headers = headers or {}
+
+
+class FetchResponse:
+    """取得した応答（本文は展開済み）"""
+
+    __slots__ = ('url', 'status', 'headers', 'body', 'http_version')
+
+    def __init__(self, url: str, status: int, headers: Dict[str, str], body: bytes, http_version: str):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.http_version = http_version
+
+
+def _read_chunks(chunks: Iterable[bytes], deadline: Optional[Deadline],
+                 cancelled: Optional[threading.Event]) -> bytes:
+    # 展開しながら受信し、チャンクごとに期限とヘッジの中止を確認
+    parts = []
+    for chunk in chunks:
+        if cancelled is not None and cancelled.is_set():
+            raise HedgeCancelled()
+        parts.append(chunk)
+        if deadline is not None:
+            deadline.check('本文の受信')
+    return b''.join(parts)
+
+
+def _lower_headers(headers) -> Dict[str, str]:
+    return {key.lower(): value for key, value in headers.items()}
+
+
+class HttpClient:
+    """HTTPクライアントの基底クラス"""
+
+    name = 'base'
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, max_connections: int = 8):
+        """
+        Args:
+            headers: すべてのリクエストに付けるヘッダー
+            max_connections: 同時に取得するリクエスト数の上限
+        """
+        self.headers = dict(headers or {})
+        self.max_connections = max_connections
+
+    def get(self, url: str, timeout: Tuple[float, float], deadline: Optional[Deadline] = None,
+            cancelled: Optional[threading.Event] = None) -> FetchResponse:
+        """
+        URLを取得
+
+        Args:
+            url: 取得するURL
+            timeout: (接続のタイムアウト, 読み込みのタイムアウト)（秒）
+            deadline: 実行の期限（本文の受信中も確認する）
+            cancelled: ヘッジの中止の目印
+
+        Returns:
+            FetchResponse
+
+        Raises:
+            FetchTimeout / FetchConnectionError / FetchHTTPError: 取得できなかった場合
+        """
+        raise NotImplementedError
+
+    def warm_up(self, url: str, timeout: Tuple[float, float]) -> bool:
+        """
+        URLのホストへの接続（名前解決・TLSハンドシェイク）を事前に確立し、接続を残しておく
+
+        Args:
+            url: 接続するホストのURL
+            timeout: (接続のタイムアウト, 読み込みのタイムアウト)（秒）
+
+        Returns:
+            接続できた場合True（応答のステータスは問わない）
+        """
+        raise NotImplementedError
+
+    def fetch_many(self, urls: List[str], timeout: Tuple[float, float],
+                   deadline: Optional[Deadline] = None) -> Dict[str, Union[FetchResponse, FetchError]]:
+        """
+        複数のURLを並列に取得（HTTP/2では同じホストへのリクエストが1本の接続に多重化される）
+
+        Args:
+            urls: 取得するURLのリスト
+            timeout: (接続のタイムアウト, 読み込みのタイムアウト)（秒）
+            deadline: 実行の期限
+
+        Returns:
+            URLと応答（失敗した場合は例外）の辞書
+        """
+        def fetch(url: str) -> Union[FetchResponse, FetchError]:
+            try:
+                return self.get(url, timeout, deadline)
+            except FetchError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_connections, len(urls))),
+                                thread_name_prefix='fetch') as executor:
+            return dict(zip(urls, executor.map(fetch, urls)))
+
+    def close(self):
+        pass
+
+
+class RequestsClient(HttpClient):
+    """requestsによるHTTP/1.1のクライアント（ホストごとに接続を使い回す）"""
+
+    name = 'http1'
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, max_connections: int = 8):
+        super().__init__(headers, max_connections)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url: str, timeout: Tuple[float, float], deadline: Optional[Deadline] = None,
+            cancelled: Optional[threading.Event] = None) -> FetchResponse:
+        try:
+            with self.session.get(url, headers=self.headers, timeout=timeout, stream=True) as response:
+                headers = _lower_headers(response.headers)
+                if response.status_code >= 400:
+                    raise FetchHTTPError(url, response.status_code, headers)
+                body = _read_chunks(response.iter_content(chunk_size=CHUNK_SIZE), deadline, cancelled)
+                return FetchResponse(response.url, response.status_code, headers, body, 'HTTP/1.1')
+        except requests.Timeout as e:
+            raise FetchTimeout(f"タイムアウト: {e}") from e
+        except requests.ConnectionError as e:
+            raise FetchConnectionError(f"接続エラー: {e}") from e
+        except requests.RequestException as e:
+            raise FetchError(str(e)) from e
+
+    def warm_up(self, url: str, timeout: Tuple[float, float]) -> bool:
+        try:
+            self.session.head(origin_of(url), headers=self.headers, timeout=timeout, allow_redirects=False)
+            return True
+        except requests.RequestException as e:
+            logger.warning(f"{url} への事前接続に失敗: {e}")
+            return False
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxClient(HttpClient):
+    """httpxによるクライアント（HTTP/2に対応していないホストはHTTP/1.1に切り替える）"""
+
+    name = 'http2'
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, max_connections: int = 8,
+                 http2: bool = True):
+        """
+        Args:
+            headers: すべてのリクエストに付けるヘッダー
+            max_connections: 同時に取得するリクエスト数の上限
+            http2: HTTP/2を使うか（h2がない場合は常にHTTP/1.1）
+        """
+        super().__init__(headers, max_connections)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(http2=self.http2, headers=self.headers, limits=limits,
+                                    follow_redirects=True)
+        self._http1_client: Optional['httpx.Client'] = None
+        self._http1_hosts = set()
+        self._lock = threading.Lock()
+
+    def _client_for(self, host: str) -> 'httpx.Client':
+        if host not in self._http1_hosts:
+            return self._client
+        with self._lock:
+            if self._http1_client is None:
+                self._http1_client = httpx.Client(http2=False, headers=self.headers, follow_redirects=True)
+            return self._http1_client
+
+    def _request(self, client: 'httpx.Client', url: str, timeout: Tuple[float, float],
+                 deadline: Optional[Deadline], cancelled: Optional[threading.Event]) -> FetchResponse:
+        connect, read = timeout
+        with client.stream('GET', url, timeout=httpx.Timeout(read, connect=connect, pool=connect)) as response:
+            headers = _lower_headers(response.headers)
+            if response.status_code >= 400:
+                raise FetchHTTPError(url, response.status_code, headers)
+            # iter_bytesは圧縮された本文を受信しながら展開する
+            body = _read_chunks(response.iter_bytes(chunk_size=CHUNK_SIZE), deadline, cancelled)
+            return FetchResponse(str(response.url), response.status_code, headers, body, response.http_version)
+
+    def get(self, url: str, timeout: Tuple[float, float], deadline: Optional[Deadline] = None,
+            cancelled: Optional[threading.Event] = None) -> FetchResponse:
+        host = urlparse(url).netloc
+        client = self._client_for(host)
+        try:
+            return self._request(client, url, timeout, deadline, cancelled)
+        except httpx.TimeoutException as e:
+            raise FetchTimeout(f"タイムアウト: {e}") from e
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+            if client is not self._client or not self.http2:
+                raise FetchConnectionError(f"プロトコルエラー: {e}") from e
+            # HTTP/2でのやり取りに失敗したホストは以降HTTP/1.1で取得する
+            logger.warning(f"{host}: HTTP/2での取得に失敗したため、HTTP/1.1に切り替えます（{e}）")
+            self._http1_hosts.add(host)
+            return self.get(url, timeout, deadline, cancelled)
+        except httpx.TransportError as e:
+            raise FetchConnectionError(f"接続エラー: {e}") from e
+        except httpx.HTTPError as e:
+            raise FetchError(str(e)) from e
+
+    def warm_up(self, url: str, timeout: Tuple[float, float]) -> bool:
+        connect, read = timeout
+        client = self._client_for(urlparse(url).netloc)
+        try:
+            client.head(origin_of(url), timeout=httpx.Timeout(read, connect=connect, pool=connect),
+                        follow_redirects=False)
+            return True
+        except httpx.HTTPError as e:
+            logger.warning(f"{url} への事前接続に失敗: {e}")
+            return False
+
+    def close(self):
+        self._client.close()
+        with self._lock:
+            if self._http1_client is not None:
+                self._http1_client.close()
+                self._http1_client = None
+
+
+def create_http_client(prefer_http2: bool = True, headers: Optional[Dict[str, str]] = None,
+                       max_connections: int = 8) -> HttpClient:
+    """
+    HTTPクライアントを作成
+
+    Args:
+        prefer_http2: HTTP/2を使うか（httpx・h2がない場合はrequestsのHTTP/1.1）
+        headers: すべてのリクエストに付けるヘッダー
+        max_connections: 同時に取得するリクエスト数の上限
+
+    Returns:
+        HttpClientインスタンス
+    """
+    if prefer_http2:
+        if HTTP2_AVAILABLE:
+            return HttpxClient(headers, max_connections)
+        logger.warning("httpx[http2]がインストールされていないため、HTTP/1.1で取得します")
+    return RequestsClient(headers, max_connections)
+
+
+def main():
+    """テスト用のメイン関数（同じホストの複数ページを取得し、使われたプロトコルを表示）"""
+    import sys
+    import time
+    import config
+
+    urls = sys.argv[1:] or [config.TARGET_URL]
+    client = create_http_client(headers={'User-Agent': config.USER_AGENT})
+    print(f"クライアント: {client.name}")
+
+    started = time.perf_counter()
+    results = client.fetch_many(urls, timeout=(config.FETCH_CONNECT_TIMEOUT, config.REQUEST_TIMEOUT))
+    elapsed = time.perf_counter() - started
+    for url, result in results.items():
+        if isinstance(result, FetchResponse):
+            encoding = result.headers.get('content-encoding', 'なし')
+            print(f"  {result.http_version}  {result.status}  {len(result.body):>8}バイト  圧縮: {encoding:<5} {url}")
+        else:
+            print(f"  失敗: {result}  {url}")
+    print(f"{len(urls)}ページ: {elapsed:.2f}秒")
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+検出アイテムのデータ型
+アイテムごとの辞書の代わりに __slots__ を使った軽量なレコードで保持する
+"""
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import fingerprint
+from normalizer import get_default_normalizer
+
+# アイテムIDの算出方式のバージョン（変更時は履歴を保存済みアイテムから作り直す）
+# フィンガープリントのアルゴリズムが環境によって変わった場合も作り直す
+ITEM_ID_VERSION = f"3:{fingerprint.ALGORITHM}"
+
+# 辞書形式で保存するキー（この順序で出力）
+ITEM_KEYS = ('type', 'tag', 'title', 'content', 'url', 'chunk')
+
+# ID・ダイジェストの計算に使うキー（変更時は再計算する）
+_IDENTITY_KEYS = frozenset(('type', 'title', 'content', 'url'))
+
+
+def make_item_id(item: Union['Item', Dict]) -> str:
+    """
+    アイテムの識別子を作成
+
+    種類・タイトル・URLから作るため、同じ見出しの本文（content）が変わっても同じIDになる。
+    タイトル・URLは正規化してから使う。
+
+    Args:
+        item: アイテム（Itemまたは辞書）
+
+    Returns:
+        16桁の16進文字列
+    """
+    normalizer = get_default_normalizer()
+    title = normalizer.normalize_text(item.get('title', ''))
+    url = normalizer.normalize_url(item.get('url', ''))
+    return fingerprint.to_hex(fingerprint.fingerprint_parts(item.get('type', ''), title, url))
+
+
+def make_item_digest(item: Union['Item', Dict]) -> str:
+    """
+    アイテムの内容のダイジェストを作成（同じIDのアイテムの変更検出用）
+
+    Args:
+        item: アイテム（Itemまたは辞書）
+
+    Returns:
+        16桁の16進文字列
+    """
+    normalizer = get_default_normalizer()
+    title = normalizer.normalize_text(item.get('title', ''))
+    content = normalizer.normalize_text(item.get('content', ''))
+    return fingerprint.to_hex(fingerprint.fingerprint_parts(title, content))
+
+
+def item_id_of(item: Union['Item', Dict]) -> str:
+    """計算済みのIDがあればそれを、なければ計算して返す"""
+    return item.item_id if isinstance(item, Item) else make_item_id(item)
+
+
+def item_digest_of(item: Union['Item', Dict]) -> str:
+    """計算済みのダイジェストがあればそれを、なければ計算して返す"""
+    return item.digest if isinstance(item, Item) else make_item_digest(item)
+
+
+def assign_item_ids(items: Iterable[Union['Item', Dict]]) -> List[str]:
+    """
+    アイテムのリストにIDを割り当て
+
+    同じIDのアイテムが複数ある場合は、出現順の連番を付けて区別する。
+
+    Args:
+        items: アイテムのリスト
+
+    Returns:
+        itemsと同じ順序のIDのリスト
+    """
+    ids = []
+    id_counts: Dict[str, int] = {}
+    for item in items:
+        item_id = item_id_of(item)
+        count = id_counts.get(item_id, 0)
+        id_counts[item_id] = count + 1
+        ids.append(f"{item_id}#{count}" if count else item_id)
+    return ids
+
+
+@dataclass(slots=True)
+class Item:
+    """
+    検出アイテム
+
+    type・tagは文字列をインターンして共有し、IDとダイジェストは生成時に一度だけ計算する。
+    移行期間中の互換性のため、item['title'] や item.get('url') のような辞書形式のアクセスもできる。
+    """
+
+    type: str
+    title: str
+    content: str
+    url: str
+    tag: Optional[str] = None
+    chunk: Optional[str] = None
+    item_id: str = field(init=False, repr=False, compare=False)
+    digest: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.type = sys.intern(self.type)
+        if self.tag is not None:
+            self.tag = sys.intern(self.tag)
+        self._update_identity()
+
+    def _update_identity(self):
+        self.item_id = make_item_id(self)
+        self.digest = make_item_digest(self)
+
+    # --- 辞書互換のアクセス ---
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in ITEM_KEYS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in ITEM_KEYS:
+            raise KeyError(key)
+        if key in ('type', 'tag') and value is not None:
+            value = sys.intern(value)
+        setattr(self, key, value)
+        if key in _IDENTITY_KEYS:
+            self._update_identity()
+
+    def __contains__(self, key: str) -> bool:
+        return key in ITEM_KEYS and getattr(self, key) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in ITEM_KEYS:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def keys(self) -> Iterator[str]:
+        return (key for key in ITEM_KEYS if getattr(self, key) is not None)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return ((key, getattr(self, key)) for key in self.keys())
+
+    # --- 状態形式との変換 ---
+
+    def to_dict(self) -> Dict[str, str]:
+        """
+        状態ファイルに保存する辞書形式に変換
+
+        Returns:
+            値がNoneのキーを除いた辞書
+        """
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Item':
+        """
+        辞書形式のアイテムから作成
+
+        Args:
+            data: type, title, content, url（任意で tag, chunk）を含む辞書
+
+        Returns:
+            Itemインスタンス
+        """
+        return cls(
+            type=data.get('type', 'unknown'),
+            title=data.get('title', ''),
+            content=data.get('content', ''),
+            url=data.get('url', ''),
+            tag=data.get('tag'),
+            chunk=data.get('chunk')
+        )
+
+
+def serialize_items(items: Iterable[Union[Item, Dict]]) -> List[Dict]:
+    """
+    アイテムのリストを状態に保存する辞書のリストに変換
+
+    Args:
+        items: アイテムのリスト（Itemと辞書の混在可）
+
+    Returns:
+        辞書のリスト
+    """
+    return [item.to_dict() if isinstance(item, Item) else item for item in items]
+
+
+def main():
+    """テスト用のメイン関数"""
+    import tracemalloc
+
+    item = Item(
+        type='heading',
+        tag='h2',
+        title='「Nintendo Switch 2（多言語対応）」招待販売について',
+        content='「Nintendo Switch 2（多言語対応）」招待販売について | 申込期限: 11月18日（火）午前11:00',
+        url='https://store-jp.nintendo.com/switch2'
+    )
+    print(f"ID: {item.item_id}, ダイジェスト: {item.digest}")
+    print(f"辞書形式のアクセス: item['type']={item['type']}, item.get('chunk')={item.get('chunk')}")
+    print(f"保存形式: {item.to_dict()}")
+    print(f"復元して同じID: {Item.from_dict(item.to_dict()).item_id == item.item_id}")
+
+    count = 10000
+    data = [dict(item.to_dict(), title=f"タイトル{i}") for i in range(count)]
+
+    tracemalloc.start()
+    records = [Item.from_dict(d) for d in data]
+    record_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    dicts = [dict(d, item_id=make_item_id(d), digest=make_item_digest(d)) for d in data]
+    dict_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"\n{count}件のメモリ使用量: Item={record_size // 1024}KB, dict={dict_size // 1024}KB")
+    del records, dicts
+
+
+if __name__ == '__main__':
+    main()
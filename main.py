@@ -1,53 +1,846 @@
 """
 Switch2 抽選販売監視システム - Cloud Functions エントリーポイント
 """
+import base64
+import functools
 import json
 import logging
-from typing import Any, Dict
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 import functions_framework
 from flask import Request
 
-from scraper import Switch2Scraper
-from notifier import LineNotifier
+from scraper import FetchResult, Switch2Scraper, context_limits_for, fetch_pages, parse_context_limits
+from deadline import Deadline, RetryPolicy
+from hedging import HedgedFetcher
+from http_client import HttpClient, create_http_client
+from politeness import PolitenessScheduler
+from discovery import DiscoveryCrawler
+from warmup import DnsCache, WarmupSchedule, parse_sale_windows
+from dispatcher import NotificationDispatcher, create_channels
+from notification_dedup import NotificationDedupCache
+from items import item_id_of
+from priority import DigestQueue, PriorityScorer
+from snapshot_store import SnapshotStore
+from serving import SingleFlight
+from sharding import QUEUE_LOCAL, InProcessQueue, ShardCoordinator, ShardWorker, WorkQueue, create_queue
+from subscriptions import DEFAULT_SUBSCRIPTION, Subscription, SubscriptionIndex, SubscriptionStore
 from state_manager import StateManager
+from state_backends import create_state_backend
 import config
 
-# ロギング設定
+# ロギング設定（各モジュールの import 時の basicConfig より優先する。同時のリクエストを区別するためスレッド名も出力）
 logging.basicConfig(
     level=getattr(logging, config.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s',
+    force=True
 )
 logger = logging.getLogger(__name__)
 
+# ウォームインスタンスの実行間で共有する状態管理インスタンス（保存先への接続を使い回す）
+_state_manager: Optional[StateManager] = None
 
-def check_lottery_and_notify() -> Dict:
+# 同一プロセスの実行間で共有する通知済みキャッシュ・通知の配信
+_dedup_cache: Optional[NotificationDedupCache] = None
+_dispatcher: Optional[NotificationDispatcher] = None
+_digest_queue: Optional[DigestQueue] = None
+_snapshot_store: Optional[SnapshotStore] = None
+_hedger: Optional[HedgedFetcher] = None
+_http_client: Optional[HttpClient] = None
+_scheduler: Optional[PolitenessScheduler] = None
+_scraper: Optional[Switch2Scraper] = None
+_target_scrapers: Dict[str, Switch2Scraper] = {}
+_discovery: Optional[DiscoveryCrawler] = None
+_subscription_index: Optional[SubscriptionIndex] = None
+_work_queue: Optional[WorkQueue] = None
+_dns_cache: Optional[DnsCache] = None
+
+# 同時のリクエスト（Cloud Runの --concurrency 2以上）でコンポーネントを1回だけ作成するためのロック
+# （取得関数は互いに呼び合うため再入可能にする）
+_init_lock = threading.RLock()
+
+# 同じ監視対象への同時のスキャンを1回にまとめる
+_single_flight = SingleFlight()
+
+
+def _synchronized(func):
+    # 共有するコンポーネントの取得関数を、同時に呼ばれても1回だけ作成されるようにする
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _init_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@_synchronized
+def get_state_manager() -> StateManager:
+    """
+    状態管理インスタンスを取得
+
+    インスタンスはモジュール内に保持し、同一プロセス（デーモン・ウォームインスタンス）の実行間で
+    保存先のクライアント・接続（warm_upで確立したもの）を共有する。
+    write-behind有効時はメモリ上の状態も共有する。
+
+    Returns:
+        StateManagerインスタンス
+    """
+    global _state_manager
+
+    if _state_manager is not None:
+        return _state_manager
+
+    backend = None
+    if config.STATE_BACKEND not in ('auto', ''):
+        backend = create_state_backend(
+            config.STATE_BACKEND,
+            state_file_path=config.STATE_FILE,
+            gcs_bucket_name=config.GCS_BUCKET_NAME,
+            gcs_state_file=config.GCS_STATE_FILE,
+            db_path=config.STATE_DB_FILE,
+            retention_days=config.HISTORY_MAX_AGE_DAYS
+        )
+
+    state_manager = StateManager(
+        config.STATE_FILE,
+        use_gcs=config.USE_CLOUD_STORAGE,
+        gcs_bucket_name=config.GCS_BUCKET_NAME,
+        gcs_state_file=config.GCS_STATE_FILE,
+        write_behind=config.STATE_WRITE_BEHIND,
+        flush_interval=config.STATE_FLUSH_INTERVAL,
+        wal_path=config.STATE_WAL_FILE,
+        backend=backend,
+        track_history=config.TRACK_HISTORY,
+        history_max_events=config.HISTORY_MAX_EVENTS,
+        history_max_age_days=config.HISTORY_MAX_AGE_DAYS
+    )
+
+    _state_manager = state_manager
+    return state_manager
+
+
+def _create_side_backend(local_file: str, gcs_file: str, state_key: str):
+    # 状態と同じ種類のバックエンドを、状態とは別の保存先で作成
+    # （SQLiteでは監視対象の状態のテーブルを使わず、キーと値だけを保存する）
+    kind = config.STATE_BACKEND
+    if kind in ('auto', ''):
+        kind = 'gcs' if config.USE_CLOUD_STORAGE and config.GCS_BUCKET_NAME else 'json'
+
+    return create_state_backend(
+        kind,
+        state_file_path=local_file,
+        gcs_bucket_name=config.GCS_BUCKET_NAME,
+        gcs_state_file=gcs_file,
+        db_path=config.STATE_DB_FILE,
+        state_key=state_key,
+        key_value=True
+    )
+
+
+@_synchronized
+def get_dedup_cache() -> Optional[NotificationDedupCache]:
+    """
+    通知済みキャッシュを取得（状態と同じ種類のバックエンドに、状態とは別に保存）
+
+    NOTIFY_DEDUP_PERSISTが無効の場合は保存せず、同じインスタンスの実行間でメモリ上に保持する。
+
+    Returns:
+        NotificationDedupCacheインスタンス（無効時はNone）
+    """
+    global _dedup_cache
+
+    if not config.NOTIFY_DEDUP:
+        return None
+    if _dedup_cache is not None:
+        return _dedup_cache
+
+    backend = None
+    if config.NOTIFY_DEDUP_PERSIST:
+        backend = _create_side_backend(
+            config.NOTIFY_DEDUP_FILE,
+            config.GCS_NOTIFY_DEDUP_FILE,
+            'notification_dedup'
+        )
+    _dedup_cache = NotificationDedupCache(
+        backend,
+        ttl_seconds=config.NOTIFY_DEDUP_TTL_HOURS * 3600,
+        max_entries=config.NOTIFY_DEDUP_MAX_ENTRIES
+    )
+    return _dedup_cache
+
+
+@_synchronized
+def get_snapshot_store() -> Optional[SnapshotStore]:
+    """
+    取得したページのスナップショットストアを取得
+
+    Returns:
+        SnapshotStoreインスタンス（無効時はNone）
+    """
+    global _snapshot_store
+
+    if not config.SNAPSHOT_STORE:
+        return None
+    if _snapshot_store is None:
+        _snapshot_store = SnapshotStore(
+            config.SNAPSHOT_DIR,
+            max_bytes=config.SNAPSHOT_MAX_MB * 1024 * 1024,
+            max_age_days=config.SNAPSHOT_MAX_AGE_DAYS,
+            pack_size=config.SNAPSHOT_PACK_MB * 1024 * 1024
+        )
+    return _snapshot_store
+
+
+@_synchronized
+def get_hedger() -> Optional[HedgedFetcher]:
+    """
+    ページ取得のヘッジを取得（ホストごとの応答時間は同一プロセスの実行間で共有）
+
+    Returns:
+        HedgedFetcherインスタンス（無効時はNone）
+    """
+    global _hedger
+
+    if not config.FETCH_HEDGING:
+        return None
+    if _hedger is None:
+        _hedger = HedgedFetcher(
+            percentile=config.FETCH_HEDGE_PERCENTILE,
+            min_samples=config.FETCH_HEDGE_MIN_SAMPLES,
+            max_ratio=config.FETCH_HEDGE_MAX_RATIO
+        )
+    return _hedger
+
+
+@_synchronized
+def get_http_client() -> HttpClient:
+    """
+    ページ取得のHTTPクライアントを取得（接続は同一プロセスの実行間で使い回す）
+
+    Returns:
+        HttpClientインスタンス
+    """
+    global _http_client
+
+    if _http_client is None:
+        _http_client = create_http_client(
+            prefer_http2=config.FETCH_HTTP2,
+            headers={'User-Agent': config.USER_AGENT},
+            max_connections=config.FETCH_MAX_CONNECTIONS
+        )
+    return _http_client
+
+
+@_synchronized
+def get_politeness_scheduler() -> Optional[PolitenessScheduler]:
+    """
+    ホストごとのアクセス間隔の制御を取得（ホストの状態は状態と同じ種類のバックエンドに、状態とは別に保存）
+
+    HOST_HEALTH_PERSISTが無効の場合は保存せず、同じインスタンスの実行間でメモリ上に保持する。
+
+    Returns:
+        PolitenessSchedulerインスタンス（無効時はNone）
+    """
+    global _scheduler
+
+    if not config.HOST_POLITENESS:
+        return None
+    if _scheduler is None:
+        backend = None
+        if config.HOST_HEALTH_PERSIST:
+            backend = _create_side_backend(config.HOST_HEALTH_FILE, config.GCS_HOST_HEALTH_FILE, 'host_health')
+        _scheduler = PolitenessScheduler(
+            backend,
+            min_interval=config.HOST_MIN_INTERVAL,
+            max_interval=config.HOST_MAX_INTERVAL,
+            backoff_factor=config.HOST_BACKOFF_FACTOR,
+            recovery_step=config.HOST_RECOVERY_STEP
+        )
+    return _scheduler
+
+
+def get_priority_scorer() -> Optional[PriorityScorer]:
+    """
+    設定から優先度の判定ルールを作成
+
+    Returns:
+        PriorityScorerインスタンス（優先度別の通知が無効の場合はNone）
+    """
+    if not config.PRIORITY_ALERTS:
+        return None
+
+    return PriorityScorer(
+        type_weights=config.PRIORITY_TYPE_WEIGHTS,
+        keyword_weights=config.PRIORITY_KEYWORD_WEIGHTS,
+        url_patterns=config.PRIORITY_URL_PATTERNS,
+        threshold=config.PRIORITY_THRESHOLD
+    )
+
+
+@_synchronized
+def get_digest_queue() -> DigestQueue:
+    """
+    ダイジェストで通知するアイテムのキューを取得（状態とは別に保存）
+
+    Returns:
+        DigestQueueインスタンス
+    """
+    global _digest_queue
+
+    if _digest_queue is None:
+        backend = None
+        if config.DIGEST_INTERVAL_MINUTES > 0:
+            backend = _create_side_backend(config.DIGEST_FILE, config.GCS_DIGEST_FILE, 'digest')
+        _digest_queue = DigestQueue(
+            backend,
+            interval_seconds=config.DIGEST_INTERVAL_MINUTES * 60,
+            max_items=config.DIGEST_MAX_ITEMS
+        )
+    return _digest_queue
+
+
+def send_digest(dispatcher: NotificationDispatcher, items: List[Dict],
+                deadline: Optional[Deadline] = None) -> Dict[str, bool]:
+    """
+    ダイジェストにアイテムを追加し、送信時刻になっていればまとめて送信
+
+    Args:
+        dispatcher: 通知の配信
+        items: ダイジェストに追加するアイテム
+        deadline: 実行の期限
+
+    Returns:
+        チャネル名と成否の辞書（送信しなかった場合は空）
+    """
+    digest = get_digest_queue()
+    digest.add(items)
+
+    channel_results: Dict[str, bool] = {}
+    if digest.is_due():
+        digest_items = digest.drain()
+        channel_results = dispatcher.send_lottery_notification_v2(digest_items, deadline=deadline)
+        if not any(channel_results.values()):
+            # すべてのチャネルで失敗した場合は次回に再送
+            digest.requeue(digest_items)
+    elif digest.pending_count():
+        logger.info(f"ダイジェストに{digest.pending_count()}件を保留中")
+
+    digest.save()
+    return channel_results
+
+
+@_synchronized
+def get_dispatcher() -> NotificationDispatcher:
+    """
+    設定されたすべての通知チャネルへ配信するディスパッチャーを取得
+
+    Returns:
+        NotificationDispatcherインスタンス
+    """
+    global _dispatcher
+
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher(
+            create_channels(config, dedup_cache=get_dedup_cache()),
+            grace_seconds=config.NOTIFY_GRACE_SECONDS
+        )
+    return _dispatcher
+
+
+def send_error_notification(error_msg: str, deadline: Optional[Deadline] = None):
+    """
+    設定済みのチャネルにエラー通知を送信（送信できない場合は何もしない）
+
+    Args:
+        error_msg: エラーメッセージ
+        deadline: 実行の期限
+    """
+    try:
+        get_dispatcher().send_error_notification(error_msg, deadline=deadline)
+    except Exception as e:
+        logger.warning(f"エラー通知を送信できませんでした: {e}")
+
+
+@_synchronized
+def get_subscription_index() -> Optional[SubscriptionIndex]:
+    """
+    購読者ごとのキーワードの転置インデックスを取得（購読は状態と同じ種類のバックエンドに、状態とは別に保存）
+
+    設定ファイルのキーワード（WATCH_KEYWORDS）も、設定された通知チャネルへの購読として含める。
+
+    Returns:
+        SubscriptionIndexインスタンス（無効時はNone）
+    """
+    global _subscription_index
+
+    if not config.SUBSCRIPTIONS:
+        return None
+    if _subscription_index is None:
+        store = SubscriptionStore(
+            _create_side_backend(config.SUBSCRIPTIONS_FILE, config.GCS_SUBSCRIPTIONS_FILE, 'subscriptions')
+        )
+        default = Subscription(DEFAULT_SUBSCRIPTION, '', config.WATCH_KEYWORDS, config.KEYWORD_MATCH_MODE)
+        _subscription_index = SubscriptionIndex([default] + store.all())
+        stats = _subscription_index.get_stats()
+        logger.info(f"購読: {stats['subscriptions'] - 1}件（キーワード: {stats['keywords']}件）")
+    return _subscription_index
+
+
+def get_watch_keywords() -> Tuple[List[str], str]:
+    """
+    ページの抽出に使うキーワードとマッチモード
+
+    Returns:
+        (キーワードのリスト, マッチモード)（購読がある場合は全購読のキーワードの和集合で 'any'）
+    """
+    index = get_subscription_index()
+    if index is None:
+        return config.WATCH_KEYWORDS, config.KEYWORD_MATCH_MODE
+    return index.union_keywords(), 'any'
+
+
+def _create_scraper(url: str, **overrides) -> Switch2Scraper:
+    # 設定からスクレイパーを作成（CONTEXT_LIMITSで監視対象ごとの上限、overridesで個別の引数を上書き）
+    options = dict(
+        incremental=config.INCREMENTAL_EXTRACTION,
+        context_max_siblings=config.CONTEXT_MAX_SIBLINGS,
+        context_max_nodes=config.CONTEXT_MAX_NODES,
+        context_max_chars=config.CONTEXT_MAX_CHARS,
+        snapshot_store=get_snapshot_store(),
+        parser_backend=config.PARSER_BACKEND,
+        keyword_prefilter=config.KEYWORD_PREFILTER,
+        connect_timeout=config.FETCH_CONNECT_TIMEOUT,
+        read_timeout=config.REQUEST_TIMEOUT,
+        retry_policy=RetryPolicy(
+            max_attempts=config.FETCH_MAX_ATTEMPTS,
+            base_delay=config.FETCH_BACKOFF_BASE,
+            max_delay=config.FETCH_BACKOFF_MAX
+        ),
+        hedger=get_hedger(),
+        http_client=get_http_client(),
+        scheduler=get_politeness_scheduler()
+    )
+    options.update(context_limits_for(url, parse_context_limits(config.CONTEXT_LIMITS)))
+    options.update(overrides)
+    keywords, match_mode = get_watch_keywords()
+    return Switch2Scraper(url, keywords, match_mode, **options)
+
+
+@_synchronized
+def get_scraper() -> Switch2Scraper:
+    """
+    スクレイパーを取得（抽出ルールのコンパイル結果・接続は同一プロセスの実行間で使い回す）
+
+    Returns:
+        Switch2Scraperインスタンス
+    """
+    global _scraper
+
+    if _scraper is None:
+        _scraper = _create_scraper(config.TARGET_URL)
+    return _scraper
+
+
+@_synchronized
+def get_target_scraper(url: str) -> Switch2Scraper:
+    """
+    監視ページ以外の監視対象のスクレイパーを取得（スナップショットの保存は行わない）
+
+    Args:
+        url: 監視対象のURL
+
+    Returns:
+        Switch2Scraperインスタンス
+    """
+    scraper = _target_scrapers.get(url)
+    if scraper is None:
+        scraper = _target_scrapers[url] = _create_scraper(url, snapshot_store=None)
+    return scraper
+
+
+@_synchronized
+def get_discovery_crawler() -> Optional[DiscoveryCrawler]:
+    """
+    探索クロールを取得（探索の状態は状態と同じ種類のバックエンドに、状態とは別に保存）
+
+    Returns:
+        DiscoveryCrawlerインスタンス（無効時はNone）
+    """
+    global _discovery
+
+    if not config.DISCOVERY_CRAWL:
+        return None
+    if _discovery is None:
+        _discovery = DiscoveryCrawler(
+            _create_side_backend(config.DISCOVERY_FILE, config.GCS_DISCOVERY_FILE, 'discovery'),
+            lambda url: _create_scraper(url, incremental=False, snapshot_store=None, hedger=None),
+            get_http_client(),
+            allowed_hosts=[urlparse(config.TARGET_URL).netloc],
+            max_depth=config.DISCOVERY_MAX_DEPTH,
+            max_pages=config.DISCOVERY_MAX_PAGES,
+            concurrency=config.DISCOVERY_CONCURRENCY,
+            max_targets=config.DISCOVERY_MAX_TARGETS,
+            max_attempts=config.DISCOVERY_MAX_ATTEMPTS,
+            root_urls=[config.TARGET_URL],
+            sitemap_url=config.DISCOVERY_SITEMAP_URL,
+            sitemap_interval_seconds=config.DISCOVERY_SITEMAP_INTERVAL_MINUTES * 60,
+            timeout=(config.FETCH_CONNECT_TIMEOUT, config.REQUEST_TIMEOUT)
+        )
+    return _discovery
+
+
+def scan_additional_targets(urls: List[str], scan_result: Dict,
+                            previous_state: Optional[Dict] = None,
+                            deadline: Optional[Deadline] = None) -> int:
+    """
+    監視ページ以外の監視対象（EXTRA_TARGET_URLS・探索で追加したページ）をスキャンし、
+    アイテムを監視ページのスキャン結果に加える
+
+    監視ページと同じアイテム（共通のヘッダーなど）は加えない。取得に失敗したページのアイテムは
+    その回だけ消えた扱いになり、次に取得できたときは再出現として扱われる（再通知しない）。
+    チャンク単位の差分抽出に使うチャンクのハッシュは、監視対象のURLごとに状態の target_chunks に保存する。
+
+    Args:
+        urls: 監視対象のURLのリスト（get_additional_urlsの結果）
+        scan_result: 監視ページのスキャン結果（items・item_count・hash・target_chunksを更新する）
+        previous_state: 前回の状態（監視対象ごとのチャンク単位の差分抽出に使用）
+        deadline: 実行の期限
+
+    Returns:
+        加えたアイテム数
+    """
+    if not urls:
+        return 0
+
+    previous_items = (previous_state or {}).get('items') or []
+    previous_chunks = (previous_state or {}).get('target_chunks') or {}
+
+    def scan_target(scraper: Switch2Scraper, fetched: FetchResult) -> Dict:
+        # そのURLで前回抽出したチャンクと、それらのチャンクのアイテムだけを前回の状態として渡す
+        chunks = previous_chunks.get(scraper.target_url) or []
+        known = set(chunks)
+        target_state = {
+            'url': scraper.target_url,
+            'chunks': chunks,
+            'items': [item for item in previous_items if item.get('chunk') in known]
+        }
+        return scraper.scan_page(previous_state=target_state, deadline=deadline, fetched=fetched)
+
+    # ページはまとめて取得し（HTTP/2では1本の接続に多重化）、解析はページごとに行う
+    scrapers = [get_target_scraper(url) for url in urls]
+    results = [scan_target(scraper, fetched)
+               for scraper, fetched in zip(scrapers, fetch_pages(scrapers, deadline=deadline))]
+
+    items = scan_result['items']
+    known_ids = {item_id_of(item) for item in items}
+    target_chunks: Dict[str, List[str]] = {}
+    added = 0
+    for url, result in zip(urls, results):
+        if not result['success']:
+            # アイテムが状態に残らないため、次回はチャンクを使い回さずに全体を抽出する
+            logger.warning(f"追加した監視対象のスキャンに失敗: {url}（{result.get('error')}）")
+            continue
+        dropped = set()
+        for item in result['items']:
+            item_id = item_id_of(item)
+            if item_id in known_ids:
+                # 状態に残らないアイテムのチャンクは、次回は使い回さずに抽出し直す
+                dropped.add(item.get('chunk'))
+                continue
+            known_ids.add(item_id)
+            items.append(item)
+            added += 1
+        target_chunks[url] = [chunk for chunk in result.get('chunks', []) if chunk not in dropped]
+
+    scan_result['target_chunks'] = target_chunks
+    if added:
+        scan_result['item_count'] = len(items)
+        scan_result['hash'] = Switch2Scraper.compute_items_hash(items)
+    logger.info(f"追加した監視対象: {len(urls)}ページから{added}件")
+    return added
+
+
+def notify_subscribers(dispatcher: NotificationDispatcher, index: SubscriptionIndex,
+                       matches: Dict[str, List[Dict]], deadline: Optional[Deadline] = None) -> Dict:
+    """
+    購読者ごとに振り分けた新しいアイテムを通知（同じアイテムの組み合わせの購読者にはまとめて送信）
+
+    Args:
+        dispatcher: 通知の配信
+        index: 購読の転置インデックス
+        matches: 購読のIDと、条件に一致した新しいアイテムの辞書
+        deadline: 実行の期限
+
+    Returns:
+        実行結果に加える辞書（subscriber_count, subscriber_channels）
+    """
+    batches = index.deliveries({
+        subscription_id: items for subscription_id, items in matches.items()
+        if subscription_id != DEFAULT_SUBSCRIPTION
+    })
+    if not batches:
+        return {}
+    recipients = sum(len(batch_recipients) for _, batch_recipients in batches)
+    logger.info(f"{recipients}人の購読者に通知します（{len(batches)}通り）")
+    channel_results = dispatcher.send_subscriber_notifications(batches, deadline=deadline)
+    if not all(channel_results.values()):
+        logger.error("一部の購読者への通知に失敗しました")
+    return {'subscriber_count': recipients, 'subscriber_channels': channel_results}
+
+
+def get_additional_urls() -> List[str]:
+    """
+    監視ページ以外の監視対象のURL（EXTRA_TARGET_URLS・探索で追加したページ）
+
+    Returns:
+        URLのリスト（重複と監視ページを除く）
+    """
+    urls = list(config.EXTRA_TARGET_URLS)
+    crawler = get_discovery_crawler()
+    if crawler is not None:
+        urls += crawler.targets()
+    return [url for url in dict.fromkeys(urls) if url != config.TARGET_URL]
+
+
+def get_monitored_urls() -> List[str]:
+    """
+    監視対象のURL（監視ページ・EXTRA_TARGET_URLS・探索で追加したページ）
+
+    Returns:
+        URLのリスト（監視ページが先頭）
+    """
+    return [config.TARGET_URL] + get_additional_urls()
+
+
+def _scraper_for(url: str) -> Switch2Scraper:
+    return get_scraper() if url == config.TARGET_URL else get_target_scraper(url)
+
+
+def _shard_backend(shard: int):
+    return _create_side_backend(
+        config.SHARD_STATE_FILE.format(shard=shard),
+        config.GCS_SHARD_STATE_FILE.format(shard=shard),
+        f"shard_{shard}"
+    )
+
+
+@_synchronized
+def get_work_queue() -> WorkQueue:
+    """
+    シャードの作業メッセージ・報告のキューを取得（SHARD_QUEUE）
+
+    Returns:
+        WorkQueueインスタンス
+    """
+    global _work_queue
+
+    if _work_queue is None:
+        _work_queue = create_queue(config.SHARD_QUEUE, config.SHARD_QUEUE_DIR, config.PUBSUB_PROJECT_ID)
+    return _work_queue
+
+
+def get_shard_worker() -> ShardWorker:
+    """シャードのワーカーを作成（シャードの状態は状態と同じ種類のバックエンドに保存）"""
+    return ShardWorker(get_work_queue(), _shard_backend, _scraper_for, config.SHARD_RESULT_TOPIC)
+
+
+def run_shard_worker(message: Dict, deadline: Optional[Deadline] = None) -> Dict:
+    """
+    シャードの作業メッセージを処理
+
+    Args:
+        message: 作業メッセージ（run_id, shard, urls）
+        deadline: 実行の期限（省略時は設定から作成）
+
+    Returns:
+        報告の辞書
+    """
+    deadline = deadline or Deadline.from_config()
+    report = get_shard_worker().handle(message, deadline=deadline)
+    scheduler = get_politeness_scheduler()
+    if scheduler is not None:
+        scheduler.save()
+    return report
+
+
+def scan_shards(deadline: Deadline) -> Dict:
+    """
+    監視対象をシャードに分けてワーカーにスキャンさせ、報告を待ってシャードの状態をまとめる
+
+    SHARD_QUEUE=local の場合は、ワーカーを同じプロセスのスレッドで実行する。キューは実行ごとに作成し、
+    報告が間に合わなかったワーカーは中止して、終わるのを待ってからシャードの状態をまとめる
+    （遅れた作業・報告を次の実行に残さず、まとめている間にシャードの状態を書き換えさせない）。
+
+    Args:
+        deadline: 実行の期限
+
+    Returns:
+        Switch2Scraper.scan_page() と同じ形式のスキャン結果
+    """
+    local = config.SHARD_QUEUE == QUEUE_LOCAL
+    work_queue = InProcessQueue() if local else get_work_queue()
+    coordinator = ShardCoordinator(work_queue, _shard_backend, config.SHARD_COUNT,
+                                   config.SHARD_WORK_TOPIC, config.SHARD_RESULT_TOPIC)
+    dispatched = coordinator.dispatch(get_monitored_urls())
+
+    workers: List[threading.Thread] = []
+    cancelled = threading.Event()
+    if local:
+        worker = ShardWorker(work_queue, _shard_backend, _scraper_for, config.SHARD_RESULT_TOPIC)
+        workers = [
+            threading.Thread(target=worker.run_pending, args=(config.SHARD_WORK_TOPIC,),
+                             kwargs={'deadline': deadline, 'cancelled': cancelled}, daemon=True)
+            for _ in range(len(dispatched['plan']))
+        ]
+        for thread in workers:
+            thread.start()
+
+    reports = coordinator.collect(dispatched['run_id'], dispatched['published'], config.SHARD_WAIT_SECONDS,
+                                  deadline=deadline)
+
+    if workers:
+        cancelled.set()
+        # スキャン中のページは期限で打ち切られるため、取得・解析の残り時間（最低1秒）だけ待つ
+        give_up = time.monotonic() + min(max(deadline.work_remaining(), 1.0), deadline.remaining())
+        for thread in workers:
+            thread.join(timeout=max(0.0, give_up - time.monotonic()))
+        running = sum(thread.is_alive() for thread in workers)
+        if running:
+            logger.warning(f"終わらなかったシャードのワーカー: {running}件（結果は保存しません）")
+    return coordinator.merge(dispatched['plan'], reports, config.TARGET_URL)
+
+
+def run_discovery(crawler: DiscoveryCrawler, seed_urls: List[str],
+                  deadline: Optional[Deadline] = None) -> Dict:
+    """
+    探索を1回分進めて保存（失敗しても監視の結果には影響させない）
+
+    Args:
+        crawler: 探索クロール
+        seed_urls: 監視ページで見つかったリンクのURL
+        deadline: 実行の期限
+
+    Returns:
+        探索の結果の辞書
+    """
+    try:
+        result = crawler.crawl(seed_urls, deadline=deadline)
+        if result['promoted']:
+            logger.info(f"{len(result['promoted'])}ページを監視対象に追加しました（次回の実行からスキャン）")
+        crawler.save()
+        return result
+    except Exception as e:
+        logger.exception(f"探索でエラー: {e}")
+        return {'error': str(e)}
+
+
+def get_warmup_schedule() -> Optional[WarmupSchedule]:
+    """
+    販売の時間帯（SALE_WINDOWS）から事前準備の予定を作成
+
+    Returns:
+        WarmupScheduleインスタンス（時間帯が設定されていない場合はNone）
+    """
+    windows = parse_sale_windows(config.SALE_WINDOWS, config.SALE_WINDOW_DURATION_MINUTES)
+    if not windows:
+        return None
+    return WarmupSchedule(windows, lead_seconds=config.WARMUP_LEAD_SECONDS)
+
+
+@_synchronized
+def get_dns_cache() -> Optional[DnsCache]:
+    """
+    名前解決のキャッシュを取得（初回にsocket.getaddrinfoを置き換える）
+
+    Returns:
+        DnsCacheインスタンス（無効時はNone）
+    """
+    global _dns_cache
+
+    if config.DNS_CACHE_TTL <= 0:
+        return None
+    if _dns_cache is None:
+        _dns_cache = DnsCache(ttl_seconds=config.DNS_CACHE_TTL)
+        _dns_cache.install()
+    return _dns_cache
+
+
+def warm_up() -> Dict:
+    """
+    販売開始前の事前準備
+
+    名前解決をキャッシュし、ストア・通知先・状態の保存先への接続を確立し、
+    抽出ルールをコンパイルしておく（通知・ページの取得は行わない）。
+    状態そのものをメモリに保持するのは write-behind（STATE_WRITE_BEHIND）が有効な場合だけ。
+    接続・キャッシュは同一プロセスの以降の実行で使われる。
+
+    Returns:
+        実行結果の辞書
+    """
+    started = time.monotonic()
+    try:
+        config.validate_config()
+
+        dns_cache = get_dns_cache()
+        if dns_cache is not None:
+            dns_cache.resolve(urlparse(config.TARGET_URL).hostname)
+
+        scraper = get_scraper()
+        store_connected = scraper.warm_up()
+        channels = get_dispatcher().warm_up()
+
+        state_connected = get_state_manager().warm_up()
+        get_dedup_cache()
+        get_priority_scorer()
+
+        result = {
+            'status': ('success' if store_connected and state_connected and all(channels.values())
+                       else 'partial_success'),
+            'mode': 'warmup',
+            'store_connected': store_connected,
+            'state_connected': state_connected,
+            'channels': channels,
+            'elapsed': round(time.monotonic() - started, 2)
+        }
+        if dns_cache is not None:
+            result['dns_cache'] = dns_cache.get_stats()
+        logger.info(f"事前準備が完了しました（{result['elapsed']}秒）")
+        return result
+
+    except Exception as e:
+        logger.exception(f"事前準備でエラー: {e}")
+        return {
+            'status': 'error',
+            'mode': 'warmup',
+            'error': str(e)
+        }
+
+
+def check_lottery_and_notify(deadline: Optional[Deadline] = None) -> Dict:
     """
     抽選情報をチェックして、新しい情報があれば通知
 
+    取得・解析は実行の期限（RUN_DEADLINE_SECONDS）から状態の保存・通知の分
+    （DEADLINE_RESERVE_SECONDS）を除いた時間内に打ち切る。
+
+    Args:
+        deadline: 実行の期限（省略時は設定から作成）
+
     Returns:
         実行結果の辞書
     """
+    deadline = deadline or Deadline.from_config()
     try:
         # 設定のバリデーション
         config.validate_config()
 
         # コンポーネントの初期化
-        scraper = Switch2Scraper(
-            config.TARGET_URL,
-            config.WATCH_KEYWORDS,
-            config.KEYWORD_MATCH_MODE
-        )
-        notifier = LineNotifier(
-            config.LINE_CHANNEL_ACCESS_TOKEN,
-            config.LINE_USER_ID,
-            config.LINE_GROUP_ID
-        )
-        state_manager = StateManager(
-            config.STATE_FILE,
-            use_gcs=config.USE_CLOUD_STORAGE,
-            gcs_bucket_name=config.GCS_BUCKET_NAME,
-            gcs_state_file=config.GCS_STATE_FILE
-        )
+        scraper = get_scraper()
+        dispatcher = get_dispatcher()
+        state_manager = get_state_manager()
 
         logger.info("=" * 60)
         logger.info("Switch2 抽選販売監視を開始")
@@ -55,22 +848,81 @@ def check_lottery_and_notify() -> Dict:
         logger.info(f"キーワード数: {len(config.WATCH_KEYWORDS)}")
         logger.info("=" * 60)
 
-        # ページをスキャン
-        scan_result = scraper.scan_page()
+        # 前回の状態を読み込み、変化したチャンクだけを再抽出してスキャン
+        # （分散実行ではワーカーがシャードの状態を使って差分抽出する）
+        previous_state = state_manager.load_state()
+        sharded = config.SHARD_MODE == 'coordinator'
+        if sharded:
+            scan_result = scan_shards(deadline)
+        else:
+            scan_result = scraper.scan_page(previous_state=previous_state, deadline=deadline)
+        if scraper.scheduler is not None:
+            scraper.scheduler.save()
+
+        if scan_result.get('throttled'):
+            # 制限中のホストには送らずに終了（制限を受けた実行でエラー通知済み）
+            logger.warning(f"スキャンを見送りました: {scan_result.get('error')}")
+            retry_after = scraper.scheduler.wait_time(urlparse(config.TARGET_URL).netloc) if scraper.scheduler else 0.0
+            return {
+                'status': 'skipped',
+                'message': scan_result.get('error'),
+                'retry_after_seconds': round(retry_after),
+                'retry_at': datetime.fromtimestamp(time.time() + retry_after, timezone.utc).isoformat(),
+                'elapsed': round(deadline.elapsed(), 2)
+            }
 
         if not scan_result['success']:
             error_msg = f"スキャン失敗: {scan_result.get('error')}"
             logger.error(error_msg)
-            notifier.send_error_notification(error_msg)
+            dispatcher.send_error_notification(error_msg, deadline=deadline)
             return {
                 'status': 'error',
-                'error': error_msg
+                'error': error_msg,
+                'elapsed': round(deadline.elapsed(), 2)
             }
 
+        # EXTRA_TARGET_URLSと探索で追加した監視対象のアイテムを加える（探索は監視ページのリンクから始める）
+        crawler = get_discovery_crawler()
+        if sharded:
+            seed_urls = scan_result.get('seed_urls', [])
+        else:
+            seed_urls = [item.get('url', '') for item in scan_result['items']]
+            scan_additional_targets(get_additional_urls(), scan_result,
+                                    previous_state=previous_state, deadline=deadline)
+
         logger.info(f"スキャン成功: {scan_result['item_count']}件検出")
 
+        # 購読がある場合は新しいアイテムを購読者ごとに振り分け、通知チャネルには設定ファイルのキーワードの分だけを送る
+        subscription_index = get_subscription_index()
+        subscriber_matches: Optional[Dict[str, List[Dict]]] = None
+
+        def own_items(new_items: List[Dict]) -> List[Dict]:
+            nonlocal subscriber_matches
+            if subscription_index is None:
+                return new_items
+            if subscriber_matches is None:
+                subscriber_matches = subscription_index.match(new_items)
+            return subscriber_matches.get(DEFAULT_SUBSCRIPTION, [])
+
+        # 優先度の高いアイテムは状態の保存を待たずに速報を送信
+        scorer = get_priority_scorer()
+        urgent_items: List[Dict] = []
+        urgent_results: Dict[str, bool] = {}
+
+        def send_urgent(new_items: List[Dict]):
+            urgent, _ = scorer.split(own_items(new_items))
+            if urgent:
+                urgent_items.extend(urgent)
+                urgent_results.update(dispatcher.send_urgent_notification(urgent, deadline=deadline))
+
         # 前回の状態と比較
-        comparison = state_manager.compare_and_update(scan_result)
+        comparison = state_manager.compare_and_update(
+            scan_result,
+            previous_state=previous_state,
+            previous_state_loaded=True,
+            before_save=send_urgent if scorer else None
+        )
+        comparison['new_items'] = own_items(comparison['new_items'])
 
         result = {
             'status': 'success',
@@ -80,6 +932,11 @@ def check_lottery_and_notify() -> Dict:
             'is_first_run': comparison['is_first_run'],
             'notification_sent': False
         }
+        if scan_result.get('partial'):
+            # 報告がないか失敗したシャードは前回の状態でまとめた
+            result['status'] = 'partial_success'
+            result['missing_shards'] = scan_result['missing_shards']
+            result['failed_shards'] = scan_result['failed_shards']
 
         # 変更があれば通知
         if comparison['has_changes']:
@@ -90,21 +947,64 @@ def check_lottery_and_notify() -> Dict:
             else:
                 logger.info(f"{len(comparison['new_items'])}件の新しいコンテンツを検出")
 
-                # 通知用のメッセージを作成
-                if notifier.send_lottery_notification_v2(comparison['new_items']):
-                    logger.info("LINE通知を送信しました")
+                if not comparison['new_items']:
+                    channel_results = {}
+                elif scorer is None:
+                    # すべての通知チャネルに並列で送信
+                    channel_results = dispatcher.send_lottery_notification_v2(
+                        comparison['new_items'], deadline=deadline
+                    )
+                else:
+                    # 速報で送ったもの以外はダイジェストへ
+                    urgent_ids = {id(item) for item in urgent_items}
+                    digest_items = [item for item in comparison['new_items'] if id(item) not in urgent_ids]
+                    channel_results = send_digest(dispatcher, digest_items, deadline=deadline)
+                    result['urgent_count'] = len(urgent_items)
+                    result['urgent_channels'] = urgent_results
+                    for name, ok in urgent_results.items():
+                        channel_results[name] = channel_results.get(name, True) and ok
+                result['channels'] = channel_results
+
+                if not comparison['new_items']:
+                    result['message'] = '新しいアイテムなし'
+                elif not channel_results and scorer is not None:
+                    logger.info("ダイジェストの送信時刻まで通知を保留します")
+                    result['message'] = f"{len(comparison['new_items'])}件をダイジェストに保留"
+                elif channel_results and all(channel_results.values()):
+                    logger.info(f"通知を送信しました: {', '.join(channel_results)}")
                     result['notification_sent'] = True
                     result['message'] = f"{len(comparison['new_items'])}件の新情報を通知"
+                elif any(channel_results.values()):
+                    failed = [name for name, ok in channel_results.items() if not ok]
+                    logger.error(f"一部のチャネルで通知の送信に失敗しました: {', '.join(failed)}")
+                    result['notification_sent'] = True
+                    result['status'] = 'partial_success'
+                    result['message'] = f"通知送信失敗（{', '.join(failed)}）"
                 else:
-                    logger.error("LINE通知の送信に失敗しました")
+                    logger.error("通知の送信に失敗しました")
                     result['status'] = 'partial_success'
                     result['message'] = '通知送信失敗'
         else:
             logger.info("変更なし: 通知はスキップします")
             result['message'] = '変更なし'
+            if scorer is not None and config.DIGEST_INTERVAL_MINUTES > 0:
+                # 保留中のダイジェストの送信時刻を確認
+                digest_results = send_digest(dispatcher, [], deadline=deadline)
+                if digest_results:
+                    result['channels'] = digest_results
+                    result['notification_sent'] = any(digest_results.values())
+                    result['message'] = '変更なし（保留中のダイジェストを送信）'
+
+        if subscriber_matches and not comparison['is_first_run']:
+            result.update(notify_subscribers(dispatcher, subscription_index, subscriber_matches, deadline=deadline))
+
+        if crawler is not None:
+            result['discovery'] = run_discovery(crawler, seed_urls, deadline=deadline)
+
+        result['elapsed'] = round(deadline.elapsed(), 2)
 
         logger.info("=" * 60)
-        logger.info(f"監視結果: {result['message']}")
+        logger.info(f"監視結果: {result['message']}（{result['elapsed']}秒）")
         logger.info("=" * 60)
 
         return result
@@ -114,15 +1014,7 @@ def check_lottery_and_notify() -> Dict:
         error_msg = f"設定エラー: {str(e)}"
         logger.error(error_msg)
 
-        try:
-            notifier = LineNotifier(
-                config.LINE_CHANNEL_ACCESS_TOKEN,
-                config.LINE_USER_ID,
-                config.LINE_GROUP_ID
-            )
-            notifier.send_error_notification(error_msg)
-        except:
-            pass
+        send_error_notification(error_msg, deadline=deadline)
 
         return {
             'status': 'error',
@@ -134,16 +1026,7 @@ def check_lottery_and_notify() -> Dict:
         error_msg = f"予期しないエラー: {str(e)}"
         logger.exception(error_msg)
 
-        try:
-            if config.LINE_CHANNEL_ACCESS_TOKEN:
-                notifier = LineNotifier(
-                    config.LINE_CHANNEL_ACCESS_TOKEN,
-                    config.LINE_USER_ID,
-                    config.LINE_GROUP_ID
-                )
-                notifier.send_error_notification(error_msg)
-        except:
-            pass
+        send_error_notification(error_msg, deadline=deadline)
 
         return {
             'status': 'error',
@@ -151,6 +1034,67 @@ def check_lottery_and_notify() -> Dict:
         }
 
 
+def run_check(force: bool = False) -> Dict:
+    """
+    監視対象のスキャンを実行
+
+    SINGLE_FLIGHT有効時は、同じインスタンスに同時に届いたスキャンを1回にまとめ、実行中のスキャンに
+    相乗りしたリクエストには同じ結果を返す（'shared': True）。状態をリセットする強制通知は
+    実行中のスキャンが終わるのを待ってから改めて実行する。
+
+    Args:
+        force: 状態をリセットしてから実行する場合True
+
+    Returns:
+        実行結果の辞書
+    """
+    def run() -> Dict:
+        if force:
+            get_state_manager().reset_state()
+            logger.info("状態をリセットしました")
+        return check_lottery_and_notify()
+
+    if not config.SINGLE_FLIGHT:
+        return run()
+
+    result, shared = _single_flight.do(config.TARGET_URL, run, share=not force)
+    if shared:
+        logger.info("実行中のスキャンの結果を返します")
+        result = dict(result, shared=True)
+    return result
+
+
+def get_status() -> Dict:
+    """
+    スキャンを行わずに、実行中のスキャン・前回の結果・共有しているキャッシュの状況を返す
+
+    Returns:
+        状況の辞書
+    """
+    finished_at, last_result = _single_flight.last_result(config.TARGET_URL)
+    components = {}
+    for name, component in (('hedger', _hedger), ('dns_cache', _dns_cache),
+                            ('discovery', _discovery), ('subscriptions', _subscription_index)):
+        if component is not None:
+            components[name] = component.get_stats()
+
+    return {
+        'status': 'success',
+        'mode': 'status',
+        'target_url': config.TARGET_URL,
+        'in_flight': _single_flight.in_flight(),
+        'single_flight': _single_flight.get_stats(),
+        'last_finished_at': datetime.fromtimestamp(finished_at, timezone.utc).isoformat() if finished_at else None,
+        'last_result': last_result,
+        'components': components
+    }
+
+
+def _status_code(result: Dict) -> int:
+    # 制限中のため見送った実行は失敗として扱わない（Cloud Schedulerが制限中のホストへ再試行しないように）
+    return 200 if result['status'] in ['success', 'partial_success', 'skipped'] else 500
+
+
 @functions_framework.http
 def main(request: Request) -> Any:
     """
@@ -167,23 +1111,32 @@ def main(request: Request) -> Any:
     # クエリパラメータでテストモードを確認
     test_mode = request.args.get('test', 'false').lower() == 'true'
     force_notify = request.args.get('force', 'false').lower() == 'true'
+    warmup_mode = request.args.get('warmup', 'false').lower() == 'true'
+    status_mode = request.args.get('status', 'false').lower() == 'true'
+
+    if status_mode:
+        # 状況の確認: スキャン中でも待たずに、実行中のスキャン・前回の結果・キャッシュの状況を返す
+        return get_status(), 200
+
+    elif warmup_mode:
+        # 事前準備モード: 販売開始前に接続・状態・抽出ルールを準備（Cloud Schedulerから開始の少し前に呼び出す）
+        logger.info("事前準備モードで実行")
+        result = warm_up()
+        status_code = _status_code(result)
+        return result, status_code
 
-    if test_mode:
+    elif test_mode:
         # テストモード: テスト通知を送信
         logger.info("テストモードで実行")
         try:
             config.validate_config()
-            notifier = LineNotifier(
-                config.LINE_CHANNEL_ACCESS_TOKEN,
-                config.LINE_USER_ID,
-                config.LINE_GROUP_ID
-            )
-            notifier.send_test_notification()
+            channel_results = get_dispatcher().send_test_notification()
 
             return {
-                'status': 'success',
+                'status': 'success' if all(channel_results.values()) else 'partial_success',
                 'mode': 'test',
-                'message': 'テスト通知を送信しました'
+                'message': 'テスト通知を送信しました',
+                'channels': channel_results
             }, 200
         except Exception as e:
             logger.exception(f"テストモードでエラー: {e}")
@@ -197,17 +1150,8 @@ def main(request: Request) -> Any:
         # 強制通知モード: 状態をリセットして実行
         logger.info("強制通知モードで実行")
         try:
-            state_manager = StateManager(
-                config.STATE_FILE,
-                use_gcs=config.USE_CLOUD_STORAGE,
-                gcs_bucket_name=config.GCS_BUCKET_NAME,
-                gcs_state_file=config.GCS_STATE_FILE
-            )
-            state_manager.reset_state()
-            logger.info("状態をリセットしました")
-
-            result = check_lottery_and_notify()
-            status_code = 200 if result['status'] in ['success', 'partial_success'] else 500
+            result = run_check(force=True)
+            status_code = _status_code(result)
             return result, status_code
 
         except Exception as e:
@@ -219,9 +1163,9 @@ def main(request: Request) -> Any:
             }, 500
 
     else:
-        # 通常モード: 抽選をチェック
-        result = check_lottery_and_notify()
-        status_code = 200 if result['status'] in ['success', 'partial_success'] else 500
+        # 通常モード: 抽選をチェック（同時に届いたスケジュール実行は1回のスキャンにまとめる）
+        result = run_check()
+        status_code = _status_code(result)
         return result, status_code
 
 
@@ -236,12 +1180,135 @@ def main_pubsub(cloud_event):
     """
     logger.info("Switch2監視システムを起動（Pub/Sub）")
 
-    result = check_lottery_and_notify()
+    message = _pubsub_payload(cloud_event)
+    if 'shard' in message:
+        # シャードの作業メッセージ（分散実行のワーカー）
+        result = run_shard_worker(message)
+    else:
+        result = run_check()
     logger.info(f"実行結果: {json.dumps(result, ensure_ascii=False)}")
 
 
+def _pubsub_payload(cloud_event) -> Dict:
+    # Pub/Subのメッセージ本文（JSON）を取り出す（JSONでない場合は空）
+    try:
+        data = cloud_event.data['message'].get('data', '')
+        payload = json.loads(base64.b64decode(data).decode('utf-8')) if data else {}
+        return payload if isinstance(payload, dict) else {}
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {}
+
+
+def run_shard_worker_loop(poll_seconds: float):
+    """
+    キューの作業メッセージを待って処理し続ける（SHARD_QUEUE=file のワーカー用）
+
+    Args:
+        poll_seconds: メッセージを待つ秒数
+    """
+    worker = get_shard_worker()
+    logger.info(f"シャードのワーカーとして起動（キュー: {config.SHARD_QUEUE}）")
+    try:
+        while True:
+            worker.run_pending(config.SHARD_WORK_TOPIC, timeout=poll_seconds, deadline=Deadline.from_config())
+            scheduler = get_politeness_scheduler()
+            if scheduler is not None:
+                scheduler.save()
+    except KeyboardInterrupt:
+        logger.info("ワーカーを停止します")
+
+
+def _wait_for_next_poll(seconds: float, schedule: Optional[WarmupSchedule]):
+    """
+    次の監視まで待つ
+
+    販売の時間帯が設定されている場合は、開始の少し前に事前準備を行い、
+    開始時刻が次の監視より前であれば開始時刻ちょうどに監視を始める。
+
+    Args:
+        seconds: 次の監視までの秒数
+        schedule: 事前準備の予定
+    """
+    wake_at = time.time() + seconds
+    while schedule is not None:
+        now = datetime.now(timezone.utc)
+        warmup_at, starts_at = schedule.next_events(now)
+        if warmup_at is not None and warmup_at.timestamp() < wake_at:
+            time.sleep(max(0.0, warmup_at.timestamp() - time.time()))
+            logger.info(f"販売開始（{starts_at.isoformat()}）に向けて事前準備を行います")
+            warm_up()
+            continue
+        if starts_at is not None and starts_at.timestamp() < wake_at:
+            wake_at = starts_at.timestamp()
+            logger.info(f"販売開始（{starts_at.isoformat()}）に合わせて監視します")
+        break
+    time.sleep(max(0.0, wake_at - time.time()))
+
+
+def serve(port: int):
+    """
+    ローカルでHTTPサーバーとして起動し、複数のリクエストを同時に処理する
+
+    Cloud Runで同時実行数（--concurrency）を2以上にした場合と同じく、1つのプロセスのスレッドで
+    リクエストを処理し、コンポーネント・接続・キャッシュをリクエスト間で共有する。
+
+    Args:
+        port: 待ち受けるポート
+    """
+    app = functions_framework.create_app(target='main', source=__file__)
+    logger.info(f"HTTPサーバーとして起動（ポート: {port}、同じ監視対象への同時のスキャンをまとめる: {config.SINGLE_FLIGHT}）")
+    app.run(host='0.0.0.0', port=port, threaded=True)
+
+
+def run_daemon(interval: int):
+    """
+    常駐モードで定期的に監視を実行
+
+    write-behindを有効にすると、実行ごとの状態の読み書きはメモリ上で完結し、
+    バックエンドへはまとめて書き込まれる。SIGTERM受信時は状態をフラッシュして終了する。
+    販売の時間帯（SALE_WINDOWS）が設定されている場合は、開始前に事前準備を行い、開始時刻に監視する。
+
+    Args:
+        interval: ポーリング間隔（秒）
+    """
+    state_manager = get_state_manager()
+    if config.STATE_WRITE_BEHIND:
+        state_manager.install_signal_handlers()
+    schedule = get_warmup_schedule()
+
+    logger.info(f"デーモンモードで起動（間隔: {interval}秒）")
+    if schedule is not None:
+        logger.info(f"販売の時間帯: {len(schedule.windows)}件（開始{config.WARMUP_LEAD_SECONDS:g}秒前に事前準備）")
+
+    try:
+        while True:
+            started = time.monotonic()
+            result = check_lottery_and_notify()
+            logger.info(f"実行結果: {json.dumps(result, ensure_ascii=False)}")
+
+            elapsed = time.monotonic() - started
+            _wait_for_next_poll(max(0.0, interval - elapsed), schedule)
+    except KeyboardInterrupt:
+        logger.info("デーモンを停止します")
+    finally:
+        if config.STATE_WRITE_BEHIND:
+            state_manager.close()
+
+
 # ローカルテスト用
 if __name__ == '__main__':
+    if '--daemon' in sys.argv:
+        run_daemon(config.POLL_INTERVAL)
+        sys.exit(0)
+
+    if '--serve' in sys.argv:
+        serve(config.SERVE_PORT)
+        sys.exit(0)
+
+    if '--shard-worker' in sys.argv:
+        run_shard_worker_loop(config.POLL_INTERVAL)
+        sys.exit(0)
+
     print("=" * 60)
     print("Switch2 抽選販売監視システム - ローカルテスト")
     print("=" * 60)
@@ -0,0 +1,478 @@
+"""
+通知メッセージのレンダリング
+テンプレートとタイプ別の書式ルールは一度だけ作成し、同じアイテムの整形結果を使い回す
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from string import Template
+from typing import Dict, List, Optional, Tuple
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 通知形式
+FORMAT_TEXT = 'text'
+FORMAT_FLEX = 'flex'
+
+# 区切り線
+RULE_LINE = '━' * 18
+SECTION_LINE = '─' * 20
+
+# 通知に表示するタイプの順序（ここにないタイプは表示しない）
+TYPE_PRIORITY = ('heading', 'banner', 'link', 'paragraph')
+
+# URLの短縮表示（ストアのトップページは表示しない）
+STORE_ORIGIN = 'https://store-jp.nintendo.com'
+STORE_HOST = 'store-jp.nintendo.com'
+STORE_SHORT_ORIGIN = '...nintendo.com'
+STORE_TOP_URLS = frozenset((STORE_ORIGIN, STORE_ORIGIN + '/'))
+
+# テキスト形式のテンプレート
+HEADER_TEMPLATE = Template(f"\n{RULE_LINE}\n$title\n{RULE_LINE}\n")
+SECTION_TEMPLATE = Template(f"$label\n{SECTION_LINE}")
+ITEM_TEMPLATE = Template("\n$emoji $title")
+SUMMARY_TEMPLATE = Template("   $summary")
+URL_TEMPLATE = Template("   🔗 $url")
+REMAINING_TEMPLATE = Template("   ...他 ${count}件")
+FOOTER_TEMPLATE = Template(
+    f"\n{RULE_LINE}\n検出時刻: $detected_at\n検出総数: ${{total}}件\n{RULE_LINE}"
+)
+
+# 速報（優先度の高いアイテムの即時通知）のテンプレート
+URGENT_HEADER_TEMPLATE = Template("$title")
+URGENT_ITEM_TEMPLATE = Template("\n$emoji $title")
+URGENT_URL_TEMPLATE = Template("$url")
+URGENT_MAX_ITEMS = 5
+
+# Flex Messageの代替テキストの最大文字数
+FLEX_ALT_TEXT_LENGTH = 400
+
+
+@dataclass(frozen=True)
+class TypeStyle:
+    """アイテムのタイプごとの書式ルール"""
+
+    label: str
+    emoji: str
+    max_items: int = 3            # 各タイプの最大表示件数（見やすさのため）
+    title_length: int = 80        # タイトルの最大文字数
+    summary_length: int = 100     # 概要の最大文字数
+    max_content_length: int = 120  # 概要を表示する本文の最大文字数
+    url_length: int = 60          # 短縮URLの最大文字数
+    color: str = '#333333'        # Flex Messageの見出し色
+
+
+TYPE_STYLES: Dict[str, TypeStyle] = {
+    'heading': TypeStyle('📌 重要見出し', '💡', color='#E60012'),
+    'banner': TypeStyle('📢 バナー情報', '🔔', color='#FF8C00'),
+    'link': TypeStyle('🔗 関連リンク', '➡️', color='#0066CC'),
+    'paragraph': TypeStyle('📝 詳細情報', '📄', color='#555555'),
+}
+
+
+@dataclass(frozen=True)
+class RenderedItem:
+    """1件のアイテムの整形結果（受信者によらず共通）"""
+
+    title: str
+    summary: str
+    display_url: str
+    url: str
+    lines: Tuple[str, ...] = field(repr=False)
+
+
+@dataclass
+class RenderedNotification:
+    """
+    レンダリング済みの通知
+
+    テキストとFlex Messageのペイロードは初回参照時に一度だけ作成し、
+    複数の送信先へ同じものを送る。
+    """
+
+    renderer: 'MessageRenderer' = field(repr=False)
+    sections: List[Tuple[str, List[RenderedItem], int]] = field(repr=False)
+    total: int
+    detected_at: str
+    items: List[Dict] = field(default_factory=list, repr=False)  # 元のアイテム（Webhook等で送信）
+    _text: Optional[str] = field(default=None, init=False, repr=False)
+    _flex: Optional[Dict] = field(default=None, init=False, repr=False)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.renderer.build_text(self)
+        return self._text
+
+    @property
+    def flex(self) -> Dict:
+        if self._flex is None:
+            self._flex = self.renderer.build_flex(self)
+        return self._flex
+
+    def to_messages(self, message_format: str = FORMAT_TEXT) -> List[Dict]:
+        """
+        Messaging APIに送信するメッセージオブジェクトのリストを取得
+
+        Args:
+            message_format: 'text' または 'flex'
+
+        Returns:
+            メッセージオブジェクトのリスト
+        """
+        if message_format == FORMAT_FLEX:
+            return [self.flex]
+        return [{'type': 'text', 'text': self.text}]
+
+
+class MessageRenderer:
+    """検出アイテムの通知メッセージを作成するクラス"""
+
+    def __init__(self, title: str = '🎮 Switch2 新情報検出！',
+                 urgent_title: str = '🚨 Switch2 速報',
+                 type_styles: Optional[Dict[str, TypeStyle]] = None,
+                 type_priority: Tuple[str, ...] = TYPE_PRIORITY,
+                 cache_size: int = 1024):
+        """
+        Args:
+            title: 通知のタイトル
+            urgent_title: 速報のタイトル
+            type_styles: タイプごとの書式ルール（省略時は TYPE_STYLES）
+            type_priority: 表示するタイプの順序
+            cache_size: アイテムの整形結果を保持する最大件数
+        """
+        self.title = title
+        self.type_styles = type_styles or TYPE_STYLES
+        self.type_priority = tuple(type_priority)
+        self.cache_size = cache_size
+
+        self._header = HEADER_TEMPLATE.substitute(title=title)
+        self._urgent_header = URGENT_HEADER_TEMPLATE.substitute(title=urgent_title)
+        self._section_headers = {
+            item_type: SECTION_TEMPLATE.substitute(label=style.label)
+            for item_type, style in self.type_styles.items()
+        }
+
+        self._item_cache: 'OrderedDict[Tuple, RenderedItem]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _truncate(text: str, length: int) -> str:
+        return text[:length - 3] + '...' if len(text) > length else text
+
+    @staticmethod
+    def shorten_url(url: str, length: int = 60) -> str:
+        """
+        ストアのURLを短縮表示用に変換
+
+        Args:
+            url: 対象のURL
+            length: 最大文字数
+
+        Returns:
+            短縮表示用のURL（ストア以外・トップページの場合は空文字列）
+        """
+        if not url or STORE_HOST not in url or url in STORE_TOP_URLS:
+            return ''
+        display_url = url.replace(STORE_ORIGIN, STORE_SHORT_ORIGIN)
+        return MessageRenderer._truncate(display_url, length)
+
+    @staticmethod
+    def extract_summary(title: str, content: str, style: TypeStyle) -> str:
+        """
+        "タイトル | 追加情報" 形式の本文から概要を取り出す
+
+        Args:
+            title: タイトル
+            content: 本文
+            style: 書式ルール
+
+        Returns:
+            概要（表示しない場合は空文字列）
+        """
+        if not content or content == title or len(content) > style.max_content_length:
+            return ''
+        _, separator, rest = content.partition('|')
+        if not separator:
+            return ''
+        return rest.split('|', 1)[0].strip()[:style.summary_length]
+
+    def render_item(self, item: Dict, style: TypeStyle) -> RenderedItem:
+        """
+        アイテムを整形（同じ内容のアイテムは整形結果を使い回す）
+
+        Args:
+            item: アイテム（Itemまたは辞書）
+            style: 書式ルール
+
+        Returns:
+            RenderedItemインスタンス
+        """
+        title = item.get('title', '').strip()
+        content = item.get('content', '').strip()
+        url = item.get('url', '')
+        key = (style, title, content, url)
+
+        with self._cache_lock:
+            rendered = self._item_cache.get(key)
+            if rendered is not None:
+                self._item_cache.move_to_end(key)
+                self.cache_hits += 1
+                return rendered
+            self.cache_misses += 1
+
+        display_title = self._truncate(title, style.title_length)
+        summary = self.extract_summary(title, content, style)
+        display_url = self.shorten_url(url, style.url_length)
+
+        lines = [ITEM_TEMPLATE.substitute(emoji=style.emoji, title=display_title)]
+        if summary:
+            lines.append(SUMMARY_TEMPLATE.substitute(summary=summary))
+        if display_url:
+            lines.append(URL_TEMPLATE.substitute(url=display_url))
+
+        rendered = RenderedItem(
+            title=display_title,
+            summary=summary,
+            display_url=display_url,
+            url=url,
+            lines=tuple(lines)
+        )
+
+        with self._cache_lock:
+            self._item_cache[key] = rendered
+            if len(self._item_cache) > self.cache_size:
+                self._item_cache.popitem(last=False)
+
+        return rendered
+
+    def render(self, items: List[Dict], now: Optional[datetime] = None) -> RenderedNotification:
+        """
+        アイテムのリストから通知を作成
+
+        Args:
+            items: 検出されたアイテムのリスト
+            now: 検出時刻（省略時は現在時刻）
+
+        Returns:
+            RenderedNotificationインスタンス
+        """
+        grouped: Dict[str, List[Dict]] = {}
+        for item in items:
+            grouped.setdefault(item.get('type', 'unknown'), []).append(item)
+
+        sections = []
+        for item_type in self.type_priority:
+            type_items = grouped.get(item_type)
+            if not type_items:
+                continue
+            style = self.type_styles.get(item_type) or TypeStyle(item_type, '•')
+            rendered_items = [self.render_item(item, style) for item in type_items[:style.max_items]]
+            sections.append((item_type, rendered_items, len(type_items) - len(rendered_items)))
+
+        return RenderedNotification(
+            renderer=self,
+            sections=sections,
+            total=len(items),
+            items=list(items),
+            detected_at=(now or datetime.now()).strftime('%Y-%m-%d %H:%M')
+        )
+
+    def render_urgent_text(self, items: List[Dict]) -> str:
+        """
+        優先度の高いアイテムの速報メッセージを作成（タイトルとURLのみの短い形式）
+
+        Args:
+            items: アイテムのリスト（優先度の高い順）
+
+        Returns:
+            メッセージ本文
+        """
+        parts = [self._urgent_header]
+        for item in items[:URGENT_MAX_ITEMS]:
+            style = self.type_styles.get(item.get('type', '')) or TypeStyle(item.get('type', ''), '•')
+            title = self._truncate(item.get('title', '').strip(), style.title_length)
+            parts.append(URGENT_ITEM_TEMPLATE.substitute(emoji=style.emoji, title=title))
+            url = item.get('url', '')
+            if url and url not in STORE_TOP_URLS:
+                parts.append(URGENT_URL_TEMPLATE.substitute(url=url))
+        if len(items) > URGENT_MAX_ITEMS:
+            parts.append(REMAINING_TEMPLATE.substitute(count=len(items) - URGENT_MAX_ITEMS).strip())
+        return '\n'.join(parts)
+
+    def build_text(self, notification: RenderedNotification) -> str:
+        """
+        テキスト形式のメッセージを作成
+
+        Args:
+            notification: レンダリング済みの通知
+
+        Returns:
+            メッセージ本文
+        """
+        parts = [self._header]
+        for index, (item_type, rendered_items, remaining) in enumerate(notification.sections):
+            if index > 0:
+                parts.append('')  # 空行で区切り
+            parts.append(self._section_headers.get(item_type)
+                         or SECTION_TEMPLATE.substitute(label=item_type))
+            for rendered in rendered_items:
+                parts.extend(rendered.lines)
+            if remaining > 0:
+                parts.append(REMAINING_TEMPLATE.substitute(count=remaining))
+
+        parts.append(FOOTER_TEMPLATE.substitute(
+            detected_at=notification.detected_at,
+            total=notification.total
+        ))
+        return '\n'.join(parts)
+
+    def _flex_item(self, rendered: RenderedItem, style: TypeStyle) -> Dict:
+        contents = [{
+            'type': 'text',
+            'text': f"{style.emoji} {rendered.title or '（タイトルなし）'}",
+            'size': 'sm',
+            'weight': 'bold',
+            'wrap': True
+        }]
+        if rendered.summary:
+            contents.append({
+                'type': 'text',
+                'text': rendered.summary,
+                'size': 'xs',
+                'color': '#666666',
+                'wrap': True
+            })
+
+        box = {'type': 'box', 'layout': 'vertical', 'spacing': 'xs', 'contents': contents}
+        if rendered.display_url:
+            box['action'] = {'type': 'uri', 'label': '詳細', 'uri': rendered.url}
+        return box
+
+    def build_flex(self, notification: RenderedNotification) -> Dict:
+        """
+        Flex Message形式のメッセージを作成
+
+        Args:
+            notification: レンダリング済みの通知
+
+        Returns:
+            Flex Messageのメッセージオブジェクト
+        """
+        body = []
+        for item_type, rendered_items, remaining in notification.sections:
+            style = self.type_styles.get(item_type) or TypeStyle(item_type, '•')
+            if body:
+                body.append({'type': 'separator', 'margin': 'md'})
+            body.append({
+                'type': 'text',
+                'text': style.label,
+                'weight': 'bold',
+                'color': style.color,
+                'margin': 'md'
+            })
+            body.extend(self._flex_item(rendered, style) for rendered in rendered_items)
+            if remaining > 0:
+                body.append({
+                    'type': 'text',
+                    'text': f"...他 {remaining}件",
+                    'size': 'xs',
+                    'color': '#999999'
+                })
+
+        bubble = {
+            'type': 'bubble',
+            'header': {
+                'type': 'box',
+                'layout': 'vertical',
+                'contents': [{'type': 'text', 'text': self.title, 'weight': 'bold', 'size': 'lg'}]
+            },
+            'body': {'type': 'box', 'layout': 'vertical', 'spacing': 'sm', 'contents': body},
+            'footer': {
+                'type': 'box',
+                'layout': 'vertical',
+                'contents': [{
+                    'type': 'text',
+                    'text': f"検出時刻: {notification.detected_at} / 検出総数: {notification.total}件",
+                    'size': 'xs',
+                    'color': '#999999',
+                    'wrap': True
+                }]
+            }
+        }
+
+        first_titles = [items[0].title for _, items, _ in notification.sections if items]
+        alt_text = f"{self.title} {notification.total}件: " + ' / '.join(first_titles)
+        return {
+            'type': 'flex',
+            'altText': self._truncate(alt_text, FLEX_ALT_TEXT_LENGTH),
+            'contents': bubble
+        }
+
+
+_default_renderer: Optional[MessageRenderer] = None
+_default_lock = threading.Lock()
+
+
+def get_default_renderer() -> MessageRenderer:
+    """
+    共有のレンダラーを取得（テンプレートは初回のみ作成）
+
+    Returns:
+        MessageRendererインスタンス
+    """
+    global _default_renderer
+
+    if _default_renderer is None:
+        with _default_lock:
+            if _default_renderer is None:
+                _default_renderer = MessageRenderer()
+    return _default_renderer
+
+
+def main():
+    """テスト用のメイン関数"""
+    import json
+    import timeit
+
+    items = [
+        {
+            'type': 'heading',
+            'title': '「Nintendo Switch 2（多言語対応）」招待販売について',
+            'content': '「Nintendo Switch 2（多言語対応）」招待販売について | 申込期限: 11月18日（火）午前11:00',
+            'url': 'https://store-jp.nintendo.com/switch2'
+        },
+        {
+            'type': 'banner',
+            'title': 'Switch2 抽選販売 受付中',
+            'content': 'Switch2 抽選販売 受付中 | 詳細はこちら',
+            'url': 'https://store-jp.nintendo.com/lottery/switch2'
+        },
+        {
+            'type': 'link',
+            'title': '多言語版Switch2の詳細を見る',
+            'content': '多言語版Switch2の詳細を見る',
+            'url': 'https://store-jp.nintendo.com/products/switch2-multilingual'
+        }
+    ]
+
+    renderer = get_default_renderer()
+    notification = renderer.render(items)
+    print("=== テキスト形式 ===")
+    print(notification.text)
+    print("\n=== Flex Message形式 ===")
+    print(json.dumps(notification.flex, ensure_ascii=False, indent=2)[:600] + '\n...')
+
+    count = 10000
+    elapsed = timeit.timeit(lambda: renderer.render(items).text, number=count)
+    print(f"\n{count}回のレンダリング: {elapsed:.3f}秒 "
+          f"(キャッシュ ヒット={renderer.cache_hits}, ミス={renderer.cache_misses})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+コンテンツの正規化
+ハッシュ計算・差分判定の前に、実行ごとに変わる揮発的な内容（時刻・カウントダウン・
+計測用のクエリ文字列・おすすめ枠など）を取り除く
+"""
+import fnmatch
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+import logging
+
+# lxmlの木に対するCSSセレクタ（オプショナル、lxmlバックエンドでのみ使用）
+try:
+    from lxml import etree
+    from lxml.cssselect import CSSSelector
+    CSSSELECT_AVAILABLE = True
+except ImportError:
+    CSSSELECT_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class ContentNormalizer:
+    """抽出したテキスト・URLを正規化するクラス（ルールは初期化時に一度だけコンパイル）"""
+
+    def __init__(self, scrub_patterns: Optional[List[str]] = None,
+                 strip_query_params: Optional[List[str]] = None,
+                 volatile_selectors: Optional[List[str]] = None,
+                 unicode_normalize: bool = True):
+        """
+        Args:
+            scrub_patterns: テキストから削除する正規表現のリスト
+            strip_query_params: URLから削除するクエリパラメータ名（'utm_*'のようなワイルドカード可、'*'ですべて）
+            volatile_selectors: 抽出前にページから取り除く要素のCSSセレクタのリスト
+            unicode_normalize: Unicode NFKC正規化を行うか
+        """
+        self.unicode_normalize = unicode_normalize
+        self.scrubbers = [
+            (f"scrub:{pattern}", re.compile(pattern))
+            for pattern in (scrub_patterns or [])
+        ]
+
+        params = strip_query_params or []
+        self.strip_all_params = '*' in params
+        self._param_re = None
+        if params and not self.strip_all_params:
+            self._param_re = re.compile(
+                '|'.join(fnmatch.translate(param) for param in params),
+                re.I
+            )
+
+        self.volatile_selectors = list(volatile_selectors or [])
+        self._css_selectors = None
+
+        self.hits: Counter = Counter()
+        self._hits_lock = threading.Lock()
+
+    def _count(self, rule: str, count: int = 1):
+        if count:
+            with self._hits_lock:
+                self.hits[rule] += count
+
+    def normalize_text(self, text: str) -> str:
+        """
+        テキストを正規化（NFKC・揮発的な文字列の削除・空白の畳み込み）
+
+        Args:
+            text: 対象のテキスト
+
+        Returns:
+            正規化後のテキスト
+        """
+        if not text:
+            return ''
+
+        if self.unicode_normalize:
+            normalized = unicodedata.normalize('NFKC', text)
+            if normalized != text:
+                self._count('nfkc')
+            text = normalized
+
+        for rule, pattern in self.scrubbers:
+            text, count = pattern.subn('', text)
+            self._count(rule, count)
+
+        return _WHITESPACE_RE.sub(' ', text).strip()
+
+    def normalize_url(self, url: str) -> str:
+        """
+        URLから計測用・キャッシュ回避用などのクエリパラメータを削除
+
+        Args:
+            url: 対象のURL
+
+        Returns:
+            正規化後のURL
+        """
+        if not url or '?' not in url or not (self.strip_all_params or self._param_re):
+            return url
+
+        parts = urlsplit(url)
+        if self.strip_all_params:
+            query = ''
+        else:
+            # 残すパラメータは元の表記（エンコード・順序）のまま残し、正規化後のURLが変わらないようにする
+            pairs = parts.query.split('&')
+            kept = [pair for pair in pairs if not self._param_re.fullmatch(unquote_plus(pair.split('=', 1)[0]))]
+            if len(kept) == len(pairs):
+                return url
+            query = '&'.join(kept)
+
+        self._count('query')
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, query, parts.fragment))
+
+    def normalize_element(self, tag: str, text: str = '', href: Optional[str] = None,
+                          classes=None) -> str:
+        """
+        チャンクハッシュの計算用に要素を正規化した1行の文字列にする
+
+        抽出で参照するタグ名・リンク先・class属性・テキストだけを残すため、
+        それ以外の属性やキャッシュ回避用のクエリ文字列・日時表示だけの変化はハッシュに影響しない。
+
+        Args:
+            tag: タグ名
+            text: 要素自身の文字列（子要素の文字列は含めない）
+            href: href属性
+            classes: class属性（文字列またはリスト）
+
+        Returns:
+            タブ区切りの文字列
+        """
+        parts = [tag]
+        if href:
+            parts.append(f"href={self.normalize_url(href)}")
+        if classes:
+            if isinstance(classes, str):
+                classes = classes.split()
+            parts.append(f"class={' '.join(classes)}")
+        text = self.normalize_text(text)
+        if text:
+            parts.append(text)
+        return '\t'.join(parts)
+
+    def remove_volatile(self, soup) -> int:
+        """
+        揮発的な要素（おすすめ枠・カウントダウン等）をページから取り除く
+
+        Args:
+            soup: BeautifulSoupオブジェクト（直接変更される）
+
+        Returns:
+            取り除いた要素数
+        """
+        removed = 0
+        for selector in self.volatile_selectors:
+            for element in soup.select(selector):
+                element.decompose()
+                removed += 1
+                self._count(f"selector:{selector}")
+        return removed
+
+    def remove_volatile_etree(self, root) -> int:
+        """
+        揮発的な要素をlxmlの木から取り除く（remove_volatileのlxml版）
+
+        Args:
+            root: lxml.etreeのルート要素（直接変更される）
+
+        Returns:
+            取り除いた要素数
+        """
+        if not self.volatile_selectors:
+            return 0
+        if not CSSSELECT_AVAILABLE:
+            raise RuntimeError("lxmlの木から要素を取り除くにはcssselectが必要です")
+
+        if self._css_selectors is None:
+            self._css_selectors = [
+                (selector, CSSSelector(selector, translator='html'))
+                for selector in self.volatile_selectors
+            ]
+
+        removed = 0
+        for selector, matcher in self._css_selectors:
+            for element in matcher(root):
+                parent = element.getparent()
+                if parent is None:
+                    continue
+                # BeautifulSoupのdecomposeと同じく前後のテキストは別々の文字列として残すため、
+                # 要素は空のコメントに置き換える（コメントはテキストに含まれない）
+                placeholder = etree.Comment('')
+                placeholder.tail = element.tail
+                parent.replace(element, placeholder)
+                removed += 1
+                self._count(f"selector:{selector}")
+        return removed
+
+    def normalize_item(self, item: Dict) -> Dict:
+        """
+        ハッシュ・識別子の計算用にアイテムを正規化したコピーを作成
+
+        Args:
+            item: アイテム辞書
+
+        Returns:
+            title, content, url を正規化したアイテム辞書
+        """
+        normalized = dict(item)
+        normalized['title'] = self.normalize_text(item.get('title', ''))
+        normalized['content'] = self.normalize_text(item.get('content', ''))
+        normalized['url'] = self.normalize_url(item.get('url', ''))
+        return normalized
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        ルールごとの適用回数を取得
+
+        Returns:
+            ルール名と適用回数の辞書
+        """
+        with self._hits_lock:
+            return dict(self.hits)
+
+
+_default_normalizer: Optional[ContentNormalizer] = None
+_default_lock = threading.Lock()
+
+
+def get_default_normalizer() -> ContentNormalizer:
+    """
+    設定ファイルのルールで作成した共有の正規化インスタンスを取得（初回のみコンパイル）
+
+    Returns:
+        ContentNormalizerインスタンス
+    """
+    global _default_normalizer
+
+    if _default_normalizer is None:
+        with _default_lock:
+            if _default_normalizer is None:
+                import config
+                _default_normalizer = ContentNormalizer(
+                    scrub_patterns=config.NORMALIZE_SCRUB_PATTERNS,
+                    strip_query_params=config.NORMALIZE_STRIP_QUERY_PARAMS,
+                    volatile_selectors=config.NORMALIZE_VOLATILE_SELECTORS,
+                    unicode_normalize=config.NORMALIZE_UNICODE
+                )
+    return _default_normalizer
+
+
+def main():
+    """テスト用のメイン関数"""
+    normalizer = get_default_normalizer()
+
+    samples = [
+        'Ｓｗｉｔｃｈ２　抽選販売   受付中',
+        'おすすめ商品 残り3時間12分',
+        '更新日時 2026/10/18 12:00:01',
+        '申込期限: 11月18日（火）午前11:00',
+    ]
+    print("=== テキスト ===")
+    for text in samples:
+        print(f"{text!r}\n  -> {normalizer.normalize_text(text)!r}")
+
+    print("\n=== URL ===")
+    for url in ['https://store-jp.nintendo.com/switch2?utm_source=top&gclid=abc&v=2&id=5',
+                'https://store-jp.nintendo.com/lottery']:
+        print(f"{url}\n  -> {normalizer.normalize_url(url)}")
+
+    print(f"\nルール適用回数: {normalizer.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+LINE以外の通知チャネル
+汎用Webhook・Slack/Discord互換Webhook・メール（SMTP）で通知を送信する
+"""
+import smtplib
+from email.message import EmailMessage
+from typing import Dict, Iterable, List, Optional
+import requests
+import logging
+
+from fingerprint import fingerprint, to_hex
+from items import serialize_items
+from message_renderer import MessageRenderer, RenderedNotification
+from notification_dedup import NotificationDedupCache
+from http_client import origin_of
+from notifier import BaseNotifier
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _url_key(kind: str, url: str) -> str:
+    # Webhook URLにはトークンが含まれるため、保存する識別子にはフィンガープリントを使う
+    return f"{kind}:{to_hex(fingerprint(url))}"
+
+
+class WebhookNotifier(BaseNotifier):
+    """任意のURLにJSONをPOSTする汎用Webhookチャネル"""
+
+    name = 'webhook'
+    display_name = 'Webhook'
+    MAX_TEXT_LENGTH = 20000
+
+    def __init__(self, url: str, headers: Optional[Dict[str, str]] = None,
+                 renderer: Optional[MessageRenderer] = None,
+                 dedup_cache: Optional[NotificationDedupCache] = None,
+                 timeout: float = 10.0):
+        """
+        Args:
+            url: 送信先のURL
+            headers: 追加のHTTPヘッダー（認証トークン等）
+            renderer: 検出通知のレンダラー
+            dedup_cache: 通知済みアイテムのキャッシュ
+            timeout: 送信のタイムアウト（秒）
+        """
+        super().__init__(renderer=renderer, dedup_cache=dedup_cache, timeout=timeout)
+        if not url:
+            raise ValueError("WebhookのURLを指定してください")
+        self.url = url
+        self.headers = {'Content-Type': 'application/json'}
+        self.headers.update(headers or {})
+
+    @property
+    def recipient_key(self) -> str:
+        return _url_key(self.name, self.url)
+
+    @property
+    def warm_up_url(self) -> Optional[str]:
+        return origin_of(self.url)
+
+    def post(self, payload: Dict) -> bool:
+        """
+        JSONをPOST
+
+        Args:
+            payload: 送信するJSON
+
+        Returns:
+            送信成功時True、失敗時False
+        """
+        try:
+            response = self.session.post(self.url, headers=self.headers, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            logger.info(f"{self.display_name}で通知を送信しました")
+            return True
+        except requests.HTTPError as e:
+            logger.error(f"{self.display_name}のHTTPエラー: {e}")
+            return False
+        except requests.RequestException as e:
+            logger.error(f"{self.display_name}の送信に失敗: {e}")
+            return False
+
+    def send_message(self, message: str) -> bool:
+        return self.post({'event': 'message', 'text': self.truncate_text(message)})
+
+    def send_rendered(self, notification: RenderedNotification,
+                      recipients: Optional[Iterable[str]] = None) -> bool:
+        return self.post({
+            'event': 'detection',
+            'text': self.truncate_text(notification.text),
+            'detected_at': notification.detected_at,
+            'total': notification.total,
+            'items': serialize_items(notification.items)
+        })
+
+    def send_urgent_notification(self, items: List[Dict],
+                                 recipients: Optional[Iterable[str]] = None) -> bool:
+        if not items:
+            return False
+        return self._deliver(
+            items, recipients,
+            lambda urgent_items: {
+                'event': 'urgent',
+                'text': self.renderer.render_urgent_text(urgent_items),
+                'items': serialize_items(urgent_items)
+            },
+            lambda payload, recipients: list(recipients) if self.post(payload) else []
+        )
+
+
+class ChatWebhookNotifier(WebhookNotifier):
+    """
+    Slack/Discord互換のIncoming Webhookチャネル
+
+    style='slack' は {"text": ...}、style='discord' は {"content": ...} の形式で送信する。
+    """
+
+    STYLES = {
+        'slack': ('text', 40000),
+        'discord': ('content', 2000),
+    }
+
+    def __init__(self, url: str, style: str = 'slack',
+                 renderer: Optional[MessageRenderer] = None,
+                 dedup_cache: Optional[NotificationDedupCache] = None,
+                 timeout: float = 10.0):
+        """
+        Args:
+            url: Incoming WebhookのURL
+            style: 'slack' または 'discord'
+            renderer: 検出通知のレンダラー
+            dedup_cache: 通知済みアイテムのキャッシュ
+            timeout: 送信のタイムアウト（秒）
+        """
+        if style not in self.STYLES:
+            raise ValueError("styleは'slack'または'discord'を指定してください")
+        super().__init__(url, renderer=renderer, dedup_cache=dedup_cache, timeout=timeout)
+        self.name = style
+        self.display_name = style.capitalize()
+        self.text_key, self.MAX_TEXT_LENGTH = self.STYLES[style]
+
+    def send_message(self, message: str) -> bool:
+        return self.post({self.text_key: self.truncate_text(message)})
+
+    def send_urgent_notification(self, items: List[Dict],
+                                 recipients: Optional[Iterable[str]] = None) -> bool:
+        return BaseNotifier.send_urgent_notification(self, items, recipients)
+
+    def send_rendered(self, notification: RenderedNotification,
+                      recipients: Optional[Iterable[str]] = None) -> bool:
+        return self.send_message(notification.text)
+
+
+class EmailNotifier(BaseNotifier):
+    """SMTPでメール通知を送信するチャネル"""
+
+    name = 'email'
+    display_name = 'メール（SMTP）'
+    MAX_TEXT_LENGTH = 100000
+
+    def __init__(self, host: str, port: int, sender: str, recipients: List[str],
+                 username: str = '', password: str = '', use_tls: bool = True,
+                 subject_prefix: str = '[Switch2監視]',
+                 renderer: Optional[MessageRenderer] = None,
+                 dedup_cache: Optional[NotificationDedupCache] = None,
+                 timeout: float = 15.0):
+        """
+        Args:
+            host: SMTPサーバーのホスト名
+            port: SMTPサーバーのポート番号
+            sender: 送信元アドレス
+            recipients: 送信先アドレスのリスト
+            username: SMTP認証のユーザー名（空の場合は認証しない）
+            password: SMTP認証のパスワード
+            use_tls: STARTTLSを使用するか
+            subject_prefix: 件名の接頭辞
+            renderer: 検出通知のレンダラー
+            dedup_cache: 通知済みアイテムのキャッシュ
+            timeout: 送信のタイムアウト（秒）
+        """
+        super().__init__(renderer=renderer, dedup_cache=dedup_cache, timeout=timeout)
+        if not host or not sender or not recipients:
+            raise ValueError("SMTPサーバー・送信元・送信先を指定してください")
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.subject_prefix = subject_prefix
+
+    @property
+    def recipient_key(self) -> str:
+        return f"email:{','.join(sorted(self.recipients))}"
+
+    def send_email(self, subject: str, body: str) -> bool:
+        """
+        メールを送信
+
+        Args:
+            subject: 件名（接頭辞は自動で付与）
+            body: 本文
+
+        Returns:
+            送信成功時True、失敗時False
+        """
+        message = EmailMessage()
+        message['Subject'] = f"{self.subject_prefix} {subject}".strip()
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(self.truncate_text(body.strip('\n')))
+
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                if self.use_tls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+                smtp.send_message(message)
+            logger.info(f"メール通知を送信しました（{len(self.recipients)}件）")
+            return True
+        except (smtplib.SMTPException, OSError) as e:
+            logger.error(f"メール通知の送信に失敗: {e}")
+            return False
+
+    def send_message(self, message: str) -> bool:
+        # 本文の最初の見出し行を件名にする
+        lines = [line.strip() for line in message.split('\n')]
+        subject = next((line for line in lines if line and not line.startswith('━')), '通知')
+        return self.send_email(subject, message)
+
+    def send_rendered(self, notification: RenderedNotification,
+                      recipients: Optional[Iterable[str]] = None) -> bool:
+        return self.send_email(f"新情報検出（{notification.total}件）", notification.text)
+
+
+def main():
+    """テスト用のメイン関数（ローカルのスタブサーバーに送信）"""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    received = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            received.append((self.path, json.loads(body)))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    items = [{
+        'type': 'banner',
+        'title': 'Switch2 抽選販売 受付中',
+        'content': 'Switch2 抽選販売 受付中 | 詳細はこちら',
+        'url': 'https://store-jp.nintendo.com/lottery/switch2'
+    }]
+    channels = [
+        WebhookNotifier(f"{base_url}/webhook"),
+        ChatWebhookNotifier(f"{base_url}/slack", style='slack'),
+        ChatWebhookNotifier(f"{base_url}/discord", style='discord'),
+    ]
+    for channel in channels:
+        print(f"{channel.name}: {channel.send_lottery_notification_v2(items)}")
+
+    for path, payload in received:
+        print(f"  {path}: {sorted(payload.keys())}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
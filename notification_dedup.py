@@ -0,0 +1,210 @@
+"""
+通知の重複防止キャッシュ
+送信先ごとに最近通知したアイテムのフィンガープリントを保持し、同じ通知の再送を防ぐ
+（状態のリセットやアイテムの出入りがあっても、TTL内は同じ内容を再通知しない）
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import threading
+import time
+import logging
+
+from fingerprint import fingerprint_parts, to_hex
+from items import item_digest_of, item_id_of
+from state_backends import StateBackend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class NotificationDedupCache:
+    """送信先ごとの通知済みアイテムをTTLと最大件数（LRU）で管理するクラス"""
+
+    def __init__(self, backend: Optional[StateBackend] = None,
+                 ttl_seconds: float = 86400, max_entries: int = 5000):
+        """
+        Args:
+            backend: キャッシュの保存先（状態と同じ種類のバックエンド、Noneの場合はメモリ上のみ）
+            ttl_seconds: 通知済みとして扱う期間（秒）
+            max_entries: 送信先ごとの最大保持件数（超えた分は古いものから削除）
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: Dict[str, 'OrderedDict[str, float]'] = {}
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def item_key(item: Dict) -> str:
+        """
+        アイテムの通知済み判定用のキーを作成（IDと内容のダイジェストから作成）
+
+        Args:
+            item: アイテム（Itemまたは辞書）
+
+        Returns:
+            16桁の16進文字列
+        """
+        return to_hex(fingerprint_parts(item_id_of(item), item_digest_of(item)))
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if self.backend is None:
+            return
+
+        data = self.backend.load() or {}
+        for recipient, pairs in (data.get('recipients') or {}).items():
+            # 送信日時の古い順に並べて復元
+            self._entries[recipient] = OrderedDict(
+                sorted(((key, float(sent_at)) for key, sent_at in pairs), key=lambda pair: pair[1])
+            )
+        self.purge_expired()
+        logger.info(f"通知済みキャッシュを読み込みました（{self.size()}件）")
+
+    def _recipient_entries(self, recipient: str) -> 'OrderedDict[str, float]':
+        return self._entries.setdefault(recipient, OrderedDict())
+
+    def filter_unsent(self, recipient: str, items: List[Dict],
+                      now: Optional[float] = None) -> List[Dict]:
+        """
+        TTL内に通知済みのアイテムを除外
+
+        Args:
+            recipient: 送信先の識別子
+            items: 通知候補のアイテムのリスト
+            now: 基準時刻（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            未通知のアイテムのリスト（元の順序）
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl_seconds
+
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._entries.get(recipient)
+            if not entries:
+                return list(items)
+
+            unsent = []
+            for item in items:
+                sent_at = entries.get(self.item_key(item))
+                if sent_at is None or sent_at < cutoff:
+                    unsent.append(item)
+
+        skipped = len(items) - len(unsent)
+        if skipped:
+            logger.info(f"通知済みのアイテムを{skipped}件除外しました（送信先: {recipient}）")
+        return unsent
+
+    def mark_sent(self, recipient: str, items: List[Dict], now: Optional[float] = None):
+        """
+        アイテムを通知済みとして記録
+
+        Args:
+            recipient: 送信先の識別子
+            items: 通知したアイテムのリスト
+            now: 送信時刻（UNIX時間、省略時は現在時刻）
+        """
+        now = time.time() if now is None else now
+
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._recipient_entries(recipient)
+            for item in items:
+                key = self.item_key(item)
+                entries[key] = now
+                entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._dirty = True
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """
+        TTLを過ぎたエントリを削除
+
+        Args:
+            now: 基準時刻（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            削除したエントリ数
+        """
+        cutoff = (time.time() if now is None else now) - self.ttl_seconds
+        removed = 0
+
+        with self._lock:
+            for recipient in list(self._entries):
+                entries = self._entries[recipient]
+                # 送信日時の古い順に並んでいるため、先頭から期限切れを削除
+                while entries and next(iter(entries.values())) < cutoff:
+                    entries.popitem(last=False)
+                    removed += 1
+                if not entries:
+                    del self._entries[recipient]
+            if removed:
+                self._dirty = True
+
+        return removed
+
+    def size(self) -> int:
+        """保持しているエントリの合計数"""
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def save(self) -> bool:
+        """
+        変更があればバックエンドに保存
+
+        Returns:
+            保存成功時（変更がない場合も）True
+        """
+        with self._lock:
+            if self.backend is None or not self._dirty:
+                return True
+            self.purge_expired()
+            data = {
+                'recipients': {
+                    recipient: [[key, sent_at] for key, sent_at in entries.items()]
+                    for recipient, entries in self._entries.items()
+                },
+                'ttl_seconds': self.ttl_seconds
+            }
+            if self.backend.save(data):
+                self._dirty = False
+                return True
+            return False
+
+    def clear(self):
+        """すべてのエントリを削除（保存先も削除）"""
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._dirty = False
+            if self.backend is not None:
+                self.backend.delete()
+
+
+def main():
+    """テスト用のメイン関数"""
+    cache = NotificationDedupCache(ttl_seconds=60, max_entries=2)
+    banner = {'type': 'banner', 'title': 'Switch2 抽選販売 受付中', 'content': '受付中', 'url': 'https://example.com/1'}
+    heading = {'type': 'heading', 'title': '招待販売について', 'content': '申込期限: 11月18日', 'url': 'https://example.com/2'}
+
+    now = time.time()
+    print(f"初回: {len(cache.filter_unsent('user', [banner, heading], now))}件を通知")
+    cache.mark_sent('user', [banner, heading], now)
+    print(f"再出現: {len(cache.filter_unsent('user', [banner, heading], now + 10))}件を通知")
+    print(f"別の送信先: {len(cache.filter_unsent('group', [banner], now + 10))}件を通知")
+    modified = dict(heading, content='申込期限: 11月25日')
+    print(f"内容変更: {len(cache.filter_unsent('user', [modified], now + 10))}件を通知")
+    print(f"TTL経過後: {len(cache.filter_unsent('user', [banner], now + 120))}件を通知")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,99 @@
 """
 LINE Messaging API通知機能
 LINE Notify終了に伴い、Messaging APIに移行
+
+通知チャネルの共通インターフェース（BaseNotifier）も定義する。
+LINE以外のチャネルは notification_channels.py を参照。
 """
 import requests
-from typing import List, Dict
+from datetime import datetime
+from typing import Any, Callable, List, Dict, Iterable, Optional, Tuple
 import logging
 
+from message_renderer import (FORMAT_FLEX, FORMAT_TEXT, MessageRenderer, RenderedNotification,
+                              get_default_renderer)
+from deadline import Deadline
+from http_client import origin_of
+from notification_dedup import NotificationDedupCache
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class LineNotifier:
-    """LINE Messaging APIで通知を送信するクラス"""
+class BaseNotifier:
+    """
+    通知チャネルの共通インターフェース
 
-    PUSH_API_URL = 'https://api.line.me/v2/bot/message/push'
-    MAX_TEXT_LENGTH = 5000  # Messaging APIのテキストメッセージの最大文字数
+    サブクラスは send_message() を実装する。検出通知・テスト通知・エラー通知・
+    ステータス通知のメッセージ作成と、通知済みアイテムの除外は共通で行う。
+    """
+
+    name = 'base'                # チャネル名（ログ・実行結果の識別用）
+    display_name = '通知チャネル'  # テスト通知に表示する名前
+    MAX_TEXT_LENGTH = 5000       # テキストメッセージの最大文字数
+    supports_recipients = False  # 送信先を指定して送信できるか（購読者への通知に使う）
 
-    def __init__(self, channel_access_token: str, user_id: str = '', group_id: str = ''):
+    def __init__(self, renderer: Optional[MessageRenderer] = None,
+                 dedup_cache: Optional[NotificationDedupCache] = None,
+                 timeout: float = 10.0):
         """
         Args:
-            channel_access_token: LINE Messaging APIのチャネルアクセストークン
-            user_id: 送信先のユーザーID（個人宛ての場合）
-            group_id: 送信先のグループID（グループ宛ての場合）
+            renderer: 検出通知のレンダラー（省略時は共有のレンダラー）
+            dedup_cache: 通知済みアイテムのキャッシュ（指定時はTTL内に通知済みのアイテムを送信しない）
+            timeout: 送信のタイムアウト（秒）
         """
-        self.channel_access_token = channel_access_token
-        self.user_id = user_id
-        self.group_id = group_id
+        self.renderer = renderer or get_default_renderer()
+        self.dedup_cache = dedup_cache
+        self.timeout = timeout
+        # 送信先への接続を実行間で使い回す（事前準備で確立した接続も使われる）
+        self.session = requests.Session()
+
+    @property
+    def warm_up_url(self) -> Optional[str]:
+        """事前準備で接続しておくURL（HTTPで送信しないチャネルはNone）"""
+        return None
+
+    def warm_up(self) -> bool:
+        """
+        送信先への接続（名前解決・TLSハンドシェイク）を事前に確立（通知は送信しない）
 
-        # 送信先の決定（グループIDが優先）
-        self.to = group_id if group_id else user_id
+        Returns:
+            接続できた場合（接続の必要がない場合も）True
+        """
+        url = self.warm_up_url
+        if not url:
+            return True
+        try:
+            # 応答のステータスは問わない（接続がセッションに残ればよい）
+            self.session.head(url, timeout=self.timeout, allow_redirects=False)
+            return True
+        except requests.RequestException as e:
+            logger.warning(f"{self.display_name}への事前接続に失敗: {e}")
+            return False
 
-        if not self.to:
-            raise ValueError("user_idまたはgroup_idのいずれかを指定してください")
+    @property
+    def recipient_key(self) -> str:
+        """通知済みキャッシュで使う送信先の識別子"""
+        return self.name
 
-        self.headers = {
-            'Authorization': f'Bearer {channel_access_token}',
-            'Content-Type': 'application/json'
-        }
+    def truncate_text(self, message: str) -> str:
+        """
+        文字数制限を超えるメッセージを切り詰める
+
+        Args:
+            message: メッセージ
+
+        Returns:
+            MAX_TEXT_LENGTH 以下のメッセージ
+        """
+        if len(message) > self.MAX_TEXT_LENGTH:
+            message = message[:self.MAX_TEXT_LENGTH - 50] + '\n...\n(文字数制限のため省略されました)'
+            logger.warning(f"メッセージが{self.MAX_TEXT_LENGTH}文字を超えたため切り詰めました（{self.name}）")
+        return message
 
     def send_message(self, message: str) -> bool:
         """
-        メッセージを送信
+        テキストメッセージを送信
 
         Args:
             message: 送信するメッセージ
@@ -48,178 +101,138 @@ class LineNotifier:
         Returns:
             送信成功時True、失敗時False
         """
-        try:
-            # 文字数制限のチェック
-            if len(message) > self.MAX_TEXT_LENGTH:
-                message = message[:self.MAX_TEXT_LENGTH - 50] + '\n...\n(文字数制限のため省略されました)'
-                logger.warning(f"メッセージが{self.MAX_TEXT_LENGTH}文字を超えたため切り詰めました")
-
-            # リクエストボディの作成
-            data = {
-                'to': self.to,
-                'messages': [
-                    {
-                        'type': 'text',
-                        'text': message
-                    }
-                ]
-            }
-
-            response = requests.post(
-                self.PUSH_API_URL,
-                headers=self.headers,
-                json=data,
-                timeout=10
-            )
-            response.raise_for_status()
+        raise NotImplementedError
 
-            logger.info("LINE Messaging API経由で通知を送信しました")
-            return True
-
-        except requests.HTTPError as e:
-            if e.response.status_code == 401:
-                logger.error("認証エラー: チャネルアクセストークンが無効です")
-            elif e.response.status_code == 400:
-                logger.error(f"リクエストエラー: {e.response.text}")
-            else:
-                logger.error(f"HTTPエラー: {e}")
-            return False
-        except requests.RequestException as e:
-            logger.error(f"LINE通知の送信に失敗: {e}")
-            return False
-
-    def send_lottery_notification(self, lotteries: List[Dict[str, str]]) -> bool:
+    def send_rendered(self, notification: RenderedNotification,
+                      recipients: Optional[Iterable[str]] = None) -> bool:
         """
-        抽選情報の通知を送信（旧形式、互換性のため残す）
+        レンダリング済みの検出通知を送信（標準ではテキスト形式で送信）
 
         Args:
-            lotteries: 抽選情報のリスト
+            notification: MessageRenderer.render() の結果
+            recipients: 送信先のリスト（チャネルが対応している場合のみ使用）
 
         Returns:
             送信成功時True、失敗時False
         """
-        if not lotteries:
-            logger.info("通知する抽選情報がありません")
-            return False
+        return self.send_message(notification.text)
 
-        # メッセージ作成
-        message_parts = ["\n🎮 Switch2 抽選販売情報 🎮\n"]
+    def _send_text(self, message: str, to: str) -> bool:
+        # 送信先を指定できるチャネルはオーバーライドする
+        return self.send_message(message)
 
-        for i, lottery in enumerate(lotteries, 1):
-            title = lottery.get('title', 'タイトルなし')
-            period = lottery.get('period', '期間不明')
-            url = lottery.get('url', '')
+    def _send_text_many(self, message: str, recipients: List[str]) -> List[str]:
+        # 送信先ごとに送信し、送信できた送信先を返す（まとめて送信できるチャネルはオーバーライドする）
+        return [to for to in recipients if self._send_text(message, to)]
 
-            message_parts.append(f"\n【{i}】{title}")
-            if period:
-                message_parts.append(f"期間: {period}")
-            if url:
-                message_parts.append(f"URL: {url}")
+    def _send_rendered_many(self, notification: RenderedNotification, recipients: List[str]) -> List[str]:
+        # 送信先ごとに送信し、送信できた送信先を返す（まとめて送信できるチャネルはオーバーライドする）
+        return [to for to in recipients if self.send_rendered(notification, [to])]
 
-        message = '\n'.join(message_parts)
-        return self.send_message(message)
+    def request_count(self, recipients: List[str]) -> int:
+        """送信先のリストへ1つのメッセージを送るのに必要なリクエスト数（待ち時間の見積もりに使う）"""
+        return len(recipients)
+
+    def _deliver(self, items: List[Dict], recipients: Optional[Iterable[str]],
+                 render: Callable[[List[Dict]], Any], send: Callable[[Any, List[str]], List[str]]) -> bool:
+        """
+        送信先ごとに通知済みのアイテムを除いて送信
+
+        除いた結果が同じ送信先には、同じレンダリング結果をまとめて送る。
 
-    def send_lottery_notification_v2(self, items: List[Dict[str, str]]) -> bool:
+        Args:
+            items: 通知するアイテムのリスト
+            recipients: 送信先のリスト（省略時は recipient_key）
+            render: アイテムのリストからメッセージを作成する関数
+            send: メッセージと送信先のリストを受け取って送信し、送信できた送信先のリストを返す関数
+
+        Returns:
+            送信成功時True、失敗時False（すべて通知済みで送信しなかった場合はTrue）
+        """
+        recipients = list(recipients or [self.recipient_key])
+        if self.dedup_cache is None:
+            return len(send(render(items), recipients)) == len(recipients)
+
+        # 除外後のアイテムが同じ送信先をまとめる
+        variants: Dict[tuple, Dict] = {}
+        for to in recipients:
+            unsent = self.dedup_cache.filter_unsent(to, items)
+            if not unsent:
+                logger.info(f"すべて通知済みのため送信をスキップします（送信先: {to}）")
+                continue
+            key = tuple(self.dedup_cache.item_key(item) for item in unsent)
+            variants.setdefault(key, {'items': unsent, 'recipients': []})['recipients'].append(to)
+
+        success = True
+        for variant in variants.values():
+            delivered = send(render(variant['items']), variant['recipients'])
+            for to in delivered:
+                self.dedup_cache.mark_sent(to, variant['items'])
+            if len(delivered) != len(variant['recipients']):
+                success = False
+
+        self.dedup_cache.save()
+        return success
+
+    def send_lottery_notification_v2(self, items: List[Dict[str, str]],
+                                     recipients: Optional[Iterable[str]] = None) -> bool:
         """
         検出されたアイテムの通知を送信（改善版）
 
+        メッセージは MessageRenderer で作成し、message_format に応じてテキストまたはFlex Messageで送信する。
+        dedup_cache がある場合は送信先ごとに通知済みのアイテムを除いて送信する。
+
         Args:
             items: 検出されたアイテムのリスト
                    各アイテムは type, title, content, url を含む辞書
+            recipients: 送信先のリスト（省略時は recipient_key、LINE以外のチャネルでは送信先の識別にのみ使用）
 
         Returns:
-            送信成功時True、失敗時False
+            送信成功時True、失敗時False（すべて通知済みで送信しなかった場合はTrue）
         """
         if not items:
             logger.info("通知するアイテムがありません")
             return False
 
-        from datetime import datetime
+        return self._deliver(items, recipients, self.renderer.render, self._send_rendered_many)
 
-        # メッセージヘッダー
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M')
-        message_parts = [
-            "\n━━━━━━━━━━━━━━━━━━",
-            "🎮 Switch2 新情報検出！",
-            "━━━━━━━━━━━━━━━━━━\n"
-        ]
-
-        # アイテムをタイプ別にグループ化
-        grouped_items = {}
-        for item in items:
-            item_type = item.get('type', 'unknown')
-            if item_type not in grouped_items:
-                grouped_items[item_type] = []
-            grouped_items[item_type].append(item)
-
-        # タイプの優先順位と絵文字
-        type_priority = ['heading', 'banner', 'link', 'paragraph']
-        type_info = {
-            'heading': {'label': '📌 重要見出し', 'emoji': '💡'},
-            'banner': {'label': '📢 バナー情報', 'emoji': '🔔'},
-            'link': {'label': '🔗 関連リンク', 'emoji': '➡️'},
-            'paragraph': {'label': '📝 詳細情報', 'emoji': '📄'}
-        }
+    def send_lottery_batches(self, batches: List[Tuple[List[Dict], List[str]]],
+                             deadline: Optional[Deadline] = None) -> bool:
+        """
+        送信先ごとに異なるアイテムの検出通知を送信（購読者への通知）
 
-        total_count = 0
-        max_items_per_type = 3  # 各タイプ最大3件まで（見やすさのため）
+        Args:
+            batches: (アイテムのリスト, 送信先のリスト) のリスト（同じアイテムの送信先はまとめておく）
+            deadline: 実行の期限（過ぎた場合は残りのまとまりを送信しない）
 
-        for item_type in type_priority:
-            if item_type not in grouped_items:
-                continue
+        Returns:
+            すべての送信に成功した場合True
+        """
+        success = True
+        for position, (items, recipients) in enumerate(batches):
+            if deadline is not None and deadline.remaining() <= 0:
+                logger.warning(f"実行の期限を過ぎたため、残り{len(batches) - position}件のまとまりを送信しません")
+                return False
+            if not self.send_lottery_notification_v2(items, recipients):
+                success = False
+        return success
+
+    def send_urgent_notification(self, items: List[Dict[str, str]],
+                                 recipients: Optional[Iterable[str]] = None) -> bool:
+        """
+        優先度の高いアイテムの速報を送信（タイトルとURLのみの短いテキスト）
+
+        Args:
+            items: 優先度の高いアイテムのリスト（優先度の高い順）
+            recipients: 送信先のリスト（省略時は recipient_key）
 
-            type_items = grouped_items[item_type]
-            info = type_info.get(item_type, {'label': item_type, 'emoji': '•'})
-
-            # タイプヘッダー
-            if total_count > 0:
-                message_parts.append("")  # 空行で区切り
-            message_parts.append(f"{info['label']}")
-            message_parts.append("─" * 20)
-
-            for i, item in enumerate(type_items[:max_items_per_type], 1):
-                total_count += 1
-                title = item.get('title', '').strip()
-                content = item.get('content', '').strip()
-                url = item.get('url', '')
-
-                # タイトル
-                if len(title) > 80:
-                    title = title[:77] + '...'
-                message_parts.append(f"\n{info['emoji']} {title}")
-
-                # 概要（タイトルと異なる場合のみ、かつ短い場合）
-                if content and content != title and len(content) <= 120:
-                    # コンテキスト情報がある場合は表示
-                    if '|' in content:
-                        # "タイトル | 追加情報" の形式
-                        parts = content.split('|')
-                        if len(parts) > 1 and parts[1].strip():
-                            summary = parts[1].strip()[:100]
-                            message_parts.append(f"   {summary}")
-
-                # URL（トップページ以外の場合のみ）
-                if url and 'store-jp.nintendo.com' in url:
-                    if url != 'https://store-jp.nintendo.com/' and url != 'https://store-jp.nintendo.com':
-                        # URLを短縮表示
-                        display_url = url.replace('https://store-jp.nintendo.com', '...nintendo.com')
-                        if len(display_url) > 60:
-                            display_url = display_url[:57] + '...'
-                        message_parts.append(f"   🔗 {display_url}")
-
-            # タイプ内のアイテム数表示
-            remaining_in_type = len(type_items) - max_items_per_type
-            if remaining_in_type > 0:
-                message_parts.append(f"   ...他 {remaining_in_type}件")
-
-        # フッター
-        message_parts.append("\n━━━━━━━━━━━━━━━━━━")
-        message_parts.append(f"検出時刻: {current_time}")
-        message_parts.append(f"検出総数: {len(items)}件")
-        message_parts.append("━━━━━━━━━━━━━━━━━━")
+        Returns:
+            送信成功時True、失敗時False（すべて通知済みで送信しなかった場合はTrue）
+        """
+        if not items:
+            return False
 
-        message = '\n'.join(message_parts)
-        return self.send_message(message)
+        return self._deliver(items, recipients, self.renderer.render_urgent_text, self._send_text_many)
 
     def send_test_notification(self) -> bool:
         """
@@ -228,7 +241,6 @@ class LineNotifier:
         Returns:
             送信成功時True、失敗時False
         """
-        from datetime import datetime
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         message = (
@@ -237,7 +249,7 @@ class LineNotifier:
             "━━━━━━━━━━━━━━━━━━\n\n"
             "📡 テスト通知\n\n"
             "システムは正常に動作しています。\n"
-            "LINE Messaging API連携が正しく設定されました。\n\n"
+            f"{self.display_name}連携が正しく設定されました。\n\n"
             f"送信時刻: {current_time}\n"
             "━━━━━━━━━━━━━━━━━━"
         )
@@ -253,7 +265,6 @@ class LineNotifier:
         Returns:
             送信成功時True、失敗時False
         """
-        from datetime import datetime
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         # エラーメッセージを整形
@@ -289,7 +300,6 @@ class LineNotifier:
         Returns:
             送信成功時True、失敗時False
         """
-        from datetime import datetime
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M')
 
         status_info = {
@@ -314,6 +324,241 @@ class LineNotifier:
         return self.send_message(message)
 
 
+class LineNotifier(BaseNotifier):
+    """LINE Messaging APIで通知を送信するクラス"""
+
+    name = 'line'
+    display_name = 'LINE Messaging API'
+    supports_recipients = True
+    PUSH_API_URL = 'https://api.line.me/v2/bot/message/push'
+    MULTICAST_API_URL = 'https://api.line.me/v2/bot/message/multicast'
+    MAX_TEXT_LENGTH = 5000  # Messaging APIのテキストメッセージの最大文字数
+    MAX_MULTICAST_RECIPIENTS = 500  # multicastの1回の送信先の上限
+
+    def __init__(self, channel_access_token: str, user_id: str = '', group_id: str = '',
+                 message_format: str = FORMAT_TEXT, renderer: Optional[MessageRenderer] = None,
+                 dedup_cache: Optional[NotificationDedupCache] = None,
+                 api_url: str = PUSH_API_URL, multicast_api_url: Optional[str] = None,
+                 timeout: float = 10.0):
+        """
+        Args:
+            channel_access_token: LINE Messaging APIのチャネルアクセストークン
+            user_id: 送信先のユーザーID（個人宛ての場合）
+            group_id: 送信先のグループID（グループ宛ての場合）
+            message_format: 検出通知の形式（'text' または 'flex'）
+            renderer: 検出通知のレンダラー（省略時は共有のレンダラー）
+            dedup_cache: 通知済みアイテムのキャッシュ（指定時はTTL内に通知済みのアイテムを送信しない）
+            api_url: プッシュAPIのURL（ローカルのスタブサーバーでの確認用）
+            multicast_api_url: multicast APIのURL（省略時は api_url と同じ場所の multicast）
+            timeout: 送信のタイムアウト（秒）
+        """
+        super().__init__(renderer=renderer, dedup_cache=dedup_cache, timeout=timeout)
+        self.channel_access_token = channel_access_token
+        self.user_id = user_id
+        self.group_id = group_id
+        self.api_url = api_url
+        self.multicast_api_url = multicast_api_url or api_url.rsplit('/', 1)[0] + '/multicast'
+
+        # 送信先の決定（グループIDが優先）
+        self.to = group_id if group_id else user_id
+
+        if not self.to:
+            raise ValueError("user_idまたはgroup_idのいずれかを指定してください")
+
+        if message_format not in (FORMAT_TEXT, FORMAT_FLEX):
+            raise ValueError("message_formatは'text'または'flex'を指定してください")
+        self.message_format = message_format
+
+        self.headers = {
+            'Authorization': f'Bearer {channel_access_token}',
+            'Content-Type': 'application/json'
+        }
+
+    @property
+    def recipient_key(self) -> str:
+        return self.to
+
+    @property
+    def warm_up_url(self) -> Optional[str]:
+        return origin_of(self.api_url)
+
+    def push_messages(self, messages: List[Dict], to: Optional[str] = None) -> bool:
+        """
+        メッセージオブジェクトを送信
+
+        Args:
+            messages: Messaging APIのメッセージオブジェクトのリスト
+            to: 送信先のユーザーID・グループID（省略時はインスタンスの送信先）
+
+        Returns:
+            送信成功時True、失敗時False
+        """
+        # リクエストボディの作成
+        data = {
+            'to': to or self.to,
+            'messages': messages
+        }
+        return self._post(self.api_url, data)
+
+    def multicast_messages(self, messages: List[Dict], user_ids: List[str]) -> bool:
+        """
+        複数のユーザーに同じメッセージオブジェクトを1回のリクエストで送信
+
+        Args:
+            messages: Messaging APIのメッセージオブジェクトのリスト
+            user_ids: 送信先のユーザーID（MAX_MULTICAST_RECIPIENTS件まで、グループID・トークルームIDは不可）
+
+        Returns:
+            送信成功時True、失敗時False
+        """
+        return self._post(self.multicast_api_url, {'to': user_ids, 'messages': messages})
+
+    @staticmethod
+    def _is_user_id(to: str) -> bool:
+        # multicastで送れるのはユーザーID（U〜）だけ
+        return to.startswith('U')
+
+    def request_count(self, recipients: List[str]) -> int:
+        user_ids = sum(1 for to in recipients if self._is_user_id(to))
+        return -(-user_ids // self.MAX_MULTICAST_RECIPIENTS) + len(recipients) - user_ids
+
+    def deliver_messages(self, messages: List[Dict], recipients: List[str]) -> List[str]:
+        """
+        複数の送信先に同じメッセージオブジェクトを送信
+
+        ユーザーIDはmulticastで MAX_MULTICAST_RECIPIENTS 件ずつまとめて送り、
+        グループID・トークルームIDはpushで1件ずつ送る。
+
+        Args:
+            messages: Messaging APIのメッセージオブジェクトのリスト
+            recipients: 送信先のユーザーID・グループIDのリスト
+
+        Returns:
+            送信できた送信先のリスト
+        """
+        recipients = list(dict.fromkeys(recipients))
+        user_ids = [to for to in recipients if self._is_user_id(to)]
+        if len(user_ids) < 2:
+            # 1人だけの場合はpushで送る
+            user_ids = []
+
+        delivered = []
+        for start in range(0, len(user_ids), self.MAX_MULTICAST_RECIPIENTS):
+            chunk = user_ids[start:start + self.MAX_MULTICAST_RECIPIENTS]
+            if self.multicast_messages(messages, chunk):
+                delivered.extend(chunk)
+        multicast = set(user_ids)
+        for to in recipients:
+            if to not in multicast and self.push_messages(messages, to):
+                delivered.append(to)
+        return delivered
+
+    def _post(self, url: str, data: Dict) -> bool:
+        # Messaging APIへの送信（エラーはログに出してFalseを返す）
+        try:
+            response = self.session.post(
+                url,
+                headers=self.headers,
+                json=data,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+
+            recipients = len(data['to']) if isinstance(data['to'], list) else 1
+            logger.info(f"LINE Messaging API経由で通知を送信しました（送信先: {recipients}件）")
+            return True
+
+        except requests.HTTPError as e:
+            if e.response.status_code == 401:
+                logger.error("認証エラー: チャネルアクセストークンが無効です")
+            elif e.response.status_code == 400:
+                logger.error(f"リクエストエラー: {e.response.text}")
+            else:
+                logger.error(f"HTTPエラー: {e}")
+            return False
+        except requests.RequestException as e:
+            logger.error(f"LINE通知の送信に失敗: {e}")
+            return False
+
+    def _send_text(self, message: str, to: str) -> bool:
+        return self.send_message(message, to)
+
+    def _send_text_many(self, message: str, recipients: List[str]) -> List[str]:
+        return self.deliver_messages([{'type': 'text', 'text': self.truncate_text(message)}], recipients)
+
+    def _send_rendered_many(self, notification: RenderedNotification, recipients: List[str]) -> List[str]:
+        return self.deliver_messages(self._rendered_messages(notification), recipients)
+
+    def _rendered_messages(self, notification: RenderedNotification,
+                           message_format: Optional[str] = None) -> List[Dict]:
+        # 通知の形式に応じたメッセージオブジェクト
+        if (message_format or self.message_format) == FORMAT_FLEX:
+            return notification.to_messages(FORMAT_FLEX)
+        return [{'type': 'text', 'text': self.truncate_text(notification.text)}]
+
+    def send_message(self, message: str, to: Optional[str] = None) -> bool:
+        """
+        メッセージを送信
+
+        Args:
+            message: 送信するメッセージ
+            to: 送信先のユーザーID・グループID（省略時はインスタンスの送信先）
+
+        Returns:
+            送信成功時True、失敗時False
+        """
+        return self.push_messages([{'type': 'text', 'text': self.truncate_text(message)}], to)
+
+    def send_rendered(self, notification: RenderedNotification,
+                      recipients: Optional[Iterable[str]] = None,
+                      message_format: Optional[str] = None) -> bool:
+        """
+        レンダリング済みの通知を送信（複数の送信先でもレンダリングは1回だけ、ユーザーにはmulticastでまとめて送る）
+
+        Args:
+            notification: MessageRenderer.render() の結果
+            recipients: 送信先のユーザーID・グループIDのリスト（省略時はインスタンスの送信先）
+            message_format: 通知の形式（省略時はインスタンスの設定）
+
+        Returns:
+            すべての送信先への送信に成功した場合True
+        """
+        recipients = list(dict.fromkeys(recipients or [self.to]))
+        delivered = self.deliver_messages(self._rendered_messages(notification, message_format), recipients)
+        return len(delivered) == len(recipients)
+
+    def send_lottery_notification(self, lotteries: List[Dict[str, str]]) -> bool:
+        """
+        抽選情報の通知を送信（旧形式、互換性のため残す）
+
+        Args:
+            lotteries: 抽選情報のリスト
+
+        Returns:
+            送信成功時True、失敗時False
+        """
+        if not lotteries:
+            logger.info("通知する抽選情報がありません")
+            return False
+
+        # メッセージ作成
+        message_parts = ["\n🎮 Switch2 抽選販売情報 🎮\n"]
+
+        for i, lottery in enumerate(lotteries, 1):
+            title = lottery.get('title', 'タイトルなし')
+            period = lottery.get('period', '期間不明')
+            url = lottery.get('url', '')
+
+            message_parts.append(f"\n【{i}】{title}")
+            if period:
+                message_parts.append(f"期間: {period}")
+            if url:
+                message_parts.append(f"URL: {url}")
+
+        message = '\n'.join(message_parts)
+        return self.send_message(message)
+
+
 def main():
     """テスト用のメイン関数"""
     import os
@@ -0,0 +1,445 @@
+"""
+HTML解析バックエンド
+抽出処理の解析部分を切り替えられるようにする
+
+    bs4:  BeautifulSoup（lxmlパーサー）の木をたどる参照実装（Switch2Scraperのメソッド）
+    lxml: lxml.etreeの木を直接たどる高速版（抽出結果はbs4と同じ）
+
+チャンクハッシュはバックエンドごとのマークアップから計算するため、
+バックエンドを切り替えた直後の1回はすべてのチャンクを再抽出する（アイテムID・ページハッシュは変わらない）。
+"""
+from typing import Dict, List, Optional, Set
+import logging
+import re
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from bs4.dammit import UnicodeDammit
+from lxml import etree
+
+from fingerprint import fingerprint, fingerprint_bytes, to_hex
+from items import Item
+from normalizer import CSSSELECT_AVAILABLE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARSER_BS4 = 'bs4'
+PARSER_LXML = 'lxml'
+
+# BeautifulSoupがget_textの対象外の文字列として扱う要素（script・style・template・ルビのrt/rp）
+# これらの要素の中の文字列は、子孫要素のものも含めてテキストに含まれない
+EXCLUDED_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+
+class TextCache:
+    """
+    要素ごとのテキスト（get_text(strip=True)相当）を1回の解析につき一度だけ計算して保持するクラス
+
+    最初に参照された要素の部分木を子から順にまとめて計算するため、
+    見出しのコンテキスト抽出や段落チェックで同じ部分木を何度もたどらない。
+    """
+
+    # get_textが対象とする文字列の型（コメント・script・styleの中身は含まない）
+    TEXT_TYPES = (NavigableString, CData)
+
+    def __init__(self):
+        self._texts: Dict[int, str] = {}
+
+    def get(self, node) -> str:
+        """
+        要素のテキストを取得
+
+        Args:
+            node: BeautifulSoup要素
+
+        Returns:
+            前後の空白を除いた文字列を連結したテキスト
+        """
+        text = self._texts.get(id(node))
+        if text is None:
+            text = self._compute(node)
+        return text
+
+    def _compute(self, root) -> str:
+        texts = self._texts
+        stack = [(root, False)]
+
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                parts = []
+                for child in node.contents:
+                    if isinstance(child, Tag):
+                        parts.append(texts[id(child)])
+                    elif type(child) in self.TEXT_TYPES:
+                        stripped = child.strip()
+                        if stripped:
+                            parts.append(stripped)
+                texts[id(node)] = ''.join(parts)
+            elif id(node) not in texts:
+                stack.append((node, True))
+                for child in node.contents:
+                    if isinstance(child, Tag) and id(child) not in texts:
+                        stack.append((child, False))
+
+        return texts[id(root)]
+
+
+class LxmlTextCache:
+    """
+    lxml要素のテキストをTextCacheと同じ規則で計算して保持するクラス
+
+    要素のtextと子要素のtailを別々の文字列として前後の空白を除いて連結する。
+    コメント・処理命令の中身と、EXCLUDED_TEXT_TAGSの要素の中の文字列は含まない。
+    """
+
+    def __init__(self):
+        # lxmlの要素はキーとして保持している間は同じオブジェクトが返るため、要素自体をキーにする
+        self._texts: Dict = {}
+
+    def get(self, node) -> str:
+        """
+        要素のテキストを取得
+
+        Args:
+            node: lxml要素
+
+        Returns:
+            前後の空白を除いた文字列を連結したテキスト
+        """
+        text = self._texts.get(node)
+        if text is None:
+            if node.tag in EXCLUDED_TEXT_TAGS or any(
+                    ancestor.tag in EXCLUDED_TEXT_TAGS for ancestor in node.iterancestors()):
+                text = self._texts[node] = ''
+            else:
+                text = self._compute(node)
+        return text
+
+    def _compute(self, root) -> str:
+        texts = self._texts
+        stack = [(root, False)]
+
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                parts = []
+                if node.text:
+                    stripped = node.text.strip()
+                    if stripped:
+                        parts.append(stripped)
+                for child in node:
+                    if isinstance(child.tag, str):
+                        parts.append(texts[child])
+                    if child.tail:
+                        stripped = child.tail.strip()
+                        if stripped:
+                            parts.append(stripped)
+                texts[node] = ''.join(parts)
+            elif node not in texts:
+                if node.tag in EXCLUDED_TEXT_TAGS:
+                    texts[node] = ''
+                    continue
+                stack.append((node, True))
+                for child in node:
+                    if isinstance(child.tag, str) and child not in texts:
+                        stack.append((child, False))
+
+        return texts[root]
+
+
+class ParserBackend:
+    """
+    解析バックエンドの基底クラス
+
+    scan_pageの流れ（解析 → 揮発的な要素の除去 → チャンク分割 → チャンクハッシュ → 抽出）の
+    各段階をバックエンドごとに実装する。
+    """
+
+    name = ''
+
+    def __init__(self, scraper):
+        """
+        Args:
+            scraper: キーワード判定・URL解決・抽出設定を提供するSwitch2Scraper
+        """
+        self.scraper = scraper
+
+    def parse(self, html: str):
+        """HTML（文字列またはバイト列）を解析して文書を返す"""
+        raise NotImplementedError
+
+    def remove_volatile(self, document) -> int:
+        """揮発的な要素を文書から取り除く"""
+        raise NotImplementedError
+
+    def split_into_chunks(self, document) -> List[List]:
+        """文書をセクション単位のチャンク（要素のリスト）に分割"""
+        raise NotImplementedError
+
+    def hash_chunk(self, nodes: List) -> str:
+        """チャンクのマークアップからハッシュ値を計算"""
+        raise NotImplementedError
+
+    def new_text_cache(self):
+        """解析1回分のテキストキャッシュを作成"""
+        raise NotImplementedError
+
+    def extract_from_nodes(self, nodes: List, found_elements: Set[int], text_cache) -> List[Item]:
+        """チャンク内の要素からキーワードに関連するコンテンツを抽出"""
+        raise NotImplementedError
+
+
+class BeautifulSoupBackend(ParserBackend):
+    """BeautifulSoupの参照実装（Switch2Scraperのメソッド）を使うバックエンド"""
+
+    name = PARSER_BS4
+
+    def parse(self, html: str):
+        return BeautifulSoup(html, 'lxml')
+
+    def remove_volatile(self, document) -> int:
+        return self.scraper.normalizer.remove_volatile(document)
+
+    def split_into_chunks(self, document) -> List[List]:
+        return self.scraper.split_into_chunks(document)
+
+    def hash_chunk(self, nodes: List) -> str:
+        return self.scraper._hash_chunk(nodes)
+
+    def new_text_cache(self) -> TextCache:
+        return TextCache()
+
+    def extract_from_nodes(self, nodes: List, found_elements: Set[int],
+                           text_cache: TextCache) -> List[Item]:
+        return self.scraper._extract_from_nodes(nodes, found_elements, text_cache)
+
+
+class LxmlBackend(ParserBackend):
+    """
+    lxml.etreeの木を直接たどるバックエンド
+
+    BeautifulSoupのオブジェクトを作らずに、参照実装と同じ順序・同じ条件で抽出する。
+    """
+
+    name = PARSER_LXML
+
+    def __init__(self, scraper):
+        super().__init__(scraper)
+        self._banner_patterns = [re.compile(class_name, re.I) for class_name in scraper.BANNER_CLASSES]
+
+    def parse(self, html):
+        if isinstance(html, bytes):
+            # バイト列はBeautifulSoupと同じ方法で文字コードを判定してから解析する
+            html = UnicodeDammit(html, is_html=True).unicode_markup or html.decode('utf-8', 'replace')
+        if html and html[0] == '\ufeff':
+            html = html[1:]
+        # BeautifulSoupのlxmlパーサーと同じ設定で、同じ木を作る
+        parser = etree.HTMLParser(recover=True, strip_cdata=False)
+        try:
+            parser.feed(html)
+            return parser.close()
+        except etree.XMLSyntaxError:
+            # 空の文書など、要素が1つもない場合
+            return None
+
+    def remove_volatile(self, document) -> int:
+        if document is None:
+            return 0
+        return self.scraper.normalizer.remove_volatile_etree(document)
+
+    @staticmethod
+    def _children(node) -> List:
+        return [child for child in node if isinstance(child.tag, str)]
+
+    def split_into_chunks(self, document) -> List[List]:
+        if document is None:
+            return []
+
+        heading_tags = self.scraper.HEADING_TAGS
+        container = next(document.iter('body'), None)
+        if container is None:
+            container = document
+        children = self._children(container)
+        while len(children) == 1 and children[0].tag not in heading_tags:
+            container = children[0]
+            children = self._children(container)
+
+        if not children:
+            return [[container]]
+
+        chunks = []
+        for child in children:
+            if child.tag in heading_tags or not chunks or chunks[-1][0].tag not in heading_tags:
+                chunks.append([child])
+            else:
+                chunks[-1].append(child)
+        return chunks
+
+    def hash_chunk(self, nodes: List) -> str:
+        # Switch2Scraper._hash_chunkと同じ規則（要素自身のtextと子要素のtailを要素の文字列とする）
+        normalizer = self.scraper.normalizer
+        lines = []
+        stack = list(reversed(nodes))
+        while stack:
+            element = stack.pop()
+            if element.tag in EXCLUDED_TEXT_TAGS:
+                continue
+            texts = [element.text] + [child.tail for child in element]
+            lines.append(normalizer.normalize_element(
+                element.tag, ' '.join(text for text in texts if text),
+                element.get('href'), element.get('class')
+            ))
+            stack.extend(reversed(self._children(element)))
+        return to_hex(fingerprint_bytes('\n'.join(lines).encode('utf-8')))
+
+    def new_text_cache(self) -> LxmlTextCache:
+        return LxmlTextCache()
+
+    @staticmethod
+    def _parent_link(element, nodes: List):
+        # チャンク内の祖先のa要素（Switch2Scraper._find_parent_link と同じ）
+        node = element
+        while not any(node is top for top in nodes):
+            node = node.getparent()
+            if node is None:
+                return None
+            if node.tag == 'a':
+                return node
+        return None
+
+    def _link_url(self, element, nodes: Optional[List] = None) -> str:
+        # 子孫の最初のa要素（なければチャンク内の祖先のa要素）のリンク先、なければ監視対象のURL
+        link = next(element.iterdescendants('a'), None)
+        if link is None and nodes is not None:
+            link = self._parent_link(element, nodes)
+        if link is not None and link.get('href'):
+            return self.scraper._resolve_url(link.get('href'))
+        return self.scraper.target_url
+
+    def extract_from_nodes(self, nodes: List, found_elements: Set[int],
+                           text_cache: LxmlTextCache) -> List[Item]:
+        scraper = self.scraper
+        relevant_items = []
+
+        def add(item: Item, element_id: Optional[int] = None):
+            element_id = scraper._dedup_key(item) if element_id is None else element_id
+            if element_id not in found_elements:
+                found_elements.add(element_id)
+                relevant_items.append(item)
+
+        # 1. 見出し要素（h1-h6）
+        for heading_tag in scraper.HEADING_TAGS:
+            for node in nodes:
+                for heading in node.iter(heading_tag):
+                    text = text_cache.get(heading)
+                    if text and scraper.check_keywords_in_text(text):
+                        element_id = fingerprint(text)
+                        if element_id not in found_elements:
+                            add(Item(
+                                type='heading',
+                                tag=heading_tag,
+                                title=text,
+                                content=self._extract_context(heading, text_cache, nodes),
+                                url=self._link_url(heading, nodes)
+                            ), element_id)
+
+        # 2. リンク要素
+        keywords = [keyword.lower() for keyword in scraper.keywords]
+        for node in nodes:
+            for link in node.iter('a'):
+                href = link.get('href')
+                if href is None:
+                    continue
+                text = text_cache.get(link)
+                if not text:
+                    continue
+                href_lower = href.lower()
+                if scraper.check_keywords_in_text(text) or any(k in href_lower for k in keywords):
+                    add(Item(type='link', title=text, content=text, url=scraper._resolve_url(href)))
+
+        # 3. バナー・通知エリア（class属性を持つ要素だけを対象にする）
+        classed = [
+            element for node in nodes
+            for element in node.iter(etree.Element) if element.get('class')
+        ]
+        for pattern in self._banner_patterns:
+            for banner in classed:
+                if not scraper._class_matches(banner, pattern):
+                    continue
+                text = text_cache.get(banner)
+                if text and scraper.check_keywords_in_text(text):
+                    add(Item(
+                        type='banner',
+                        title=text[:100],
+                        content=text,
+                        url=self._link_url(banner)
+                    ))
+
+        # 4. 段落・div要素（厳しめの条件）
+        for node in nodes:
+            for para in node.iter('p', 'div'):
+                text = text_cache.get(para)
+                if text and 10 < len(text) < 500 and scraper.check_keywords_in_text(text):
+                    add(Item(
+                        type='paragraph',
+                        title=text[:100],
+                        content=text,
+                        url=self._link_url(para, nodes)
+                    ))
+
+        return relevant_items
+
+    def _extract_context(self, element, text_cache: LxmlTextCache, nodes: List) -> str:
+        # Switch2Scraper._extract_context と同じ上限で、後続の兄弟要素（チャンク内）のテキストを連結
+        scraper = self.scraper
+        context_parts = [text_cache.get(element)]
+        remaining_chars = scraper.context_max_chars
+
+        position = next((i for i, node in enumerate(nodes) if node is element), None)
+        siblings = nodes[position + 1:] if position is not None else element.itersiblings(etree.Element)
+
+        visited = 0
+        for sibling in siblings:
+            if (len(context_parts) > scraper.context_max_siblings
+                    or visited >= scraper.context_max_nodes
+                    or remaining_chars <= 0):
+                break
+            visited += 1
+            sibling_text = text_cache.get(sibling)
+            if sibling_text and len(sibling_text) > 5:
+                sibling_text = sibling_text[:remaining_chars]
+                context_parts.append(sibling_text)
+                remaining_chars -= len(sibling_text)
+
+        return ' | '.join(context_parts)
+
+
+PARSER_BACKENDS = {
+    PARSER_BS4: BeautifulSoupBackend,
+    PARSER_LXML: LxmlBackend,
+}
+
+
+def create_parser_backend(name: str, scraper) -> ParserBackend:
+    """
+    解析バックエンドを作成
+
+    lxmlバックエンドで揮発的な要素のCSSセレクタを使うにはcssselectが必要。
+    インストールされていない場合はbs4バックエンドを使う。
+
+    Args:
+        name: 'bs4' または 'lxml'
+        scraper: Switch2Scraperインスタンス
+
+    Returns:
+        ParserBackendインスタンス
+    """
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"未対応の解析バックエンドです: {name}")
+
+    if name == PARSER_LXML and scraper.normalizer.volatile_selectors and not CSSSELECT_AVAILABLE:
+        logger.warning("cssselectがインストールされていないため、bs4バックエンドを使用します")
+        name = PARSER_BS4
+
+    return PARSER_BACKENDS[name](scraper)
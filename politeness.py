@@ -0,0 +1,269 @@
+"""
+ホストごとのアクセス間隔の制御
+同じホストへのリクエストの間隔を空け、Retry-Afterに従い、403・429・503を受けたら間隔を倍々に広げ、
+成功するたびに少しずつ元に戻す（乗算的に広げ、加算的に戻す）
+
+ホストの状態（現在の間隔・次にリクエストできる時刻など）は状態と同じ種類のバックエンドに保存し、
+実行をまたいで引き継ぐ。制限中のホストには、期限内に待ちきれない場合はリクエストを送らない。
+"""
+import threading
+import time
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, Optional
+import logging
+
+from deadline import Deadline
+from state_backends import StateBackend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 制限・ブロックとして扱うステータスコード
+THROTTLE_STATUSES = frozenset({403, 429, 503})
+
+
+class HostThrottled(Exception):
+    """ホストが制限中で、期限内にリクエストできない場合の例外"""
+
+    def __init__(self, host: str, wait_seconds: float):
+        super().__init__(f"{host} は制限中のため取得を見送りました（あと{wait_seconds:.0f}秒）")
+        self.host = host
+        self.wait_seconds = wait_seconds
+
+
+def parse_retry_after(value: Optional[str], now: float) -> Optional[float]:
+    """
+    Retry-Afterヘッダーを秒数に変換
+
+    Args:
+        value: ヘッダーの値（秒数またはHTTP日付）
+        now: 現在時刻（UNIX時間）
+
+    Returns:
+        待つ秒数（解釈できない場合はNone）
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - now)
+
+
+class PolitenessScheduler:
+    """ホストごとにリクエストの間隔を制御するクラス"""
+
+    def __init__(self, backend: Optional[StateBackend] = None, min_interval: float = 1.0,
+                 max_interval: float = 600.0, backoff_factor: float = 2.0, recovery_step: float = 5.0,
+                 max_retry_after: float = 3600.0,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            backend: ホストの状態の保存先（Noneの場合はメモリ上のみ）
+            min_interval: 同じホストへのリクエストの最小間隔（秒）
+            max_interval: 間隔の上限（秒）
+            backoff_factor: 403・429・503を受けたときに間隔に掛ける倍率
+            recovery_step: 成功するたびに間隔から引く秒数
+            max_retry_after: Retry-Afterに従う上限（秒）
+            clock: 時計（UNIX時間、テスト用）
+            sleep: 待機する関数（テスト用）
+        """
+        self.backend = backend
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.recovery_step = recovery_step
+        self.max_retry_after = max_retry_after
+        self.clock = clock
+        self.sleep = sleep
+
+        self._hosts: Dict[str, Dict] = {}
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.backend is None:
+            return
+        data = self.backend.load() or {}
+        self._hosts = {host: dict(health) for host, health in data.get('hosts', {}).items()}
+
+    def _health(self, host: str) -> Dict:
+        health = self._hosts.get(host)
+        if health is None:
+            health = self._hosts[host] = {
+                'interval': self.min_interval,
+                'next_allowed': 0.0,
+                'blocked_until': 0.0,
+                'failures': 0,
+                'throttled': 0,
+                'last_status': None,
+                'updated_at': 0.0
+            }
+        return health
+
+    def wait_time(self, host: str) -> float:
+        """次にリクエストできるまでの秒数"""
+        with self._lock:
+            self._ensure_loaded()
+            health = self._health(host)
+            return max(0.0, max(health['next_allowed'], health['blocked_until']) - self.clock())
+
+    def is_throttled(self, host: str) -> bool:
+        """ホストが制限を受けている（間隔を広げている・Retry-Afterで待っている）か"""
+        with self._lock:
+            self._ensure_loaded()
+            health = self._hosts.get(host)
+            if health is None:
+                return False
+            return health['interval'] > self.min_interval or health['blocked_until'] > self.clock()
+
+    def acquire(self, host: str, deadline: Optional[Deadline] = None) -> float:
+        """
+        ホストにリクエストしてよい時刻まで待ち、次のリクエストの時刻を予約
+
+        Args:
+            host: ホスト名
+            deadline: 実行の期限（待ちきれない場合は待たずに例外を送出）
+
+        Returns:
+            待った秒数
+
+        Raises:
+            HostThrottled: 期限内にリクエストできない場合
+        """
+        with self._lock:
+            self._ensure_loaded()
+            health = self._health(host)
+            now = self.clock()
+            wait = max(0.0, max(health['next_allowed'], health['blocked_until']) - now)
+            if deadline is not None and wait > deadline.work_remaining():
+                raise HostThrottled(host, wait)
+            # 待っている間に他のスレッドが同じ時刻を使わないよう、先に予約する
+            # （最小間隔の予約は実行をまたいで引き継ぐ必要がないため、保存の対象にしない）
+            health['next_allowed'] = now + wait + health['interval']
+
+        if wait > 0:
+            logger.info(f"{host}: アクセス間隔を空けるため{wait:.1f}秒待ちます")
+            self.sleep(wait)
+        return wait
+
+    def try_acquire(self, host: str) -> bool:
+        """
+        待たずにリクエストできる場合だけ、次のリクエストの時刻を予約（ヘッジの追加リクエスト用）
+
+        Args:
+            host: ホスト名
+
+        Returns:
+            予約できた場合True（間隔を空ける必要がある・Retry-Afterで待っている場合はFalse）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            health = self._health(host)
+            now = self.clock()
+            if max(health['next_allowed'], health['blocked_until']) > now:
+                return False
+            health['next_allowed'] = now + health['interval']
+            return True
+
+    def record(self, host: str, status: Optional[int], headers: Optional[Dict[str, str]] = None):
+        """
+        応答を記録して間隔を調整
+
+        Args:
+            host: ホスト名
+            status: ステータスコード（タイムアウト・接続エラーの場合はNone）
+            headers: 応答ヘッダー（小文字のキー）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            health = self._health(host)
+            now = self.clock()
+            before = (health['interval'], health['blocked_until'], health['failures'], health['last_status'])
+            health['last_status'] = status
+
+            if status in THROTTLE_STATUSES:
+                # 乗算的に間隔を広げ、Retry-Afterがあればそれまで待つ
+                health['interval'] = min(self.max_interval,
+                                         max(health['interval'], self.min_interval) * self.backoff_factor)
+                health['failures'] += 1
+                health['throttled'] += 1
+                retry_after = parse_retry_after((headers or {}).get('retry-after'), now)
+                pause = health['interval'] if retry_after is None else min(retry_after, self.max_retry_after)
+                health['blocked_until'] = max(health['blocked_until'], now + pause)
+                health['next_allowed'] = max(health['next_allowed'], now + health['interval'])
+                logger.warning(
+                    f"{host}: {status} を受けたため間隔を{health['interval']:.0f}秒に広げます"
+                    f"（{pause:.0f}秒後まで待機）"
+                )
+            elif status is not None and status < 400:
+                # 成功するたびに加算的に元の間隔へ戻す
+                health['interval'] = max(self.min_interval, health['interval'] - self.recovery_step)
+                health['failures'] = 0
+            else:
+                health['failures'] += 1
+
+            # 状態が変わらない成功（通常時）は保存しない
+            if (health['interval'], health['blocked_until'], health['failures'], health['last_status']) != before:
+                health['updated_at'] = now
+                self._dirty = True
+
+    def get_health(self) -> Dict[str, Dict]:
+        """
+        ホストごとの状態
+
+        Returns:
+            ホスト名と状態（interval, next_allowed, blocked_until, failures, throttled, last_status）の辞書
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return {host: dict(health) for host, health in self._hosts.items()}
+
+    def save(self) -> bool:
+        """
+        変更があればバックエンドに保存
+
+        Returns:
+            保存成功時（変更がない場合も）True
+        """
+        with self._lock:
+            if self.backend is None or not self._dirty:
+                return True
+            if self.backend.save({'hosts': {host: dict(health) for host, health in self._hosts.items()}}):
+                self._dirty = False
+                return True
+            return False
+
+
+def main():
+    """テスト用のメイン関数（時計を進めながら制限と回復の様子を表示）"""
+    now = [0.0]
+    scheduler = PolitenessScheduler(min_interval=1.0, recovery_step=5.0,
+                                    clock=lambda: now[0], sleep=lambda seconds: now.__setitem__(0, now[0] + seconds))
+    host = 'store-jp.nintendo.com'
+    responses = [200, 200, 429, 429, 503, 200, 200, 200, 200, 200, 200, 200]
+    for status in responses:
+        waited = scheduler.acquire(host)
+        headers = {'retry-after': '30'} if status == 429 else {}
+        scheduler.record(host, status, headers)
+        health = scheduler.get_health()[host]
+        print(f"t={now[0]:6.1f}s  待機 {waited:5.1f}s  応答 {status}  間隔 {health['interval']:5.1f}s")
+        now[0] += 0.5
+
+    retry_at = formatdate(time.time() + 120, usegmt=True)
+    print(f"\nRetry-After: {retry_at} → {parse_retry_after(retry_at, time.time()):.0f}秒")
+
+
+if __name__ == '__main__':
+    main()
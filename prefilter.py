@@ -0,0 +1,178 @@
+"""
+キーワードの事前チェック
+取得したページの本文（バイト列）にキーワードが含まれる可能性がない場合、HTMLの解析を省略する
+
+抽出処理は要素のテキスト（文字列ごとに前後の空白を除いて連結したもの）とリンク先に
+キーワードが含まれるかで判定するため、ここでは次のいずれかにキーワードが含まれるかを調べる。
+どれにも含まれなければ、抽出しても必ず0件になる。
+
+    1. 本文のバイト列そのもの（大半の該当ページはここで確定）
+    2. 文字参照を展開した本文（属性値に文字参照を含むリンク先）
+    3. タグ・コメントを取り除き、文字列ごとに前後の空白を除いて連結したテキスト
+       （「Switch<b>2</b>」のようにタグをまたぐキーワード）
+"""
+import html
+import re
+import threading
+from typing import Dict, List, Optional, Union
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# タグ・コメント（引用符内の'>'も考慮、'<'の直後が英字・'/'・'!'・'?'のものだけがタグ）
+_TAG_RE = re.compile(r'<!--.*?-->|<[A-Za-z/!?][^\'">]*(?:(?:"[^"]*"|\'[^\']*\')[^\'">]*)*>', re.S)
+# タグを置き換える目印
+_MARK = '\x00'
+
+# BeautifulSoupと同じ範囲で宣言された文字コードを探す
+_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([^>]*?)[ /;\'">]', re.I)
+_XML_ENCODING_RE = re.compile(rb'^\s*<\?.*encoding=[\'"](.*?)[\'"].*\?>')
+
+
+def _declared_encoding(body: bytes) -> Optional[str]:
+    match = _XML_ENCODING_RE.search(body[:1024]) or _CHARSET_RE.search(body[:max(2048, len(body) // 20)])
+    if match:
+        return match.group(1).decode('ascii', 'replace').strip().lower() or None
+    return None
+
+
+class KeywordPrefilter:
+    """ページにキーワードが含まれる可能性があるかを、解析せずに判定するクラス"""
+
+    def __init__(self, keywords: List[str]):
+        """
+        Args:
+            keywords: 検出対象のキーワードリスト
+        """
+        self.keywords = [keyword for keyword in keywords if keyword]
+
+        # 照合する文字列は小文字にしたキーワードのうち、他のキーワードを含まないものだけでよい
+        # （「抽選販売」を含むページは必ず「抽選」も含む）
+        lowered = {keyword.lower() for keyword in self.keywords}
+        self.needles = sorted(
+            keyword for keyword in lowered
+            if not any(other != keyword and other in keyword for other in lowered)
+        )
+        self._byte_needles: Dict[str, Optional[List[bytes]]] = {}
+        self._lock = threading.Lock()
+
+        self.checked = 0
+        self.skipped = 0
+
+    def _encoded_needles(self, encoding: str) -> Optional[List[bytes]]:
+        # 文字コードごとにエンコードしたキーワードを一度だけ作る
+        needles = self._byte_needles.get(encoding, False)
+        if needles is False:
+            try:
+                needles = [needle.encode(encoding) for needle in self.needles]
+            except (LookupError, UnicodeError):
+                needles = None
+            with self._lock:
+                self._byte_needles[encoding] = needles
+        return needles
+
+    def _contains(self, text: str) -> bool:
+        text = text.lower()
+        return any(needle in text for needle in self.needles)
+
+    @staticmethod
+    def _decode(body: bytes, encoding: Optional[str]) -> Optional[str]:
+        if encoding:
+            try:
+                return body.decode(encoding, 'replace')
+            except LookupError:
+                return None
+
+        # 文字コードが不明な場合は、BeautifulSoupと同じく宣言された文字コード、UTF-8の順に試す
+        if body.startswith(b'\xef\xbb\xbf'):
+            return body[3:].decode('utf-8', 'replace')
+        declared = _declared_encoding(body)
+        if declared:
+            try:
+                return body.decode(declared, 'replace')
+            except LookupError:
+                pass
+        try:
+            return body.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    def _text_variants_match(self, text: str) -> bool:
+        # 文字参照を展開した本文（属性値のリンク先を含む）
+        if self._contains(html.unescape(text) if '&' in text else text):
+            return True
+
+        # タグを取り除き、文字列ごとに前後の空白を除いて連結したテキスト（タグをまたぐキーワード）
+        parts = html.unescape(_TAG_RE.sub(_MARK, text)).split(_MARK)
+        return self._contains(''.join([part.strip() for part in parts]))
+
+    def might_match(self, body: Union[bytes, str], encoding: Optional[str] = None) -> bool:
+        """
+        ページからキーワードに関連するアイテムが抽出される可能性があるか
+
+        Args:
+            body: ページの本文（バイト列または文字列）
+            encoding: バイト列の文字コード（省略時は宣言された文字コード・UTF-8から判定）
+
+        Returns:
+            可能性がある場合True（判定できない場合もTrue）、キーワードが一切含まれない場合False
+        """
+        if not self.needles or not body:
+            return True
+
+        if isinstance(body, str):
+            text = body
+        else:
+            # バイト列のまま照合できれば確定（ASCIIの大文字・小文字は区別しない）
+            needles = self._encoded_needles(encoding or 'utf-8')
+            if needles is not None:
+                lowered = body.lower()
+                if any(needle in lowered for needle in needles):
+                    return True
+            text = self._decode(body, encoding)
+            if text is None:
+                return True
+
+        matched = self._text_variants_match(text)
+        with self._lock:
+            self.checked += 1
+            if not matched:
+                self.skipped += 1
+        return matched
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        判定回数と解析を省略した回数
+
+        Returns:
+            {'checked': 判定回数（バイト列で確定したものを除く）, 'skipped': 省略した回数}
+        """
+        with self._lock:
+            return {'checked': self.checked, 'skipped': self.skipped}
+
+
+def main():
+    """テスト用のメイン関数"""
+    import time
+    import config
+
+    prefilter = KeywordPrefilter(config.WATCH_KEYWORDS)
+    samples = [
+        '<html><body><p>新商品のお知らせ</p><a href="/news">ニュース</a></body></html>',
+        '<html><body><h2>Switch<b>2</b> の情報</h2></body></html>',
+        '<html><body><p>&#25277;&#36984;販売</p></body></html>',
+        '<html><body><a href="/sw&#105;tch2/">詳細</a></body></html>',
+    ]
+    for sample in samples:
+        print(f"{prefilter.might_match(sample.encode('utf-8'), 'utf-8')!s:<5}  {sample}")
+
+    page = ('<div class="item"><a href="/goods/1">商品名</a><span>1,980円</span></div>' * 2000).encode('utf-8')
+    started = time.perf_counter()
+    for _ in range(20):
+        prefilter.might_match(page, 'utf-8')
+    print(f"\n{len(page)}バイトのページ: {(time.perf_counter() - started) / 20 * 1000:.2f}ms/回")
+
+
+if __name__ == '__main__':
+    main()
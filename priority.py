@@ -0,0 +1,225 @@
+"""
+検出アイテムの優先度判定とダイジェスト
+優先度の高いアイテムは即時に短い速報で通知し、それ以外はまとめて定期的に通知する
+"""
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+from items import Item, serialize_items
+from state_backends import StateBackend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PriorityScorer:
+    """タイプ・キーワード・URLのルールでアイテムの優先度を計算するクラス"""
+
+    def __init__(self, type_weights: Optional[Dict[str, float]] = None,
+                 keyword_weights: Optional[Dict[str, float]] = None,
+                 url_patterns: Optional[Sequence[Tuple[str, float]]] = None,
+                 threshold: float = 6.0):
+        """
+        Args:
+            type_weights: アイテムのタイプごとの重み
+            keyword_weights: タイトル・本文に含まれるキーワードごとの重み（各キーワード1回まで）
+            url_patterns: URLの正規表現と重みのペアのリスト（一致したものをすべて加算）
+            threshold: 即時通知する最小スコア
+        """
+        self.type_weights = dict(type_weights or {})
+        self.keyword_weights = [
+            (keyword.lower(), weight) for keyword, weight in (keyword_weights or {}).items()
+        ]
+        self.url_patterns = [(re.compile(pattern), weight) for pattern, weight in (url_patterns or [])]
+        self.threshold = threshold
+
+    def score(self, item: Dict) -> float:
+        """
+        アイテムのスコアを計算
+
+        Args:
+            item: アイテム（Itemまたは辞書）
+
+        Returns:
+            スコア
+        """
+        score = self.type_weights.get(item.get('type', ''), 0.0)
+
+        text = f"{item.get('title', '')} {item.get('content', '')}".lower()
+        for keyword, weight in self.keyword_weights:
+            if keyword in text:
+                score += weight
+
+        url = item.get('url', '')
+        if url:
+            for pattern, weight in self.url_patterns:
+                if pattern.search(url):
+                    score += weight
+
+        return score
+
+    def split(self, items: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        アイテムを即時通知とダイジェストに振り分け
+
+        Args:
+            items: アイテムのリスト
+
+        Returns:
+            (即時通知するアイテム（スコアの高い順）, ダイジェストに回すアイテム（元の順序）)
+        """
+        urgent = []
+        normal = []
+        for item in items:
+            score = self.score(item)
+            if score >= self.threshold:
+                urgent.append((score, item))
+            else:
+                normal.append(item)
+
+        urgent.sort(key=lambda pair: pair[0], reverse=True)
+        if urgent:
+            logger.info(f"優先度の高いアイテム: {len(urgent)}件（最高スコア: {urgent[0][0]:g}）")
+        return [item for _, item in urgent], normal
+
+
+class DigestQueue:
+    """ダイジェストで通知するアイテムを貯め、一定間隔でまとめて取り出すクラス"""
+
+    def __init__(self, backend: Optional[StateBackend] = None,
+                 interval_seconds: float = 0, max_items: int = 100):
+        """
+        Args:
+            backend: 未通知アイテムの保存先（Noneの場合はメモリ上のみ）
+            interval_seconds: ダイジェストの送信間隔（秒、0の場合は毎回送信）
+            max_items: 保持する最大件数（超えた分は古いものから削除）
+        """
+        self.backend = backend
+        self.interval_seconds = interval_seconds
+        self.max_items = max_items
+
+        self._pending: List[Dict] = []
+        self._last_sent = 0.0
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.backend is None:
+            return
+        data = self.backend.load() or {}
+        self._pending = [Item.from_dict(item) for item in data.get('pending', [])]
+        self._last_sent = float(data.get('last_sent', 0))
+
+    def add(self, items: List[Dict]):
+        """
+        アイテムをダイジェストに追加
+
+        Args:
+            items: アイテムのリスト
+        """
+        if not items:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._pending.extend(items)
+            if len(self._pending) > self.max_items:
+                logger.warning(f"ダイジェストが{self.max_items}件を超えたため古いアイテムを削除しました")
+                self._pending = self._pending[-self.max_items:]
+            self._dirty = True
+
+    def pending_count(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._pending)
+
+    def is_due(self, now: Optional[float] = None) -> bool:
+        """
+        ダイジェストの送信時刻かどうか
+
+        Args:
+            now: 基準時刻（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            未通知のアイテムがあり、前回の送信から interval_seconds 以上経過した場合True
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            return bool(self._pending) and now - self._last_sent >= self.interval_seconds
+
+    def drain(self, now: Optional[float] = None) -> List[Dict]:
+        """
+        未通知のアイテムをすべて取り出す（送信時刻として記録）
+
+        Args:
+            now: 送信時刻（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            アイテムのリスト（追加順）
+        """
+        with self._lock:
+            self._ensure_loaded()
+            items, self._pending = self._pending, []
+            self._last_sent = time.time() if now is None else now
+            self._dirty = True
+            return items
+
+    def requeue(self, items: List[Dict]):
+        """送信に失敗したアイテムを先頭に戻す"""
+        with self._lock:
+            self._pending = list(items) + self._pending
+            self._pending = self._pending[-self.max_items:]
+            self._dirty = True
+
+    def save(self) -> bool:
+        """
+        変更があればバックエンドに保存
+
+        Returns:
+            保存成功時（変更がない場合も）True
+        """
+        with self._lock:
+            if self.backend is None or not self._dirty:
+                return True
+            data = {'pending': serialize_items(self._pending), 'last_sent': self._last_sent}
+            if self.backend.save(data):
+                self._dirty = False
+                return True
+            return False
+
+
+def main():
+    """テスト用のメイン関数"""
+    import config
+
+    scorer = PriorityScorer(
+        type_weights=config.PRIORITY_TYPE_WEIGHTS,
+        keyword_weights=config.PRIORITY_KEYWORD_WEIGHTS,
+        url_patterns=config.PRIORITY_URL_PATTERNS,
+        threshold=config.PRIORITY_THRESHOLD
+    )
+    items = [
+        {'type': 'heading', 'title': '「Nintendo Switch 2」招待販売について',
+         'content': '「Nintendo Switch 2」招待販売について | 申込期限: 11月18日（火）午前11:00',
+         'url': 'https://store-jp.nintendo.com/switch2'},
+        {'type': 'paragraph', 'title': '多言語対応のソフトも順次発売予定です。',
+         'content': '多言語対応のソフトも順次発売予定です。', 'url': 'https://store-jp.nintendo.com/'},
+        {'type': 'link', 'title': '抽選販売のお申込みはこちら', 'content': '抽選販売のお申込みはこちら',
+         'url': 'https://store-jp.nintendo.com/lottery/switch2'},
+    ]
+    for item in items:
+        print(f"{scorer.score(item):>5g}  {item['type']:<10} {item['title']}")
+
+    urgent, normal = scorer.split(items)
+    print(f"\n即時通知: {len(urgent)}件, ダイジェスト: {len(normal)}件")
+
+
+if __name__ == '__main__':
+    main()
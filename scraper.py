@@ -2,71 +2,308 @@
 Switch2 抽選販売ページのスクレイピング
 任天堂公式ストア（https://store-jp.nintendo.com/）向けに最適化
 """
-import requests
-from bs4 import BeautifulSoup
-from typing import Dict, List, Optional, Set
+from bs4 import Tag
+from dataclasses import dataclass
+from requests.compat import chardet
+from typing import Dict, List, Optional, Set, Tuple
 import logging
 import hashlib
 import re
-from urllib.parse import urljoin
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+from fingerprint import fingerprint, fingerprint_bytes, to_hex
+from items import Item, item_digest_of, item_id_of
+from normalizer import ContentNormalizer, get_default_normalizer
+from parser_backends import EXCLUDED_TEXT_TAGS, PARSER_BS4, TextCache, create_parser_backend
+from prefilter import KeywordPrefilter
+from deadline import Deadline, DeadlineExceeded, RetryPolicy
+from hedging import HedgedFetcher
+from politeness import HostThrottled, PolitenessScheduler
+from http_client import (
+    FetchError, FetchHTTPError, FetchResponse, FetchTimeout, HttpClient, RequestsClient
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 監視対象ごとに上書きできるコンテキスト抽出の上限（Switch2Scraperの引数名）
+CONTEXT_LIMIT_KEYS = ('context_max_siblings', 'context_max_nodes', 'context_max_chars')
+
+
+def parse_context_limits(spec: str) -> Dict[str, Dict[str, int]]:
+    """
+    監視対象ごとのコンテキスト抽出の上限の指定を解析
+
+    Args:
+        spec: 'URLの前方一致=含める兄弟要素数,たどる兄弟要素数,文字数' を ';' で区切った文字列
+              （空の値は全体の設定を使う。例: 'https://example.com/news/=3,20,1000;https://example.com/=,,200'）
+
+    Returns:
+        URLの前方一致と、Switch2Scraperの引数名と値の辞書
+
+    Raises:
+        ValueError: 形式が正しくない場合
+    """
+    limits: Dict[str, Dict[str, int]] = {}
+    for entry in spec.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        prefix, separator, values = entry.rpartition('=')
+        fields = values.split(',')
+        if not separator or not prefix.strip() or len(fields) > len(CONTEXT_LIMIT_KEYS):
+            raise ValueError(f"CONTEXT_LIMITSの形式が正しくありません: {entry}")
+        options = {}
+        for key, value in zip(CONTEXT_LIMIT_KEYS, fields):
+            value = value.strip()
+            if not value:
+                continue
+            if not value.isdigit():
+                raise ValueError(f"CONTEXT_LIMITSの上限は0以上の整数を指定してください: {entry}")
+            options[key] = int(value)
+        limits[prefix.strip()] = options
+    return limits
+
+
+def context_limits_for(url: str, limits: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    """
+    URLに最も長く前方一致する指定のコンテキスト抽出の上限
+
+    Args:
+        url: 監視対象のURL
+        limits: parse_context_limitsの結果
+
+    Returns:
+        Switch2Scraperの引数名と値の辞書（一致する指定がない場合は空）
+    """
+    matched = [prefix for prefix in limits if url.startswith(prefix)]
+    return dict(limits[max(matched, key=len)]) if matched else {}
+
+
+@dataclass
+class FetchResult:
+    """
+    1回分のページ取得の結果
+
+    スクレイパーは同時に実行される複数のスキャンで共有されるため、取得ごとの本文やエラーは
+    スクレイパーの属性ではなくこの結果で返す。
+    """
+
+    html: Optional[str] = None
+    body: Optional[bytes] = None  # 受信した本文（デコード前）
+    encoding: Optional[str] = None  # 本文の文字コード
+    error: Optional[str] = None
+    throttled: bool = False  # 制限中のホストのため、リクエストを送らずに見送った場合True
+
 
 class Switch2Scraper:
     """Switch2の抽選販売情報をスクレイピングするクラス"""
 
-    def __init__(self, target_url: str, keywords: List[str], match_mode: str = 'any'):
+    HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+    BANNER_CLASSES = ['banner', 'notification', 'alert', 'announcement', 'notice']
+
+    def __init__(self, target_url: str, keywords: List[str], match_mode: str = 'any',
+                 incremental: bool = True, normalizer: Optional[ContentNormalizer] = None,
+                 context_max_siblings: int = 2, context_max_nodes: int = 10,
+                 context_max_chars: int = 500, snapshot_store=None,
+                 parser_backend: str = PARSER_BS4, keyword_prefilter: bool = True,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 hedger: Optional[HedgedFetcher] = None,
+                 http_client: Optional[HttpClient] = None,
+                 scheduler: Optional[PolitenessScheduler] = None):
         """
         Args:
             target_url: 監視対象のURL
             keywords: 検出対象のキーワードリスト
             match_mode: 'any'（いずれか） or 'all'（すべて）
+            incremental: 前回から変化したチャンクだけを再抽出するか
+            normalizer: ハッシュ計算前の正規化（省略時は設定ファイルのルール）
+            context_max_siblings: 見出しのコンテキストに含める兄弟要素の最大数
+            context_max_nodes: コンテキスト抽出でたどる兄弟要素の最大数（短い要素も含む）
+            context_max_chars: 見出しに続くコンテキストの最大文字数
+            snapshot_store: 取得したページを保存するSnapshotStore（省略時は保存しない）
+            parser_backend: 解析バックエンド（'bs4': 参照実装、'lxml': lxmlを直接使う高速版）
+            keyword_prefilter: キーワードを一切含まないページの解析を省略するか
+            connect_timeout: 接続のタイムアウト（秒）
+            read_timeout: 読み込みのタイムアウト（秒、受信の間隔）
+            retry_policy: 取得のリトライ方針（省略時は3回・ジッター付き指数バックオフ）
+            hedger: 応答が遅い場合に2回目のリクエストを送るヘッジ（省略時はヘッジしない）
+            http_client: ページ取得のHTTPクライアント（省略時はrequestsのHTTP/1.1）
+            scheduler: ホストごとのアクセス間隔の制御（省略時は制御しない）
         """
         self.target_url = target_url
         self.keywords = keywords
         self.match_mode = match_mode
+        self.incremental = incremental
+        self.normalizer = normalizer or get_default_normalizer()
+        self.context_max_siblings = context_max_siblings
+        self.context_max_nodes = context_max_nodes
+        self.context_max_chars = context_max_chars
+        self.snapshot_store = snapshot_store
+        self.backend = create_parser_backend(parser_backend, self)
+        self.prefilter = KeywordPrefilter(keywords) if keyword_prefilter else None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.hedger = hedger
+        self.scheduler = scheduler
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         }
+        self.http_client = http_client or RequestsClient(self.headers)
 
-    def fetch_page(self, max_retries: int = 3) -> Optional[str]:
+    def fetch_page(self, max_retries: Optional[int] = None,
+                   deadline: Optional[Deadline] = None) -> Optional[str]:
         """
-        ページのHTMLを取得（リトライ機能付き）
+        ページのHTMLを取得（リトライ機能付き、失敗の理由が必要な場合はfetchを使う）
 
         Args:
-            max_retries: 最大リトライ回数
+            max_retries: 最大試行回数（省略時はリトライ方針の設定）
+            deadline: 実行の期限（省略時は期限なし）
 
         Returns:
             HTML文字列、取得失敗時はNone
         """
-        for attempt in range(max_retries):
+        return self.fetch(max_retries, deadline).html
+
+    def fetch(self, max_retries: Optional[int] = None,
+              deadline: Optional[Deadline] = None) -> FetchResult:
+        """
+        ページを取得（リトライ機能付き）
+
+        接続・読み込みのタイムアウトと本文の受信は実行の期限（保存・通知の分を除く）内に収め、
+        失敗時はジッター付き指数バックオフで待ってからリトライする。
+        タイムアウト・接続エラー・429・5xx以外のHTTPエラーはリトライしない。
+        アクセス間隔の制御が有効な場合は、ホストにリクエストしてよい時刻まで待ち、
+        403・429・503を受けたらRetry-Afterに従って次のリクエストを遅らせる。
+        期限内に待ちきれない場合はリクエストを送らない。
+
+        Args:
+            max_retries: 最大試行回数（省略時はリトライ方針の設定）
+            deadline: 実行の期限（省略時は期限なし）
+
+        Returns:
+            FetchResult（取得失敗時はhtmlがNoneで、errorに理由）
+        """
+        deadline = deadline or Deadline()
+        policy = self.retry_policy
+        attempts = max_retries or policy.max_attempts
+        result = FetchResult()
+        host = urlparse(self.target_url).netloc
+
+        for attempt in range(attempts):
+            if deadline.work_remaining() < policy.min_attempt_seconds:
+                result.error = 'ページ取得の時間が残っていません（実行の期限）'
+                logger.error(result.error)
+                return result
+
             try:
-                logger.info(f"ページ取得中... (試行 {attempt + 1}/{max_retries})")
-                response = requests.get(
-                    self.target_url,
-                    headers=self.headers,
-                    timeout=30
-                )
-                response.raise_for_status()
-                response.encoding = response.apparent_encoding
+                if self.scheduler is not None:
+                    self.scheduler.acquire(host, deadline)
+                logger.info(f"ページ取得中... (試行 {attempt + 1}/{attempts})")
+                result.body, result.encoding = self._fetch_once(deadline)
+                result.html = str(result.body, result.encoding, errors='replace')
+                result.error = None
+                self._record_response(host, 200)
+                logger.info(f"ページ取得成功: {len(result.html)} 文字")
+                return result
+
+            except HostThrottled as e:
+                # この実行でまだリクエストしていない場合は、制限中のため見送ったことを示す
+                logger.warning(str(e))
+                result.throttled = attempt == 0
+                result.error = str(e) if result.throttled else f"{result.error}、{e}"
+                return result
+
+            except DeadlineExceeded as e:
+                result.error = str(e)
+                logger.error(f"ページ取得を中止: {e}")
+                return result
+
+            except FetchTimeout:
+                result.error = 'タイムアウト'
+                self._record_response(host, None)
+                logger.warning(f"タイムアウト (試行 {attempt + 1}/{attempts})")
+
+            except FetchHTTPError as e:
+                result.error = f"HTTPエラー: {e}"
+                self._record_response(host, e.status, e.headers)
+                logger.error(f"ページ取得エラー (試行 {attempt + 1}/{attempts}): {e}")
+                if e.status != 429 and e.status < 500:
+                    return result
+
+            except FetchError as e:
+                result.error = f"ページ取得エラー: {e}"
+                self._record_response(host, None)
+                logger.error(f"ページ取得エラー (試行 {attempt + 1}/{attempts}): {e}")
+
+            if not policy.wait_before_retry(attempt, deadline):
+                break
+
+        logger.error(f"ページ取得失敗: {result.error}")
+        return result
+
+    def _fetch_once(self, deadline: Deadline) -> Tuple[bytes, str]:
+        """
+        1回分の取得（本文は分割して受信し、受信中も期限を確認する）
+
+        ヘッジが有効な場合、応答が遅ければ2回目のリクエストを送り、先に返った方を使う。
+
+        Args:
+            deadline: 実行の期限
 
-                logger.info(f"ページ取得成功: {len(response.text)} 文字")
-                return response.text
+        Returns:
+            (本文, 文字コード)
+        """
+        host = urlparse(self.target_url).netloc
+        # 制限を受けているホストにはヘッジの追加リクエストを送らない。
+        # それ以外も追加のリクエストはアクセス間隔の予約を取れた場合だけ送る（リクエストの頻度を超えない）
+        if self.hedger is not None and (self.scheduler is None or not self.scheduler.is_throttled(host)):
+            body = self.hedger.fetch(
+                host,
+                lambda cancelled: self._request_body(deadline, cancelled),
+                deadline,
+                admit=(lambda: self.scheduler.try_acquire(host)) if self.scheduler is not None else None
+            )
+        else:
+            body = self._request_body(deadline)
 
-            except requests.Timeout:
-                logger.warning(f"タイムアウト (試行 {attempt + 1}/{max_retries})")
-                if attempt == max_retries - 1:
-                    logger.error("タイムアウトによりページ取得失敗")
-                    return None
+        return body, self._detect_encoding(body)
 
-            except requests.RequestException as e:
-                logger.error(f"ページ取得エラー (試行 {attempt + 1}/{max_retries}): {e}")
-                if attempt == max_retries - 1:
-                    return None
+    @staticmethod
+    def _detect_encoding(body: bytes) -> str:
+        # response.apparent_encoding と同じ判定
+        return (chardet.detect(body)['encoding'] if chardet is not None else None) or 'utf-8'
 
-        return None
+    def warm_up(self) -> bool:
+        """
+        最初の取得・解析の準備（抽出ルールのコンパイルと、ホストへの接続の確立）
+
+        Returns:
+            ホストに接続できた場合True
+        """
+        sample = '<html><head><title>-</title></head><body><h2>-</h2><p><a href="/">-</a></p></body></html>'
+        self._extract_from_document(self.backend.parse(sample))
+        if self.prefilter is not None:
+            self.prefilter.might_match(sample.encode('utf-8'), 'utf-8')
+
+        host = urlparse(self.target_url).netloc
+        if self.scheduler is not None and self.scheduler.is_throttled(host):
+            logger.info(f"{host} は制限中のため事前接続を行いません")
+            return False
+        return self.http_client.warm_up(self.target_url, (self.connect_timeout, self.read_timeout))
+
+    def _record_response(self, host: str, status: Optional[int], headers: Optional[Dict[str, str]] = None):
+        if self.scheduler is not None:
+            self.scheduler.record(host, status, headers)
+
+    def _request_body(self, deadline: Deadline, cancelled: Optional[threading.Event] = None) -> bytes:
+        # 1回分のリクエスト（ヘッジで負けた場合は受信を打ち切る）
+        timeout = (deadline.cap(self.connect_timeout), deadline.cap(self.read_timeout))
+        return self.http_client.get(self.target_url, timeout, deadline, cancelled).body
 
     def check_keywords_in_text(self, text: str) -> bool:
         """
@@ -86,7 +323,7 @@ class Switch2Scraper:
         else:  # 'any'
             return any(matches)
 
-    def extract_relevant_content(self, html: str) -> List[Dict[str, str]]:
+    def extract_relevant_content(self, html: str) -> List[Item]:
         """
         HTMLからキーワードに関連するコンテンツを抽出
 
@@ -96,150 +333,379 @@ class Switch2Scraper:
         Returns:
             関連コンテンツのリスト
         """
-        soup = BeautifulSoup(html, 'lxml')
+        if self.prefilter is not None and not self.prefilter.might_match(html):
+            return []
+        items, _ = self._extract_from_document(self.backend.parse(html))
+        return items
+
+    def split_into_chunks(self, soup) -> List[List]:
+        """
+        ページをセクション単位のチャンクに分割
+
+        body から子要素が1つだけのラッパー要素をたどり、子要素が複数ある最初の要素の
+        子要素を区切りとする。見出し要素は後続の兄弟要素（次の見出しまで）と同じチャンクにする。
+        ラッパー要素自体（複数チャンクにまたがるテキストを持つ）は抽出対象外。
+
+        Args:
+            soup: BeautifulSoupオブジェクト
+
+        Returns:
+            チャンク（要素のリスト）のリスト
+        """
+        container = soup.body or soup
+        children = container.find_all(True, recursive=False)
+        while len(children) == 1 and children[0].name not in self.HEADING_TAGS:
+            container = children[0]
+            children = container.find_all(True, recursive=False)
+
+        if not children:
+            return [[container]]
+
+        chunks = []
+        for child in children:
+            if child.name in self.HEADING_TAGS or not chunks or chunks[-1][0].name not in self.HEADING_TAGS:
+                chunks.append([child])
+            else:
+                chunks[-1].append(child)
+        return chunks
+
+    def _hash_chunk(self, nodes: List) -> str:
+        """
+        チャンクを正規化した内容からハッシュ値を計算
+
+        マークアップそのものではなく要素ごとにnormalize_elementで正規化した文字列を使うため、
+        抽出結果に影響しない変化（キャッシュ回避用のクエリ文字列など）では再抽出しない。
+
+        Args:
+            nodes: チャンクを構成する要素のリスト
+
+        Returns:
+            16桁の16進文字列
+        """
+        lines = []
+        stack = list(reversed(nodes))
+        while stack:
+            element = stack.pop()
+            if element.name in EXCLUDED_TEXT_TAGS:
+                continue
+            text = ' '.join(child for child in element.contents if type(child) in TextCache.TEXT_TYPES)
+            lines.append(self.normalizer.normalize_element(
+                element.name, text, element.get('href'), element.get('class')
+            ))
+            stack.extend(reversed(element.find_all(True, recursive=False)))
+        return to_hex(fingerprint_bytes('\n'.join(lines).encode('utf-8')))
+
+    @staticmethod
+    def _dedup_key(item) -> int:
+        """重複判定用のフィンガープリント（リンクはテキスト + URL、それ以外はテキスト）"""
+        if item.get('type') == 'link':
+            return fingerprint(item.get('title', '') + item.get('url', ''))
+        if item.get('type') == 'heading':
+            return fingerprint(item.get('title', ''))
+        return fingerprint(item.get('content', ''))
+
+    def extraction_fingerprint(self) -> str:
+        """
+        抽出結果に影響する設定（キーワード・検出条件・コンテキスト抽出の上限）のフィンガープリント
+
+        Returns:
+            16桁の16進文字列
+        """
+        spec = '\n'.join([
+            self.match_mode,
+            str(self.context_max_siblings), str(self.context_max_nodes), str(self.context_max_chars),
+            *sorted(self.keywords),
+        ])
+        return to_hex(fingerprint(spec))
+
+    def _extract_from_document(self, document, previous_items: Optional[List[Dict]] = None,
+                           previous_chunks: Optional[List[str]] = None) -> Tuple[List[Item], List[str]]:
+        """
+        チャンクごとに関連コンテンツを抽出
+
+        前回のチャンクハッシュが与えられた場合、変化していないチャンクは前回のアイテムを
+        そのまま再利用し、変化したチャンクだけを再抽出する。チャンクハッシュには抽出の設定の
+        フィンガープリントを含めるため、キーワードなどが変わった場合はすべてのチャンクを再抽出する。
+
+        Args:
+            document: 解析バックエンドで解析した文書
+            previous_items: 前回のアイテムリスト（'chunk'キー付き）
+            previous_chunks: 前回のチャンクハッシュのリスト
+
+        Returns:
+            (関連コンテンツのリスト, チャンクハッシュのリスト)
+        """
         relevant_items = []
         found_elements = set()  # 重複を避けるため
+        chunk_hashes = []
+
+        # おすすめ枠などの揮発的な要素はチャンク分割・抽出の前に取り除く
+        backend = self.backend
+        backend.remove_volatile(document)
+        text_cache = backend.new_text_cache()
+
+        extraction_key = self.extraction_fingerprint()
+        known_chunks = set(previous_chunks or [])
+        reusable: Dict[str, List[Dict]] = {}
+        if previous_items and known_chunks:
+            for item in previous_items:
+                chunk_hash = item.get('chunk')
+                if chunk_hash in known_chunks:
+                    reusable.setdefault(chunk_hash, []).append(item)
 
         try:
-            # 1. 見出し要素（h1-h6）をチェック
-            for heading_tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                headings = soup.find_all(heading_tag)
-                for heading in headings:
-                    text = heading.get_text(strip=True)
-                    if text and self.check_keywords_in_text(text):
-                        element_id = hashlib.md5(text.encode()).hexdigest()
-                        if element_id not in found_elements:
-                            found_elements.add(element_id)
-
-                            # 周辺のコンテキストを取得
-                            context = self._extract_context(heading)
-
-                            item = {
-                                'type': 'heading',
-                                'tag': heading_tag,
-                                'title': text,
-                                'content': context,
-                                'url': self.target_url
-                            }
-
-                            # リンクがあれば取得
-                            link = heading.find('a') or heading.find_parent('a')
-                            if link and link.get('href'):
-                                item['url'] = urljoin(self.target_url, link['href'])
-
-                            relevant_items.append(item)
-                            logger.debug(f"見出し検出: {text[:50]}...")
-
-            # 2. リンク要素をチェック
-            links = soup.find_all('a', href=True)
-            for link in links:
-                text = link.get_text(strip=True)
-                href = link.get('href', '')
-
-                # URLパターンチェック（/switch2 など）
-                url_matches_keyword = any(
-                    keyword.lower() in href.lower()
-                    for keyword in self.keywords
-                )
+            chunks = backend.split_into_chunks(document)
+            extracted = 0
+
+            for nodes in chunks:
+                chunk_hash = to_hex(fingerprint(f"{extraction_key}:{backend.hash_chunk(nodes)}"))
+
+                if chunk_hash in reusable:
+                    # 変化していないチャンクは前回の抽出結果を再利用
+                    candidates = [Item.from_dict(item) for item in reusable.pop(chunk_hash)]
+                elif chunk_hash in known_chunks:
+                    # 前回アイテムのなかったチャンク、または再利用済みの同一チャンク
+                    chunk_hashes.append(chunk_hash)
+                    continue
+                else:
+                    # 重複の判定はチャンク内だけで行い、チャンクのアイテムをすべて候補にする
+                    extracted += 1
+                    candidates = backend.extract_from_nodes(nodes, set(), text_cache)
+                    for item in candidates:
+                        item.chunk = chunk_hash
+
+                # チャンクをまたいだ重複はページ全体で除く。除いたアイテムがあるチャンクは
+                # 保存するアイテムだけでは再利用できないため、ハッシュを記録せず次回も再抽出する
+                complete = True
+                for item in candidates:
+                    element_id = self._dedup_key(item)
+                    if element_id in found_elements:
+                        complete = False
+                        continue
+                    found_elements.add(element_id)
+                    relevant_items.append(item)
+                if complete:
+                    chunk_hashes.append(chunk_hash)
+
+            if known_chunks:
+                logger.info(f"変化したチャンク: {extracted}/{len(chunks)}件を再抽出")
+            logger.info(f"{len(relevant_items)}件の関連コンテンツを検出")
+
+        except Exception as e:
+            logger.error(f"HTML解析エラー: {e}", exc_info=True)
+
+        return relevant_items, chunk_hashes
 
-                if text and (self.check_keywords_in_text(text) or url_matches_keyword):
-                    element_id = hashlib.md5((text + href).encode()).hexdigest()
+    @staticmethod
+    def _iter_matching(nodes: List, predicate, *args, **kwargs):
+        """チャンクの各要素自身と子孫要素のうち条件に合うものを順に返す"""
+        for node in nodes:
+            if predicate(node):
+                yield node
+            yield from node.find_all(*args, **kwargs)
+
+    def _extract_from_nodes(self, nodes: List, found_elements: Set[int],
+                            text_cache: TextCache) -> List[Item]:
+        """
+        チャンク内の要素からキーワードに関連するコンテンツを抽出
+
+        Args:
+            nodes: チャンクを構成する要素のリスト
+            found_elements: 検出済み要素のフィンガープリント（追加される）
+            text_cache: 解析中のページのテキストキャッシュ
+
+        Returns:
+            関連コンテンツのリスト
+        """
+        relevant_items = []
+
+        # 1. 見出し要素（h1-h6）をチェック
+        for heading_tag in self.HEADING_TAGS:
+            headings = self._iter_matching(nodes, lambda node: node.name == heading_tag, heading_tag)
+            for heading in headings:
+                text = text_cache.get(heading)
+                if text and self.check_keywords_in_text(text):
+                    element_id = fingerprint(text)
                     if element_id not in found_elements:
                         found_elements.add(element_id)
 
-                        item = {
-                            'type': 'link',
-                            'title': text,
-                            'url': urljoin(self.target_url, href),
-                            'content': text
-                        }
+                        # 周辺のコンテキストを取得
+                        context = self._extract_context(heading, text_cache, nodes)
+
+                        # リンクがあれば取得
+                        url = self.target_url
+                        link = heading.find('a') or self._find_parent_link(heading, nodes)
+                        if link and link.get('href'):
+                            url = self._resolve_url(link['href'])
+
+                        item = Item(
+                            type='heading',
+                            tag=heading_tag,
+                            title=text,
+                            content=context,
+                            url=url
+                        )
                         relevant_items.append(item)
-                        logger.debug(f"リンク検出: {text[:50]}...")
-
-            # 3. バナー・通知エリアをチェック
-            banner_classes = ['banner', 'notification', 'alert', 'announcement', 'notice']
-            for class_name in banner_classes:
-                banners = soup.find_all(class_=re.compile(class_name, re.I))
-                for banner in banners:
-                    text = banner.get_text(strip=True)
-                    if text and self.check_keywords_in_text(text):
-                        element_id = hashlib.md5(text.encode()).hexdigest()
-                        if element_id not in found_elements:
-                            found_elements.add(element_id)
-
-                            item = {
-                                'type': 'banner',
-                                'title': text[:100],  # 長すぎる場合は切り詰め
-                                'content': text,
-                                'url': self.target_url
-                            }
-
-                            # リンクがあれば取得
-                            link = banner.find('a')
-                            if link and link.get('href'):
-                                item['url'] = urljoin(self.target_url, link['href'])
-
-                            relevant_items.append(item)
-                            logger.debug(f"バナー検出: {text[:50]}...")
-
-            # 4. 段落・div要素をチェック（厳しめの条件）
-            paragraphs = soup.find_all(['p', 'div'])
-            for para in paragraphs:
-                text = para.get_text(strip=True)
-                # 長すぎる、または短すぎるテキストは除外
-                if text and 10 < len(text) < 500 and self.check_keywords_in_text(text):
-                    element_id = hashlib.md5(text.encode()).hexdigest()
+                        logger.debug(f"見出し検出: {text[:50]}...")
+
+        # 2. リンク要素をチェック
+        links = self._iter_matching(
+            nodes, lambda node: node.name == 'a' and node.get('href') is not None, 'a', href=True
+        )
+        for link in links:
+            text = text_cache.get(link)
+            href = link.get('href', '')
+
+            # URLパターンチェック（/switch2 など）
+            url_matches_keyword = any(
+                keyword.lower() in href.lower()
+                for keyword in self.keywords
+            )
+
+            if text and (self.check_keywords_in_text(text) or url_matches_keyword):
+                item = Item(
+                    type='link',
+                    title=text,
+                    content=text,
+                    url=self._resolve_url(href)
+                )
+
+                element_id = self._dedup_key(item)
+                if element_id not in found_elements:
+                    found_elements.add(element_id)
+                    relevant_items.append(item)
+                    logger.debug(f"リンク検出: {text[:50]}...")
+
+        # 3. バナー・通知エリアをチェック
+        for class_name in self.BANNER_CLASSES:
+            pattern = re.compile(class_name, re.I)
+            banners = self._iter_matching(
+                nodes, lambda node: self._class_matches(node, pattern), class_=pattern
+            )
+            for banner in banners:
+                text = text_cache.get(banner)
+                if text and self.check_keywords_in_text(text):
+                    # リンクがあれば取得
+                    url = self.target_url
+                    link = banner.find('a')
+                    if link and link.get('href'):
+                        url = self._resolve_url(link['href'])
+
+                    item = Item(
+                        type='banner',
+                        title=text[:100],  # 長すぎる場合は切り詰め
+                        content=text,
+                        url=url
+                    )
+
+                    element_id = self._dedup_key(item)
                     if element_id not in found_elements:
                         found_elements.add(element_id)
+                        relevant_items.append(item)
+                        logger.debug(f"バナー検出: {text[:50]}...")
+
+        # 4. 段落・div要素をチェック（厳しめの条件）
+        paragraphs = self._iter_matching(nodes, lambda node: node.name in ('p', 'div'), ['p', 'div'])
+        for para in paragraphs:
+            text = text_cache.get(para)
+            # 長すぎる、または短すぎるテキストは除外
+            if text and 10 < len(text) < 500 and self.check_keywords_in_text(text):
+                # 親要素にリンクがあれば取得
+                url = self.target_url
+                link = para.find('a') or self._find_parent_link(para, nodes)
+                if link and link.get('href'):
+                    url = self._resolve_url(link['href'])
+
+                item = Item(
+                    type='paragraph',
+                    title=text[:100],
+                    content=text,
+                    url=url
+                )
 
-                        item = {
-                            'type': 'paragraph',
-                            'title': text[:100],
-                            'content': text,
-                            'url': self.target_url
-                        }
+                element_id = self._dedup_key(item)
+                if element_id not in found_elements:
+                    found_elements.add(element_id)
+                    relevant_items.append(item)
+                    logger.debug(f"段落検出: {text[:50]}...")
 
-                        # 親要素にリンクがあれば取得
-                        link = para.find('a') or para.find_parent('a')
-                        if link and link.get('href'):
-                            item['url'] = urljoin(self.target_url, link['href'])
+        return relevant_items
 
-                        relevant_items.append(item)
-                        logger.debug(f"段落検出: {text[:50]}...")
+    @staticmethod
+    def _find_parent_link(element, nodes: List):
+        """
+        チャンク内の祖先のa要素（チャンクを囲む要素のリンクは見ない）
 
-            logger.info(f"{len(relevant_items)}件の関連コンテンツを検出")
+        チャンクの外の要素はチャンクハッシュに含まれないため、参照すると
+        再利用したアイテムに古いリンク先が残る。
+        """
+        tops = {id(node) for node in nodes}
+        node = element
+        while id(node) not in tops:
+            node = node.parent
+            if node is None:
+                return None
+            if node.name == 'a':
+                return node
+        return None
 
-        except Exception as e:
-            logger.error(f"HTML解析エラー: {e}", exc_info=True)
+    def _resolve_url(self, href: str) -> str:
+        """リンク先を絶対URLにし、キャッシュ回避用のクエリパラメータを取り除く"""
+        return self.normalizer.normalize_url(urljoin(self.target_url, href))
 
-        return relevant_items
+    @staticmethod
+    def _class_matches(node, pattern) -> bool:
+        """要素のclass属性が正規表現に一致するか（BeautifulSoupのclass_指定と同じ判定）"""
+        classes = node.get('class') or []
+        if isinstance(classes, str):
+            classes = classes.split()
+        return any(pattern.search(c) for c in classes) or bool(classes and pattern.search(' '.join(classes)))
 
-    def _extract_context(self, element) -> str:
+    def _extract_context(self, element, text_cache: Optional[TextCache] = None,
+                         chunk_nodes: Optional[List] = None) -> str:
         """
         要素の周辺コンテキストを抽出
 
+        たどる兄弟要素の数（context_max_nodes）と追加する文字数（context_max_chars）に
+        上限を設け、短い要素が大量に続く場合や巨大な兄弟要素がある場合も処理量を抑える。
+        チャンクが与えられた場合、兄弟要素はチャンク内のものだけをたどる（次のチャンクの
+        内容を含めると、チャンクを再利用したときに古いコンテキストが残る）。
+
         Args:
             element: BeautifulSoup要素
+            text_cache: 解析中のページのテキストキャッシュ（省略時は新規作成）
+            chunk_nodes: 要素を含むチャンクを構成する要素のリスト
 
         Returns:
             コンテキスト文字列
         """
-        context_parts = []
+        text_cache = text_cache or TextCache()
 
         # 要素自体のテキスト
-        context_parts.append(element.get_text(strip=True))
+        context_parts = [text_cache.get(element)]
+        remaining_chars = self.context_max_chars
 
-        # 次の兄弟要素を最大3つまで取得
-        next_sibling = element.find_next_sibling()
-        count = 0
-        while next_sibling and count < 3:
-            sibling_text = next_sibling.get_text(strip=True)
+        # 次の兄弟要素を上限まで取得
+        position = next((i for i, node in enumerate(chunk_nodes or []) if node is element), None)
+        if position is not None:
+            siblings = chunk_nodes[position + 1:]
+        else:
+            siblings = (sibling for sibling in element.next_siblings if isinstance(sibling, Tag))
+
+        visited = 0
+        for sibling in siblings:
+            if (len(context_parts) > self.context_max_siblings
+                    or visited >= self.context_max_nodes
+                    or remaining_chars <= 0):
+                break
+            visited += 1
+            sibling_text = text_cache.get(sibling)
             if sibling_text and len(sibling_text) > 5:
+                sibling_text = sibling_text[:remaining_chars]
                 context_parts.append(sibling_text)
-                count += 1
-            next_sibling = next_sibling.find_next_sibling()
+                remaining_chars -= len(sibling_text)
 
-        return ' | '.join(context_parts[:3])  # 最大3つまで
+        return ' | '.join(context_parts)
 
     def get_page_hash(self, html: str) -> str:
         """
@@ -252,47 +718,227 @@ class Switch2Scraper:
             SHA256ハッシュ値
         """
         # HTMLから関連コンテンツのみを抽出してハッシュ化
-        relevant_content = self.extract_relevant_content(html)
-        content_str = str(relevant_content)
-        return hashlib.sha256(content_str.encode()).hexdigest()
+        return self.compute_items_hash(self.extract_relevant_content(html))
+
+    @staticmethod
+    def compute_items_hash(items: List[Item]) -> str:
+        """
+        抽出済みアイテムのハッシュ値を計算
+
+        正規化済みの内容から計算したアイテムID・ダイジェストを使うため、
+        時刻やカウントダウンなどの揮発的な内容やチャンク情報は含まれない。
+
+        Args:
+            items: 関連コンテンツのリスト
+
+        Returns:
+            SHA256ハッシュ値
+        """
+        digest = hashlib.sha256()
+        for item in items:
+            digest.update(f"{item_id_of(item)}:{item_digest_of(item)}\n".encode())
+        return digest.hexdigest()
 
-    def scan_page(self) -> Dict[str, any]:
+    def _save_snapshot(self, body: bytes) -> Optional[str]:
+        # スナップショットの保存に失敗しても監視は続ける
+        try:
+            return self.snapshot_store.put(body, self.target_url)
+        except Exception as e:
+            logger.warning(f"スナップショットの保存に失敗: {e}")
+            return None
+
+    def scan_page(self, previous_state: Optional[Dict] = None,
+                  deadline: Optional[Deadline] = None,
+                  fetched: Optional[FetchResult] = None) -> Dict[str, any]:
         """
         ページをスキャンして関連情報を取得
 
+        Args:
+            previous_state: 前回の状態（チャンク単位の差分抽出に使用、省略時は全体を抽出）
+            deadline: 実行の期限（取得・解析は保存・通知の分を残して打ち切る）
+            fetched: fetch_pagesでまとめて取得済みの結果（省略時はこのスキャンで取得する）
+
         Returns:
             スキャン結果の辞書
         """
-        html = self.fetch_page()
+        if fetched is None:
+            fetched = self.fetch(deadline=deadline)
+        html = fetched.html
         if not html:
+            error = 'ページの取得に失敗しました'
             return {
                 'success': False,
-                'error': 'ページの取得に失敗しました',
+                'error': f"{error}（{fetched.error}）" if fetched.error else error,
+                'throttled': fetched.throttled,
                 'items': [],
                 'hash': None
             }
 
-        try:
-            items = self.extract_relevant_content(html)
-            page_hash = self.get_page_hash(html)
+        # 解析・抽出に失敗したページも調べられるよう、解析の前に保存する
+        snapshot = self._save_snapshot(fetched.body) if self.snapshot_store is not None else None
 
-            return {
+        try:
+            if deadline is not None:
+                deadline.check('解析')
+            if self.prefilter is not None and not self.prefilter.might_match(fetched.body, fetched.encoding):
+                # キーワードを一切含まないページは解析しても0件のため、木を作らない
+                logger.info("キーワードを含まないページのため解析を省略しました")
+                items, chunk_hashes = [], []
+            else:
+                document = self.backend.parse(html)
+
+                previous_items = previous_chunks = None
+                if self.incremental and previous_state and previous_state.get('url') == self.target_url:
+                    previous_items = previous_state.get('items')
+                    previous_chunks = previous_state.get('chunks')
+
+                items, chunk_hashes = self._extract_from_document(document, previous_items, previous_chunks)
+            page_hash = self.compute_items_hash(items)
+
+            result = {
                 'success': True,
                 'items': items,
                 'hash': page_hash,
+                'chunks': chunk_hashes,
                 'item_count': len(items),
                 'url': self.target_url
             }
+            if snapshot:
+                result['snapshot'] = snapshot
+            return result
+
+        except DeadlineExceeded as e:
+            logger.error(f"スキャンを中止: {e}")
+            result = {
+                'success': False,
+                'error': str(e),
+                'items': [],
+                'hash': None
+            }
 
         except Exception as e:
             logger.error(f"スキャンエラー: {e}", exc_info=True)
-            return {
+            result = {
                 'success': False,
                 'error': str(e),
                 'items': [],
                 'hash': None
             }
 
+        if snapshot:
+            result['snapshot'] = snapshot
+        return result
+
+
+def fetch_pages(scrapers: List[Switch2Scraper], deadline: Optional[Deadline] = None,
+                max_retries: Optional[int] = None) -> List[FetchResult]:
+    """
+    複数のスクレイパーのページをまとめて取得
+
+    同じHTTPクライアントのページはHttpClient.fetch_manyで一度に送る（HTTP/2では同じホストへの
+    リクエストが1本の接続に多重化される）。アクセス間隔の制御が有効な場合は、まとめて送る1回分を
+    ホストごとに予約し、応答はページごとに記録する。1回目に失敗したページは、リトライできる
+    エラーであればSwitch2Scraper.fetchと同じ方針で個別に取得し直す（ヘッジは使わない）。
+
+    Args:
+        scrapers: 取得するページのスクレイパー
+        deadline: 実行の期限（省略時は期限なし）
+        max_retries: 1ページあたりの最大試行回数（省略時は各スクレイパーのリトライ方針の設定）
+
+    Returns:
+        scrapersと同じ順のFetchResultのリスト
+    """
+    deadline = deadline or Deadline()
+    results: List[Optional[FetchResult]] = [None] * len(scrapers)
+    groups: Dict[int, List[int]] = {}
+    for index, scraper in enumerate(scrapers):
+        groups.setdefault(id(scraper.http_client), []).append(index)
+
+    def fetch_group(indexes: List[int]):
+        batch: Dict[str, List[int]] = {}
+        throttled: Dict[Tuple[int, str], Optional[HostThrottled]] = {}
+        for index in indexes:
+            scraper = scrapers[index]
+            host = urlparse(scraper.target_url).netloc
+            if deadline.work_remaining() < scraper.retry_policy.min_attempt_seconds:
+                results[index] = FetchResult(error='ページ取得の時間が残っていません（実行の期限）')
+                continue
+            key = (id(scraper.scheduler), host)
+            if scraper.scheduler is not None and key not in throttled:
+                try:
+                    scraper.scheduler.acquire(host, deadline)
+                    throttled[key] = None
+                except HostThrottled as e:
+                    logger.warning(str(e))
+                    throttled[key] = e
+            if throttled.get(key) is not None:
+                results[index] = FetchResult(error=str(throttled[key]), throttled=True)
+                continue
+            batch.setdefault(scraper.target_url, []).append(index)
+        if not batch:
+            return
+
+        first = scrapers[next(iter(batch.values()))[0]]
+        timeout = (deadline.cap(first.connect_timeout), deadline.cap(first.read_timeout))
+        logger.info(f"{len(batch)}ページをまとめて取得中...（{first.http_client.name}）")
+        try:
+            responses = first.http_client.fetch_many(list(batch), timeout, deadline)
+        except DeadlineExceeded as e:
+            logger.error(f"ページ取得を中止: {e}")
+            for batch_indexes in batch.values():
+                for index in batch_indexes:
+                    results[index] = FetchResult(error=str(e))
+            return
+
+        retries: List[int] = []
+        for url, batch_indexes in batch.items():
+            scraper = scrapers[batch_indexes[0]]
+            host = urlparse(url).netloc
+            response = responses[url]
+            retryable = True
+            if isinstance(response, FetchResponse):
+                scraper._record_response(host, 200)
+                encoding = scraper._detect_encoding(response.body)
+                result = FetchResult(str(response.body, encoding, errors='replace'), response.body, encoding)
+            elif isinstance(response, FetchTimeout):
+                scraper._record_response(host, None)
+                result = FetchResult(error='タイムアウト')
+            elif isinstance(response, FetchHTTPError):
+                scraper._record_response(host, response.status, response.headers)
+                result = FetchResult(error=f"HTTPエラー: {response}")
+                retryable = response.status == 429 or response.status >= 500
+            else:
+                scraper._record_response(host, None)
+                result = FetchResult(error=f"ページ取得エラー: {response}")
+            if result.html is None:
+                logger.warning(f"ページ取得エラー: {url}（{result.error}）")
+            for index in batch_indexes:
+                results[index] = result
+                if result.html is None and retryable:
+                    retries.append(index)
+
+        def retry(index: int):
+            scraper = scrapers[index]
+            attempts = (max_retries or scraper.retry_policy.max_attempts) - 1
+            if attempts < 1 or not scraper.retry_policy.wait_before_retry(0, deadline):
+                return
+            results[index] = scraper.fetch(max_retries=attempts, deadline=deadline)
+
+        if retries:
+            with ThreadPoolExecutor(max_workers=min(len(retries), first.http_client.max_connections),
+                                    thread_name_prefix='retry') as executor:
+                list(executor.map(retry, retries))
+
+    if len(groups) == 1:
+        fetch_group(next(iter(groups.values())))
+    elif groups:
+        with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix='fetch-group') as executor:
+            list(executor.map(fetch_group, groups.values()))
+
+    fetched = sum(result.html is not None for result in results)
+    logger.info(f"まとめて取得: {fetched}/{len(scrapers)}ページ")
+    return results
+
 
 def main():
     """テスト用のメイン関数"""
@@ -0,0 +1,135 @@
+"""
+1つのインスタンスで複数のリクエストを同時に処理するための部品
+Cloud Runの同時実行数（--concurrency）を2以上にすると、Cloud Schedulerの再試行や
+複数のスケジュールからの起動が同じインスタンスに同時に届く。同じ監視対象へのスキャンは
+実行中のものに相乗りさせ（single-flight）、1回のスキャンの結果を全員に返す。
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """実行中の呼び出し"""
+
+    __slots__ = ('done', 'result', 'error', 'started_at', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.started_at = time.time()
+        self.waiters = 0
+
+
+class SingleFlight:
+    """同じキーの同時の呼び出しを1回の実行にまとめる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._last: Dict[str, Tuple[float, Any]] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any], share: bool = True) -> Tuple[Any, bool]:
+        """
+        キーごとに1つだけ実行し、実行中に呼ばれた場合はその結果を待って返す
+
+        Args:
+            key: まとめる単位のキー（監視対象のURLなど）
+            fn: 実行する関数
+            share: Falseの場合は実行中の呼び出しに相乗りせず、終わるのを待ってから改めて実行する
+                   （状態をリセットしてからのスキャンなど、実行中のものと結果を共有できない場合）
+
+        Returns:
+            (結果, 他の呼び出しの結果を受け取った場合True)
+
+        Raises:
+            実行した関数の例外（相乗りした呼び出しにも同じ例外を送出する）
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    break
+                if share:
+                    call.waiters += 1
+                    self.shared += 1
+            call.done.wait()
+            if share:
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.executed += 1
+                if call.error is None:
+                    self._last[key] = (time.time(), call.result)
+                if call.waiters:
+                    logger.info(f"同時の呼び出し{call.waiters}件を1回の実行にまとめました: {key}")
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> List[Dict]:
+        """
+        実行中の呼び出し
+
+        Returns:
+            {'key': キー, 'running_seconds': 実行中の秒数, 'waiters': 待っている呼び出しの数} のリスト
+        """
+        now = time.time()
+        with self._lock:
+            return [{'key': key, 'running_seconds': round(now - call.started_at, 3), 'waiters': call.waiters}
+                    for key, call in self._calls.items()]
+
+    def last_result(self, key: str) -> Tuple[Optional[float], Any]:
+        """
+        キーの最後に成功した実行の結果
+
+        Returns:
+            (終了時刻のUNIX時間, 結果)（まだない場合は (None, None)）
+        """
+        with self._lock:
+            return self._last.get(key, (None, None))
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+def main():
+    """テスト用のメイン関数（同時に20件呼び出して実行回数を数える）"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    flight = SingleFlight()
+    runs = []
+
+    def scan():
+        runs.append(threading.current_thread().name)
+        time.sleep(0.5)
+        return {'status': 'success', 'new_items': len(runs)}
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        futures = [executor.submit(flight.do, 'https://store-jp.nintendo.com/', scan) for _ in range(20)]
+        results = [future.result() for future in futures]
+
+    print(f"呼び出し: {len(results)}件  実行: {len(runs)}回  相乗り: {sum(shared for _, shared in results)}件")
+    print(f"統計: {flight.get_stats()}")
+    print(f"最後の結果: {flight.last_result('https://store-jp.nintendo.com/')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,603 @@
+"""
+シャードに分けた分散実行
+コーディネーターが監視対象のURLをシャードに分けて作業メッセージをキューに送り、ワーカー（別の関数インスタンス）が
+シャードごとにスキャンしてシャードの状態に保存し、結果をキューで報告する。コーディネーターは報告を待ち、
+シャードの状態をまとめたスキャン結果で通常どおり差分判定・通知を行う。
+
+URLは正規化したURLのフィンガープリントでシャードに割り当てるため、同じURLは毎回同じシャードになり、
+シャードの状態（ページごとのアイテム・チャンク）で差分抽出ができる。期限内に報告がなかったシャードは
+前回保存された状態を使うため、遅れたシャードのアイテムが消えた扱いになることはない。
+
+キューは差し替えられる:
+    local   同じプロセス内のキュー（ワーカーはスレッドで実行、テスト用）
+    file    ディレクトリ上のファイル（複数のプロセスで共有）
+    pubsub  Cloud Pub/Sub（作業メッセージでワーカーの関数を起動し、報告はサブスクリプションから受け取る）
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import logging
+
+from deadline import Deadline
+from discovery import canonical_url
+from fingerprint import fingerprint
+from items import Item, item_id_of, serialize_items
+from scraper import Switch2Scraper, fetch_pages
+from state_backends import StateBackend
+
+try:
+    from google.cloud import pubsub_v1
+    PUBSUB_AVAILABLE = True
+except ImportError:
+    PUBSUB_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUEUE_LOCAL = 'local'
+QUEUE_FILE = 'file'
+QUEUE_PUBSUB = 'pubsub'
+
+
+def shard_of(url: str, shard_count: int) -> int:
+    """
+    URLを割り当てるシャードの番号
+
+    Args:
+        url: 監視対象のURL
+        shard_count: シャード数
+
+    Returns:
+        0以上 shard_count 未満の整数
+    """
+    return fingerprint(canonical_url(url)) % shard_count
+
+
+def plan_shards(urls: Iterable[str], shard_count: int) -> Dict[int, List[str]]:
+    """
+    URLをシャードに分ける（URLのないシャードは含めない）
+
+    Args:
+        urls: 監視対象のURLのリスト
+        shard_count: シャード数
+
+    Returns:
+        シャードの番号とURLのリストの辞書
+    """
+    plan: Dict[int, List[str]] = {}
+    for url in dict.fromkeys(urls):
+        plan.setdefault(shard_of(url, shard_count), []).append(url)
+    return plan
+
+
+class WorkQueue:
+    """作業メッセージ・報告を受け渡すキューの基底クラス"""
+
+    name = 'base'
+
+    def publish(self, topic: str, message: Dict) -> bool:
+        """
+        メッセージを送信
+
+        Args:
+            topic: トピック名
+            message: JSONにできる辞書
+
+        Returns:
+            送信成功時True
+        """
+        raise NotImplementedError
+
+    def pull(self, topic: str, max_messages: int = 10, timeout: float = 0.0) -> List[Dict]:
+        """
+        メッセージを受け取る（受け取ったメッセージはキューから取り除く）
+
+        Args:
+            topic: トピック名
+            max_messages: 一度に受け取る最大数
+            timeout: メッセージがない場合に待つ秒数
+
+        Returns:
+            メッセージのリスト
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessQueue(WorkQueue):
+    """同じプロセス内のキュー（テスト・ローカル実行用）"""
+
+    name = QUEUE_LOCAL
+
+    def __init__(self):
+        self._topics: Dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+
+    def _topic(self, topic: str) -> queue.Queue:
+        with self._lock:
+            return self._topics.setdefault(topic, queue.Queue())
+
+    def publish(self, topic: str, message: Dict) -> bool:
+        self._topic(topic).put(json.loads(json.dumps(message)))
+        return True
+
+    def pull(self, topic: str, max_messages: int = 10, timeout: float = 0.0) -> List[Dict]:
+        messages = []
+        target = self._topic(topic)
+        try:
+            messages.append(target.get(timeout=timeout) if timeout > 0 else target.get_nowait())
+            while len(messages) < max_messages:
+                messages.append(target.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+
+class FileQueue(WorkQueue):
+    """
+    ディレクトリ上のファイルによるキュー（複数のプロセスで共有できる）
+
+    メッセージは1件1ファイルで書き込み、受け取る側は名前の変更で取り合うため、
+    同じメッセージを複数のプロセスが受け取ることはない。
+    """
+
+    name = QUEUE_FILE
+
+    def __init__(self, directory: str, poll_interval: float = 0.1):
+        """
+        Args:
+            directory: キューのディレクトリ（トピックごとにサブディレクトリを作る）
+            poll_interval: メッセージを待つ間の確認間隔（秒）
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+
+    def _path(self, topic: str) -> str:
+        path = os.path.join(self.directory, topic)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def publish(self, topic: str, message: Dict) -> bool:
+        path = self._path(topic)
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex}"
+        temp = os.path.join(path, f".{name}.tmp")
+        try:
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(message, f, ensure_ascii=False)
+            os.replace(temp, os.path.join(path, f"{name}.json"))
+            return True
+        except OSError as e:
+            logger.error(f"メッセージの書き込みに失敗: {e}")
+            return False
+
+    def _take(self, path: str, max_messages: int) -> List[Dict]:
+        messages = []
+        for name in sorted(os.listdir(path)):
+            if len(messages) >= max_messages:
+                break
+            if not name.endswith('.json'):
+                continue
+            claimed = os.path.join(path, f".{name}.{os.getpid()}.{threading.get_ident()}.claimed")
+            try:
+                os.rename(os.path.join(path, name), claimed)
+            except FileNotFoundError:
+                continue  # 他のプロセスが先に受け取った
+            try:
+                with open(claimed, encoding='utf-8') as f:
+                    messages.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"読めないメッセージを捨てました: {name}（{e}）")
+            finally:
+                os.remove(claimed)
+        return messages
+
+    def pull(self, topic: str, max_messages: int = 10, timeout: float = 0.0) -> List[Dict]:
+        path = self._path(topic)
+        give_up = time.monotonic() + timeout
+        while True:
+            messages = self._take(path, max_messages)
+            if messages or time.monotonic() >= give_up:
+                return messages
+            time.sleep(min(self.poll_interval, max(0.0, give_up - time.monotonic())))
+
+
+class PubSubQueue(WorkQueue):
+    """
+    Cloud Pub/Subによるキュー
+
+    受け取りはトピック名に subscription_suffix を付けたサブスクリプションから行う
+    （作業メッセージはプッシュでワーカーの関数を起動するため、pullするのは報告のトピックだけ）。
+    """
+
+    name = QUEUE_PUBSUB
+
+    def __init__(self, project_id: str, subscription_suffix: str = '-sub'):
+        """
+        Args:
+            project_id: Google CloudのプロジェクトID
+            subscription_suffix: 受け取りに使うサブスクリプション名の接尾辞
+        """
+        if not PUBSUB_AVAILABLE:
+            raise ValueError("google-cloud-pubsubがインストールされていません")
+        self.project_id = project_id
+        self.subscription_suffix = subscription_suffix
+        self._publisher = pubsub_v1.PublisherClient()
+        self._subscriber: Optional['pubsub_v1.SubscriberClient'] = None
+
+    def publish(self, topic: str, message: Dict) -> bool:
+        try:
+            data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+            self._publisher.publish(self._publisher.topic_path(self.project_id, topic), data).result(timeout=30)
+            return True
+        except Exception as e:
+            logger.error(f"Pub/Subへの送信に失敗: {e}")
+            return False
+
+    def pull(self, topic: str, max_messages: int = 10, timeout: float = 0.0) -> List[Dict]:
+        if self._subscriber is None:
+            self._subscriber = pubsub_v1.SubscriberClient()
+        subscription = self._subscriber.subscription_path(self.project_id, topic + self.subscription_suffix)
+        try:
+            response = self._subscriber.pull(
+                request={'subscription': subscription, 'max_messages': max_messages},
+                timeout=max(timeout, 1.0)
+            )
+        except Exception as e:
+            logger.warning(f"Pub/Subからの受け取りに失敗: {e}")
+            return []
+
+        messages, ack_ids = [], []
+        for received in response.received_messages:
+            ack_ids.append(received.ack_id)
+            try:
+                messages.append(json.loads(received.message.data.decode('utf-8')))
+            except ValueError as e:
+                logger.warning(f"読めないメッセージを捨てました: {e}")
+        if ack_ids:
+            self._subscriber.acknowledge(request={'subscription': subscription, 'ack_ids': ack_ids})
+        return messages
+
+    def close(self):
+        if self._subscriber is not None:
+            self._subscriber.close()
+            self._subscriber = None
+
+
+def create_queue(kind: str, directory: str = '', project_id: str = '') -> WorkQueue:
+    """
+    種類を指定してキューを作成
+
+    Args:
+        kind: 'local'、'file'、'pubsub' のいずれか
+        directory: FileQueueのディレクトリ（file）
+        project_id: Google CloudのプロジェクトID（pubsub）
+
+    Returns:
+        WorkQueueインスタンス
+    """
+    if kind == QUEUE_LOCAL:
+        return InProcessQueue()
+    if kind == QUEUE_FILE:
+        return FileQueue(directory)
+    if kind == QUEUE_PUBSUB:
+        return PubSubQueue(project_id)
+    raise ValueError(f"不明なキューの種類です: {kind}")
+
+
+class ShardWorker:
+    """シャードのURLをスキャンしてシャードの状態に保存し、結果を報告するクラス"""
+
+    def __init__(self, work_queue: WorkQueue, backend_factory: Callable[[int], StateBackend],
+                 scraper_for: Callable[[str], Switch2Scraper], result_topic: str):
+        """
+        Args:
+            work_queue: 報告を送るキュー
+            backend_factory: シャードの番号からシャードの状態の保存先を作成する関数
+            scraper_for: URLからそのページのスクレイパーを取得する関数
+            result_topic: 報告のトピック名
+        """
+        self.work_queue = work_queue
+        self.backend_factory = backend_factory
+        self.scraper_for = scraper_for
+        self.result_topic = result_topic
+
+    def handle(self, message: Dict, deadline: Optional[Deadline] = None,
+               cancelled: Optional[threading.Event] = None) -> Dict:
+        """
+        作業メッセージを処理
+
+        Args:
+            message: 作業メッセージ（run_id, shard, urls）
+            deadline: 実行の期限
+            cancelled: コーディネーターが報告を待つのをやめたときにセットされるイベント
+                       （セットされた場合は残りのページをスキャンせず、シャードの状態も保存しない）
+
+        Returns:
+            報告の辞書（run_id, shard, success, item_count, errors, throttled、中止した場合はcancelled）
+        """
+        shard = message['shard']
+        urls = message.get('urls', [])
+        backend = self.backend_factory(shard)
+        previous = (backend.load() or {}).get('pages', {})
+
+        pages: Dict[str, Dict] = {}
+        errors: Dict[str, str] = {}
+        throttled = False
+        # シャードのページはまとめて取得し（HTTP/2では1本の接続に多重化）、解析はページごとに行う
+        scrapers = [self.scraper_for(url) for url in urls]
+        fetched = fetch_pages(scrapers, deadline=deadline)
+        for url, scraper, page in zip(urls, scrapers, fetched):
+            if cancelled is not None and cancelled.is_set():
+                break
+            result = scraper.scan_page(previous_state=previous.get(url), deadline=deadline, fetched=page)
+            if result['success']:
+                pages[url] = {
+                    'url': url,
+                    'items': serialize_items(result['items']),
+                    'chunks': result.get('chunks', []),
+                    'hash': result['hash'],
+                    'item_count': result['item_count'],
+                    'scanned_at': datetime.now(timezone.utc).isoformat()
+                }
+            else:
+                # 失敗したページは前回の状態を残す（アイテムが消えた扱いにしない）
+                errors[url] = result.get('error') or 'スキャンに失敗しました'
+                throttled = throttled or bool(result.get('throttled'))
+                if url in previous:
+                    pages[url] = previous[url]
+
+        if cancelled is not None and cancelled.is_set():
+            # コーディネーターは前回の状態でまとめているため、遅れた結果は書き込まない
+            logger.warning(f"シャード{shard}: 報告の期限を過ぎたため中止しました")
+            return {'run_id': message.get('run_id'), 'shard': shard, 'success': False, 'cancelled': True,
+                    'item_count': 0, 'errors': {'_shard': '中止'}, 'throttled': throttled}
+
+        saved = backend.save({
+            'run_id': message.get('run_id'),
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+            'pages': pages
+        })
+        report = {
+            'run_id': message.get('run_id'),
+            'shard': shard,
+            'success': saved and not errors,
+            'item_count': sum(page['item_count'] for page in pages.values()),
+            'errors': errors,
+            'throttled': throttled
+        }
+        if not saved:
+            report['errors']['_state'] = 'シャードの状態の保存に失敗しました'
+        self.work_queue.publish(self.result_topic, report)
+        logger.info(f"シャード{shard}: {len(urls)}ページ, {report['item_count']}件（失敗: {len(errors)}ページ）")
+        return report
+
+    def run_pending(self, work_topic: str, timeout: float = 0.0,
+                    deadline: Optional[Deadline] = None,
+                    cancelled: Optional[threading.Event] = None) -> int:
+        """
+        キューにある作業メッセージを順に処理（local・fileのキューで使う）
+
+        Args:
+            work_topic: 作業メッセージのトピック名
+            timeout: メッセージがない場合に待つ秒数
+            deadline: 実行の期限
+            cancelled: セットされたら残りのメッセージを処理せずに終わるイベント
+
+        Returns:
+            処理したメッセージ数
+        """
+        handled = 0
+        while cancelled is None or not cancelled.is_set():
+            messages = self.work_queue.pull(work_topic, max_messages=1, timeout=timeout if not handled else 0.0)
+            if not messages:
+                return handled
+            self.handle(messages[0], deadline=deadline, cancelled=cancelled)
+            handled += 1
+        return handled
+
+
+class ShardCoordinator:
+    """URLをシャードに分けて作業を配り、報告を待ってシャードの状態をまとめるクラス"""
+
+    def __init__(self, work_queue: WorkQueue, backend_factory: Callable[[int], StateBackend],
+                 shard_count: int, work_topic: str, result_topic: str):
+        """
+        Args:
+            work_queue: 作業メッセージ・報告のキュー
+            backend_factory: シャードの番号からシャードの状態の保存先を作成する関数
+            shard_count: シャード数
+            work_topic: 作業メッセージのトピック名
+            result_topic: 報告のトピック名
+        """
+        self.work_queue = work_queue
+        self.backend_factory = backend_factory
+        self.shard_count = shard_count
+        self.work_topic = work_topic
+        self.result_topic = result_topic
+
+    def dispatch(self, urls: List[str], run_id: Optional[str] = None) -> Dict:
+        """
+        URLをシャードに分けて作業メッセージを送信
+
+        Args:
+            urls: 監視対象のURLのリスト
+            run_id: 実行のID（省略時は作成）
+
+        Returns:
+            {'run_id': 実行のID, 'plan': シャードの番号とURLのリストの辞書, 'published': 送信できたシャードの集合}
+        """
+        run_id = run_id or uuid.uuid4().hex
+        plan = plan_shards(urls, self.shard_count)
+        published = set()
+        for shard, shard_urls in sorted(plan.items()):
+            if self.work_queue.publish(self.work_topic, {'run_id': run_id, 'shard': shard, 'urls': shard_urls}):
+                published.add(shard)
+        logger.info(f"{len(urls)}ページを{len(plan)}シャードに分けて送信しました（実行ID: {run_id}）")
+        return {'run_id': run_id, 'plan': plan, 'published': published}
+
+    def collect(self, run_id: str, shards: Set[int], wait_seconds: float,
+                deadline: Optional[Deadline] = None) -> Dict[int, Dict]:
+        """
+        シャードの報告を待つ
+
+        Args:
+            run_id: 実行のID（他の実行の報告は捨てる）
+            shards: 報告を待つシャード
+            wait_seconds: 待つ秒数の上限
+            deadline: 実行の期限（取得・解析に使える時間を超えて待たない）
+
+        Returns:
+            シャードの番号と報告の辞書（期限内に届いたもののみ）
+        """
+        if deadline is not None:
+            wait_seconds = min(wait_seconds, deadline.work_remaining())
+        give_up = time.monotonic() + max(0.0, wait_seconds)
+        reports: Dict[int, Dict] = {}
+        while len(reports) < len(shards):
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                break
+            for report in self.work_queue.pull(self.result_topic, max_messages=len(shards),
+                                               timeout=min(remaining, 1.0)):
+                if report.get('run_id') == run_id and report.get('shard') in shards:
+                    reports[report['shard']] = report
+        missing = sorted(shards - set(reports))
+        if missing:
+            logger.warning(f"報告が届かなかったシャード: {missing}（前回の状態を使います）")
+        return reports
+
+    def merge(self, plan: Dict[int, List[str]], reports: Dict[int, Dict], root_url: str) -> Dict:
+        """
+        シャードの状態をまとめてスキャン結果を作成
+
+        Args:
+            plan: シャードの番号とURLのリストの辞書
+            reports: シャードの報告
+            root_url: 状態に記録する監視ページのURL
+
+        Returns:
+            Switch2Scraper.scan_page() と同じ形式のスキャン結果
+            （shardsに各シャードの報告、seed_urlsに監視ページのアイテムのURL、
+            報告がないか失敗したシャードがあればpartialがTrueで、missing_shards・failed_shardsにその番号）
+        """
+        items: List[Item] = []
+        known_ids = set()
+        seed_urls: List[str] = []
+        scanned = 0
+        for shard, urls in sorted(plan.items()):
+            pages = (self.backend_factory(shard).load() or {}).get('pages', {})
+            for url in urls:
+                page = pages.get(url)
+                if page is None:
+                    continue
+                scanned += 1
+                if url == root_url:
+                    seed_urls = [data.get('url', '') for data in page.get('items', [])]
+                for data in page.get('items', []):
+                    item = Item.from_dict(data)
+                    item.chunk = None
+                    item_id = item_id_of(item)
+                    if item_id not in known_ids:
+                        known_ids.add(item_id)
+                        items.append(item)
+
+        shard_reports = {str(shard): reports.get(shard, {'success': False, 'errors': {'_shard': '報告なし'}})
+                         for shard in sorted(plan)}
+        missing = [shard for shard in sorted(plan) if shard not in reports]
+        failed = [shard for shard, report in sorted(reports.items())
+                  if shard in plan and (not report.get('success') or report.get('errors'))]
+        if not scanned:
+            errors = [error for report in reports.values() for error in report.get('errors', {}).values()]
+            return {
+                'success': False,
+                'error': f"すべてのシャードでスキャンに失敗しました（{'、'.join(errors[:3]) or '報告なし'}）",
+                'throttled': bool(reports) and all(report.get('throttled') for report in reports.values()),
+                'items': [],
+                'hash': None,
+                'shards': shard_reports
+            }
+        if missing or failed:
+            logger.warning(f"一部のシャードは前回の状態を使いました（報告なし: {missing}、失敗: {failed}）")
+        return {
+            'success': True,
+            'partial': bool(missing or failed),
+            'missing_shards': missing,
+            'failed_shards': failed,
+            'items': items,
+            'hash': Switch2Scraper.compute_items_hash(items),
+            'item_count': len(items),
+            'url': root_url,
+            'seed_urls': seed_urls,
+            'shards': shard_reports
+        }
+
+
+def main():
+    """テスト用のメイン関数（ローカルのスタブサイトをシャードに分けてスキャン）"""
+    import argparse
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import config
+    from state_backends import create_state_backend
+
+    parser = argparse.ArgumentParser(description='シャードに分けたスキャンの確認')
+    parser.add_argument('--pages', type=int, default=12)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--delay-ms', type=int, default=300, help='スタブサーバーの応答時間')
+    args = parser.parse_args()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(args.delay_ms / 1000)
+            body = f"<html><body><h2>Switch2 抽選販売 {self.path}</h2></body></html>".encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/page/{i}" for i in range(args.pages)]
+    directory = tempfile.mkdtemp()
+
+    def backend_factory(shard: int) -> StateBackend:
+        return create_state_backend('json', state_file_path=os.path.join(directory, f"shard_{shard}.json"))
+
+    def scraper_for(url: str) -> Switch2Scraper:
+        return Switch2Scraper(url, config.WATCH_KEYWORDS, config.KEYWORD_MATCH_MODE)
+
+    work_queue = InProcessQueue()
+    coordinator = ShardCoordinator(work_queue, backend_factory, args.shards, 'work', 'results')
+    started = time.perf_counter()
+    dispatched = coordinator.dispatch(urls)
+    workers = [
+        threading.Thread(target=ShardWorker(work_queue, backend_factory, scraper_for, 'results').run_pending,
+                         args=('work',))
+        for _ in range(args.shards)
+    ]
+    for worker in workers:
+        worker.start()
+    reports = coordinator.collect(dispatched['run_id'], dispatched['published'], wait_seconds=30)
+    result = coordinator.merge(dispatched['plan'], reports, urls[0])
+    elapsed = time.perf_counter() - started
+    print(f"{args.pages}ページ / {len(dispatched['plan'])}シャード: {result['item_count']}件, {elapsed:.2f}秒"
+          f"（1ページずつなら約{args.pages * args.delay_ms / 1000:.1f}秒）")
+    for shard, report in result['shards'].items():
+        print(f"  シャード{shard}: {report}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""
+取得したページのスナップショット保存
+取得したHTMLを内容のダイジェストで1回だけ保存し（同じ内容は重複保存しない）、
+検出の原因調査や新しい抽出ロジックでの再実行、スナップショット間の差分確認に使う
+
+保存形式:
+    <directory>/pack-000001.dat  圧縮済みの本文を追記していくパックファイル
+    <directory>/index.jsonl      ダイジェストごとの格納位置・取得日時（追記型）
+"""
+import difflib
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+import logging
+
+# zstd対応（オプショナル、未インストール時はzlib）
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CODEC_ZSTD = 'zstd'
+CODEC_ZLIB = 'zlib'
+
+INDEX_FILE = 'index.jsonl'
+PACK_PATTERN = re.compile(r'^pack-(\d{6})\.dat$')
+
+_TAG_BOUNDARY_RE = re.compile(rb'>\s*<')
+
+
+class SnapshotStore:
+    """内容アドレス方式のスナップショットストア（追記型パックファイル + インデックス）"""
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024,
+                 max_age_days: float = 14, pack_size: int = 32 * 1024 * 1024,
+                 touch_interval: float = 60, compression_level: int = 3):
+        """
+        Args:
+            directory: 保存先ディレクトリ
+            max_bytes: パックファイルの合計サイズの上限（超えた場合は古いパックから削除）
+            max_age_days: 最後に取得されてからの保持日数
+            pack_size: 1つのパックファイルの目安サイズ（超えたら新しいパックに切り替え）
+            touch_interval: 同じ内容を再取得したときに最終取得日時を記録する最小間隔（秒）
+            compression_level: 圧縮レベル
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.pack_size = pack_size
+        self.touch_interval = touch_interval
+        self.codec = CODEC_ZSTD if ZSTD_AVAILABLE else CODEC_ZLIB
+
+        if ZSTD_AVAILABLE:
+            self._compressor = zstandard.ZstdCompressor(level=compression_level)
+            self._decompressor = zstandard.ZstdDecompressor()
+        self.compression_level = compression_level
+
+        self._entries: Dict[str, Dict] = {}
+        self._latest: Dict[str, str] = {}  # URLごとの最新のダイジェスト
+        self._touched: Dict[str, float] = {}
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._files: Dict[int, object] = {}
+        self._lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._active_pack = max(self._pack_ids(), default=1)
+        self._load_index()
+
+    # --- パスとインデックス ---
+
+    def _pack_path(self, pack_id: int) -> str:
+        return os.path.join(self.directory, f"pack-{pack_id:06d}.dat")
+
+    def _pack_ids(self) -> List[int]:
+        ids = []
+        for name in os.listdir(self.directory):
+            match = PACK_PATTERN.match(name)
+            if match:
+                ids.append(int(match.group(1)))
+        return sorted(ids)
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+
+        with open(self._index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で終了した最終行は無視
+                    logger.warning("スナップショットのインデックスに壊れた行があります（無視します）")
+                    continue
+                digest = record.get('digest')
+                if record.get('op') == 'add':
+                    self._entries[digest] = {k: v for k, v in record.items() if k != 'op'}
+                elif record.get('op') == 'seen' and digest in self._entries:
+                    self._entries[digest]['last_seen'] = record['last_seen']
+
+        # パックファイルが削除済みのエントリは除く
+        existing = set(self._pack_ids())
+        self._entries = {d: e for d, e in self._entries.items() if e['pack'] in existing}
+        for digest, entry in sorted(self._entries.items(), key=lambda pair: pair[1]['last_seen']):
+            self._latest[entry.get('url', '')] = digest
+
+    def _append_index(self, record: Dict):
+        with open(self._index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _rewrite_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for digest, entry in self._entries.items():
+                f.write(json.dumps(dict(entry, op='add', digest=digest), ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self._index_path)
+
+    # --- 圧縮 ---
+
+    def _compress(self, body: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            return self._compressor.compress(body)
+        return zlib.compress(body, self.compression_level)
+
+    def _decompress(self, data: bytes, codec: str) -> bytes:
+        if codec == CODEC_ZSTD:
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("zstd形式のスナップショットの読み込みにはzstandardが必要です")
+            return self._decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    # --- 書き込み ---
+
+    @staticmethod
+    def digest_of(body: bytes) -> str:
+        """本文のダイジェスト（SHA-256の16進文字列）"""
+        return hashlib.sha256(body).hexdigest()
+
+    def _write_blob(self, data: bytes) -> Dict:
+        path = self._pack_path(self._active_pack)
+        if os.path.exists(path) and os.path.getsize(path) >= self.pack_size:
+            self._active_pack += 1
+            path = self._pack_path(self._active_pack)
+
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(data)
+        return {'pack': self._active_pack, 'offset': offset, 'length': len(data)}
+
+    def put(self, body: bytes, url: str = '', now: Optional[float] = None) -> str:
+        """
+        スナップショットを保存（同じ内容が保存済みの場合は最終取得日時のみ更新）
+
+        Args:
+            body: ページの本文（取得したままのバイト列）
+            url: 取得元のURL
+            now: 取得日時（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            本文のダイジェスト
+        """
+        now = time.time() if now is None else now
+        digest = self.digest_of(body)
+
+        with self._lock:
+            self._latest[url] = digest
+            entry = self._entries.get(digest)
+            if entry is not None:
+                entry['last_seen'] = now
+                # 短い間隔のポーリングでインデックスが肥大化しないよう、記録は間引く
+                if now - self._touched.get(digest, 0) >= self.touch_interval:
+                    self._touched[digest] = now
+                    self._append_index({'op': 'seen', 'digest': digest, 'last_seen': now})
+                return digest
+
+            location = self._write_blob(self._compress(body))
+            entry = dict(location, codec=self.codec, size=len(body), url=url,
+                         first_seen=now, last_seen=now)
+            self._entries[digest] = entry
+            self._touched[digest] = now
+            self._append_index(dict(entry, op='add', digest=digest))
+            logger.info(f"スナップショットを保存しました: {digest[:12]}（{len(body)} → {location['length']}バイト）")
+
+            if location['offset'] == 0:
+                # パックを切り替えたタイミングで保持期間・容量を確認
+                self.prune(now)
+
+        return digest
+
+    # --- 読み込み ---
+
+    def _map_pack(self, pack_id: int, min_length: int) -> mmap.mmap:
+        mapped = self._maps.get(pack_id)
+        if mapped is not None and len(mapped) >= min_length:
+            return mapped
+
+        # 追記でパックが伸びた場合は再マップ
+        if mapped is not None:
+            mapped.close()
+            self._files.pop(pack_id).close()
+
+        f = open(self._pack_path(pack_id), 'rb')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files[pack_id] = f
+        self._maps[pack_id] = mapped
+        return mapped
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """
+        スナップショットの本文を取得（パックはmmapで必要な範囲だけ読む）
+
+        Args:
+            digest: ダイジェスト（先頭の一部でも可）
+
+        Returns:
+            本文、存在しない場合はNone
+        """
+        with self._lock:
+            digest = self.resolve(digest)
+            if digest is None:
+                return None
+            entry = self._entries[digest]
+            end = entry['offset'] + entry['length']
+            mapped = self._map_pack(entry['pack'], end)
+            data = mapped[entry['offset']:end]
+
+        return self._decompress(data, entry['codec'])
+
+    def resolve(self, prefix: str) -> Optional[str]:
+        """ダイジェストの先頭部分から完全なダイジェストを取得（一意に決まらない場合はNone）"""
+        with self._lock:
+            if prefix in self._entries:
+                return prefix
+            matches = [digest for digest in self._entries if digest.startswith(prefix)]
+            return matches[0] if len(matches) == 1 else None
+
+    def has(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._entries
+
+    def latest(self, url: str = '') -> Optional[str]:
+        """URLごとの最新のスナップショットのダイジェスト"""
+        with self._lock:
+            return self._latest.get(url)
+
+    def list(self, url: Optional[str] = None) -> List[Dict]:
+        """
+        スナップショットの一覧を取得
+
+        Args:
+            url: 取得元のURLで絞り込む場合に指定
+
+        Returns:
+            エントリのリスト（初回取得日時の古い順）
+        """
+        with self._lock:
+            entries = [
+                dict(entry, digest=digest) for digest, entry in self._entries.items()
+                if url is None or entry.get('url') == url
+            ]
+        return sorted(entries, key=lambda entry: entry['first_seen'])
+
+    def diff(self, digest_a: str, digest_b: str, context: int = 3) -> str:
+        """
+        2つのスナップショットの差分を作成（タグごとに改行してから行単位で比較）
+
+        Args:
+            digest_a: 比較元のダイジェスト
+            digest_b: 比較先のダイジェスト
+            context: 差分の前後に表示する行数
+
+        Returns:
+            unified diff形式の文字列
+        """
+        body_a = self.get(digest_a)
+        body_b = self.get(digest_b)
+        if body_a is None or body_b is None:
+            missing = digest_a if body_a is None else digest_b
+            raise KeyError(f"スナップショットが見つかりません: {missing}")
+
+        lines_a = _TAG_BOUNDARY_RE.sub(b'>\n<', body_a).decode('utf-8', 'replace').splitlines()
+        lines_b = _TAG_BOUNDARY_RE.sub(b'>\n<', body_b).decode('utf-8', 'replace').splitlines()
+        return '\n'.join(difflib.unified_diff(
+            lines_a, lines_b,
+            fromfile=digest_a[:12], tofile=digest_b[:12],
+            n=context, lineterm=''
+        ))
+
+    # --- 保持期間・容量 ---
+
+    def _delete_pack(self, pack_id: int):
+        mapped = self._maps.pop(pack_id, None)
+        if mapped is not None:
+            mapped.close()
+            self._files.pop(pack_id).close()
+        try:
+            os.remove(self._pack_path(pack_id))
+        except FileNotFoundError:
+            pass
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(os.path.getsize(self._pack_path(pack_id)) for pack_id in self._pack_ids())
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        保持期間・容量を超えたパックを削除
+
+        保持期間を過ぎたエントリだけのパックは削除し、容量を超えた場合は古いパックから削除する。
+        容量による削除では、URLごとの最新のスナップショットは新しいパックに移してから削除する。
+
+        Args:
+            now: 基準日時（UNIX時間、省略時は現在時刻）
+
+        Returns:
+            削除したスナップショット数
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.max_age_days * 86400
+        removed = 0
+
+        with self._lock:
+            by_pack: Dict[int, List[str]] = {}
+            for digest, entry in self._entries.items():
+                by_pack.setdefault(entry['pack'], []).append(digest)
+
+            old_packs = [pack_id for pack_id in self._pack_ids() if pack_id != self._active_pack]
+            sizes = {pack_id: os.path.getsize(self._pack_path(pack_id)) for pack_id in self._pack_ids()}
+            total = sum(sizes.values())
+            latest = set(self._latest.values())
+
+            for pack_id in old_packs:
+                digests = by_pack.get(pack_id, [])
+                expired = all(self._entries[d]['last_seen'] < cutoff for d in digests)
+                over_size = total > self.max_bytes
+                if not expired and not over_size:
+                    continue
+
+                for digest in digests:
+                    entry = self._entries[digest]
+                    if not expired and digest in latest:
+                        # 最新のスナップショットは新しいパックに移す
+                        data = self._map_pack(pack_id, entry['offset'] + entry['length'])[
+                            entry['offset']:entry['offset'] + entry['length']]
+                        entry.update(self._write_blob(bytes(data)))
+                    else:
+                        del self._entries[digest]
+                        self._touched.pop(digest, None)
+                        removed += 1
+
+                self._delete_pack(pack_id)
+                total -= sizes[pack_id]
+
+            if removed or any(pack_id not in self._pack_ids() for pack_id in old_packs):
+                self._latest = {url: d for url, d in self._latest.items() if d in self._entries}
+                self._rewrite_index()
+                logger.info(f"古いスナップショットを削除しました（{removed}件）")
+
+        return removed
+
+    def stats(self) -> Dict:
+        """保存件数・元のサイズ・保存サイズ"""
+        with self._lock:
+            raw = sum(entry['size'] for entry in self._entries.values())
+            return {
+                'snapshots': len(self._entries),
+                'raw_bytes': raw,
+                'stored_bytes': self.total_bytes(),
+                'packs': len(self._pack_ids()),
+                'codec': self.codec
+            }
+
+    def close(self):
+        """mmapとファイルを閉じる"""
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            for f in self._files.values():
+                f.close()
+            self._maps.clear()
+            self._files.clear()
+
+
+def main():
+    """テスト用のメイン関数"""
+    import sys
+    import tempfile
+
+    if len(sys.argv) >= 3 and sys.argv[1] in ('list', 'show', 'diff'):
+        # 保存済みスナップショットの確認: list <dir> / show <dir> <digest> / diff <dir> <a> <b>
+        store = SnapshotStore(sys.argv[2])
+        if sys.argv[1] == 'list':
+            for entry in store.list():
+                seen = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_seen']))
+                print(f"{entry['digest'][:12]}  {entry['size']:>8}  {seen}  {entry.get('url', '')}")
+        elif sys.argv[1] == 'show':
+            sys.stdout.write((store.get(sys.argv[3]) or b'').decode('utf-8', 'replace'))
+        else:
+            print(store.diff(sys.argv[3], sys.argv[4]))
+        return
+
+    directory = tempfile.mkdtemp(prefix='snapshots-')
+    store = SnapshotStore(directory)
+    page = '<html><body><h2>Switch2 抽選販売</h2><p>受付期間: 11月18日まで</p>{}</body></html>'
+
+    first = store.put(page.format('').encode(), 'https://store-jp.nintendo.com/')
+    for _ in range(100):
+        store.put(page.format('').encode(), 'https://store-jp.nintendo.com/')
+    second = store.put(page.format('<p>第2回の受付を開始しました</p>').encode(), 'https://store-jp.nintendo.com/')
+
+    print(f"保存先: {directory}")
+    print(f"統計: {store.stats()}")
+    print(f"\n差分:\n{store.diff(first, second)}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
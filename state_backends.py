@@ -0,0 +1,727 @@
+"""
+状態の永続化バックエンド
+ローカルJSON・Google Cloud Storage・SQLiteを同じインターフェースで扱う
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+
+# GCS対応（オプショナル）
+try:
+    from google.cloud import storage
+    GCS_AVAILABLE = True
+except ImportError:
+    GCS_AVAILABLE = False
+    logger = logging.getLogger(__name__)
+    logger.warning("google-cloud-storage がインストールされていません。ローカルファイルのみ使用可能です。")
+
+from items import assign_item_ids, item_digest_of, make_item_id
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """状態の読み書きを行うバックエンドの基底クラス"""
+
+    name = 'base'
+
+    def load(self) -> Optional[Dict]:
+        """
+        状態を読み込み
+
+        Returns:
+            状態辞書、存在しない場合はNone
+        """
+        raise NotImplementedError
+
+    def save(self, state: Dict) -> bool:
+        """
+        状態を保存
+
+        Args:
+            state: 保存する状態辞書
+
+        Returns:
+            保存成功時True
+        """
+        raise NotImplementedError
+
+    def delete(self) -> bool:
+        """
+        状態を削除
+
+        Returns:
+            成功時True
+        """
+        raise NotImplementedError
+
+    def warm_up(self) -> bool:
+        """
+        保存先への接続を事前に確立（以降の読み書きで使い回す）
+
+        Returns:
+            接続できた場合True（接続の必要がない保存先もTrue）
+        """
+        return True
+
+    # アイテムを1行ずつ保存し、アイテムIDで索引付きの検索ができるか（lookup_items）
+    supports_item_index = False
+
+    def lookup_items(self, item_ids: List[str]) -> Dict[str, Dict]:
+        """
+        アイテムIDの検出履歴と、現在ページにあるアイテムの検出履歴を取得
+
+        Args:
+            item_ids: assign_item_idsで割り当てたアイテムIDのリスト
+
+        Returns:
+            アイテムIDと履歴エントリ（type, title, url, digest, first_seen, last_seen, present）の辞書
+        """
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        """ログ表示用の保存先"""
+        return self.name
+
+
+class LocalJsonBackend(StateBackend):
+    """ローカルのJSONファイルに状態を保存するバックエンド"""
+
+    name = 'json'
+
+    def __init__(self, state_file_path: str):
+        """
+        Args:
+            state_file_path: 状態ファイルのパス
+        """
+        self.state_file_path = state_file_path
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.state_file_path):
+            logger.info(f"状態ファイルが存在しません: {self.state_file_path}")
+            return None
+
+        try:
+            with open(self.state_file_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+                logger.info(f"状態を読み込みました: {self.state_file_path}")
+                return state
+        except json.JSONDecodeError as e:
+            logger.error(f"状態ファイルの読み込みエラー（JSON解析失敗）: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"状態ファイルの読み込みエラー: {e}")
+            return None
+
+    def save(self, state: Dict) -> bool:
+        try:
+            # ディレクトリが存在しない場合は作成
+            directory = os.path.dirname(self.state_file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            # タイムスタンプを追加
+            state['last_updated'] = datetime.now().isoformat()
+
+            with open(self.state_file_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+
+            logger.info(f"状態を保存しました: {self.state_file_path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"状態ファイルの保存エラー: {e}")
+            return False
+
+    def delete(self) -> bool:
+        try:
+            if os.path.exists(self.state_file_path):
+                os.remove(self.state_file_path)
+                logger.info(f"状態ファイルを削除しました: {self.state_file_path}")
+            return True
+        except Exception as e:
+            logger.error(f"状態ファイルの削除エラー: {e}")
+            return False
+
+    def describe(self) -> str:
+        return self.state_file_path
+
+
+class GcsJsonBackend(StateBackend):
+    """Google Cloud Storage上のJSONファイルに状態を保存するバックエンド"""
+
+    name = 'gcs'
+
+    def __init__(self, bucket_name: str, state_file: str):
+        """
+        Args:
+            bucket_name: GCSバケット名
+            state_file: GCS上の状態ファイル名
+        """
+        if not GCS_AVAILABLE:
+            raise ValueError("google-cloud-storageがインストールされていません")
+        if not bucket_name:
+            logger.error("GCS使用時はgcs_bucket_nameが必須です")
+            raise ValueError("gcs_bucket_nameが指定されていません")
+
+        self.bucket_name = bucket_name
+        self.state_file = state_file
+        self._client = None
+
+    def _blob(self):
+        # クライアント（認証情報とHTTPS接続）は同一プロセスの以降の読み書きで使い回す
+        if self._client is None:
+            self._client = storage.Client()
+        bucket = self._client.bucket(self.bucket_name)
+        return bucket.blob(self.state_file)
+
+    def warm_up(self) -> bool:
+        try:
+            self._blob().exists()
+            return True
+        except Exception as e:
+            logger.warning(f"GCSへの接続に失敗: {e}")
+            return False
+
+    def load(self) -> Optional[Dict]:
+        try:
+            blob = self._blob()
+
+            if not blob.exists():
+                logger.info(f"GCS上に状態ファイルが存在しません: {self.describe()}")
+                return None
+
+            content = blob.download_as_text(encoding='utf-8')
+            state = json.loads(content)
+            logger.info(f"GCSから状態を読み込みました: {self.describe()}")
+            return state
+
+        except json.JSONDecodeError as e:
+            logger.error(f"GCS状態ファイルの読み込みエラー（JSON解析失敗）: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"GCS状態ファイルの読み込みエラー: {e}")
+            return None
+
+    def save(self, state: Dict) -> bool:
+        try:
+            # タイムスタンプを追加
+            state['last_updated'] = datetime.now().isoformat()
+
+            content = json.dumps(state, ensure_ascii=False, indent=2)
+            self._blob().upload_from_string(content, content_type='application/json')
+
+            logger.info(f"GCSに状態を保存しました: {self.describe()}")
+            return True
+
+        except Exception as e:
+            logger.error(f"GCS状態ファイルの保存エラー: {e}")
+            return False
+
+    def delete(self) -> bool:
+        try:
+            blob = self._blob()
+            if blob.exists():
+                blob.delete()
+                logger.info(f"GCS状態ファイルを削除しました: {self.describe()}")
+            return True
+        except Exception as e:
+            logger.error(f"GCS状態ファイルの削除エラー: {e}")
+            return False
+
+    def describe(self) -> str:
+        return f"gs://{self.bucket_name}/{self.state_file}"
+
+
+class SqliteBackend(StateBackend):
+    """
+    SQLiteに状態を保存するバックエンド
+
+    アイテムは1行ずつ保存し、実行ごとに1トランザクションでまとめてupsertする。
+    ファイル全体を書き直さず、アイテムIDや初回/最終検出日時で索引付きの検索ができる。
+    itemsテーブルがアイテムの検出履歴を兼ねるため、消えてから保持期間を過ぎたアイテムと
+    古い実行履歴は保存のたびに削除する。
+    """
+
+    name = 'sqlite'
+    supports_item_index = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS targets (
+            state_key TEXT PRIMARY KEY,
+            url TEXT,
+            hash TEXT,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            last_updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            state_key TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            present INTEGER NOT NULL DEFAULT 1,
+            type TEXT,
+            digest TEXT,
+            data TEXT NOT NULL,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            PRIMARY KEY (state_key, item_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_items_item_id ON items (item_id);
+        CREATE INDEX IF NOT EXISTS idx_items_first_seen ON items (state_key, first_seen);
+        CREATE INDEX IF NOT EXISTS idx_items_last_seen ON items (state_key, last_seen);
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            state_key TEXT NOT NULL,
+            hash TEXT,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (state_key, created_at);
+        CREATE TABLE IF NOT EXISTS state_meta (
+            state_key TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (state_key, key)
+        );
+    """
+
+    # targets/itemsテーブルで管理するキー（それ以外はstate_metaにJSONで保存）
+    CORE_KEYS = ('hash', 'items', 'item_count', 'url', 'last_updated')
+
+    # IN句に1回で渡すアイテムIDの数（SQLiteのパラメータ数の上限より小さくする）
+    LOOKUP_BATCH = 500
+
+    def __init__(self, db_path: str, state_key: str = 'default',
+                 retention_days: int = 30, max_runs: int = 1000):
+        """
+        Args:
+            db_path: SQLiteデータベースファイルのパス（':memory:'も可）
+            state_key: 状態の識別キー（監視対象ごとに分ける場合に使用）
+            retention_days: 消えたアイテムと実行履歴の保持日数
+            max_runs: 実行履歴の最大保持件数
+        """
+        self.db_path = db_path
+        self.state_key = state_key
+        self.retention_days = retention_days
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        # 保存済みのstate_metaの値（JSON文字列、変わったキーだけを書き込むため）
+        self._saved_meta: Optional[Dict[str, str]] = None
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if db_path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(items)')}
+        if 'digest' not in columns:
+            # digest列のない旧形式のデータベース（読み込み時にdataから計算する）
+            self._conn.execute('ALTER TABLE items ADD COLUMN digest TEXT')
+        self._conn.commit()
+
+    def load(self) -> Optional[Dict]:
+        try:
+            with self._lock:
+                target = self._conn.execute(
+                    'SELECT url, hash, item_count, last_updated FROM targets WHERE state_key = ?',
+                    (self.state_key,)
+                ).fetchone()
+
+                if target is None:
+                    logger.info(f"SQLite上に状態が存在しません: {self.describe()}")
+                    return None
+
+                rows = self._conn.execute(
+                    'SELECT data FROM items WHERE state_key = ? AND present = 1 ORDER BY position',
+                    (self.state_key,)
+                ).fetchall()
+                meta_rows = self._conn.execute(
+                    'SELECT key, value FROM state_meta WHERE state_key = ?',
+                    (self.state_key,)
+                ).fetchall()
+
+            state = {
+                'hash': target['hash'],
+                'items': [json.loads(row['data']) for row in rows],
+                'item_count': target['item_count'],
+                'url': target['url'],
+                'last_updated': target['last_updated']
+            }
+            for row in meta_rows:
+                state[row['key']] = json.loads(row['value'])
+
+            logger.info(f"SQLiteから状態を読み込みました: {self.describe()}")
+            return state
+
+        except Exception as e:
+            logger.error(f"SQLite状態の読み込みエラー: {e}")
+            return None
+
+    def save(self, state: Dict) -> bool:
+        now = datetime.now().isoformat()
+        state['last_updated'] = now
+        items = state.get('items', [])
+
+        rows = []
+        for position, (item_id, item) in enumerate(zip(assign_item_ids(items), items)):
+            rows.append((
+                self.state_key, item_id, position, item.get('type'), item_digest_of(item),
+                json.dumps(item, ensure_ascii=False), now, now
+            ))
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+
+        meta = {
+            key: json.dumps(value, ensure_ascii=False)
+            for key, value in state.items()
+            if key not in self.CORE_KEYS
+        }
+
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """
+                    INSERT INTO targets (state_key, url, hash, item_count, last_updated)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (state_key) DO UPDATE SET
+                        url = excluded.url,
+                        hash = excluded.hash,
+                        item_count = excluded.item_count,
+                        last_updated = excluded.last_updated
+                    """,
+                    (self.state_key, state.get('url'), state.get('hash'),
+                     state.get('item_count', len(items)), now)
+                )
+                self._conn.execute(
+                    'UPDATE items SET present = 0 WHERE state_key = ? AND present = 1',
+                    (self.state_key,)
+                )
+                self._conn.executemany(
+                    """
+                    INSERT INTO items (state_key, item_id, position, present, type, digest, data,
+                                       first_seen, last_seen)
+                    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+                    ON CONFLICT (state_key, item_id) DO UPDATE SET
+                        position = excluded.position,
+                        present = 1,
+                        type = excluded.type,
+                        digest = excluded.digest,
+                        data = excluded.data,
+                        last_seen = excluded.last_seen
+                    """,
+                    rows
+                )
+                self._write_meta(meta)
+                self._conn.execute(
+                    'INSERT INTO runs (state_key, hash, item_count, created_at) VALUES (?, ?, ?, ?)',
+                    (self.state_key, state.get('hash'), len(items), now)
+                )
+                pruned = self._prune(cutoff)
+            self._saved_meta = meta
+            if pruned:
+                logger.info(f"保持期間を過ぎたアイテム・実行履歴を削除しました（{pruned}件）")
+
+            logger.info(f"SQLiteに状態を保存しました: {self.describe()}（{len(rows)}件）")
+            return True
+
+        except Exception as e:
+            # ロールバックされたため、次回は保存済みの値を読み直す
+            self._saved_meta = None
+            logger.error(f"SQLite状態の保存エラー: {e}")
+            return False
+
+    def delete(self) -> bool:
+        try:
+            with self._lock, self._conn:
+                for table in ('targets', 'items', 'runs', 'state_meta'):
+                    self._conn.execute(f'DELETE FROM {table} WHERE state_key = ?', (self.state_key,))
+                self._saved_meta = {}
+            logger.info(f"SQLite状態を削除しました: {self.describe()}")
+            return True
+        except Exception as e:
+            logger.error(f"SQLite状態の削除エラー: {e}")
+            return False
+
+    def _write_meta(self, meta: Dict[str, str]):
+        # state_metaを1キー1行で更新（値が変わったキーだけを書き込み、なくなったキーは削除する）
+        # トランザクション内・ロック中に呼び出す
+        if self._saved_meta is None:
+            self._saved_meta = {
+                row['key']: row['value'] for row in self._conn.execute(
+                    'SELECT key, value FROM state_meta WHERE state_key = ?', (self.state_key,)
+                )
+            }
+        saved = self._saved_meta
+        removed = [key for key in saved if key not in meta]
+        changed = [(self.state_key, key, value) for key, value in meta.items() if saved.get(key) != value]
+        if removed:
+            self._conn.executemany(
+                'DELETE FROM state_meta WHERE state_key = ? AND key = ?',
+                [(self.state_key, key) for key in removed]
+            )
+        if changed:
+            self._conn.executemany(
+                """
+                INSERT INTO state_meta (state_key, key, value) VALUES (?, ?, ?)
+                ON CONFLICT (state_key, key) DO UPDATE SET value = excluded.value
+                """,
+                changed
+            )
+
+    def _prune(self, cutoff: str) -> int:
+        # 消えてから保持期間を過ぎたアイテムと、保持期間・保持件数を超えた実行履歴を削除（索引で絞り込む）
+        pruned = self._conn.execute(
+            'DELETE FROM items WHERE state_key = ? AND last_seen < ? AND present = 0',
+            (self.state_key, cutoff)
+        ).rowcount
+        pruned += self._conn.execute(
+            """
+            DELETE FROM runs WHERE state_key = ? AND (created_at < ? OR id <= (
+                SELECT id FROM runs WHERE state_key = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+            ))
+            """,
+            (self.state_key, cutoff, self.state_key, self.max_runs)
+        ).rowcount
+        return pruned
+
+    def lookup_items(self, item_ids: List[str]) -> Dict[str, Dict]:
+        query = """
+            SELECT item_id, type, digest, data, first_seen, last_seen, present FROM items
+            WHERE state_key = ? AND {condition}
+        """
+        with self._lock:
+            rows = self._conn.execute(query.format(condition='present = 1'), (self.state_key,)).fetchall()
+            unique_ids = list(dict.fromkeys(item_ids))
+            for start in range(0, len(unique_ids), self.LOOKUP_BATCH):
+                batch = unique_ids[start:start + self.LOOKUP_BATCH]
+                rows += self._conn.execute(
+                    query.format(condition=f"item_id IN ({','.join('?' * len(batch))}) AND present = 0"),
+                    (self.state_key, *batch)
+                ).fetchall()
+
+        entries = {}
+        for row in rows:
+            item = json.loads(row['data'])
+            entries[row['item_id']] = {
+                'type': row['type'],
+                'title': item.get('title', ''),
+                'url': item.get('url', ''),
+                'digest': row['digest'] or item_digest_of(item),
+                'first_seen': row['first_seen'],
+                'last_seen': row['last_seen'],
+                'present': bool(row['present'])
+            }
+        return entries
+
+    def has_item(self, item_id: str) -> bool:
+        """
+        過去に検出したことのあるアイテムかチェック（主キー索引で検索）
+
+        Args:
+            item_id: make_item_idで作成したアイテムID
+
+        Returns:
+            検出履歴があればTrue
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM items WHERE state_key = ? AND item_id = ?',
+                (self.state_key, item_id)
+            ).fetchone()
+        return row is not None
+
+    def get_items_first_seen_since(self, since: str) -> List[Dict]:
+        """
+        指定日時以降に初めて検出されたアイテムを取得
+
+        Args:
+            since: ISO 8601形式の日時
+
+        Returns:
+            アイテム辞書のリスト（first_seen, last_seen, presentを付与）
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT data, first_seen, last_seen, present FROM items
+                WHERE state_key = ? AND first_seen >= ?
+                ORDER BY first_seen
+                """,
+                (self.state_key, since)
+            ).fetchall()
+
+        items = []
+        for row in rows:
+            item = json.loads(row['data'])
+            item['first_seen'] = row['first_seen']
+            item['last_seen'] = row['last_seen']
+            item['present'] = bool(row['present'])
+            items.append(item)
+        return items
+
+    def get_runs(self, limit: int = 20) -> List[Dict]:
+        """
+        直近の保存履歴を取得
+
+        Args:
+            limit: 取得件数
+
+        Returns:
+            実行履歴のリスト（新しい順）
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT hash, item_count, created_at FROM runs
+                WHERE state_key = ? ORDER BY id DESC LIMIT ?
+                """,
+                (self.state_key, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def describe(self) -> str:
+        return f"sqlite://{self.db_path}#{self.state_key}"
+
+
+class SqliteKeyValueBackend(SqliteBackend):
+    """
+    SQLiteのstate_metaテーブルにキーと値だけを保存するバックエンド
+
+    重複排除キャッシュ・ダイジェストのキュー・シャードの状態など、監視対象の状態ではない
+    補助的な保存先に使う。最上位のキーごとに1行で保存し、値が変わったキーだけを書き込む。
+    targets/items/runsテーブルには書き込まない。
+    """
+
+    name = 'sqlite-kv'
+    supports_item_index = False
+
+    def load(self) -> Optional[Dict]:
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT key, value FROM state_meta WHERE state_key = ?',
+                    (self.state_key,)
+                ).fetchall()
+
+            if not rows:
+                logger.info(f"SQLite上に状態が存在しません: {self.describe()}")
+                return None
+
+            self._saved_meta = {row['key']: row['value'] for row in rows}
+            return {row['key']: json.loads(row['value']) for row in rows}
+
+        except Exception as e:
+            logger.error(f"SQLite状態の読み込みエラー: {e}")
+            return None
+
+    def save(self, state: Dict) -> bool:
+        meta = {key: json.dumps(value, ensure_ascii=False) for key, value in state.items()}
+
+        try:
+            with self._lock, self._conn:
+                self._write_meta(meta)
+            self._saved_meta = meta
+            return True
+
+        except Exception as e:
+            self._saved_meta = None
+            logger.error(f"SQLite状態の保存エラー: {e}")
+            return False
+
+    def delete(self) -> bool:
+        try:
+            with self._lock, self._conn:
+                self._conn.execute('DELETE FROM state_meta WHERE state_key = ?', (self.state_key,))
+                self._saved_meta = {}
+            logger.info(f"SQLite状態を削除しました: {self.describe()}")
+            return True
+        except Exception as e:
+            logger.error(f"SQLite状態の削除エラー: {e}")
+            return False
+
+    def lookup_items(self, item_ids: List[str]) -> Dict[str, Dict]:
+        return {}
+
+
+def create_state_backend(kind: str, state_file_path: str = '', gcs_bucket_name: str = '',
+                         gcs_state_file: str = '', db_path: str = '',
+                         state_key: str = 'default', retention_days: int = 30,
+                         key_value: bool = False) -> StateBackend:
+    """
+    種類を指定してバックエンドを作成
+
+    Args:
+        kind: 'json'、'gcs'、'sqlite' のいずれか
+        state_file_path: ローカル状態ファイルのパス（json）
+        gcs_bucket_name: GCSバケット名（gcs）
+        gcs_state_file: GCS上の状態ファイル名（gcs）
+        db_path: SQLiteデータベースファイルのパス（sqlite）
+        state_key: SQLite上の状態の識別キー（sqlite）
+        retention_days: 消えたアイテムと実行履歴の保持日数（sqlite）
+        key_value: 監視対象の状態ではないキーと値だけの保存先の場合True
+                   （sqliteではstate_metaテーブルだけを使う）
+
+    Returns:
+        StateBackendインスタンス
+    """
+    if kind == 'gcs':
+        return GcsJsonBackend(gcs_bucket_name, gcs_state_file)
+    if kind == 'sqlite':
+        if key_value:
+            return SqliteKeyValueBackend(db_path, state_key=state_key)
+        return SqliteBackend(db_path, state_key=state_key, retention_days=retention_days)
+    if kind == 'json':
+        return LocalJsonBackend(state_file_path)
+
+    raise ValueError(f"不明な状態バックエンドです: {kind}")
+
+
+def main():
+    """テスト用のメイン関数"""
+    import tempfile
+
+    db_path = os.path.join(tempfile.gettempdir(), 'test_state.db')
+    print(f"テスト用データベース: {db_path}")
+
+    backend = SqliteBackend(db_path)
+    backend.delete()
+
+    state = {
+        'hash': 'abc123',
+        'items': [
+            {'type': 'heading', 'title': 'Switch2 抽選開始', 'content': '詳細はこちら', 'url': 'https://example.com/1'}
+        ],
+        'item_count': 1,
+        'url': 'https://store-jp.nintendo.com/'
+    }
+    print(f"\n保存: {backend.save(state)}")
+
+    loaded = backend.load()
+    print(f"読み込み: {loaded['item_count']}件, hash={loaded['hash']}")
+
+    item_id = make_item_id(state['items'][0])
+    print(f"検出履歴あり: {backend.has_item(item_id)}")
+    print(f"索引での検索: {backend.lookup_items([item_id])[item_id]['first_seen']}")
+    print(f"実行履歴: {len(backend.get_runs())}件")
+
+    backend.delete()
+    backend.close()
+    print("\nテストデータを削除しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,24 @@
 状態管理モジュール
 前回のスキャン結果を保存し、変更を検出する
 """
+import atexit
 import json
 import os
+import signal
+import sys
+import threading
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List
 import logging
 
-# GCS対応（オプショナル）
-try:
-    from google.cloud import storage
-    GCS_AVAILABLE = True
-except ImportError:
-    GCS_AVAILABLE = False
-    logger = logging.getLogger(__name__)
-    logger.warning("google-cloud-storage がインストールされていません。ローカルファイルのみ使用可能です。")
+from history import ItemHistory
+from items import assign_item_ids, item_digest_of, serialize_items
+from state_backends import (
+    GCS_AVAILABLE,
+    GcsJsonBackend,
+    LocalJsonBackend,
+    StateBackend,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,93 +29,143 @@ class StateManager:
     """スキャン結果の状態を管理するクラス"""
 
     def __init__(self, state_file_path: str, use_gcs: bool = False,
-                 gcs_bucket_name: str = '', gcs_state_file: str = ''):
+                 gcs_bucket_name: str = '', gcs_state_file: str = '',
+                 write_behind: bool = False, flush_interval: float = 5.0,
+                 wal_path: str = '', backend: Optional[StateBackend] = None,
+                 track_history: bool = True, history_max_events: int = 1000,
+                 history_max_age_days: int = 30):
         """
         Args:
             state_file_path: ローカル状態ファイルのパス
             use_gcs: Google Cloud Storageを使用するか
             gcs_bucket_name: GCSバケット名
             gcs_state_file: GCS上の状態ファイル名
+            write_behind: 状態をメモリに保持し、バックエンドへは非同期にまとめて書き込むか
+            flush_interval: write-behind時のバックエンドへの書き込み間隔（秒）
+            wal_path: write-behind時の先行書き込みログ（WAL）のパス（省略時は状態ファイル名 + .wal）
+            backend: 使用するバックエンド（省略時はuse_gcsに応じてGCSまたはローカルJSON）
+            track_history: アイテムの検出履歴・変更ログを状態に保持するか
+            history_max_events: 変更ログの最大保持件数
+            history_max_age_days: 変更ログ・消えたアイテムの履歴の最大保持日数
         """
         self.state_file_path = state_file_path
         self.use_gcs = use_gcs and GCS_AVAILABLE
         self.gcs_bucket_name = gcs_bucket_name
         self.gcs_state_file = gcs_state_file
+        self.track_history = track_history
+        self.history_max_events = history_max_events
+        self.history_max_age_days = history_max_age_days
+
+        # write-behind（メモリ上の状態 + 非同期フラッシュ）
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.wal_path = wal_path or f"{state_file_path}.wal"
+        self._lock = threading.RLock()
+        self._cached_state: Optional[Dict] = None
+        self._cache_loaded = False
+        self._dirty = False
+        self._generation = 0  # save_stateのたびに増加（フラッシュ中の更新検出用）
+        # バックエンドへの書き込み・削除を直列化するロック（_lockより先に取得する）
+        self._flush_lock = threading.Lock()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._atexit_registered = False
 
         if use_gcs and not GCS_AVAILABLE:
             logger.warning("GCSの使用が指定されていますが、google-cloud-storageが利用できません。ローカルファイルを使用します。")
             self.use_gcs = False
 
-        if self.use_gcs and not gcs_bucket_name:
-            logger.error("GCS使用時はgcs_bucket_nameが必須です")
-            raise ValueError("gcs_bucket_nameが指定されていません")
+        if backend is not None:
+            self.backend = backend
+            self.use_gcs = isinstance(backend, GcsJsonBackend)
+        elif self.use_gcs:
+            self.backend = GcsJsonBackend(gcs_bucket_name, gcs_state_file)
+        else:
+            self.backend = LocalJsonBackend(state_file_path)
+
+        if write_behind and not isinstance(self.backend, LocalJsonBackend):
+            # WALはローカルディスクにしか書かないため、復元できるのは同じディスクで再起動した場合だけ
+            # （Cloud Functions / Cloud Runの/tmpはインスタンスとともに消える）
+            logger.warning(f"WAL（{self.wal_path}）はローカルディスクに保存されるため、"
+                           f"インスタンスが入れ替わった場合は未フラッシュの状態を復元できません")
 
-    def _load_state_from_gcs(self) -> Optional[Dict]:
+        # アイテムを1行ずつ保存するバックエンド（SQLite）では、保存済みのアイテムが検出履歴を兼ねる。
+        # 履歴は今回のアイテムIDと現在ページにあるアイテムだけを索引で引き、状態には変更ログだけを保存する
+        # （write-behind時はバックエンドへの反映が遅れるため、メモリ上の状態の履歴を使う）
+        self.indexed_history = self.backend.supports_item_index and not write_behind
+
+    def _load_state_from_backend(self) -> Optional[Dict]:
         """
-        GCSから状態を読み込み
+        バックエンドから状態を読み込み
 
         Returns:
             状態辞書、存在しない場合はNone
         """
-        try:
-            client = storage.Client()
-            bucket = client.bucket(self.gcs_bucket_name)
-            blob = bucket.blob(self.gcs_state_file)
-
-            if not blob.exists():
-                logger.info(f"GCS上に状態ファイルが存在しません: gs://{self.gcs_bucket_name}/{self.gcs_state_file}")
-                return None
-
-            content = blob.download_as_text(encoding='utf-8')
-            state = json.loads(content)
-            logger.info(f"GCSから状態を読み込みました: gs://{self.gcs_bucket_name}/{self.gcs_state_file}")
-            return state
-
-        except json.JSONDecodeError as e:
-            logger.error(f"GCS状態ファイルの読み込みエラー（JSON解析失敗）: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"GCS状態ファイルの読み込みエラー: {e}")
-            return None
+        return self.backend.load()
 
-    def _load_state_from_local(self) -> Optional[Dict]:
+    def load_state(self) -> Optional[Dict]:
         """
-        ローカルファイルから状態を読み込み
+        前回の状態を読み込み
+
+        write-behind有効時は初回のみバックエンドから読み込み、以降はメモリ上の状態を返す。
+        未フラッシュのWALが残っていれば、そちらを優先して復元する。
 
         Returns:
             状態辞書、存在しない場合はNone
         """
-        if not os.path.exists(self.state_file_path):
-            logger.info(f"状態ファイルが存在しません: {self.state_file_path}")
-            return None
+        if not self.write_behind:
+            return self._load_state_from_backend()
+
+        with self._lock:
+            if not self._cache_loaded:
+                state = self._load_state_from_backend()
+                wal_state = self._read_wal()
+                if wal_state is not None:
+                    logger.info(f"WALから未反映の状態を復元しました: {self.wal_path}")
+                    state = wal_state
+                    self._dirty = True
+                    self._generation += 1
+                self._cached_state = state
+                self._cache_loaded = True
+            recovered = self._dirty
+
+        if recovered:
+            self._ensure_flusher()
+        return self._cached_state
+
+    def warm_up(self) -> bool:
+        """
+        状態の保存先への接続を事前に確立
 
-        try:
-            with open(self.state_file_path, 'r', encoding='utf-8') as f:
-                state = json.load(f)
-                logger.info(f"状態を読み込みました: {self.state_file_path}")
-                return state
-        except json.JSONDecodeError as e:
-            logger.error(f"状態ファイルの読み込みエラー（JSON解析失敗）: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"状態ファイルの読み込みエラー: {e}")
-            return None
+        write-behind有効時は状態を読み込んでメモリに保持する（以降の実行は読み込みを省略できる）。
+        無効時は実行ごとに読み込むため、保存先への接続（GCSの認証・HTTPS接続など）だけを確立する。
 
-    def load_state(self) -> Optional[Dict]:
+        Returns:
+            接続できた場合True
+        """
+        if self.write_behind:
+            self.load_state()
+            return True
+        return self.backend.warm_up()
+
+    def _save_state_to_backend(self, state: Dict) -> bool:
         """
-        前回の状態を読み込み（GCSまたはローカル）
+        バックエンドに状態を保存
+
+        Args:
+            state: 保存する状態辞書
 
         Returns:
-            状態辞書、存在しない場合はNone
+            保存成功時True
         """
-        if self.use_gcs:
-            return self._load_state_from_gcs()
-        else:
-            return self._load_state_from_local()
+        return self.backend.save(state)
 
-    def _save_state_to_gcs(self, state: Dict) -> bool:
+    def save_state(self, state: Dict) -> bool:
         """
-        GCSに状態を保存
+        現在の状態を保存
+
+        write-behind有効時はWALに追記してメモリ上の状態を更新し、
+        バックエンドへの書き込みはバックグラウンドでまとめて行う。
 
         Args:
             state: 保存する状態辞書
@@ -119,67 +173,169 @@ class StateManager:
         Returns:
             保存成功時True
         """
-        try:
-            # タイムスタンプを追加
-            state['last_updated'] = datetime.now().isoformat()
-
-            client = storage.Client()
-            bucket = client.bucket(self.gcs_bucket_name)
-            blob = bucket.blob(self.gcs_state_file)
+        if not self.write_behind:
+            return self._save_state_to_backend(state)
 
-            content = json.dumps(state, ensure_ascii=False, indent=2)
-            blob.upload_from_string(content, content_type='application/json')
+        with self._lock:
+            state['last_updated'] = datetime.now().isoformat()
+            appended = self._append_wal(state)
+            self._cached_state = state
+            self._cache_loaded = True
+            self._dirty = True
+            self._generation += 1
 
-            logger.info(f"GCSに状態を保存しました: gs://{self.gcs_bucket_name}/{self.gcs_state_file}")
-            return True
+        if not appended:
+            # WALに書けない場合はクラッシュ耐性を優先して同期書き込み
+            logger.warning("WALへの書き込みに失敗したため、同期的に保存します")
+            return self.flush()
 
-        except Exception as e:
-            logger.error(f"GCS状態ファイルの保存エラー: {e}")
-            return False
+        self._ensure_flusher()
+        return True
 
-    def _save_state_to_local(self, state: Dict) -> bool:
+    def _append_wal(self, state: Dict) -> bool:
         """
-        ローカルファイルに状態を保存
+        WALに状態を1行追記
 
         Args:
-            state: 保存する状態辞書
+            state: 追記する状態辞書
 
         Returns:
-            保存成功時True
+            追記成功時True
         """
         try:
-            # ディレクトリが存在しない場合は作成
-            directory = os.path.dirname(self.state_file_path)
+            directory = os.path.dirname(self.wal_path)
             if directory and not os.path.exists(directory):
                 os.makedirs(directory)
 
-            # タイムスタンプを追加
-            state['last_updated'] = datetime.now().isoformat()
-
-            with open(self.state_file_path, 'w', encoding='utf-8') as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-
-            logger.info(f"状態を保存しました: {self.state_file_path}")
+            line = json.dumps(state, ensure_ascii=False, separators=(',', ':'))
+            with open(self.wal_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
             return True
 
         except Exception as e:
-            logger.error(f"状態ファイルの保存エラー: {e}")
+            logger.error(f"WALの書き込みエラー: {e}")
             return False
 
-    def save_state(self, state: Dict) -> bool:
+    def _read_wal(self) -> Optional[Dict]:
         """
-        現在の状態を保存（GCSまたはローカル）
+        WALから最後に書き込まれた完全な状態を読み込み
 
-        Args:
-            state: 保存する状態辞書
+        Returns:
+            状態辞書、WALが存在しないか空の場合はNone
+        """
+        if not os.path.exists(self.wal_path):
+            return None
+
+        state = None
+        try:
+            with open(self.wal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        state = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中でクラッシュした末尾行は無視
+                        logger.warning("WALの不完全な行をスキップしました")
+        except Exception as e:
+            logger.error(f"WALの読み込みエラー: {e}")
+            return None
+
+        return state
+
+    def _truncate_wal(self):
+        """WALを削除"""
+        try:
+            if os.path.exists(self.wal_path):
+                os.remove(self.wal_path)
+        except Exception as e:
+            logger.error(f"WALの削除エラー: {e}")
+
+    def _ensure_flusher(self):
+        """バックグラウンドのフラッシュスレッドを起動（起動済みなら何もしない）"""
+        with self._lock:
+            if self._flush_thread is not None and self._flush_thread.is_alive():
+                return
+
+            self._stop_event.clear()
+            self._flush_thread = threading.Thread(
+                target=self._flush_loop,
+                name='state-flusher',
+                daemon=True
+            )
+            self._flush_thread.start()
+
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def _flush_loop(self):
+        """flush_intervalごとに未保存の状態をバックエンドへ書き込む"""
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> bool:
+        """
+        未保存の状態をバックエンドへ書き込み
+
+        フラッシュ中に新たな保存があった場合はWALを残し、次回のフラッシュで反映する。
+        書き込みはreset_stateと直列化し、書き込む状態はロックを取得してから取り出すため、
+        リセットを待っていたフラッシュがリセット前の状態を書き戻すことはない。
 
         Returns:
-            保存成功時True
+            書き込み成功時（または書き込む必要がない場合）True
         """
-        if self.use_gcs:
-            return self._save_state_to_gcs(state)
-        else:
-            return self._save_state_to_local(state)
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return True
+                state = self._cached_state
+                generation = self._generation
+
+            if state is None:
+                return True
+
+            saved = self._save_state_to_backend(dict(state))
+
+            with self._lock:
+                if saved and generation == self._generation:
+                    self._dirty = False
+                    self._truncate_wal()
+
+        return saved
+
+    def close(self):
+        """フラッシュスレッドを停止し、未保存の状態を書き込む"""
+        self._stop_event.set()
+        thread = self._flush_thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def install_signal_handlers(self):
+        """
+        SIGTERM受信時に未保存の状態をフラッシュしてから終了するハンドラを登録
+
+        シグナルハンドラはメインスレッドからのみ登録できるため、それ以外では何もしない。
+        """
+        if threading.current_thread() is not threading.main_thread():
+            logger.debug("メインスレッド以外のためシグナルハンドラを登録しません")
+            return
+
+        previous_handler = signal.getsignal(signal.SIGTERM)
+
+        def _handle_sigterm(signum, frame):
+            logger.info("SIGTERMを受信しました。状態をフラッシュします")
+            self.close()
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+            else:
+                sys.exit(128 + signum)
+
+        signal.signal(signal.SIGTERM, _handle_sigterm)
 
     def has_content_changed(self, current_hash: str, previous_hash: Optional[str]) -> bool:
         """
@@ -214,16 +370,12 @@ class StateManager:
         Returns:
             新しいアイテムのリスト
         """
-        # タイトルと内容で識別
-        previous_signatures = set()
-        for item in previous_items:
-            signature = f"{item.get('title', '')}:{item.get('content', '')}"
-            previous_signatures.add(signature)
+        # タイトルと内容（正規化後）のダイジェストで識別
+        previous_signatures = {item_digest_of(item) for item in previous_items}
 
         new_items = []
         for item in current_items:
-            signature = f"{item.get('title', '')}:{item.get('content', '')}"
-            if signature not in previous_signatures:
+            if item_digest_of(item) not in previous_signatures:
                 new_items.append(item)
 
         if new_items:
@@ -243,20 +395,33 @@ class StateManager:
         Returns:
             状態辞書
         """
-        return {
+        state = {
             'hash': scan_result.get('hash'),
-            'items': scan_result.get('items', []),
+            'items': serialize_items(scan_result.get('items', [])),
             'item_count': scan_result.get('item_count', 0),
             'url': scan_result.get('url'),
             'last_updated': datetime.now().isoformat()
         }
-
-    def compare_and_update(self, current_scan_result: Dict) -> Dict:
+        if 'chunks' in scan_result:
+            state['chunks'] = scan_result['chunks']
+        if scan_result.get('target_chunks'):
+            state['target_chunks'] = scan_result['target_chunks']
+        if scan_result.get('snapshot'):
+            state['snapshot'] = scan_result['snapshot']
+        return state
+
+    def compare_and_update(self, current_scan_result: Dict, previous_state: Optional[Dict] = None,
+                           previous_state_loaded: bool = False,
+                           before_save: Optional[Callable[[List[Dict]], None]] = None) -> Dict:
         """
         前回の状態と比較し、変更があれば更新
 
         Args:
             current_scan_result: 現在のスキャン結果
+            previous_state: 読み込み済みの前回の状態（previous_state_loaded=Trueの場合に使用）
+            previous_state_loaded: previous_stateを使い、状態を再読み込みしないか
+            before_save: 新しいアイテムを検出したとき、状態の保存前に呼び出す関数
+                         （初回実行時は呼び出さない。速報を保存より先に送るために使用）
 
         Returns:
             比較結果の辞書:
@@ -268,7 +433,8 @@ class StateManager:
                 'is_first_run': bool
             }
         """
-        previous_state = self.load_state()
+        if not previous_state_loaded:
+            previous_state = self.load_state()
         is_first_run = previous_state is None
 
         current_hash = current_scan_result.get('hash')
@@ -278,6 +444,10 @@ class StateManager:
             # 初回実行
             logger.info("初回実行です")
             new_state = self.create_state_from_scan_result(current_scan_result)
+            if self.track_history:
+                history = self._load_history(None)
+                history.record(current_items, snapshot=current_scan_result.get('snapshot'))
+                self._history_to_state(history, new_state)
             self.save_state(new_state)
 
             return {
@@ -293,11 +463,27 @@ class StateManager:
         previous_items = previous_state.get('items', [])
 
         has_changes = self.has_content_changed(current_hash, previous_hash)
-        new_items = self.get_new_items(current_items, previous_items) if has_changes else []
+        new_items = []
 
         # 状態を更新
         if has_changes:
             new_state = self.create_state_from_scan_result(current_scan_result)
+
+            if self.track_history:
+                history = self._load_history(previous_state, current_items)
+                new_items = self._record_history(
+                    history, current_items, snapshot=current_scan_result.get('snapshot')
+                )
+                self._history_to_state(history, new_state)
+            else:
+                new_items = self.get_new_items(current_items, previous_items)
+
+            if before_save is not None and new_items:
+                try:
+                    before_save(new_items)
+                except Exception as e:
+                    logger.exception(f"保存前の処理でエラーが発生しました: {e}")
+
             self.save_state(new_state)
 
         return {
@@ -308,29 +494,101 @@ class StateManager:
             'is_first_run': False
         }
 
+    def _load_history(self, state: Optional[Dict], current_items: Optional[List[Dict]] = None) -> ItemHistory:
+        """
+        状態辞書から履歴を復元
+
+        Args:
+            state: 状態辞書
+            current_items: 今回のアイテムリスト（索引で履歴を引く場合、このアイテムの履歴を取得する）
+
+        Returns:
+            ItemHistoryインスタンス
+        """
+        if self.indexed_history and state is not None:
+            return ItemHistory(
+                entries=self.backend.lookup_items(assign_item_ids(current_items or [])),
+                changes=list(state.get('changes') or []),
+                max_events=self.history_max_events,
+                max_age_days=self.history_max_age_days
+            )
+        return ItemHistory.from_state(
+            state,
+            max_events=self.history_max_events,
+            max_age_days=self.history_max_age_days
+        )
+
+    def _history_to_state(self, history: ItemHistory, state: Dict):
+        # 索引で履歴を引く場合、アイテムごとの履歴は保存済みのアイテムが兼ねるため変更ログだけを保存する
+        history.to_state(state)
+        if self.indexed_history:
+            del state['history']
+
+    def _record_history(self, history: ItemHistory, current_items: List[Dict],
+                        snapshot: Optional[str] = None) -> List[Dict]:
+        """
+        履歴に今回のアイテムを記録し、通知対象のアイテムを返す
+
+        Args:
+            history: 前回までの履歴
+            current_items: 現在のアイテムリスト
+            snapshot: 今回のページのスナップショットのダイジェスト
+
+        Returns:
+            新規または内容が変わったアイテムのリスト（現在のアイテムリストの順序）
+        """
+        events = history.record(current_items, snapshot=snapshot)
+
+        if events['reappeared']:
+            logger.info(f"{len(events['reappeared'])}件のアイテムが再出現しました（通知対象外）")
+        if events['removed']:
+            logger.info(f"{len(events['removed'])}件のアイテムが消えました")
+
+        notify_ids = {id(item) for item in events['added'] + events['modified']}
+        new_items = [item for item in current_items if id(item) in notify_ids]
+
+        if new_items:
+            logger.info(f"{len(new_items)}件の新しいアイテムを検出")
+        else:
+            logger.info("新しいアイテムはありません")
+
+        return new_items
+
+    def get_changes_since(self, since, events: Optional[List[str]] = None) -> List[Dict]:
+        """
+        指定日時以降の変更ログを取得
+
+        Args:
+            since: 基準日時（datetimeまたはISO 8601形式の文字列）
+            events: 取得するイベント種別（'added', 'removed', 'modified'。省略時はすべて）
+
+        Returns:
+            変更イベントのリスト（古い順）
+
+        Raises:
+            ValueError: 基準日時を解析できない場合
+        """
+        history = self._load_history(self.load_state())
+        return history.get_changes_since(since, events)
+
     def reset_state(self) -> bool:
         """
         状態をリセット（ファイルを削除）
 
+        実行中のフラッシュの完了を待ってから削除するため、リセット前の状態が後から書き戻されることはない。
+
         Returns:
             成功時True
         """
-        try:
-            if self.use_gcs:
-                client = storage.Client()
-                bucket = client.bucket(self.gcs_bucket_name)
-                blob = bucket.blob(self.gcs_state_file)
-                if blob.exists():
-                    blob.delete()
-                    logger.info(f"GCS状態ファイルを削除しました: gs://{self.gcs_bucket_name}/{self.gcs_state_file}")
-            else:
-                if os.path.exists(self.state_file_path):
-                    os.remove(self.state_file_path)
-                    logger.info(f"状態ファイルを削除しました: {self.state_file_path}")
-            return True
-        except Exception as e:
-            logger.error(f"状態ファイルの削除エラー: {e}")
-            return False
+        with self._flush_lock:
+            with self._lock:
+                self._cached_state = None
+                self._cache_loaded = self.write_behind
+                self._dirty = False
+                self._generation += 1
+                self._truncate_wal()
+
+            return self.backend.delete()
 
 
 def main():
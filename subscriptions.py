@@ -0,0 +1,341 @@
+"""
+購読者ごとのキーワードの照合
+購読者（LINEのユーザーID・グループID）ごとにキーワード・マッチモード・対象のURLを登録し、
+1回のスキャンで見つかったアイテムを全購読者の条件と照合する
+
+ページの取得・抽出は全購読者のキーワードの和集合で1回だけ行い、照合はキーワードから購読者への
+転置インデックスで行う。アイテムの文字列は全キーワードのAho-Corasickオートマトンで1回だけ走査し、
+含まれていたキーワードの購読者だけを調べるため、照合の手間は購読者数ではなく
+アイテムの文字数と一致したキーワードの購読者数に比例する。
+"""
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from items import Item, item_id_of
+from state_backends import StateBackend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 設定ファイルのキーワード・通知チャネルへの通知を表す購読のID
+DEFAULT_SUBSCRIPTION = '_default'
+
+
+class Subscription:
+    """購読者ごとの照合条件"""
+
+    __slots__ = ('subscription_id', 'recipient', 'keywords', 'match_mode', 'targets')
+
+    def __init__(self, subscription_id: str, recipient: str, keywords: Iterable[str],
+                 match_mode: str = 'any', targets: Optional[Iterable[str]] = None):
+        """
+        Args:
+            subscription_id: 購読のID
+            recipient: 送信先のLINEのユーザーID・グループID
+            keywords: キーワードのリスト
+            match_mode: 'any'（いずれか） or 'all'（すべて）
+            targets: 対象のURL（アイテムのURLの前方一致、省略時はすべて）
+        """
+        if match_mode not in ('any', 'all'):
+            raise ValueError(f"match_modeは'any'または'all'を指定してください: {subscription_id}")
+        self.subscription_id = subscription_id
+        self.recipient = recipient
+        self.keywords = [keyword for keyword in dict.fromkeys(keywords) if keyword]
+        if not self.keywords:
+            raise ValueError(f"キーワードが設定されていません: {subscription_id}")
+        self.match_mode = match_mode
+        self.targets = list(targets or [])
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.subscription_id,
+            'recipient': self.recipient,
+            'keywords': list(self.keywords),
+            'match_mode': self.match_mode,
+            'targets': list(self.targets)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Subscription':
+        return cls(data['id'], data.get('recipient', ''), data.get('keywords', []),
+                   data.get('match_mode', 'any'), data.get('targets'))
+
+
+class SubscriptionStore:
+    """購読の保存先（状態と同じ種類のバックエンド）"""
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        """
+        Args:
+            backend: 購読の保存先（Noneの場合はメモリ上のみ）
+        """
+        self.backend = backend
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.backend is None:
+            return
+        data = self.backend.load() or {}
+        for entry in data.get('subscriptions', []):
+            try:
+                subscription = Subscription.from_dict(entry)
+            except (KeyError, ValueError) as e:
+                logger.warning(f"購読の設定を読み飛ばしました: {e}")
+                continue
+            self._subscriptions[subscription.subscription_id] = subscription
+
+    def all(self) -> List[Subscription]:
+        """登録されている購読のリスト"""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._subscriptions.values())
+
+    def put(self, subscription: Subscription):
+        """購読を登録（同じIDの購読は置き換える）"""
+        with self._lock:
+            self._ensure_loaded()
+            self._subscriptions[subscription.subscription_id] = subscription
+            self._dirty = True
+
+    def remove(self, subscription_id: str) -> bool:
+        """
+        購読を削除
+
+        Returns:
+            削除した場合True
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._subscriptions.pop(subscription_id, None) is None:
+                return False
+            self._dirty = True
+            return True
+
+    def save(self) -> bool:
+        """
+        変更があればバックエンドに保存
+
+        Returns:
+            保存成功時（変更がない場合も）True
+        """
+        with self._lock:
+            if self.backend is None or not self._dirty:
+                return True
+            data = {'subscriptions': [subscription.to_dict() for subscription in self._subscriptions.values()]}
+            if self.backend.save(data):
+                self._dirty = False
+                return True
+            return False
+
+
+class KeywordAutomaton:
+    """複数のキーワードを1回の走査で探すAho-Corasickオートマトン（大文字・小文字は区別しない）"""
+
+    def __init__(self, keywords: List[str]):
+        """
+        Args:
+            keywords: キーワードのリスト（小文字にしたもの、位置が番号になる）
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[Tuple[int, ...]] = [()]
+
+        for number, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append(())
+                state = next_state
+            self._outputs[state] += (number,)
+
+        # 幅優先で失敗時の遷移先を求め、遷移先の出力をまとめておく
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+
+    @property
+    def node_count(self) -> int:
+        return len(self._goto)
+
+    def find(self, text: str) -> Set[int]:
+        """
+        テキストに含まれるキーワードの番号
+
+        Args:
+            text: 対象のテキスト
+
+        Returns:
+            含まれていたキーワードの番号の集合
+        """
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: Set[int] = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class SubscriptionIndex:
+    """キーワードから購読への転置インデックス"""
+
+    def __init__(self, subscriptions: Iterable[Subscription]):
+        """
+        Args:
+            subscriptions: 照合する購読のリスト
+        """
+        self.subscriptions = list(subscriptions)
+        numbers: Dict[str, int] = {}
+        self._postings: List[List[int]] = []
+        # 'all' の購読が一致するのに必要な（小文字で重複を除いた）キーワード数
+        self._required: List[int] = []
+
+        for position, subscription in enumerate(self.subscriptions):
+            lowered = {keyword.lower() for keyword in subscription.keywords}
+            self._required.append(len(lowered))
+            for keyword in lowered:
+                number = numbers.get(keyword)
+                if number is None:
+                    number = numbers[keyword] = len(self._postings)
+                    self._postings.append([])
+                self._postings[number].append(position)
+
+        self.keywords = list(numbers)
+        self._automaton = KeywordAutomaton(self.keywords)
+
+    def union_keywords(self) -> List[str]:
+        """全購読のキーワードの和集合（ページの抽出に使う、登録順）"""
+        return list(dict.fromkeys(keyword for subscription in self.subscriptions
+                                  for keyword in subscription.keywords))
+
+    @staticmethod
+    def _text_of(item: Item) -> str:
+        # 抽出時と同じく、見出し・本文・リンク先のいずれかに含まれるかで判定する（区切りをまたいで一致させない）
+        return '\x1f'.join((item.get('title', ''), item.get('content', ''), item.get('url', '')))
+
+    def match(self, items: Iterable[Item]) -> Dict[str, List[Item]]:
+        """
+        アイテムを全購読の条件と照合
+
+        Args:
+            items: 新しく見つかったアイテムのリスト
+
+        Returns:
+            購読のIDと、その購読の条件に一致したアイテムのリスト（一致したものがある購読のみ）
+        """
+        matches: Dict[str, List[Item]] = {}
+        for item in items:
+            found = self._automaton.find(self._text_of(item))
+            if not found:
+                continue
+            hits: Dict[int, int] = {}
+            for number in found:
+                for position in self._postings[number]:
+                    hits[position] = hits.get(position, 0) + 1
+
+            url = item.get('url', '')
+            for position, count in hits.items():
+                subscription = self.subscriptions[position]
+                if subscription.match_mode == 'all' and count < self._required[position]:
+                    continue
+                if subscription.targets and not url.startswith(tuple(subscription.targets)):
+                    continue
+                matches.setdefault(subscription.subscription_id, []).append(item)
+        return matches
+
+    def deliveries(self, matches: Dict[str, List[Item]]) -> List[Tuple[List[Item], List[str]]]:
+        """
+        同じアイテムの組み合わせの購読者をまとめる（メッセージの作成を組み合わせごとに1回にする）
+
+        Args:
+            matches: match() の結果（DEFAULT_SUBSCRIPTION は除いておく）
+
+        Returns:
+            (アイテムのリスト, 送信先のリスト) のリスト
+        """
+        recipients = {subscription.subscription_id: subscription.recipient for subscription in self.subscriptions}
+        batches: Dict[tuple, Tuple[List[Item], List[str]]] = {}
+        for subscription_id, items in matches.items():
+            recipient = recipients.get(subscription_id)
+            if not recipient:
+                continue
+            key = tuple(item_id_of(item) for item in items)
+            batch = batches.setdefault(key, (items, []))
+            if recipient not in batch[1]:
+                batch[1].append(recipient)
+        return list(batches.values())
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'subscriptions': len(self.subscriptions),
+            'keywords': len(self.keywords),
+            'automaton_nodes': self._automaton.node_count
+        }
+
+
+def main():
+    """テスト用のメイン関数（購読者数を増やしながら照合の時間を測る）"""
+    import random
+    import time
+
+    random.seed(0)
+    vocabulary = ['Switch2', '抽選販売', '招待販売', 'マリオカート', 'ドンキーコング', 'Joy-Con', 'Pro コントローラー',
+                  'amiibo', 'ポケモン', 'ゼルダ', 'カービィ', 'スプラトゥーン'] + [f"限定{i}" for i in range(500)]
+    items = [Item(type='heading', title=f"{random.choice(vocabulary)} {random.choice(vocabulary)} のお知らせ",
+                  content='受付期間と応募条件の詳細', url=f"https://store-jp.nintendo.com/news/{i}")
+             for i in range(50)]
+
+    for count in (10, 1000, 10000):
+        subscriptions = [
+            Subscription(f"user{i}", f"U{i:032d}", random.sample(vocabulary, 3),
+                         'all' if i % 10 == 0 else 'any')
+            for i in range(count)
+        ]
+        started = time.perf_counter()
+        index = SubscriptionIndex(subscriptions)
+        built = time.perf_counter() - started
+
+        started = time.perf_counter()
+        matches = index.match(items)
+        matched = time.perf_counter() - started
+        batches = index.deliveries(matches)
+
+        started = time.perf_counter()
+        naive = 0
+        for subscription in subscriptions:
+            check = all if subscription.match_mode == 'all' else any
+            for item in items:
+                text = index._text_of(item).lower()
+                naive += check(keyword.lower() in text for keyword in subscription.keywords)
+        naive_seconds = time.perf_counter() - started
+        print(f"購読者 {count:>6}: 構築 {built * 1000:7.1f}ms  照合 {matched * 1000:7.1f}ms"
+              f"（総当たり {naive_seconds * 1000:8.1f}ms）  一致 {sum(map(len, matches.values()))}件"
+              f"（総当たり {naive}件）  送信のまとまり {len(batches)}")
+
+
+if __name__ == '__main__':
+    main()
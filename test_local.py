@@ -207,6 +207,338 @@ def test_full_system():
         return False
 
 
+def test_chunk_reuse():
+    """チャンクの再利用のテスト（チャンクをまたいで重複するアイテムが消えないこと）"""
+    print_section("6. チャンク再利用テスト")
+    from scraper import Switch2Scraper
+
+    notice = '<p>Switch2 抽選販売のお知らせです</p>'
+
+    def page(first_class: str, first: str) -> str:
+        return f'<html><body><div class="{first_class}">{first}</div><div>{notice}</div></body></html>'
+
+    for parser in ('bs4', 'lxml'):
+        scraper = Switch2Scraper('https://example.com/', ['抽選'], parser_backend=parser)
+        first, chunks = scraper._extract_from_document(scraper.backend.parse(page('a', notice)))
+        previous = [item.to_dict() for item in first]
+
+        # 1つ目のチャンクが変化しても、2つ目のチャンクの同じ段落は残る
+        edited, _ = scraper._extract_from_document(scraper.backend.parse(page('b', notice)), previous, chunks)
+        # 1つ目のチャンクから段落がなくなっても、2つ目のチャンクの段落として残る
+        removed, _ = scraper._extract_from_document(scraper.backend.parse(page('a', '<p>-</p>')), previous, chunks)
+
+        print(f"✓ {parser}: 1回目 {len(first)}件 / 1つ目を変更 {len(edited)}件 / 1つ目から削除 {len(removed)}件")
+        for items in (first, edited, removed):
+            assert [item['title'] for item in items] == ['Switch2 抽選販売のお知らせです']
+
+    # キーワードを追加した場合は、変化していないチャンクも再抽出する
+    html = '<html><body><div><p>Switch2 抽選販売のお知らせです</p></div><div><p>招待販売の受付を開始しました</p></div></body></html>'
+    for parser in ('bs4', 'lxml'):
+        scraper = Switch2Scraper('https://example.com/', ['抽選'], parser_backend=parser)
+        first, chunks = scraper._extract_from_document(scraper.backend.parse(html))
+        previous = [item.to_dict() for item in first]
+
+        scraper = Switch2Scraper('https://example.com/', ['抽選', '招待販売'], parser_backend=parser)
+        rescanned, _ = scraper._extract_from_document(scraper.backend.parse(html), previous, chunks)
+        full, _ = scraper._extract_from_document(scraper.backend.parse(html))
+
+        print(f"✓ {parser}: キーワード追加前 {len(first)}件 / 追加後 {len(rescanned)}件（全体の抽出 {len(full)}件）")
+        assert len(first) == 1
+        assert [item['title'] for item in rescanned] == [item['title'] for item in full]
+        assert len(rescanned) == 2
+
+    print("\n✅ チャンク再利用テスト完了")
+    return True
+
+
+def test_sqlite_backend():
+    """SQLiteバックエンドのテスト（upsert・古い行の削除・索引による検出履歴）"""
+    print_section("7. SQLiteバックエンドテスト")
+    import tempfile
+    from state_backends import SqliteBackend
+    from state_manager import StateManager
+
+    def item(title: str) -> dict:
+        return {'type': 'heading', 'title': title, 'content': f'{title} 抽選販売', 'url': 'https://example.com/'}
+
+    def scan(*titles: str) -> dict:
+        items = [item(title) for title in titles]
+        return {'hash': '/'.join(titles), 'items': items, 'item_count': len(items), 'url': 'https://example.com/'}
+
+    with tempfile.TemporaryDirectory() as directory:
+        # upsert: 同じアイテムは初回検出日時を保ったまま更新し、消えたアイテムは行を残して非表示にする
+        backend = SqliteBackend(os.path.join(directory, 'state.db'), max_runs=2)
+        backend.save(scan('A', 'B'))
+        first_seen = backend.get_items_first_seen_since('')
+        backend.save(scan('A', 'C'))
+        backend.save(scan('A', 'C'))
+        state = backend.load()
+        rows = {row['title']: row for row in backend.get_items_first_seen_since('')}
+        print(f"✓ upsert: 現在のアイテム {[i['title'] for i in state['items']]} / 行 {sorted(rows)}")
+        assert [i['title'] for i in state['items']] == ['A', 'C']
+        assert rows['A']['first_seen'] == first_seen[0]['first_seen'] and rows['A']['present']
+        assert not rows['B']['present']
+        # 実行履歴は保持件数までに削除する
+        assert len(backend.get_runs()) == 2
+        backend.close()
+
+        # 削除: 消えてから保持期間を過ぎたアイテムの行は削除し、現在のアイテムは残す
+        backend = SqliteBackend(os.path.join(directory, 'prune.db'), retention_days=0)
+        backend.save(scan('A', 'B'))
+        backend.save(scan('A'))
+        remaining = [row['title'] for row in backend.get_items_first_seen_since('')]
+        print(f"✓ 削除: 残った行 {remaining}")
+        assert remaining == ['A']
+        backend.close()
+
+        # 索引による検出履歴: 状態に履歴を保存せず、再出現したアイテムは通知対象にしない
+        backend = SqliteBackend(os.path.join(directory, 'history.db'))
+        manager = StateManager(os.path.join(directory, 'state.json'), backend=backend)
+        assert manager.indexed_history
+        manager.compare_and_update(scan('A', 'B'))
+        manager.compare_and_update(scan('A'))
+        reappeared = manager.compare_and_update(scan('A', 'B'))
+        added = manager.compare_and_update(scan('A', 'B', 'D'))
+        state = manager.load_state()
+        print(f"✓ 索引による履歴: 再出現 {len(reappeared['new_items'])}件 / 新規 {[i['title'] for i in added['new_items']]}")
+        assert reappeared['new_items'] == []
+        assert [i['title'] for i in added['new_items']] == ['D']
+        assert 'history' not in state and state.get('changes')
+        backend.close()
+
+    print("\n✅ SQLiteバックエンドテスト完了")
+    return True
+
+
+def test_dispatcher():
+    """通知の配信のテスト（ローカルのスタブサーバーでチャネルごとのタイムアウトと分離を確認）"""
+    print_section("8. 通知の配信テスト")
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from dispatcher import NotificationDispatcher
+    from notification_channels import ChatWebhookNotifier, WebhookNotifier
+
+    received = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            received.append(self.path)
+            if self.path == '/slow':
+                time.sleep(3)
+            self.send_response(500 if self.path == '/error' else 204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    class BrokenNotifier(WebhookNotifier):
+        name = 'broken'
+
+        def post(self, payload):
+            raise RuntimeError('送信処理の不具合')
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    dispatcher = NotificationDispatcher([
+        WebhookNotifier(f"{base_url}/fast", timeout=5),
+        ChatWebhookNotifier(f"{base_url}/slow", style='slack', timeout=1),
+        ChatWebhookNotifier(f"{base_url}/error", style='discord', timeout=5),
+        BrokenNotifier(f"{base_url}/broken", timeout=5),
+    ], grace_seconds=0.5)
+
+    items = [{
+        'type': 'banner',
+        'title': 'Switch2 抽選販売 受付中',
+        'content': 'Switch2 抽選販売 受付中 | 詳細はこちら',
+        'url': 'https://store-jp.nintendo.com/lottery/switch2'
+    }]
+    try:
+        started = time.monotonic()
+        results = dispatcher.send_lottery_notification_v2(items)
+        elapsed = time.monotonic() - started
+    finally:
+        dispatcher.close()
+        server.shutdown()
+
+    print(f"✓ 結果: {results}（{elapsed:.2f}秒）")
+    # 遅いチャネルは自分のタイムアウト（+ 待ち時間）で失敗扱いになり、他のチャネルを待たせない
+    assert results == {'webhook': True, 'slack': False, 'discord': False, 'broken': False}
+    assert elapsed < 2.5
+    assert '/fast' in received and '/broken' not in received
+
+    print("\n✅ 通知の配信テスト完了")
+    return True
+
+
+def test_parser_backends():
+    """解析バックエンドのテスト（lxmlバックエンドがBeautifulSoupと同じ結果を返すこと）"""
+    print_section("9. 解析バックエンドテスト")
+    from scraper import Switch2Scraper
+
+    html = '''<html><head><title>Switch2 抽選</title><script>var lottery = "抽選";</script></head>
+    <body><div id="wrapper"><main>
+      <h2>Nintendo Switch 2 抽選販売のお知らせ</h2>
+      <p>応募期間は　11月18日（火）まで</p><p>  </p><p>当選者にはメールでご連絡します。</p>
+      <section class="notice important">
+        <span>招待販売</span>の受付を<!-- 開始 -->開始しました <a href="/invite?utm_source=top&amp;id=7">詳細</a>
+      </section>
+      <div class="recommend"><p>おすすめ: Switch2 抽選販売</p></div>
+      <ul>
+        <li><a href="/lottery/switch2">Switch2 抽選販売の申し込み</a></li>
+        <li><a href="/news/lottery-result">結果発表</a></li>
+        <li><a href="/other">その他のお知らせ</a></li>
+      </ul>
+      <h3>申込み方法</h3>
+      <p><ruby>抽選<rt>ちゅうせん</rt></ruby>に申し込むにはログインが必要です</p>
+      <template><p>抽選販売（テンプレート）</p></template>
+      <style>.lottery { color: red }</style>
+    </main></div></body></html>'''
+    keywords = ['抽選', '招待販売', '申込み', 'lottery']
+
+    results = {}
+    for parser in ('bs4', 'lxml'):
+        scraper = Switch2Scraper('https://store-jp.nintendo.com/', keywords, parser_backend=parser)
+        items, chunks = scraper._extract_from_document(scraper.backend.parse(html))
+        results[parser] = ([item.to_dict() for item in items], chunks)
+        print(f"✓ {parser}: {len(items)}件 / チャンク {len(chunks)}件")
+
+    bs4_items, bs4_chunks = results['bs4']
+    lxml_items, lxml_chunks = results['lxml']
+    for expected, actual in zip(bs4_items, lxml_items):
+        assert expected == actual, f"{expected} != {actual}"
+    assert len(bs4_items) == len(lxml_items) and bs4_items
+    assert bs4_chunks == lxml_chunks
+
+    print("\n✅ 解析バックエンドテスト完了")
+    return True
+
+
+def test_hedging():
+    """ヘッジリクエストのテスト（負けた方の中止と、負けた応答・エラーの扱い）"""
+    print_section("10. ヘッジリクエストテスト")
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from hedging import HedgeCancelled, HedgedFetcher
+    from http_client import FetchTimeout
+    from scraper import Switch2Scraper
+
+    def new_fetcher(host: str) -> HedgedFetcher:
+        # 記録済みの応答時間から、約50msで2回目のリクエストを送る
+        fetcher = HedgedFetcher(percentile=50, min_samples=5, max_ratio=1.0)
+        for _ in range(5):
+            fetcher.tracker.record(host, 0.01)
+        return fetcher
+
+    def slow(label: str, seconds: float, seen: dict):
+        # 中止の目印を確認しながら遅い応答を待つ（send関数の例）
+        def send(cancelled: threading.Event):
+            if cancelled.wait(seconds):
+                seen[label] = 'cancelled'
+                raise HedgeCancelled()
+            seen[label] = 'finished'
+            return label
+        return send
+
+    # 1回目が遅い場合: 2回目の結果を使い、1回目は中止する
+    seen = {}
+    fetcher = new_fetcher('example.com')
+    sends = iter([slow('primary', 2.0, seen), lambda cancelled: 'hedge'])
+    started = time.monotonic()
+    result = fetcher.fetch('example.com', lambda cancelled: next(sends)(cancelled))
+    elapsed = time.monotonic() - started
+    time.sleep(0.05)
+    print(f"✓ 2回目が先着: {result}（{elapsed:.2f}秒）/ 1回目 {seen.get('primary')} / {fetcher.get_stats()}")
+    assert result == 'hedge' and elapsed < 1.0 and seen['primary'] == 'cancelled'
+    assert fetcher.get_stats()['hedge_wins'] == 1
+    fetcher.close()
+
+    # 2回目を送った後に1回目が返った場合: 1回目の結果を使い、2回目を中止する
+    seen = {}
+    fetcher = new_fetcher('example.com')
+    sends = iter([slow('primary', 0.15, seen), slow('hedge', 2.0, seen)])
+    result = fetcher.fetch('example.com', lambda cancelled: next(sends)(cancelled))
+    time.sleep(0.05)
+    print(f"✓ 1回目が先着: {result} / 2回目 {seen.get('hedge')} / {fetcher.get_stats()}")
+    assert result == 'primary' and seen['hedge'] == 'cancelled'
+    assert fetcher.get_stats()['hedged'] == 1 and fetcher.get_stats()['hedge_wins'] == 0
+    fetcher.close()
+
+    # 1回目が失敗した場合: 失敗は送出せず、2回目の結果を使う
+    def failing(cancelled: threading.Event):
+        time.sleep(0.1)
+        raise FetchTimeout('タイムアウト')
+
+    fetcher = new_fetcher('example.com')
+    sends = iter([failing, slow('hedge', 0.2, {})])
+    result = fetcher.fetch('example.com', lambda cancelled: next(sends)(cancelled))
+    print(f"✓ 1回目が失敗: {result}")
+    assert result == 'hedge'
+    fetcher.close()
+
+    # アクセス間隔の予約が取れない場合は2回目を送らない
+    from politeness import PolitenessScheduler
+    scheduler = PolitenessScheduler(min_interval=5.0)
+    scheduler.acquire('example.com')
+    seen = {}
+    fetcher = new_fetcher('example.com')
+    result = fetcher.fetch('example.com', slow('primary', 0.15, seen),
+                           admit=lambda: scheduler.try_acquire('example.com'))
+    print(f"✓ アクセス間隔内: {result} / {fetcher.get_stats()}")
+    assert result == 'primary'
+    assert fetcher.get_stats()['hedged'] == 0 and fetcher.get_stats()['admit_denied'] == 1
+    fetcher.close()
+
+    # スタブサーバー: 1回目の本文の受信中に2回目が返った場合、1回目の受信を打ち切る
+    requests_seen = []
+    fast_body = '<html><body><h2>Switch2 抽選販売</h2></body></html>'.encode('utf-8')
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            first = len(requests_seen) == 1
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.end_headers()
+            try:
+                if first:
+                    for _ in range(20):
+                        self.wfile.write(b'<p>slow</p>' * 1000)
+                        self.wfile.flush()
+                        time.sleep(0.1)
+                else:
+                    self.wfile.write(fast_body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"127.0.0.1:{server.server_port}"
+    fetcher = new_fetcher(host)
+    try:
+        scraper = Switch2Scraper(f"http://{host}/", ['抽選'], hedger=fetcher)
+        started = time.monotonic()
+        fetched = scraper.fetch(max_retries=1)
+        elapsed = time.monotonic() - started
+    finally:
+        fetcher.close()
+        server.shutdown()
+
+    print(f"✓ スタブサーバー: {len(fetched.body or b'')}バイト（{elapsed:.2f}秒）/ リクエスト {len(requests_seen)}件")
+    assert fetched.body == fast_body and elapsed < 1.5
+    assert len(requests_seen) == 2
+
+    print("\n✅ ヘッジリクエストテスト完了")
+    return True
+
+
 def main():
     """メイン実行関数"""
     print("\n" + "=" * 70)
@@ -260,6 +592,21 @@ def main():
         print("スキップしました")
         results.append(("システム全体", None))
 
+    # 6. チャンク再利用テスト
+    results.append(("チャンク再利用", test_chunk_reuse()))
+
+    # 7. SQLiteバックエンドテスト
+    results.append(("SQLiteバックエンド", test_sqlite_backend()))
+
+    # 8. 通知の配信テスト
+    results.append(("通知の配信", test_dispatcher()))
+
+    # 9. 解析バックエンドテスト
+    results.append(("解析バックエンド", test_parser_backends()))
+
+    # 10. ヘッジリクエストテスト
+    results.append(("ヘッジリクエスト", test_hedging()))
+
     # 結果サマリー
     print_section("テスト結果サマリー")
 
@@ -0,0 +1,218 @@
+"""
+販売開始時刻に向けた事前準備
+設定された販売の時間帯（抽選・招待販売の受付開始時刻など）の少し前に、DNSの名前解決・
+ストアと通知先へのTLS接続・状態の読み込み・抽出ルールのコンパイルを済ませておき、
+受付開始直後の最初の監視で準備の時間がかからないようにする
+
+時間帯の書式（カンマ区切り）:
+    2025-11-18T11:00+09:00          開始時刻（継続時間は既定値）
+    2025-11-18T11:00+09:00/120      開始時刻/継続時間（分）
+"""
+import bisect
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# タイムゾーンのない時刻は日本時間として扱う
+JST = timezone(timedelta(hours=9))
+
+
+class SaleWindow:
+    """販売の時間帯"""
+
+    __slots__ = ('starts_at', 'ends_at')
+
+    def __init__(self, starts_at: datetime, duration_minutes: float = 60):
+        """
+        Args:
+            starts_at: 開始時刻（タイムゾーンがない場合は日本時間）
+            duration_minutes: 継続時間（分）
+        """
+        if starts_at.tzinfo is None:
+            starts_at = starts_at.replace(tzinfo=JST)
+        self.starts_at = starts_at
+        self.ends_at = starts_at + timedelta(minutes=duration_minutes)
+
+    def contains(self, now: datetime) -> bool:
+        return self.starts_at <= now < self.ends_at
+
+    def __repr__(self) -> str:
+        return f"SaleWindow({self.starts_at.isoformat()} - {self.ends_at.isoformat()})"
+
+
+def parse_sale_windows(spec: str, default_duration_minutes: float = 60) -> List[SaleWindow]:
+    """
+    販売の時間帯の設定を解析
+
+    Args:
+        spec: カンマ区切りの「開始時刻[/継続時間（分）]」（開始時刻はISO 8601）
+        default_duration_minutes: 継続時間を省略した場合の継続時間（分）
+
+    Returns:
+        開始時刻順のSaleWindowのリスト
+
+    Raises:
+        ValueError: 書式が正しくない場合
+    """
+    windows = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        start, _, duration = entry.partition('/')
+        try:
+            starts_at = datetime.fromisoformat(start.strip())
+            minutes = float(duration) if duration.strip() else default_duration_minutes
+        except ValueError:
+            raise ValueError(f"販売の時間帯の書式が正しくありません: {entry}")
+        windows.append(SaleWindow(starts_at, minutes))
+    return sorted(windows, key=lambda window: window.starts_at)
+
+
+class WarmupSchedule:
+    """販売の時間帯ごとに、事前準備と開始直後の監視の時刻を管理するクラス"""
+
+    def __init__(self, windows: List[SaleWindow], lead_seconds: float = 45.0):
+        """
+        Args:
+            windows: 販売の時間帯のリスト
+            lead_seconds: 開始の何秒前に事前準備を行うか
+        """
+        self.windows = sorted(windows, key=lambda window: window.starts_at)
+        self.lead = timedelta(seconds=lead_seconds)
+        self._starts = [window.starts_at for window in self.windows]
+
+    def next_window(self, now: datetime) -> Optional[SaleWindow]:
+        """これから始まる最初の時間帯（なければNone）"""
+        index = bisect.bisect_right(self._starts, now)
+        return self.windows[index] if index < len(self.windows) else None
+
+    def active_window(self, now: datetime) -> Optional[SaleWindow]:
+        """現在の時間帯（なければNone）"""
+        for window in self.windows:
+            if window.contains(now):
+                return window
+        return None
+
+    def next_events(self, now: datetime) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """
+        次の事前準備の時刻と、次の時間帯の開始時刻
+
+        Args:
+            now: 現在時刻（タイムゾーン付き）
+
+        Returns:
+            (事前準備の時刻, 開始時刻)（事前準備の時刻を過ぎている場合は事前準備の時刻はNone）
+        """
+        window = self.next_window(now)
+        if window is None:
+            return None, None
+        warmup_at = window.starts_at - self.lead
+        return (warmup_at if warmup_at > now else None), window.starts_at
+
+
+class DnsCache:
+    """
+    名前解決の結果をTTLの間保持するキャッシュ
+
+    install() すると socket.getaddrinfo を置き換え、requests・httpx を含むプロセス内の
+    すべての接続で使われる。失敗した名前解決はキャッシュしない。
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0):
+        """
+        Args:
+            ttl_seconds: 結果を保持する秒数
+        """
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[tuple, Tuple[float, list]] = {}
+        self._lock = threading.Lock()
+        self._original = None
+        self.hits = 0
+        self.misses = 0
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return list(entry[1])
+            self.misses += 1
+
+        resolve = self._original or socket.getaddrinfo
+        result = resolve(host, port, family, type, proto, flags)
+        with self._lock:
+            self._entries[key] = (now + self.ttl_seconds, list(result))
+        return result
+
+    def resolve(self, host: str, port: int = 443) -> bool:
+        """
+        ホスト名を名前解決してキャッシュ
+
+        Args:
+            host: ホスト名
+            port: ポート番号
+
+        Returns:
+            成功時True
+        """
+        try:
+            self.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+            return True
+        except OSError as e:
+            logger.warning(f"{host} の名前解決に失敗: {e}")
+            return False
+
+    def install(self):
+        """socket.getaddrinfo をキャッシュ付きのものに置き換える"""
+        with self._lock:
+            if self._original is None:
+                self._original = socket.getaddrinfo
+                socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        """socket.getaddrinfo を元に戻す"""
+        with self._lock:
+            if self._original is not None:
+                socket.getaddrinfo = self._original
+                self._original = None
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def main():
+    """テスト用のメイン関数"""
+    now = datetime.now(JST).replace(microsecond=0)
+    spec = f"{(now + timedelta(minutes=10)).isoformat()}/30, {(now - timedelta(minutes=5)).isoformat()}"
+    schedule = WarmupSchedule(parse_sale_windows(spec), lead_seconds=45)
+    print(f"設定: {spec}")
+    for window in schedule.windows:
+        print(f"  {window}")
+    warmup_at, starts_at = schedule.next_events(now)
+    print(f"現在の時間帯: {schedule.active_window(now)}")
+    print(f"次の事前準備: {warmup_at}, 次の開始: {starts_at}")
+
+    cache = DnsCache(ttl_seconds=60)
+    cache.install()
+    try:
+        for _ in range(3):
+            started = time.perf_counter()
+            cache.resolve('localhost')
+            print(f"localhost の名前解決: {(time.perf_counter() - started) * 1000:.3f}ms")
+    finally:
+        cache.uninstall()
+    print(cache.get_stats())
+
+
+if __name__ == '__main__':
+    main()